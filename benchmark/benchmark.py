@@ -0,0 +1,327 @@
+#! /usr/bin/env python3
+
+'''
+# -----------------------------------------------------------------------------
+# benchmark.py - Measure docker-compose-air-gapper.py and the scripts it creates.
+#   For each case, a synthetic docker-compose.yaml file is written and
+#     1. "create-save-images" generates save-images.sh,
+#     2. save-images.sh saves the images, using the stand-in docker in benchmark/bin,
+#     3. the bundle is extracted and load-images.sh loads the images.
+#   Wall time and peak memory are measured for each step,
+#   and peak disk usage and bundle size for the save.
+#   The stage metrics of save-images.sh and load-images.sh (METRICS_FILE) are summarized.
+#   Results are JSON, keyed by case name, so runs of different versions can be compared with --compare.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Metadata
+
+__all__ = []
+__version__ = "1.0.0"  # See https://www.python.org/dev/peps/pep-0396/
+__date__ = '2026-10-18'
+__updated__ = '2026-10-18'
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARK_DIR)
+FAKE_DOCKER_DIR = os.path.join(BENCHMARK_DIR, "bin")
+PROGRAM = os.path.join(REPOSITORY_DIR, "docker-compose-air-gapper.py")
+
+# Metrics compared by --compare. Lower is better for all of them.
+
+COMPARED_METRICS = [
+    ("generate", "seconds"),
+    ("generate", "max_rss_kilobytes"),
+    ("save", "seconds"),
+    ("save", "max_rss_kilobytes"),
+    ("save", "peak_disk_bytes"),
+    ("save", "bundle_bytes"),
+    ("load", "seconds"),
+    ("load", "max_rss_kilobytes"),
+]
+
+# -----------------------------------------------------------------------------
+# Define argument parser
+# -----------------------------------------------------------------------------
+
+
+def get_parser():
+    ''' Parse commandline arguments. '''
+
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Benchmark docker-compose-air-gapper.py with synthetic docker-compose files and a stand-in docker.")
+    parser.add_argument("--services", type=int, nargs="+", default=[1, 10, 100, 1000, 10000], help="Number of services of each case. Default: 1 10 100 1000 10000")
+    parser.add_argument("--reuse-factor", type=int, default=100, help="In 'reuse' cases, this many services share each image. Cases are made for service counts of at least this. 0 disables them. Default: 100")
+    parser.add_argument("--max-images-end-to-end", type=int, default=1000, help="Cases with more images only measure the generation of save-images.sh. Default: 1000")
+    parser.add_argument("--concurrency", type=int, default=4, help="CONCURRENCY of save-images.sh and load-images.sh. Default: 4")
+    parser.add_argument("--compression", default="gzip", help="COMPRESSION of save-images.sh: gzip, zstd, or none. Default: gzip")
+    parser.add_argument("--base-layer-size", type=int, default=1048576, help="Bytes of the layer shared by all images. Default: 1048576")
+    parser.add_argument("--layer-size", type=int, default=262144, help="Bytes of the layer of each image. Default: 262144")
+    parser.add_argument("--pull-seconds", type=float, default=0, help="Latency of 'docker pull'. Default: 0")
+    parser.add_argument("--save-seconds", type=float, default=0, help="Latency of 'docker save'. Default: 0")
+    parser.add_argument("--load-seconds", type=float, default=0, help="Latency of 'docker load'. Default: 0")
+    parser.add_argument("--disk-sample-seconds", type=float, default=0.1, help="Interval of disk usage samples. Default: 0.1")
+    parser.add_argument("--work-dir", help="Directory for the files of each case. Default: a temporary directory")
+    parser.add_argument("--keep", action="store_true", help="Keep the files of each case.")
+    parser.add_argument("--compare", metavar="RESULTS_FILE", help="Results of an earlier run. Prints the change of each metric of each case.")
+    parser.add_argument("--output-file", help="Write the JSON results to this file. Default: STDOUT")
+    return parser
+
+# -----------------------------------------------------------------------------
+# Case functions
+# -----------------------------------------------------------------------------
+
+
+def get_cases(args):
+    ''' Return the cases to run: (name, services, images). '''
+    result = []
+    for services in args.services:
+        result.append(("unique-{0}".format(services), services, services))
+        if args.reuse_factor and services >= args.reuse_factor:
+            result.append(("reuse-{0}".format(services), services, max(1, services // args.reuse_factor)))
+    return result
+
+
+def write_docker_compose_file(filename, services, images):
+    ''' Write a docker-compose.yaml file of "services" services using "images" different images. '''
+    with open(filename, "w") as a_file:
+        a_file.write("services:\n")
+        for service in range(services):
+            a_file.write("  service-{0:05d}:\n".format(service))
+            a_file.write("    image: benchmark/image-{0:05d}:1.0\n".format(service % images))
+            a_file.write("    environment:\n")
+            a_file.write("      SERVICE_NUMBER: \"{0}\"\n".format(service))
+
+
+def get_directory_size(directory):
+    ''' Return the bytes of the files in a directory, ignoring files that disappear while walking it. '''
+    result = 0
+    for path, _, names in os.walk(directory):
+        for name in names:
+            try:
+                result += os.lstat(os.path.join(path, name)).st_size
+            except OSError:
+                pass
+    return result
+
+
+def run(arguments, environment, log_filename, disk_directory=None, disk_sample_seconds=0.1):
+    ''' Run a program. Return its wall time in seconds, peak resident memory in kilobytes, and,
+        with "disk_directory", the peak bytes of that directory.
+        The peak memory is that of the largest process of the program, from wait4().
+    '''
+
+    peak_disk = {"bytes": 0}
+    done = threading.Event()
+
+    def sample_disk():
+        while not done.is_set():
+            peak_disk["bytes"] = max(peak_disk.get("bytes"), get_directory_size(disk_directory))
+            done.wait(disk_sample_seconds)
+
+    sampler = threading.Thread(target=sample_disk, daemon=True) if disk_directory else None
+    start_time = time.time()
+    with open(log_filename, "w") as log_file, subprocess.Popen(arguments, env=environment, stdout=log_file, stderr=subprocess.STDOUT) as process:
+        if sampler:
+            sampler.start()
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.time() - start_time
+    done.set()
+    if sampler:
+        sampler.join()
+        peak_disk["bytes"] = max(peak_disk.get("bytes"), get_directory_size(disk_directory))
+    if process.returncode != 0:
+        raise RuntimeError("{0} returned {1}. See {2}".format(" ".join(arguments), process.returncode, log_filename))
+    result = {
+        "seconds": round(seconds, 3),
+        "max_rss_kilobytes": rusage.ru_maxrss,
+    }
+    if disk_directory:
+        result["peak_disk_bytes"] = peak_disk.get("bytes")
+    return result
+
+
+def summarize_stages(metrics_filename):
+    ''' Return the total seconds and bytes of each stage in a METRICS_FILE of save-images.sh or load-images.sh. '''
+    result = {}
+    if not os.path.exists(metrics_filename):
+        return result
+    with open(metrics_filename) as a_file:
+        report = json.load(a_file)
+    for image in report.get("images"):
+        for stage, metrics in image.get("stages").items():
+            total = result.setdefault(stage, {"bytes": 0, "seconds": 0})
+            total["bytes"] += metrics.get("bytes")
+            total["seconds"] = round(total.get("seconds") + metrics.get("duration_seconds"), 3)
+    for stage, metrics in report.get("stages").items():
+        result[stage] = {"bytes": metrics.get("bytes"), "seconds": metrics.get("duration_seconds")}
+    return result
+
+
+def run_case(args, work_dir, name, services, images):
+    ''' Run one case. Return its results. '''
+
+    case_dir = os.path.join(work_dir, name)
+    shutil.rmtree(case_dir, ignore_errors=True)
+    os.makedirs(case_dir)
+    docker_compose_file = os.path.join(case_dir, "docker-compose.yaml")
+    save_images_file = os.path.join(case_dir, "save-images.sh")
+    write_docker_compose_file(docker_compose_file, services, images)
+
+    result = {
+        "services": services,
+        "images": images,
+    }
+
+    # Generate save-images.sh.
+
+    environment = dict(os.environ, SENZING_LOG_LEVEL="warning")
+    result["generate"] = run([sys.executable, PROGRAM, "create-save-images", "--docker-compose-file", docker_compose_file, "--output-file", save_images_file], environment, os.path.join(case_dir, "generate.log"))
+    result["generate"]["script_bytes"] = os.path.getsize(save_images_file)
+    if images > args.max_images_end_to_end:
+        return result
+
+    # Save images with the stand-in docker.
+
+    home_dir = os.path.join(case_dir, "home")
+    os.makedirs(home_dir)
+    output_file = os.path.join(home_dir, "bundle.tgz")
+    environment = dict(
+        os.environ,
+        COMPRESSION=args.compression,
+        CONCURRENCY=str(args.concurrency),
+        FAKE_DOCKER_BASE_LAYER_SIZE=str(args.base_layer_size),
+        FAKE_DOCKER_LAYER_SIZE=str(args.layer_size),
+        FAKE_DOCKER_LOAD_SECONDS=str(args.load_seconds),
+        FAKE_DOCKER_PULL_SECONDS=str(args.pull_seconds),
+        FAKE_DOCKER_SAVE_SECONDS=str(args.save_seconds),
+        FAKE_DOCKER_STATE=os.path.join(case_dir, "docker-save"),
+        METRICS_FILE=os.path.join(case_dir, "save-metrics.json"),
+        MY_HOME=home_dir,
+        OUTPUT_FILE=output_file,
+        PATH="{0}{1}{2}".format(FAKE_DOCKER_DIR, os.pathsep, os.environ.get("PATH", "")),
+    )
+    result["save"] = run(["bash", save_images_file], environment, os.path.join(case_dir, "save.log"), home_dir, args.disk_sample_seconds)
+    result["save"]["bundle_bytes"] = os.path.getsize(output_file)
+    result["save"]["stages"] = summarize_stages(environment.get("METRICS_FILE"))
+
+    # Extract the bundle and load images into a new stand-in docker.
+
+    load_dir = os.path.join(case_dir, "load")
+    os.makedirs(load_dir)
+    subprocess.run(["tar", "--extract", "--file", output_file, "--directory", load_dir], check=True)
+    load_images_files = [os.path.join(load_dir, bundle_name, "load-images.sh") for bundle_name in os.listdir(load_dir)]
+    environment.update(
+        FAKE_DOCKER_STATE=os.path.join(case_dir, "docker-load"),
+        METRICS_FILE=os.path.join(case_dir, "load-metrics.json"),
+    )
+    result["load"] = run(["bash", load_images_files[0]], environment, os.path.join(case_dir, "load.log"))
+    result["load"]["stages"] = summarize_stages(environment.get("METRICS_FILE"))
+    return result
+
+# -----------------------------------------------------------------------------
+# Comparison functions
+# -----------------------------------------------------------------------------
+
+
+def compare_results(previous, current):
+    ''' Return lines of text with the change of each compared metric of each case in both results. '''
+    result = ["{0:<16} {1:<28} {2:>14} {3:>14} {4:>8}".format("CASE", "METRIC", "PREVIOUS", "CURRENT", "CHANGE")]
+    if previous.get("parameters") != current.get("parameters"):
+        result.insert(0, "Warning: the runs used different parameters, so they may not be comparable.")
+    for name, case in current.get("cases").items():
+        previous_case = previous.get("cases", {}).get(name)
+        if not previous_case:
+            continue
+        for step, metric in COMPARED_METRICS:
+            previous_value = previous_case.get(step, {}).get(metric)
+            current_value = case.get(step, {}).get(metric)
+            if previous_value is None or current_value is None:
+                continue
+            change = "{0:+.1f}%".format((current_value - previous_value) * 100 / previous_value) if previous_value else ""
+            result.append("{0:<16} {1:<28} {2:>14} {3:>14} {4:>8}".format(name, "{0}.{1}".format(step, metric), previous_value, current_value, change))
+    return result
+
+# -----------------------------------------------------------------------------
+# Main
+# -----------------------------------------------------------------------------
+
+
+def get_program_version():
+    ''' Return __version__ of docker_compose_air_gapper and, in a git repository, the commit. '''
+    with open(os.path.join(REPOSITORY_DIR, "docker_compose_air_gapper", "common.py")) as a_file:
+        match = re.search(r'^__version__ = "([^"]*)"', a_file.read(), re.MULTILINE)
+    git = subprocess.run(["git", "-C", REPOSITORY_DIR, "describe", "--always", "--dirty"], capture_output=True, text=True, check=False)
+    return {
+        "version": match.group(1) if match else None,
+        "git": git.stdout.strip() if git.returncode == 0 else None,
+    }
+
+
+def main():
+    ''' Run the benchmark. '''
+
+    args = get_parser().parse_args()
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix="docker-compose-air-gapper-benchmark-")
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = {
+        "created_on": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "program": get_program_version(),
+        "host": {
+            "cpus": os.cpu_count(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+        },
+        "parameters": {
+            "base_layer_size": args.base_layer_size,
+            "compression": args.compression,
+            "concurrency": args.concurrency,
+            "layer_size": args.layer_size,
+            "load_seconds": args.load_seconds,
+            "pull_seconds": args.pull_seconds,
+            "save_seconds": args.save_seconds,
+        },
+        "cases": {},
+    }
+
+    try:
+        for name, services, images in get_cases(args):
+            print("Running {0}: {1} services, {2} images".format(name, services, images), file=sys.stderr)
+            results["cases"][name] = run_case(args, work_dir, name, services, images)
+            if not args.keep:
+                shutil.rmtree(os.path.join(work_dir, name), ignore_errors=True)
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output_text = json.dumps(results, indent=4)
+    if args.output_file:
+        with open(args.output_file, "w") as a_file:
+            a_file.write(output_text)
+            a_file.write("\n")
+    else:
+        print(output_text)
+
+    if args.compare:
+        with open(args.compare) as a_file:
+            previous = json.load(a_file)
+        print("\n".join(compare_results(previous, results)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper
+#   The program behind docker-compose-air-gapper.py, as a package Python programs can import.
+#   It also runs by itself, as "python3 -m docker_compose_air_gapper".
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import importlib
+
+# Import from docker_compose_air_gapper.
+
+from .common import __date__, __updated__, __version__
+
+# The functions of the package, with the module of each. A module is imported when one of its functions is first used,
+# so that "import docker_compose_air_gapper" is fast and a subcommand imports only the modules it uses.
+
+PUBLIC_FUNCTIONS = {
+    "extract_images": "library",
+    "extract_services": "library",
+    "main": "cli",
+    "render_load_images_script": "library",
+    "render_save_images_script": "library",
+}
+FUNCTIONS = dict(PUBLIC_FUNCTIONS, get_library_services_by_file="library")
+
+# Metadata
+
+__all__ = sorted(PUBLIC_FUNCTIONS)
+
+
+def __getattr__(name):
+    ''' Return a function of the package, importing its module. '''
+    if name not in FUNCTIONS:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    value = getattr(importlib.import_module(".{0}".format(FUNCTIONS.get(name)), __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    ''' Return the names of the package, with the functions not yet imported. '''
+    return sorted(set(globals()) | set(FUNCTIONS))
@@ -0,0 +1,11 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/__main__.py
+#   Run docker_compose_air_gapper with "python3 -m docker_compose_air_gapper".
+# -----------------------------------------------------------------------------
+'''
+
+from .cli import main
+
+if __name__ == "__main__":
+    main()
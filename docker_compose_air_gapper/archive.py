@@ -0,0 +1,680 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/archive.py
+#   Compress bundles, write them as volumes or as indexed archives, and read bundles to load their images.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import contextlib
+import glob
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import shutil
+import threading
+import time
+import zlib
+
+# Import from standard library and https://pypi.org/, when first used.
+
+from .common import concurrent, subprocess, tarfile
+
+# Import from docker_compose_air_gapper.
+
+from .bundle_scripts import file_text_for_verify_volumes
+from .common import MEGABYTES, message_info, replace_variables_in_text
+from .metrics import RunMetrics
+from .registry import HTTP_CHUNK_SIZE
+
+# -----------------------------------------------------------------------------
+# Compression functions
+#   A bundle directory is written as a tar file, compressed with one of COMPRESSIONS, as one file or as numbered volumes.
+# -----------------------------------------------------------------------------
+
+
+COMPRESSIONS = {
+    "gzip": {
+        "commands": [["pigz", "-{0}"]],
+        "default_level": 6,
+        "extension": "tgz",
+        "max_level": 9,
+    },
+    "zstd": {
+        "commands": [["zstd", "--quiet", "--threads=0", "--ultra", "-{0}"]],
+        "default_level": 3,
+        "extension": "tar.zst",
+        "max_level": 22,
+    },
+    "none": {
+        "commands": [],
+        "default_level": 0,
+        "extension": "tar",
+        "max_level": 0,
+    },
+}
+
+
+# Digits of the number of a volume. There can be at most 10 ** VOLUME_SUFFIX_LENGTH volumes.
+
+VOLUME_SUFFIX_LENGTH = 4
+
+
+def get_volume_filename(output_file, number):
+    ''' Same as the names made by "split --numeric-suffixes --suffix-length=4" in save-images.sh. '''
+    return "{0}.{1:0{2}d}".format(output_file, number, VOLUME_SUFFIX_LENGTH)
+
+
+def get_volume_pattern(output_file):
+    ''' Return the glob pattern of the volumes of a file. '''
+    return "{0}.{1}".format(glob.escape(output_file), "[0-9]" * VOLUME_SUFFIX_LENGTH)
+
+
+class VolumeWriter:
+    ''' Write a stream as numbered volumes of a fixed size: OUTPUT_FILE.0000, OUTPUT_FILE.0001, ...
+        The checksum of each volume is computed as it is written.
+    '''
+
+    def __init__(self, output_file, volume_size):
+        self.output_file = output_file
+        self.volume_size = volume_size
+        self.volume_file = None
+        self.volume_files = contextlib.ExitStack()
+        self.volume_hasher = None
+        self.volume_remaining = 0
+        self.checksums = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close_volume(self):
+        ''' Finish the current volume and record its checksum. '''
+        if self.volume_file:
+            self.volume_files.close()
+            self.checksums.append((self.volume_hasher.hexdigest(), os.path.basename(get_volume_filename(self.output_file, len(self.checksums)))))
+            self.volume_file = None
+
+    def write(self, data):
+        ''' Write bytes, starting a new volume whenever the current one is full. '''
+        view = memoryview(data)
+        while view:
+            if not self.volume_remaining:
+                self.close_volume()
+                if len(self.checksums) >= 10 ** VOLUME_SUFFIX_LENGTH:
+                    raise ValueError("{0} needs more than {1} volumes of {2} bytes.".format(self.output_file, 10 ** VOLUME_SUFFIX_LENGTH, self.volume_size))
+                self.volume_file = self.volume_files.enter_context(open(get_volume_filename(self.output_file, len(self.checksums)), "wb"))
+                self.volume_hasher = hashlib.sha256()
+                self.volume_remaining = self.volume_size
+            chunk = view[:self.volume_remaining]
+            self.volume_file.write(chunk)
+            self.volume_hasher.update(chunk)
+            self.volume_remaining -= len(chunk)
+            view = view[len(chunk):]
+        return len(data)
+
+    def tell(self):
+        ''' Return the number of bytes written to all volumes. '''
+        return (len(self.checksums) + (1 if self.volume_file else 0)) * self.volume_size - self.volume_remaining
+
+    def flush(self):
+        ''' Flush the current volume. '''
+        if self.volume_file:
+            self.volume_file.flush()
+
+    def close(self):
+        ''' Finish the last volume. '''
+        self.close_volume()
+        self.volume_remaining = 0
+
+
+def write_volume_files(output_file, checksums):
+    ''' Write OUTPUT_FILE.sha256, in "sha256sum" format, and OUTPUT_FILE.verify.sh, as save-images.sh does. Return the script's name. '''
+
+    with open("{0}.sha256".format(output_file), "w") as a_file:
+        for checksum, volume in checksums:
+            a_file.write("{0}  {1}\n".format(checksum, volume))
+    verify_volumes_filename = "{0}.verify.sh".format(output_file)
+    with open(verify_volumes_filename, "w") as a_file:
+        a_file.write(replace_variables_in_text(file_text_for_verify_volumes, {}))
+    os.chmod(verify_volumes_filename, 0o755)
+    return verify_volumes_filename
+
+
+def copy_stream(source, destination, errors):
+    ''' Copy a stream in a thread. An error is added to errors and the source is closed, so the program writing it stops. '''
+
+    try:
+        shutil.copyfileobj(source, destination, HTTP_CHUNK_SIZE)
+    except (OSError, ValueError) as err:
+        errors.append(err)
+        source.close()
+
+
+def compress_directory(directory, output_file, compression="gzip", compression_level=0, volume_size=0):
+    ''' Create a compressed tar file of a directory. Use a multithreaded compression program when one is installed.
+        With a volume_size, the file is written as numbered volumes. Return the checksums of the volumes.
+    '''
+
+    compression_details = COMPRESSIONS.get(compression)
+    compression_level = compression_level or compression_details.get("default_level")
+    command = None
+    for candidate in compression_details.get("commands"):
+        if shutil.which(candidate[0]):
+            command = [argument.format(compression_level) for argument in candidate]
+            break
+
+    for volume_filename in glob.glob(get_volume_pattern(output_file)):
+        os.remove(volume_filename)
+    with VolumeWriter(output_file, volume_size) if volume_size else open(output_file, "wb") as output:
+
+        # Without a compression program, use Python's gzip and tarfile.
+
+        if not command:
+            if compression == "gzip":
+                with gzip.GzipFile(fileobj=output, mode="wb", compresslevel=compression_level) as gzip_file:
+                    with tarfile.open(fileobj=gzip_file, mode="w|") as tar_file:
+                        tar_file.add(directory, arcname=os.path.basename(directory))
+            else:
+                with tarfile.open(fileobj=output, mode="w|") as tar_file:
+                    tar_file.add(directory, arcname=os.path.basename(directory))
+            return getattr(output, "checksums", [])
+
+        # Volumes are not files a program can write to, so the program's output is copied into them.
+
+        copy_errors = []
+        with subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE if volume_size else output) as process:
+            copier = None
+            if volume_size:
+                copier = threading.Thread(target=copy_stream, args=(process.stdout, output, copy_errors))
+                copier.start()
+            try:
+                with tarfile.open(fileobj=process.stdin, mode="w|") as tar_file:
+                    tar_file.add(directory, arcname=os.path.basename(directory))
+                process.stdin.close()
+            except BrokenPipeError:
+                if not copy_errors:
+                    raise
+            if copier:
+                copier.join()
+        if copy_errors:
+            raise copy_errors[0]
+        if process.returncode != 0:
+            raise RuntimeError("{0} returned {1}".format(command[0], process.returncode))
+    return getattr(output, "checksums", [])
+
+# -----------------------------------------------------------------------------
+# Bundle index functions
+#   In an indexed bundle, each file is compressed separately. A file can then be read
+#   without decompressing the files before it. The bundle is still an ordinary compressed
+#   tar file, because gzip and zstd decompress concatenated members as one stream.
+#   OUTPUT_FILE.index.json tells where each file is:
+#     {"compression": "gzip", "files": {"images.txt": {"data_offset": 512, "length": 212, "offset": 1536, "size": 164}, ...}, "root": "docker-compose-air-gapper-1700000000", "volume_size": 0}
+#   "offset" and "length" locate the compressed member in the bundle, across volumes.
+#   "data_offset" and "size" locate the file's bytes in the decompressed member, after its tar header.
+# -----------------------------------------------------------------------------
+
+
+TAR_BLOCK_SIZE = 512
+
+
+def get_index_filename(bundle_file):
+    ''' Return the name of the index of a bundle file. '''
+    return "{0}.index.json".format(bundle_file)
+
+
+def get_volume_filenames(bundle_file):
+    ''' Return the bundle file, or its numbered volumes if it was split. '''
+    if os.path.isfile(bundle_file):
+        return [bundle_file]
+    return sorted(glob.glob(get_volume_pattern(bundle_file)))
+
+
+def iterate_tar_member(filename, tar_info, header):
+    ''' Yield the bytes of a file as a tar member: its header, its content, and padding to a full block. '''
+    yield header
+    if tar_info.isreg():
+        with open(filename, "rb") as a_file:
+            yield from iter(lambda: a_file.read(HTTP_CHUNK_SIZE), b"")
+        if tar_info.size % TAR_BLOCK_SIZE:
+            yield bytes(TAR_BLOCK_SIZE - tar_info.size % TAR_BLOCK_SIZE)
+
+
+def write_chunks(output, chunks):
+    ''' Write chunks of bytes and close the output. A reader that stops early is not an error. '''
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    except (BrokenPipeError, ValueError):
+        pass
+    finally:
+        with contextlib.suppress(BrokenPipeError):
+            output.close()
+
+
+def compress_member(output, chunks, compression, compression_level):
+    ''' Write chunks of bytes to output as one compressed member. '''
+
+    if compression == "gzip":
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            output.write(compressor.compress(chunk))
+        output.write(compressor.flush())
+        return
+
+    commands = COMPRESSIONS.get(compression).get("commands")
+    if not commands:
+        for chunk in chunks:
+            output.write(chunk)
+        return
+
+    command = [argument.format(compression_level) for argument in commands[0]]
+    copy_errors = []
+    with subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE) as process:
+        copier = threading.Thread(target=copy_stream, args=(process.stdout, output, copy_errors))
+        copier.start()
+        write_chunks(process.stdin, chunks)
+        copier.join()
+    if copy_errors:
+        raise copy_errors[0]
+    if process.returncode != 0:
+        raise RuntimeError("{0} returned {1}".format(command[0], process.returncode))
+
+
+def decompress_member(chunks, compression):
+    ''' Yield the decompressed bytes of one compressed member, or of several concatenated members, as in a whole bundle file. '''
+
+    if compression == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            while chunk:
+                if decompressor.eof:
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                yield decompressor.decompress(chunk)
+                chunk = decompressor.unused_data
+        yield decompressor.flush()
+        return
+
+    if compression != "zstd":
+        yield from chunks
+        return
+
+    with subprocess.Popen(["zstd", "--decompress", "--stdout", "--quiet"], stdin=subprocess.PIPE, stdout=subprocess.PIPE) as process:
+        feeder = threading.Thread(target=write_chunks, args=(process.stdin, chunks))
+        feeder.start()
+        try:
+            yield from iter(lambda: process.stdout.read(HTTP_CHUNK_SIZE), b"")
+        finally:
+            if process.poll() is None:
+                process.kill()
+            feeder.join()
+
+
+def write_indexed_archive(directory, output_file, compression="gzip", compression_level=0, volume_size=0):
+    ''' Create a compressed tar file of a directory in which each file is a separate compressed member,
+        and OUTPUT_FILE.index.json, which tells where each file is.
+        With a volume_size, the file is written as numbered volumes. Return the checksums of the volumes.
+    '''
+
+    compression_level = compression_level or COMPRESSIONS.get(compression).get("default_level")
+    root = os.path.basename(os.path.abspath(directory))
+    index = {
+        "compression": compression,
+        "files": {},
+        "root": root,
+        "volume_size": volume_size,
+    }
+
+    for volume_filename in glob.glob(get_volume_pattern(output_file)):
+        os.remove(volume_filename)
+    with VolumeWriter(output_file, volume_size) if volume_size else open(output_file, "wb") as output:
+        with tarfile.open(fileobj=io.BytesIO(), mode="w") as tar_file:
+            for dirpath, dirnames, filenames in os.walk(directory):
+                dirnames.sort()
+                for filename in [dirpath] + [os.path.join(dirpath, name) for name in sorted(filenames)]:
+                    path = os.path.relpath(filename, directory).replace(os.sep, "/")
+                    tar_info = tar_file.gettarinfo(filename, arcname=root if path == "." else "{0}/{1}".format(root, path))
+                    tar_info.mtime = int(tar_info.mtime)
+                    header = tar_info.tobuf(tar_file.format, tar_file.encoding, tar_file.errors)
+                    offset = output.tell()
+                    compress_member(output, iterate_tar_member(filename, tar_info, header), compression, compression_level)
+                    if tar_info.isreg():
+                        index["files"][path] = {
+                            "data_offset": len(header),
+                            "length": output.tell() - offset,
+                            "offset": offset,
+                            "size": tar_info.size,
+                        }
+                    elif tar_info.issym():
+                        index["files"][path] = {
+                            "link": posixpath.normpath(posixpath.join(posixpath.dirname(path), tar_info.linkname)),
+                        }
+
+        # End of the tar archive: two empty blocks.
+
+        compress_member(output, [bytes(2 * TAR_BLOCK_SIZE)], compression, compression_level)
+
+    with open(get_index_filename(output_file), "w") as a_file:
+        json.dump(index, a_file, indent=2, sort_keys=True)
+    return getattr(output, "checksums", [])
+
+
+def write_bundle_archive(config, directory, output_file):
+    ''' Compress a bundle directory into output_file, as an indexed archive with SENZING_INDEX, and in volumes with SENZING_VOLUME_SIZE_IN_MEGABYTES.
+        Log the files written.
+    '''
+
+    write_archive = write_indexed_archive if config.get('index') else compress_directory
+    checksums = write_archive(directory, output_file, config.get('compression'), config.get('compression_level'), config.get('volume_size_in_megabytes') * MEGABYTES)
+    if checksums:
+        verify_volumes_filename = write_volume_files(output_file, checksums)
+        logging.info(message_info(112, len(checksums), checksums[0][1], checksums[-1][1], verify_volumes_filename))
+    else:
+        logging.info(message_info(103, output_file))
+    if config.get('index'):
+        logging.info(message_info(103, get_index_filename(output_file)))
+    logging.info(message_info(104, directory))
+
+
+class ChunkReader(io.RawIOBase):
+    ''' A read-only file object over an iterator of bytes. '''
+
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = chunks
+        self.chunk = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.chunk:
+            self.chunk = next(self.chunks, None)
+            if self.chunk is None:
+                self.chunk = b""
+                return 0
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+    def close(self):
+        if hasattr(self.chunks, "close"):
+            self.chunks.close()
+        super().close()
+
+
+def get_bundle_blob_dirs(bundle_dir):
+    ''' Same as BLOB_DIRS in load-images.sh: this bundle's blobs, then those of bundles extracted next to it. '''
+    bundle_dir = os.path.abspath(bundle_dir)
+    result = [os.path.join(bundle_dir, "blobs")]
+    for previous_bundle_dir in sorted(glob.glob(os.path.join(os.path.dirname(bundle_dir), "docker-compose-air-gapper-*", ""))):
+        previous_bundle_dir = os.path.abspath(previous_bundle_dir)
+        if previous_bundle_dir != bundle_dir and os.path.isdir(os.path.join(previous_bundle_dir, "blobs")):
+            result.append(os.path.join(previous_bundle_dir, "blobs"))
+    return result
+
+
+class BundleDirectory:
+    ''' The files of an extracted bundle. Paths are relative to the bundle directory.
+        Blobs are also found in bundles extracted next to it, as in load-images.sh.
+    '''
+
+    def __init__(self, bundle_dir):
+        self.bundle_dir = os.path.abspath(bundle_dir)
+        self.blob_dirs = get_bundle_blob_dirs(bundle_dir)
+
+    def exists(self, path):
+        ''' Return True if the bundle has a file. '''
+        return os.path.exists(os.path.join(self.bundle_dir, path))
+
+    def listdir(self, path):
+        ''' Return the names in a directory of the bundle. '''
+        return sorted(os.listdir(os.path.join(self.bundle_dir, path)))
+
+    def open(self, path):
+        ''' Open a file of the bundle for reading bytes. '''
+        return open(os.path.join(self.bundle_dir, path), "rb")
+
+    def size(self, path):
+        ''' Return the size of a file of the bundle. '''
+        return os.path.getsize(os.path.join(self.bundle_dir, path))
+
+    def find_blob(self, path):
+        ''' Return the path, for open() and size(), of a blob from the first blob directory that has it, or None. '''
+        for blob_dir in self.blob_dirs:
+            filename = os.path.join(blob_dir, path)
+            if os.path.exists(filename):
+                return os.path.relpath(filename, self.bundle_dir)
+        return None
+
+
+class BundleArchive:
+    ''' The files of an indexed bundle file, read in place. Paths are relative to the bundle directory in the archive.
+        Only the compressed members of the files that are opened are read, by seeking in the bundle or its volumes.
+    '''
+
+    def __init__(self, bundle_file):
+        with open(get_index_filename(bundle_file)) as a_file:
+            self.index = json.load(a_file)
+        self.volumes = []
+        offset = 0
+        volume_filenames = get_volume_filenames(bundle_file)
+        if not volume_filenames:
+            raise RuntimeError("{0} does not exist.".format(bundle_file))
+        for number, volume_filename in enumerate(volume_filenames):
+            if volume_filename not in [bundle_file, get_volume_filename(bundle_file, number)]:
+                raise RuntimeError("Volume {0} is missing.".format(get_volume_filename(bundle_file, number)))
+            volume_size = os.path.getsize(volume_filename)
+            self.volumes.append((offset, volume_size, volume_filename))
+            offset += volume_size
+
+    def get_entry(self, path):
+        ''' Return the index entry of a file, following symbolic links, or None. '''
+        entry = self.index.get("files").get(path)
+        for _ in range(len(self.index.get("files"))):
+            if not entry or "link" not in entry:
+                break
+            entry = self.index.get("files").get(entry.get("link"))
+        return entry
+
+    def read_range(self, offset, length):
+        ''' Yield the bytes at an offset of the bundle, reading across volumes. '''
+        for volume_offset, volume_size, volume_filename in self.volumes:
+            if length <= 0:
+                break
+            if offset >= volume_offset + volume_size:
+                continue
+            with open(volume_filename, "rb") as a_file:
+                a_file.seek(offset - volume_offset)
+                remaining = min(length, volume_offset + volume_size - offset)
+                while remaining:
+                    chunk = a_file.read(min(remaining, HTTP_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    yield chunk
+                    remaining -= len(chunk)
+                    offset += len(chunk)
+                    length -= len(chunk)
+        if length > 0:
+            raise RuntimeError("The bundle ends {0} bytes early. Is a volume missing?".format(length))
+
+    def iterate_file(self, path, entry):
+        ''' Yield the bytes of a file: the decompressed member without its tar header. '''
+        skip = entry.get("data_offset")
+        remaining = entry.get("size")
+        chunks = decompress_member(self.read_range(entry.get("offset"), entry.get("length")), self.index.get("compression"))
+        try:
+            for chunk in chunks:
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:skip + remaining]
+                skip = 0
+                remaining -= len(chunk)
+                yield chunk
+                if not remaining:
+                    break
+        finally:
+            chunks.close()
+        if remaining:
+            raise RuntimeError("{0} is damaged in the bundle.".format(path))
+
+    def exists(self, path):
+        ''' Return True if the bundle has a file. '''
+        return self.get_entry(path) is not None
+
+    def listdir(self, path):
+        ''' Return the names in a directory of the bundle. '''
+        prefix = path.rstrip("/") + "/"
+        return sorted({name[len(prefix):].split("/", 1)[0] for name in self.index.get("files") if name.startswith(prefix)})
+
+    def open(self, path):
+        ''' Open a file of the bundle for reading bytes. '''
+        entry = self.get_entry(path)
+        if not entry:
+            raise FileNotFoundError("{0} is not in the bundle.".format(path))
+        return io.BufferedReader(ChunkReader(self.iterate_file(path, entry)), HTTP_CHUNK_SIZE)
+
+    def size(self, path):
+        ''' Return the size of a file of the bundle. '''
+        return self.get_entry(path).get("size")
+
+    def find_blob(self, path):
+        ''' Return the path, for open() and size(), of a blob, or None. '''
+        path = "blobs/{0}".format(path)
+        return path if self.exists(path) else None
+
+
+def open_bundle(config):
+    ''' Return the bundle given by SENZING_INPUT_FILE, an indexed bundle file, or SENZING_INPUT_DIRECTORY, an extracted bundle. '''
+    if config.get('input_file'):
+        return BundleArchive(config.get('input_file'))
+    return BundleDirectory(config.get('input_directory'))
+
+
+def read_bundle_images(bundle):
+    ''' Return the (image_id, image, platform) of each line of images.txt. '''
+    result = []
+    with bundle.open("images.txt") as a_file:
+        for line in a_file.read().decode().splitlines():
+            if line.strip():
+                result.append(tuple((line.split() + [None])[:3]))
+    return result
+
+
+def select_bundle_images(bundle_images, selections=None, platform=None):
+    ''' Return the bundle images named, or identified by IMAGE_ID, in selections (all when there are none)
+        that run on a platform, comparing only os/arch as load-images.sh does. Also return the selections that match nothing.
+    '''
+    selections = selections or []
+    result = []
+    for image_id, image, image_platform in bundle_images:
+        if selections and image_id not in selections and image not in selections:
+            continue
+        if platform and image_platform and image_platform.split("/")[:2] != platform.split("/")[:2]:
+            continue
+        result.append((image_id, image, image_platform))
+    unmatched = [selection for selection in selections if not any(selection in bundle_image[:2] for bundle_image in bundle_images)]
+    return result, unmatched
+
+
+def get_docker_platform():
+    ''' Return the "os/arch" of the docker daemon, or None when docker does not say. '''
+    try:
+        result = subprocess.run(["docker", "version", "--format", "{{.Server.Os}}/{{.Server.Arch}}"], capture_output=True, check=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def add_bundle_file(tar_file, bundle, path, arcname):
+    ''' Add a file of a bundle to a tar stream. '''
+    tar_info = tarfile.TarInfo(arcname)
+    tar_info.size = bundle.size(path)
+    tar_info.mode = 0o644
+    tar_info.mtime = int(time.time())
+    with bundle.open(path) as a_file:
+        tar_file.addfile(tar_info, a_file)
+
+
+def load_bundle_image(bundle, image_id):
+    ''' Stream a "docker save" tar of one image of a bundle into "docker load", as load_image in load-images.sh does.
+        Return ("present", 0) if docker already has the image, which is then only tagged,
+        or ("loaded", SIZE), where SIZE is the bytes of the blobs that were loaded.
+    '''
+
+    manifest_dir = "manifests/{0}".format(image_id)
+    with bundle.open("{0}/manifest.json".format(manifest_dir)) as a_file:
+        docker_manifest = json.load(a_file)[0]
+    with bundle.open("{0}/blobs.txt".format(manifest_dir)) as a_file:
+        blob_paths = a_file.read().decode().split()
+
+    # An image whose image ID is already in docker is only tagged.
+
+    config_digest = "sha256:{0}".format(docker_manifest.get("Config", "").rsplit("/", 1)[-1])
+    if subprocess.run(["docker", "image", "inspect", config_digest], capture_output=True, check=False).returncode == 0:
+        for tag in docker_manifest.get("RepoTags") or []:
+            subprocess.run(["docker", "tag", config_digest, tag], capture_output=True, check=True)
+        return "present", 0
+
+    blobs = []
+    for blob_path in blob_paths:
+        blob = bundle.find_blob(blob_path)
+        if not blob:
+            raise RuntimeError("{0} is not in this bundle or a previous bundle.".format(blob_path))
+        blobs.append((blob, blob_path))
+
+    with subprocess.Popen(["docker", "load"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT) as process:
+        output_reader = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        output = output_reader.submit(process.stdout.read)
+        try:
+            with tarfile.open(fileobj=process.stdin, mode="w|") as tar_file:
+                for name in bundle.listdir(manifest_dir):
+                    if name != "blobs.txt":
+                        add_bundle_file(tar_file, bundle, "{0}/{1}".format(manifest_dir, name), name)
+                for blob, blob_path in blobs:
+                    add_bundle_file(tar_file, bundle, blob, blob_path)
+        except BrokenPipeError:
+            pass
+        finally:
+            with contextlib.suppress(BrokenPipeError):
+                process.stdin.close()
+            output_reader.shutdown()
+    if process.returncode != 0:
+        raise RuntimeError(output.result().decode().strip() or "docker load returned {0}".format(process.returncode))
+    return "loaded", sum(bundle.size(blob) for blob, _ in blobs)
+
+
+def load_bundle_images(config, bundle, bundle_images, metrics=None):
+    ''' Load images of a bundle into docker, SENZING_CONCURRENCY at a time. Return (results, failures), keyed by (image_id, platform),
+        as an image may be in a bundle for several platforms. "results" maps each to "loaded" or "present". The "load" stage is added to "metrics".
+    '''
+
+    metrics = metrics or RunMetrics()
+
+    def load(image_id):
+        start_time = time.time()
+        result, size = load_bundle_image(bundle, image_id)
+        if result == "loaded":
+            metrics.add("load", start_time, size, image_id)
+        return result
+
+    results = {}
+    failures = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.get('concurrency')) as executor:
+        futures = {(image_id, image, platform): executor.submit(load, image_id) for image_id, image, platform in bundle_images}
+        for (image_id, image, platform), future in futures.items():
+            try:
+                results[(image_id, platform)] = future.result()
+            except Exception as err:
+                failures[(image_id, platform)] = err
+            metrics.set_result(image_id, image, platform, results.get((image_id, platform), "failed"))
+    return results, failures
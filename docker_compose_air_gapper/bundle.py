@@ -0,0 +1,436 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/bundle.py
+#   Save the images of docker-compose files into a bundle, plan a bundle, and keep the blob cache.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import datetime
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+# Import from standard library and https://pypi.org/, when first used.
+
+from .common import concurrent
+
+# Import from docker_compose_air_gapper.
+
+from .archive import write_bundle_archive
+from .bundle_scripts import create_load_images_text
+from .common import MEGABYTES, message_debug, message_info, message_warning
+from .compose import create_docker_compose_files_text
+from .metrics import RunMetrics
+from .registry import (
+    DEFAULT_PLATFORM,
+    create_registry_client,
+    digest_path,
+    parse_image_reference,
+    resolve_images,
+)
+
+# -----------------------------------------------------------------------------
+# Blob cache functions
+#   Blobs downloaded by "save-images" are kept in SENZING_CACHE_DIR/blobs/sha256/<hex>,
+#   so later runs need not download them again. A blob's modification time is its last use.
+# -----------------------------------------------------------------------------
+
+
+def get_cached_blob_filename(cache_dir, digest):
+    ''' Return the location of a blob in the cache. '''
+    return os.path.join(os.path.expanduser(cache_dir), "blobs", digest_path(digest))
+
+
+def link_or_copy(source, destination):
+    ''' Hard link a file, or copy it when a hard link is not possible. Replaces "destination" atomically. '''
+    temporary_filename = "{0}.{1}.{2}".format(destination, os.getpid(), threading.get_ident())
+    try:
+        os.link(source, temporary_filename)
+    except OSError:
+        shutil.copyfile(source, temporary_filename)
+    os.replace(temporary_filename, destination)
+
+
+def get_blob_from_cache(cache_dir, digest, size, filename):
+    ''' Copy a blob from the cache to "filename". Return True if the cache had the blob with the expected size. '''
+    cached_filename = get_cached_blob_filename(cache_dir, digest)
+    try:
+        if size and os.path.getsize(cached_filename) != size:
+            return False
+        link_or_copy(cached_filename, filename)
+        os.utime(cached_filename)
+    except OSError:
+        return False
+    return True
+
+
+def add_blob_to_cache(cache_dir, digest, filename):
+    ''' Add a downloaded and verified blob to the cache. A cache that cannot be written is not an error. '''
+    cached_filename = get_cached_blob_filename(cache_dir, digest)
+    try:
+        os.makedirs(os.path.dirname(cached_filename), exist_ok=True)
+        link_or_copy(filename, cached_filename)
+    except OSError as err:
+        logging.debug(message_debug(903, filename, err))
+
+
+def get_cache_entries(cache_dir):
+    ''' Return (modification_time, size, filename) of each cached blob, least recently used first. '''
+    result = []
+    blobs_dir = os.path.join(os.path.expanduser(cache_dir), "blobs")
+    for directory, _, filenames in os.walk(blobs_dir):
+        for filename in filenames:
+            try:
+                stat = os.stat(os.path.join(directory, filename))
+            except OSError:
+                continue
+            result.append((stat.st_mtime, stat.st_size, os.path.join(directory, filename)))
+    return sorted(result)
+
+
+def prune_blob_cache(cache_dir, max_size):
+    ''' Remove least recently used blobs until the cache holds at most "max_size" bytes. Return (blobs_removed, bytes_removed). '''
+    entries = get_cache_entries(cache_dir)
+    total_size = sum(size for _, size, _ in entries)
+    blobs_removed = 0
+    bytes_removed = 0
+    for _, size, filename in entries:
+        if total_size - bytes_removed <= max_size:
+            break
+        try:
+            os.remove(filename)
+        except OSError:
+            continue
+        blobs_removed += 1
+        bytes_removed += size
+    return blobs_removed, bytes_removed
+
+# -----------------------------------------------------------------------------
+# Bundle functions
+#   A bundle is the directory (and its TGZ file) that is moved to the air-gapped system:
+#     blobs/                  Image layers and configurations, each stored once.
+#     manifests/IMAGE_ID/     "docker save" metadata per image and blobs.txt.
+#     images.txt              "IMAGE_ID DOCKER_IMAGE_NAME" per image.
+#     bundle-manifest.txt     Blobs on the air-gapped system after loading, for the next delta bundle.
+#     blobs.sha256            "sha256sum" checksums of the files in blobs/.
+#     journal.txt             Images saved by save-images.sh, used by RESUME_DIR.
+#     load-images.sh          Script to "docker load" the images.
+# -----------------------------------------------------------------------------
+
+
+def get_previous_blobs(config):
+    ''' Return the blobs listed in the "bundle-manifest.txt" of a previous bundle. '''
+    result = []
+    previous_bundle_manifest = config.get('previous_bundle_manifest')
+    if previous_bundle_manifest:
+        with open(previous_bundle_manifest) as a_file:
+            result = [line.strip() for line in a_file if line.strip()]
+    return result
+
+
+def get_image_id(image, platform=None):
+    ''' Same as "image_id" in save-images.sh. '''
+    if platform:
+        image = "{0}--{1}".format(image, platform)
+    return image.translate(str.maketrans("/:@", "---"))
+
+
+def write_image_manifests(bundle_dir, resolved_image, tags=None, image_id=None):
+    ''' Write manifests/IMAGE_ID for an image fetched from a registry, in the format of "docker save".
+        "tags" are the names of an image given by digest, as listed in a lock file.
+    '''
+
+    image = resolved_image.get("image")
+    image_reference = resolved_image.get("image_reference")
+    image_manifest_dir = os.path.join(bundle_dir, "manifests", image_id or get_image_id(image))
+    os.makedirs(image_manifest_dir, exist_ok=True)
+
+    manifest_path = digest_path(resolved_image.get("digest"))
+    config_path = digest_path(resolved_image.get("config").get("digest"))
+    layer_paths = [digest_path(layer.get("digest")) for layer in resolved_image.get("layers")]
+    repo_tags = list(tags or [])
+    if not repo_tags and image_reference.get("tag"):
+        repo_tags.append(image.split("@", 1)[0])
+
+    docker_manifest = [
+        {
+            "Config": config_path,
+            "RepoTags": repo_tags,
+            "Layers": layer_paths,
+        }
+    ]
+    oci_index = {
+        "schemaVersion": 2,
+        "mediaType": "application/vnd.oci.image.index.v1+json",
+        "manifests": [
+            {
+                "mediaType": resolved_image.get("media_type"),
+                "digest": resolved_image.get("digest"),
+                "size": len(resolved_image.get("manifest")),
+                "annotations": {
+                    "io.containerd.image.name": (repo_tags or [image])[0],
+                    "org.opencontainers.image.ref.name": parse_image_reference((repo_tags or [image])[0]).get("tag") or "",
+                },
+            }
+        ],
+    }
+    oci_layout = {
+        "imageLayoutVersion": "1.0.0",
+    }
+
+    with open(os.path.join(image_manifest_dir, "manifest.json"), "w") as a_file:
+        json.dump(docker_manifest, a_file)
+    with open(os.path.join(image_manifest_dir, "index.json"), "w") as a_file:
+        json.dump(oci_index, a_file)
+    with open(os.path.join(image_manifest_dir, "oci-layout"), "w") as a_file:
+        json.dump(oci_layout, a_file)
+    with open(os.path.join(image_manifest_dir, "blobs.txt"), "w") as a_file:
+        for path in sorted(set([manifest_path, config_path] + layer_paths)):
+            a_file.write("{0}\n".format(path))
+
+
+def write_resolved_manifests(resolved_images, blobs_dir):
+    ''' Write the manifests of resolved images into blobs_dir. Image manifests are small and written directly.
+        Return the unique blobs of the images, {digest: (image_reference, size, image_id)}.
+        Each blob has the ID of the first image that uses it, so it counts toward the metrics of that image.
+    '''
+
+    blobs = {}
+    for (image, platform), resolved_image in resolved_images.items():
+        manifest_filename = os.path.join(blobs_dir, digest_path(resolved_image.get("digest")))
+        os.makedirs(os.path.dirname(manifest_filename), exist_ok=True)
+        with open(manifest_filename, "wb") as a_file:
+            a_file.write(resolved_image.get("manifest"))
+        for descriptor in [resolved_image.get("config")] + resolved_image.get("layers"):
+            blobs.setdefault(descriptor.get("digest"), (resolved_image.get("image_reference"), descriptor.get("size", 0), get_image_id(image, platform)))
+    return blobs
+
+
+def download_blobs(config, registry_client, blobs_dir, missing_blobs, metrics):
+    ''' Download blobs into blobs_dir, running at most SENZING_CONCURRENCY downloads at a time.
+        "missing_blobs" is {digest: (image_reference, size, image_id)}. Return {digest: reason} for the blobs that could not be downloaded.
+        Blobs in the blob cache are linked or copied instead of downloaded.
+    '''
+
+    cache_dir = config.get('cache_dir')
+    use_cache = config.get('cache_max_size_in_megabytes') > 0
+
+    def download(digest, image_reference, size, image_id):
+        start_time = time.time()
+        filename = os.path.join(blobs_dir, digest_path(digest))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        if use_cache and get_blob_from_cache(cache_dir, digest, size, filename):
+            metrics.add("cache", start_time, size, image_id)
+            return size
+        registry_client.download_blob(image_reference, digest, filename)
+        metrics.add("pull", start_time, os.path.getsize(filename), image_id)
+        if use_cache:
+            add_blob_to_cache(cache_dir, digest, filename)
+        return None
+
+    failed_blobs = {}
+    cached_sizes = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.get('concurrency')) as executor:
+        futures = {digest: executor.submit(download, digest, *value) for digest, value in missing_blobs.items()}
+        for digest, future in futures.items():
+            try:
+                cached_size = future.result()
+                if cached_size is not None:
+                    cached_sizes.append(cached_size)
+            except Exception as err:
+                failed_blobs[digest] = err
+    if use_cache:
+        logging.info(message_info(106, len(cached_sizes), len(missing_blobs), sum(cached_sizes) / MEGABYTES))
+    return failed_blobs
+
+
+def write_bundle_files(bundle_dir, platforms, bundle_blobs, previous_blobs):
+    ''' Write platforms.txt, bundle-manifest.txt, blobs.sha256, and load-images.sh into a bundle directory. '''
+
+    with open(os.path.join(bundle_dir, "platforms.txt"), "w") as a_file:
+        for platform in platforms:
+            a_file.write("{0}\n".format(platform or DEFAULT_PLATFORM))
+
+    with open(os.path.join(bundle_dir, "bundle-manifest.txt"), "w") as a_file:
+        for blob in sorted(bundle_blobs):
+            a_file.write("{0}\n".format(blob))
+
+    # Write checksums of the blobs in this bundle, in "sha256sum" format. A verified blob's digest is its checksum.
+
+    with open(os.path.join(bundle_dir, "blobs.sha256"), "w") as a_file:
+        for blob in sorted(bundle_blobs - previous_blobs):
+            if blob.startswith("blobs/sha256/") and os.path.exists(os.path.join(bundle_dir, "blobs", blob)):
+                a_file.write("{0}  {1}\n".format(blob.rsplit("/", 1)[-1], blob))
+
+    load_images_filename = os.path.join(bundle_dir, "load-images.sh")
+    with open(load_images_filename, "w") as a_file:
+        a_file.write(create_load_images_text())
+    os.chmod(load_images_filename, 0o755)
+
+
+def save_images_to_directory(config, images, bundle_dir, image_tags=None, metrics=None):
+    ''' Fetch images from their registries into a bundle directory. Return a dictionary of images that failed.
+        The "resolve", "pull", "cache", and "save" stages are added to "metrics".
+    '''
+
+    metrics = metrics or RunMetrics()
+    blobs_dir = os.path.join(bundle_dir, "blobs")
+    previous_blobs = set(get_previous_blobs(config))
+    registry_client = create_registry_client(config)
+    platforms = config.get('platforms') or [None]
+
+    # Resolve image manifests.
+
+    logging.info(message_info(101, len(images)))
+    start_time = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.get('concurrency')) as executor:
+        resolved_images, failures = resolve_images(executor, registry_client, images, platforms)
+    metrics.add("resolve", start_time, sum(len(resolved_image.get("manifest")) for resolved_image in resolved_images.values()))
+
+    # Download unique blobs that are not already in this bundle or a previous bundle.
+
+    blobs = write_resolved_manifests(resolved_images, blobs_dir)
+    missing_blobs = {}
+    for digest, value in blobs.items():
+        if digest_path(digest) not in previous_blobs and not os.path.exists(os.path.join(blobs_dir, digest_path(digest))):
+            missing_blobs[digest] = value
+    missing_size = sum(size for _, size, _ in missing_blobs.values())
+    logging.info(message_info(102, len(missing_blobs), missing_size / MEGABYTES, len(resolved_images), len(blobs) - len(missing_blobs)))
+    failed_blobs = download_blobs(config, registry_client, blobs_dir, missing_blobs, metrics)
+    registry_client.close()
+
+    # Write image metadata and the list of images, in the original order.
+
+    for (image, _), resolved_image in resolved_images.items():
+        for descriptor in [resolved_image.get("config")] + resolved_image.get("layers"):
+            if descriptor.get("digest") in failed_blobs:
+                failures[image] = failed_blobs.get(descriptor.get("digest"))
+
+    bundle_blobs = set(previous_blobs)
+    with open(os.path.join(bundle_dir, "images.txt"), "w") as images_file:
+        for image in images:
+            if image in failures:
+                for platform in platforms:
+                    metrics.set_result(get_image_id(image, platform), image, platform or DEFAULT_PLATFORM, "failed")
+                continue
+            for platform in platforms:
+                image_id = get_image_id(image, platform)
+                start_time = time.time()
+                write_image_manifests(bundle_dir, resolved_images.get((image, platform)), (image_tags or {}).get(image), image_id)
+                image_manifest_dir = os.path.join(bundle_dir, "manifests", image_id)
+                metrics.add("save", start_time, sum(os.path.getsize(os.path.join(image_manifest_dir, name)) for name in os.listdir(image_manifest_dir)), image_id)
+                metrics.set_result(image_id, image, platform or DEFAULT_PLATFORM, "saved")
+                images_file.write("{0} {1} {2}\n".format(image_id, image, platform or DEFAULT_PLATFORM))
+                with open(os.path.join(bundle_dir, "manifests", image_id, "blobs.txt")) as blobs_file:
+                    bundle_blobs.update(line.strip() for line in blobs_file)
+
+    write_bundle_files(bundle_dir, platforms, bundle_blobs, previous_blobs)
+    return failures
+
+
+def save_bundle(config, image_lists, output_dir, output_file, metrics=None):
+    ''' Save images into output_dir and compress it into output_file. Return {image: reason} for the images that could not be saved.
+        "image_lists" holds the "images" to save, the "image_tags" of images given by digest, and the "images_by_file" of each docker-compose file.
+        The "compress" metric counts the bytes of output_dir, before compression.
+    '''
+
+    metrics = metrics or RunMetrics()
+    failures = save_images_to_directory(config, image_lists.get("images"), output_dir, image_lists.get("image_tags"), metrics)
+    with open(os.path.join(output_dir, "docker-compose-files.txt"), "w") as a_file:
+        a_file.write(create_docker_compose_files_text(image_lists.get("images_by_file") or {}))
+    if config.get('cache_max_size_in_megabytes') > 0:
+        prune_blob_cache(config.get('cache_dir'), config.get('cache_max_size_in_megabytes') * MEGABYTES)
+    for image, failure in failures.items():
+        logging.warning(message_warning(301, image, failure))
+    start_time = time.time()
+    compress_size = sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(output_dir) for name in names if not os.path.islink(os.path.join(path, name)))
+    write_bundle_archive(config, output_dir, output_file)
+    metrics.add("compress", start_time, compress_size)
+    return failures
+
+# -----------------------------------------------------------------------------
+# Plan functions
+#   A plan reports what a bundle would hold, using only image manifests.
+# -----------------------------------------------------------------------------
+
+
+def create_plan(config, images):
+    ''' Fetch the manifests of images and report the size of the bundle they would make. Return (plan, failures).
+        Sizes are the compressed sizes in the registry, close to the size of the compressed bundle.
+    '''
+
+    bandwidth_in_megabits_per_second = config.get('bandwidth_in_megabits_per_second')
+    previous_blobs = set(get_previous_blobs(config))
+    registry_client = create_registry_client(config)
+    platforms = config.get('platforms') or [None]
+
+    logging.info(message_info(101, len(images)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.get('concurrency')) as executor:
+        resolved_images, failures = resolve_images(executor, registry_client, images, platforms)
+    registry_client.close()
+
+    # Find the images that use each blob.
+
+    blob_sizes = {}
+    blob_images = {}
+    for (image, platform), resolved_image in resolved_images.items():
+        blob_sizes[resolved_image.get("digest")] = len(resolved_image.get("manifest"))
+        blob_images.setdefault(resolved_image.get("digest"), []).append(get_image_id(image, platform))
+        for descriptor in [resolved_image.get("config")] + resolved_image.get("layers"):
+            blob_sizes[descriptor.get("digest")] = descriptor.get("size", 0)
+            image_ids = blob_images.setdefault(descriptor.get("digest"), [])
+            if get_image_id(image, platform) not in image_ids:
+                image_ids.append(get_image_id(image, platform))
+    new_blobs = [digest for digest in blob_sizes if digest_path(digest) not in previous_blobs]
+
+    # Report each image. "unique_size" counts blobs that no other image uses.
+
+    plan_images = []
+    for (image, platform), resolved_image in resolved_images.items():
+        digests = [resolved_image.get("digest"), resolved_image.get("config").get("digest")] + [layer.get("digest") for layer in resolved_image.get("layers")]
+        plan_images.append({
+            "compressed_size": sum(blob_sizes.get(digest) for digest in digests),
+            "digest": resolved_image.get("digest"),
+            "image": image,
+            "image_id": get_image_id(image, platform),
+            "layers": len(resolved_image.get("layers")),
+            "platform": platform or DEFAULT_PLATFORM,
+            "unique_size": sum(blob_sizes.get(digest) for digest in digests if len(blob_images.get(digest)) == 1),
+        })
+
+    shared_layers = []
+    for digest, image_ids in blob_images.items():
+        if len(image_ids) > 1:
+            shared_layers.append({
+                "digest": digest,
+                "images": image_ids,
+                "size": blob_sizes.get(digest),
+            })
+    shared_layers.sort(key=lambda shared_layer: shared_layer.get("size") * (len(shared_layer.get("images")) - 1), reverse=True)
+
+    # Totals. Each blob is transferred once, unless it is already in a previous bundle.
+
+    compressed_size = sum(blob_sizes.get(digest) for digest in new_blobs)
+    plan = {
+        "bandwidth_in_megabits_per_second": bandwidth_in_megabits_per_second,
+        "created_on": datetime.datetime.now().astimezone().isoformat(sep=" ", timespec="seconds"),
+        "failures": {image: str(failure) for image, failure in failures.items()},
+        "images": plan_images,
+        "shared_layers": shared_layers,
+        "total": {
+            "blobs": len(new_blobs),
+            "blobs_in_previous_bundle": len(blob_sizes) - len(new_blobs),
+            "compressed_size": compressed_size,
+            "compressed_size_without_sharing": sum(plan_image.get("compressed_size") for plan_image in plan_images),
+            "estimated_transfer_time_in_seconds": round(compressed_size * 8 / (bandwidth_in_megabits_per_second * 1000 * 1000), 1),
+            "images": len(plan_images),
+            "largest_image_compressed_size": max([plan_image.get("compressed_size") for plan_image in plan_images] or [0]),
+            "shared_size": sum(shared_layer.get("size") * (len(shared_layer.get("images")) - 1) for shared_layer in shared_layers),
+        },
+    }
+    return plan, failures
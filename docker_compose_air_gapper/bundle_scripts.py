@@ -0,0 +1,504 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/bundle_scripts.py
+#   The scripts a bundle holds: load-images.sh, the verify script of its volumes, and the metrics script.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import datetime
+
+# Import from docker_compose_air_gapper.
+
+from .common import replace_variables_in_text
+
+# -----------------------------------------------------------------------------
+# Text functions
+# -----------------------------------------------------------------------------
+
+
+def file_text_for_load_images_header():
+    """#!/usr/bin/env bash
+
+# 'load-images.sh' uses 'docker load' to import images into local registry.
+# Created on {created_on}
+"""
+    return 0
+
+
+def file_text_for_load_images():
+    """
+# Images are rebuilt from the layer-deduplicated bundle:
+#  - images.txt lists "IMAGE_ID DOCKER_IMAGE_NAME [PLATFORM]" for each image.
+#  - platforms.txt, if present, lists the platforms the images were saved for.
+#  - manifests/IMAGE_ID holds the "docker save" metadata for the image.
+#  - manifests/IMAGE_ID/blobs.txt lists the files in "blobs" used by the image.
+# Blobs that are not in this bundle are found in previous bundles, which are
+# either given as arguments or extracted next to this bundle.
+# A bundle created with STREAM=true is a "docker save" archive that "docker load"
+# reads directly, so it does not need to be extracted. Its compression is detected automatically.
+# Before any image is loaded, the blobs in this bundle are checked against blobs.sha256,
+# using up to CONCURRENCY "sha256sum" processes. Set VERIFY=false to skip the check.
+# Then up to CONCURRENCY images are loaded at the same time. An image whose image ID
+# is already in docker is only tagged. A summary shows how long each image took.
+# With METRICS_FILE set, a JSON report of the duration, bytes, and MB/s of loading each image,
+# and of verifying the blobs, is written to it. With PROMETHEUS_FILE set, the same metrics
+# are written as a Prometheus textfile.
+#
+# Usage: load-images.sh [PREVIOUS_BUNDLE_DIR ...]
+#        load-images.sh docker-compose-air-gapper-0000000000.tgz
+
+set -o pipefail
+
+# Make input variables.
+
+INPUT_DIR=$(cd "$(dirname "${{BASH_SOURCE[0]}}")" && pwd)
+INPUT_BLOBS_DIR=${{INPUT_DIR}}/blobs
+INPUT_MANIFESTS_DIR=${{INPUT_DIR}}/manifests
+INPUT_IMAGES_FILE=${{INPUT_DIR}}/images.txt
+INPUT_PLATFORMS_FILE=${{INPUT_DIR}}/platforms.txt
+INPUT_CHECKSUMS_FILE=${{INPUT_DIR}}/blobs.sha256
+
+# Make processing variables.
+
+CONCURRENCY=${{CONCURRENCY:-4}}
+VERIFY=${{VERIFY:-true}}
+METRICS_FILE=${{METRICS_FILE:-}}
+PROMETHEUS_FILE=${{PROMETHEUS_FILE:-}}
+
+# Define return codes.
+
+OK=0
+NOT_OK=1
+
+{metrics_functions}
+# Identify the platform of the docker daemon as "os/arch[/variant]". Set PLATFORM to override.
+
+PLATFORM=${{PLATFORM:-$(docker version --format "{{{{.Server.Os}}}}/{{{{.Server.Arch}}}}" 2>/dev/null)}}
+
+# Succeed if an image saved for a platform runs on PLATFORM. Variants are not compared.
+
+platform_matches() {{
+  local IMAGE_PLATFORM=$1
+  [ -z "${{IMAGE_PLATFORM}}" ] || [ -z "${{PLATFORM}}" ] || [ "$(echo ${{IMAGE_PLATFORM}} | cut -d / -f 1-2)" == "$(echo ${{PLATFORM}} | cut -d / -f 1-2)" ]
+}}
+
+# Refuse a bundle saved for other platforms before loading anything.
+
+if [ -f ${{INPUT_PLATFORMS_FILE}} ]; then
+  PLATFORM_FOUND=false
+  for IMAGE_PLATFORM in $(cat ${{INPUT_PLATFORMS_FILE}});
+  do
+    if platform_matches ${{IMAGE_PLATFORM}}; then
+      PLATFORM_FOUND=true
+    fi
+  done
+  if [ ${{PLATFORM_FOUND}} = false ]; then
+    echo "Error: Images in this bundle are for $(paste -s -d " " ${{INPUT_PLATFORMS_FILE}}), but docker runs on ${{PLATFORM}}."
+    exit ${{NOT_OK}}
+  fi
+fi
+
+# Identify the program that decompresses a file, by its "magic number".
+
+decompress_command() {{
+  case $(head -c 4 $1 | od -An -tx1 | tr -d " \n") in
+    1f8b*)
+      if command -v pigz > /dev/null; then
+        echo "pigz --decompress --stdout"
+      else
+        echo "gzip --decompress --stdout"
+      fi
+      ;;
+    28b52ffd)
+      echo "zstd --decompress --stdout --quiet"
+      ;;
+    *)
+      echo "cat"
+      ;;
+  esac
+}}
+
+# Load a bundle created with STREAM=true.
+
+if [ -f "$1" ]; then
+  echo "Loading images from $1"
+  $(decompress_command $1) < $1 | docker load
+  exit $?
+fi
+
+if [ ! -d ${{INPUT_MANIFESTS_DIR}} ] && [ -f ${{INPUT_DIR}}/manifest.json ]; then
+  echo "Loading images from ${{INPUT_DIR}}"
+  tar --create --file - --directory ${{INPUT_DIR}} $(ls ${{INPUT_DIR}} | grep -v -e "^load-images.sh$" -e "^images.txt$" -e "^docker-compose-files.txt$" -e "^platforms.txt$") | docker load
+  exit $?
+fi
+
+# Enumerate directories holding blobs. This bundle's blobs are used first.
+
+BLOB_DIRS=(${{INPUT_BLOBS_DIR}})
+for PREVIOUS_BUNDLE_DIR in "$@" ${{INPUT_DIR}}/../docker-compose-air-gapper-*/;
+do
+  PREVIOUS_BUNDLE_DIR=$(cd ${{PREVIOUS_BUNDLE_DIR}} 2>/dev/null && pwd)
+  if [ -d "${{PREVIOUS_BUNDLE_DIR}}/blobs" ] && [ "${{PREVIOUS_BUNDLE_DIR}}" != "${{INPUT_DIR}}" ]; then
+    BLOB_DIRS+=(${{PREVIOUS_BUNDLE_DIR}}/blobs)
+  fi
+done
+
+# Stream a "docker save" tar of a single image into "docker load".
+# Each blob is taken from the first directory in BLOB_DIRS that has it.
+# The "load" metric counts the bytes of the blobs.
+
+load_image() {{
+  local IMAGE_ID=$1
+  local IMAGE_MANIFEST_DIR=${{INPUT_MANIFESTS_DIR}}/${{IMAGE_ID}}
+  local METADATA_FILES=$(cd ${{IMAGE_MANIFEST_DIR}} && ls | grep -v "^blobs.txt$")
+  local BLOB_LISTS_DIR=$(mktemp -d)
+  local TAR_ARGUMENTS=(--directory ${{IMAGE_MANIFEST_DIR}} ${{METADATA_FILES}})
+  local START_MILLISECONDS=$(now_milliseconds)
+  local LOAD_BYTES=0
+  local BLOB BLOB_DIR_INDEX FOUND RETURN_CODE
+
+  while read BLOB;
+  do
+    FOUND=false
+    for BLOB_DIR_INDEX in ${{!BLOB_DIRS[@]}};
+    do
+      if [ -e ${{BLOB_DIRS[${{BLOB_DIR_INDEX}}]}}/${{BLOB}} ]; then
+        echo ${{BLOB}} >> ${{BLOB_LISTS_DIR}}/${{BLOB_DIR_INDEX}}
+        FOUND=true
+        break
+      fi
+    done
+    if [ ${{FOUND}} = false ]; then
+      echo "Error: ${{BLOB}} is not in this bundle or a previous bundle."
+      rm -rf ${{BLOB_LISTS_DIR}}
+      return ${{NOT_OK}}
+    fi
+  done < ${{IMAGE_MANIFEST_DIR}}/blobs.txt
+
+  for BLOB_DIR_INDEX in ${{!BLOB_DIRS[@]}};
+  do
+    if [ -f ${{BLOB_LISTS_DIR}}/${{BLOB_DIR_INDEX}} ]; then
+      TAR_ARGUMENTS+=(--directory ${{BLOB_DIRS[${{BLOB_DIR_INDEX}}]}} --files-from ${{BLOB_LISTS_DIR}}/${{BLOB_DIR_INDEX}})
+      LOAD_BYTES=$(( LOAD_BYTES + $(cd ${{BLOB_DIRS[${{BLOB_DIR_INDEX}}]}} && xargs -r stat --dereference --format %s < ${{BLOB_LISTS_DIR}}/${{BLOB_DIR_INDEX}} | awk '{{total += $1}} END {{print total + 0}}') ))
+    fi
+  done
+
+  tar --create --file - --no-recursion "${{TAR_ARGUMENTS[@]}}" | docker load
+  RETURN_CODE=$?
+  if [ ${{RETURN_CODE}} -eq ${{OK}} ]; then
+    record_metric ${{IMAGE_ID}} load ${{START_MILLISECONDS}} ${{LOAD_BYTES}}
+  fi
+  rm -rf ${{BLOB_LISTS_DIR}}
+  return ${{RETURN_CODE}}
+}}
+
+# Check the blobs in this bundle against the checksums recorded when they were saved,
+# in CONCURRENCY parts at the same time. Nothing is loaded if a blob is damaged or missing.
+
+RESULTS_DIR=$(mktemp -d)
+trap "rm -rf ${{RESULTS_DIR}}" EXIT
+METRICS_DIR=${{RESULTS_DIR}}
+RUN_START_MILLISECONDS=$(now_milliseconds)
+
+if [ "${{VERIFY}}" == "true" ] && [ -s ${{INPUT_CHECKSUMS_FILE}} ]; then
+  echo "Verifying $(wc -l < ${{INPUT_CHECKSUMS_FILE}}) blobs in ${{INPUT_BLOBS_DIR}}"
+  split --number=l/${{CONCURRENCY}} --numeric-suffixes ${{INPUT_CHECKSUMS_FILE}} ${{RESULTS_DIR}}/checksums.
+  for CHECKSUMS_PART in ${{RESULTS_DIR}}/checksums.*;
+  do
+    (cd ${{INPUT_BLOBS_DIR}} && sha256sum --check --quiet ${{CHECKSUMS_PART}} 2>/dev/null | sed "s/: .*//" > ${{CHECKSUMS_PART}}.failed) &
+  done
+  wait
+  BAD_BLOBS=($(cat ${{RESULTS_DIR}}/checksums.*.failed))
+  if [ ${{#BAD_BLOBS[@]}} -gt 0 ]; then
+    for BAD_BLOB in ${{BAD_BLOBS[@]}};
+    do
+      echo "Error: ${{BAD_BLOB}} is damaged or missing. Used by: $(grep -l -x ${{BAD_BLOB}} ${{INPUT_MANIFESTS_DIR}}/*/blobs.txt | xargs -r -n 1 dirname | xargs -r -n 1 basename | paste -s -d " ")"
+    done
+    echo "Error: ${{#BAD_BLOBS[@]}} blobs do not match blobs.sha256. No images were loaded."
+    exit ${{NOT_OK}}
+  fi
+  record_metric run verify ${{RUN_START_MILLISECONDS}} $(du --bytes --summarize --dereference ${{INPUT_BLOBS_DIR}} | cut -f 1)
+fi
+
+# Print the IDs an image may have in docker: the digest of its config
+# (docker's classic image store) and the digests in its index.json (containerd image store).
+
+image_digests() {{
+  local IMAGE_MANIFEST_DIR=$1
+  grep -o '"Config": *"[^"]*"' ${{IMAGE_MANIFEST_DIR}}/manifest.json | sed 's|.*/||; s|"||g; s|^|sha256:|'
+  grep -o '"digest": *"sha256:[0-9a-f]*"' ${{IMAGE_MANIFEST_DIR}}/index.json 2>/dev/null | sed 's|.*: *||; s|"||g'
+}}
+
+# Print the tags of an image, from the "RepoTags" of its manifest.json.
+
+image_tags() {{
+  local IMAGE_MANIFEST_DIR=$1
+  grep -o '"RepoTags": *\\[[^]]*\\]' ${{IMAGE_MANIFEST_DIR}}/manifest.json | grep -o '"[^"]*"' | tail -n +2 | tr -d '"'
+}}
+
+# Load a single image, unless docker already has it, in which case only tag it.
+# The result and elapsed milliseconds are kept in "RESULTS_DIR/IMAGE_ID.result".
+
+process_image() {{
+  local IMAGE_ID=$1
+  local DOCKER_IMAGE_NAME=$2
+  local IMAGE_PLATFORM=$3
+  local IMAGE_MANIFEST_DIR=${{INPUT_MANIFESTS_DIR}}/${{IMAGE_ID}}
+  local START_TIME=$(date +%s%N)
+  local RESULT=failed
+  local DIGEST TAG
+
+  for DIGEST in $(image_digests ${{IMAGE_MANIFEST_DIR}});
+  do
+    if docker image inspect --format "{{{{.Id}}}}" ${{DIGEST}} > /dev/null 2>&1; then
+      RESULT=present
+      for TAG in $(image_tags ${{IMAGE_MANIFEST_DIR}});
+      do
+        docker tag ${{DIGEST}} ${{TAG}} || RESULT=failed
+      done
+      echo "Skipping ${{DOCKER_IMAGE_NAME}} ${{IMAGE_PLATFORM}}. Already in docker as ${{DIGEST}}"
+      break
+    fi
+  done
+
+  if [ ${{RESULT}} == failed ]; then
+    echo "Loading ${{DOCKER_IMAGE_NAME}} ${{IMAGE_PLATFORM}}"
+    if load_image ${{IMAGE_ID}}; then
+      RESULT=loaded
+    else
+      echo "Error: Could not load ${{DOCKER_IMAGE_NAME}}"
+    fi
+  fi
+  echo "${{RESULT}} $(( ($(date +%s%N) - START_TIME) / 1000000 ))" > ${{RESULTS_DIR}}/${{IMAGE_ID}}.result
+}}
+
+# Load images, running at most CONCURRENCY "process_image" jobs at a time.
+
+LOAD_START_TIME=$(date +%s%N)
+while read IMAGE_ID DOCKER_IMAGE_NAME IMAGE_PLATFORM;
+do
+  if ! platform_matches "${{IMAGE_PLATFORM}}"; then
+    echo "Skipping ${{DOCKER_IMAGE_NAME}} for ${{IMAGE_PLATFORM}}"
+    echo "other-platform 0" > ${{RESULTS_DIR}}/${{IMAGE_ID}}.result
+    continue
+  fi
+  while [ $(jobs -r -p | wc -l) -ge ${{CONCURRENCY}} ];
+  do
+    wait -n
+  done
+  process_image ${{IMAGE_ID}} ${{DOCKER_IMAGE_NAME}} ${{IMAGE_PLATFORM}} &
+done < ${{INPUT_IMAGES_FILE}}
+wait
+
+# Summarize, in images.txt order. The result of each image is recorded for METRICS_FILE.
+
+RETURN_CODE=${{OK}}
+echo ""
+printf "%-16s %10s  %s\n" "RESULT" "SECONDS" "IMAGE"
+while read IMAGE_ID DOCKER_IMAGE_NAME IMAGE_PLATFORM;
+do
+  read RESULT MILLISECONDS 2>/dev/null < ${{RESULTS_DIR}}/${{IMAGE_ID}}.result
+  if [ "${{RESULT:-failed}}" == failed ]; then
+    RETURN_CODE=${{NOT_OK}}
+  fi
+  printf "%-16s %6d.%03d  %s\n" "${{RESULT:-failed}}" $(( ${{MILLISECONDS:-0}} / 1000 )) $(( ${{MILLISECONDS:-0}} % 1000 )) "${{DOCKER_IMAGE_NAME}} ${{IMAGE_PLATFORM}}"
+  echo "${{IMAGE_ID}} ${{RESULT:-failed}} ${{DOCKER_IMAGE_NAME}}${{IMAGE_PLATFORM:+ ${{IMAGE_PLATFORM}}}}" >> ${{METRICS_DIR}}/images.txt
+  RESULT=""
+  MILLISECONDS=""
+done < ${{INPUT_IMAGES_FILE}}
+LOAD_MILLISECONDS=$(( ($(date +%s%N) - LOAD_START_TIME) / 1000000 ))
+printf "%-16s %6d.%03d\n" "total" $(( LOAD_MILLISECONDS / 1000 )) $(( LOAD_MILLISECONDS % 1000 ))
+write_metrics load-images.sh ${{RUN_START_MILLISECONDS}}
+
+exit ${{RETURN_CODE}}
+"""
+    return 0
+
+# -----------------------------------------------------------------------------
+# Text functions
+# -----------------------------------------------------------------------------
+
+
+def file_text_for_metrics():
+    """# Record metrics in METRICS_DIR. Each stage of an image adds "STAGE MILLISECONDS BYTES" to METRICS_DIR/IMAGE_ID.metrics
+# and each stage of the whole run adds the same to METRICS_DIR/run.metrics.
+# METRICS_DIR/images.txt lists "IMAGE_ID RESULT DOCKER_IMAGE_NAME [PLATFORM]" for each image.
+
+now_milliseconds() {{
+  date +%s%3N
+}}
+
+record_metric() {{
+  local NAME=$1
+  local STAGE=$2
+  local START_MILLISECONDS=$3
+  local BYTES=$4
+  echo "${{STAGE}} $(( $(now_milliseconds) - START_MILLISECONDS )) ${{BYTES:-0}}" >> ${{METRICS_DIR}}/${{NAME}}.metrics
+}}
+
+# Write the metrics in METRICS_DIR as a JSON report to METRICS_FILE, and as a Prometheus textfile to PROMETHEUS_FILE.
+# The Prometheus textfile is renamed into place, so a collector never reads part of it.
+
+write_metrics() {{
+  local COMMAND=$1
+  local START_MILLISECONDS=$2
+  if [ -z "${{METRICS_FILE}}" ] && [ -z "${{PROMETHEUS_FILE}}" ]; then
+    return ${{OK}}
+  fi
+  touch ${{METRICS_DIR}}/images.txt
+  awk \\
+    -v command=${{COMMAND}} \\
+    -v created_on=$(date -u +%Y-%m-%dT%H:%M:%SZ) \\
+    -v duration=$(( $(now_milliseconds) - START_MILLISECONDS )) \\
+    -v metrics_dir=${{METRICS_DIR}} \\
+    -v prometheus_file=${{PROMETHEUS_FILE:+${{PROMETHEUS_FILE}}.$$}} \\
+    '
+    function stages(metrics_file, labels,    line, fields, result, separator) {{
+      while ((getline line < metrics_file) > 0) {{
+        split(line, fields, " ")
+        result = result separator sprintf("\\"%s\\": {{\\"bytes\\": %d, \\"duration_seconds\\": %.3f, \\"megabytes_per_second\\": %.2f}}", fields[1], fields[3], fields[2] / 1000, fields[2] > 0 ? fields[3] / 1048576 / (fields[2] / 1000) : 0)
+        separator = ", "
+        durations = durations sprintf("docker_compose_air_gapper_stage_duration_seconds{{%sstage=\\"%s\\"}} %.3f\\n", labels, fields[1], fields[2] / 1000)
+        sizes = sizes sprintf("docker_compose_air_gapper_stage_bytes{{%sstage=\\"%s\\"}} %d\\n", labels, fields[1], fields[3])
+      }}
+      close(metrics_file)
+      return result
+    }}
+    BEGIN {{
+      printf "{{\\n    \\"command\\": \\"%s\\",\\n    \\"created_on\\": \\"%s\\",\\n    \\"duration_seconds\\": %.3f,\\n    \\"images\\": [", command, created_on, duration / 1000
+    }}
+    {{
+      labels = sprintf("command=\\"%s\\",image=\\"%s\\",platform=\\"%s\\",", command, $3, $4)
+      printf "%s\\n        {{\\"image\\": \\"%s\\", \\"image_id\\": \\"%s\\", \\"platform\\": \\"%s\\", \\"result\\": \\"%s\\", \\"stages\\": {{%s}}}}", separator, $3, $1, $4, $2, stages(metrics_dir "/" $1 ".metrics", labels)
+      separator = ","
+      results[$2]++
+    }}
+    END {{
+      printf "\\n    ],\\n    \\"stages\\": {{%s}}\\n}}\\n", stages(metrics_dir "/run.metrics", sprintf("command=\\"%s\\",", command))
+      if (prometheus_file != "") {{
+        print "# HELP docker_compose_air_gapper_stage_duration_seconds Duration of a stage of an image or of the whole run." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_stage_duration_seconds gauge" > prometheus_file
+        printf "%s", durations > prometheus_file
+        print "# HELP docker_compose_air_gapper_stage_bytes Bytes handled by a stage of an image or of the whole run." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_stage_bytes gauge" > prometheus_file
+        printf "%s", sizes > prometheus_file
+        print "# HELP docker_compose_air_gapper_images Images by result." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_images gauge" > prometheus_file
+        for (result in results) {{
+          printf "docker_compose_air_gapper_images{{command=\\"%s\\",result=\\"%s\\"}} %d\\n", command, result, results[result] > prometheus_file
+        }}
+        print "# HELP docker_compose_air_gapper_run_duration_seconds Duration of the whole run." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_run_duration_seconds gauge" > prometheus_file
+        printf "docker_compose_air_gapper_run_duration_seconds{{command=\\"%s\\"}} %.3f\\n", command, duration / 1000 > prometheus_file
+      }}
+    }}
+    ' ${{METRICS_DIR}}/images.txt > ${{METRICS_FILE:-/dev/null}}
+  if [ -n "${{PROMETHEUS_FILE}}" ]; then
+    mv ${{PROMETHEUS_FILE}}.$$ ${{PROMETHEUS_FILE}}
+  fi
+}}
+"""
+    return 0
+
+
+def file_text_for_verify_volumes():
+    """#!/usr/bin/env bash
+
+# 'NAME.verify.sh' checks the volumes of a bundle, NAME.0000, NAME.0001, ...,
+# against the checksums in NAME.sha256 that were recorded when the volumes were written.
+# Up to CONCURRENCY volumes are checked at the same time. Default: the number of CPUs.
+# Volumes that are missing or damaged are listed, so that only they need to be sent again.
+# When every volume is good and OUTPUT_DIRECTORY is given, the volumes are joined and extracted into it.
+# To load a bundle created with STREAM=true, join the volumes with "cat NAME.[0-9][0-9][0-9][0-9] > NAME" instead.
+#
+# Usage: NAME.verify.sh [OUTPUT_DIRECTORY]
+
+set -o pipefail
+
+# Make input variables.
+
+INPUT_FILE=${{0%.verify.sh}}
+INPUT_DIR=$(cd "$(dirname "${{INPUT_FILE}}")" && pwd)
+INPUT_CHECKSUMS_FILE=${{INPUT_DIR}}/$(basename ${{INPUT_FILE}}).sha256
+OUTPUT_DIRECTORY=${{1:+$(mkdir -p $1 && cd $1 && pwd)}}
+CONCURRENCY=${{CONCURRENCY:-$(nproc)}}
+RESULTS_DIR=$(mktemp -d)
+
+# Define return codes.
+
+OK=0
+NOT_OK=1
+
+# Check each volume, running at most CONCURRENCY checks at a time.
+# The return code of each check is kept in "RESULTS_DIR/VOLUME.rc".
+
+VOLUMES=($(awk '{{print $2}}' ${{INPUT_CHECKSUMS_FILE}}))
+echo "Verifying ${{#VOLUMES[@]}} volumes in ${{INPUT_DIR}}"
+cd ${{INPUT_DIR}}
+for VOLUME in ${{VOLUMES[@]}};
+do
+  while [ $(jobs -r -p | wc -l) -ge ${{CONCURRENCY}} ];
+  do
+    wait -n
+  done
+  (awk -v volume=${{VOLUME}} '$2 == volume' ${{INPUT_CHECKSUMS_FILE}} | sha256sum --check --quiet --status 2>/dev/null; echo $? > ${{RESULTS_DIR}}/${{VOLUME}}.rc) &
+done
+wait
+
+# Report volumes to send again.
+
+BAD_VOLUMES=()
+for VOLUME in ${{VOLUMES[@]}};
+do
+  if [ ! -f ${{VOLUME}} ]; then
+    BAD_VOLUMES+=(${{VOLUME}})
+    echo "Missing: ${{VOLUME}}"
+  elif [ "$(cat ${{RESULTS_DIR}}/${{VOLUME}}.rc)" != "${{OK}}" ]; then
+    BAD_VOLUMES+=(${{VOLUME}})
+    echo "Damaged: ${{VOLUME}}"
+  fi
+done
+rm -rf ${{RESULTS_DIR}}
+
+if [ ${{#BAD_VOLUMES[@]}} -gt 0 ]; then
+  echo "Error: ${{#BAD_VOLUMES[@]}} of ${{#VOLUMES[@]}} volumes must be sent again:"
+  printf "    %s\n" ${{BAD_VOLUMES[@]}}
+  exit ${{NOT_OK}}
+fi
+echo "All ${{#VOLUMES[@]}} volumes are good."
+
+# Identify the program that decompresses the bundle, by the "magic number" of its first volume.
+
+case $(head -c 4 ${{VOLUMES[0]}} | od -An -tx1 | tr -d " \n") in
+  1f8b*)
+    DECOMPRESS_COMMAND="gzip --decompress --stdout"
+    if command -v pigz > /dev/null; then
+      DECOMPRESS_COMMAND="pigz --decompress --stdout"
+    fi
+    ;;
+  28b52ffd)
+    DECOMPRESS_COMMAND="zstd --decompress --stdout --quiet"
+    ;;
+  *)
+    DECOMPRESS_COMMAND="cat"
+    ;;
+esac
+
+# Join and extract the volumes.
+
+if [ -n "${{OUTPUT_DIRECTORY}}" ]; then
+  echo "Extracting into ${{OUTPUT_DIRECTORY}}"
+  cat ${{VOLUMES[@]}} | ${{DECOMPRESS_COMMAND}} | tar --extract --ignore-zeros --file - --directory ${{OUTPUT_DIRECTORY}} || exit ${{NOT_OK}}
+fi
+"""
+    return 0
+
+
+def create_load_images_text():
+    ''' Create the text of load-images.sh. '''
+    variables = {
+        "created_on": datetime.datetime.now().astimezone().isoformat(sep=" ", timespec="seconds"),
+    }
+    return replace_variables_in_text(file_text_for_load_images_header, variables) + replace_variables_in_text(file_text_for_load_images, {"metrics_functions": replace_variables_in_text(file_text_for_metrics, {})})
@@ -0,0 +1,613 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/cli.py
+#   The subcommands of the program and its main function.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import signal
+import sys
+import time
+import zlib
+
+# Import from standard library and https://pypi.org/, when first used.
+
+from .common import http, tarfile
+
+# Import from docker_compose_air_gapper.
+
+from .common import (
+    LOG_FORMAT,
+    MEGABYTES,
+    LazyModule,
+    __updated__,
+    __version__,
+    bootstrap_signal_handler,
+    create_signal_handler_function,
+    exit_error,
+    exit_silently,
+    message_debug,
+    message_info,
+    message_warning,
+)
+from .parser import get_parser
+
+# Import from docker_compose_air_gapper, when first used, so that each subcommand imports only the modules it uses.
+
+archive = LazyModule("docker_compose_air_gapper.archive")
+bundle = LazyModule("docker_compose_air_gapper.bundle")
+compose = LazyModule("docker_compose_air_gapper.compose")
+configuration = LazyModule("docker_compose_air_gapper.configuration")
+merge = LazyModule("docker_compose_air_gapper.merge")
+metrics = LazyModule("docker_compose_air_gapper.metrics")
+push = LazyModule("docker_compose_air_gapper.push")
+registry = LazyModule("docker_compose_air_gapper.registry")
+save_images_script = LazyModule("docker_compose_air_gapper.save_images_script")
+serve = LazyModule("docker_compose_air_gapper.serve")
+shard = LazyModule("docker_compose_air_gapper.shard")
+watch = LazyModule("docker_compose_air_gapper.watch")
+
+# -----------------------------------------------------------------------------
+# do_* functions
+#   Common function signature: do_XXX(args)
+# -----------------------------------------------------------------------------
+
+
+def do_docker_acceptance_test(subcommand, args):
+    ''' For use with Docker acceptance testing. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_cache_stats(subcommand, args):
+    ''' Report on the blob cache. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Report.
+
+    entries = bundle.get_cache_entries(config.get('cache_dir'))
+    logging.info(message_info(107, os.path.expanduser(config.get('cache_dir')), len(entries), sum(size for _, size, _ in entries) / MEGABYTES, config.get('cache_max_size_in_megabytes')))
+    if entries:
+        logging.info(message_info(108, datetime.datetime.fromtimestamp(entries[0][0]).isoformat(sep=" ", timespec="seconds"), datetime.datetime.fromtimestamp(entries[-1][0]).isoformat(sep=" ", timespec="seconds")))
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_create_lock_file(subcommand, args):
+    ''' Create a lock file that maps each image to a content digest. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Resolve images to digests. Services without an "image" cannot be resolved.
+
+    images = [image for image in compose.get_images(compose.get_images_by_file(config)) if image]
+    digests, failures = registry.resolve_image_digests(config, images)
+    for image, failure in failures.items():
+        logging.warning(message_warning(303, image, failure))
+
+    # Create output.
+
+    lock = {
+        "created_on": datetime.datetime.now().astimezone().isoformat(sep=" ", timespec="seconds"),
+        "images": digests,
+    }
+    output_text = json.dumps(lock, indent=4)
+
+    # Print output.
+
+    output_file = config.get('output_file')
+    if output_file:
+        with open(output_file, "w") as a_file:
+            a_file.write(output_text)
+            a_file.write("\n")
+    else:
+        print(output_text)
+
+    if failures:
+        exit_error(702, len(failures), len(images))
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_create_save_images(subcommand, args):
+    ''' Create 'save-images.sh' '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Create list of images. With a lock file, images are pinned to digests.
+    # Images of services that are only built are built by save-images.sh, then saved like the others.
+    # With a shard, save-images.sh builds and saves only the images of the shard.
+
+    try:
+        images_by_file, images, image_tags, builds = compose.get_save_images_lists(config, compose.get_services_by_file(config))
+    except ValueError as err:
+        exit_error(708, err)
+    if builds:
+        logging.info(message_info(115, len(builds), ", ".join(build.get("image") for build in builds)))
+
+    # Create output.
+
+    output_text = save_images_script.create_output_text(config, images, image_tags, images_by_file, builds)
+
+    # Print output.
+
+    output_file = config.get('output_file')
+    if output_file:
+        with open(output_file, "w") as a_file:
+            a_file.write(output_text)
+    else:
+        print(output_text)
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_load_images(subcommand, args):
+    ''' Load selected images of a bundle into docker. An indexed bundle file is read in place. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Select images for the platform of docker.
+
+    try:
+        bundle_archive = archive.open_bundle(config)
+        bundle_images, unmatched = archive.select_bundle_images(archive.read_bundle_images(bundle_archive), config.get('images'), archive.get_docker_platform())
+    except (OSError, RuntimeError, ValueError) as err:
+        exit_error(707, err)
+    if unmatched:
+        exit_error(705, ", ".join(unmatched))
+
+    # Load images.
+
+    run_metrics = metrics.RunMetrics(subcommand)
+    results, failures = archive.load_bundle_images(config, bundle_archive, bundle_images, run_metrics)
+    images = {(image_id, platform): " ".join(filter(None, [image, platform])) for image_id, image, platform in bundle_images}
+    for key, failure in failures.items():
+        logging.warning(message_warning(305, images.get(key), failure))
+    logging.info(message_info(114, list(results.values()).count("loaded"), list(results.values()).count("present")))
+    metrics.write_metrics_files(config, run_metrics)
+
+    if failures:
+        exit_error(706, len(failures), len(bundle_images))
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_merge_bundles(subcommand, args):
+    ''' Combine bundles, such as the shards of a sharded save, into one bundle. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Make output variables, as in save-images.sh.
+
+    output_extension = archive.COMPRESSIONS.get(config.get('compression')).get("extension")
+    output_date = int(time.time())
+    output_file = config.get('output_file') or os.path.expanduser("~/docker-compose-air-gapper-{0}.{1}".format(output_date, output_extension))
+    output_dir = os.path.join(os.path.dirname(os.path.abspath(output_file)), "docker-compose-air-gapper-{0}".format(output_date))
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Merge bundles.
+
+    bundle_merger = merge.BundleMerger(output_dir)
+    try:
+        for bundle_file in config.get('bundles'):
+            bundle_merger.add_bundle(bundle_file)
+    except (OSError, RuntimeError, ValueError, tarfile.TarError, zlib.error) as err:
+        exit_error(707, err)
+    image_count = bundle_merger.finish()
+    counts = bundle_merger.counts
+    logging.info(message_info(118, len(config.get('bundles')), image_count, counts.get("blobs"), counts.get("duplicate_blobs"), counts.get("duplicate_size") / MEGABYTES))
+
+    # Compress results.
+
+    archive.write_bundle_archive(config, output_dir, output_file)
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_plan(subcommand, args):
+    ''' Report the size and transfer time of a bundle without pulling images. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Create list of images, as for save-images.sh. Services without an "image" have no manifest to fetch.
+
+    images, _ = registry.apply_lock_file(config, [image for image in compose.get_images(compose.get_images_by_file(config)) if image])
+
+    # Create output.
+
+    plan, failures = bundle.create_plan(config, images)
+    total = plan.get("total")
+    logging.info(message_info(110, total.get("images"), total.get("blobs"), total.get("compressed_size") / MEGABYTES, total.get("shared_size") / MEGABYTES))
+    logging.info(message_info(111, plan.get("bandwidth_in_megabits_per_second"), datetime.timedelta(seconds=round(total.get("estimated_transfer_time_in_seconds")))))
+    output_text = json.dumps(plan, indent=4)
+
+    # Print output.
+
+    output_file = config.get('output_file')
+    if output_file:
+        with open(output_file, "w") as a_file:
+            a_file.write(output_text)
+            a_file.write("\n")
+    else:
+        print(output_text)
+
+    if failures:
+        exit_error(702, len(failures), len(images))
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_prune_cache(subcommand, args):
+    ''' Shrink the blob cache to SENZING_CACHE_MAX_SIZE_IN_MEGABYTES. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Prune.
+
+    blobs_removed, bytes_removed = bundle.prune_blob_cache(config.get('cache_dir'), config.get('cache_max_size_in_megabytes') * MEGABYTES)
+    logging.info(message_info(109, blobs_removed, bytes_removed / MEGABYTES))
+    entries = bundle.get_cache_entries(config.get('cache_dir'))
+    logging.info(message_info(107, os.path.expanduser(config.get('cache_dir')), len(entries), sum(size for _, size, _ in entries) / MEGABYTES, config.get('cache_max_size_in_megabytes')))
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_push_images(subcommand, args):
+    ''' Push the images of a bundle to a registry, without using docker. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Select images.
+
+    try:
+        bundle_archive = archive.open_bundle(config)
+        bundle_images, unmatched = archive.select_bundle_images(archive.read_bundle_images(bundle_archive), config.get('images'))
+    except (OSError, RuntimeError, ValueError) as err:
+        exit_error(707, err)
+    if unmatched:
+        exit_error(705, ", ".join(unmatched))
+
+    # Push images.
+
+    run_metrics = metrics.RunMetrics(subcommand)
+    pushed, failures, counts = push.push_images(config, bundle_archive, bundle_images, run_metrics)
+    for image, failure in failures.items():
+        logging.warning(message_warning(304, image, failure))
+    logging.info(message_info(113, len(pushed), config.get('target_registry'), counts.get("uploaded"), counts.get("uploaded_size") / MEGABYTES, counts.get("exists"), counts.get("mounted")))
+    metrics.write_metrics_files(config, run_metrics)
+
+    # Print output: the original and pushed name of each image.
+
+    output_text = "".join("{0} {1}\n".format(image, target) for image, target in pushed.items())
+    output_file = config.get('output_file')
+    if output_file:
+        with open(output_file, "w") as a_file:
+            a_file.write(output_text)
+    else:
+        print(output_text, end="")
+
+    if failures:
+        exit_error(704, len(failures), len(pushed) + len(failures))
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_save_images(subcommand, args):
+    ''' Save images from their registries into a bundle, without using docker. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Create list of images. Services without an "image" cannot be pulled from a registry.
+
+    services_by_file = compose.get_services_by_file(config)
+    images_by_file = {docker_compose_file: services.get("images") for docker_compose_file, services in services_by_file.items()}
+    images, image_tags = registry.apply_lock_file(config, [image for image in compose.get_images(images_by_file) if image])
+    images, _ = shard.select_shard(config, images)
+    for services in services_by_file.values():
+        for build in services.get("builds"):
+            logging.warning(message_warning(306, build.get("service")))
+
+    # Make output variables, as in save-images.sh. Blobs already in a resumed bundle directory are not downloaded again.
+
+    output_extension = archive.COMPRESSIONS.get(config.get('compression')).get("extension")
+    resume_dir = config.get('resume_dir')
+    if resume_dir:
+        output_dir = os.path.abspath(resume_dir)
+        output_file = config.get('output_file') or "{0}.{1}".format(output_dir, output_extension)
+    else:
+        output_date = "{0}{1}".format(int(time.time()), shard.get_shard_suffix(config))
+        output_file = config.get('output_file') or os.path.expanduser("~/docker-compose-air-gapper-{0}.{1}".format(output_date, output_extension))
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(output_file)), "docker-compose-air-gapper-{0}".format(output_date))
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Save images and compress results.
+
+    run_metrics = metrics.RunMetrics(subcommand)
+    failures = bundle.save_bundle(config, {"images": images, "image_tags": image_tags, "images_by_file": images_by_file}, output_dir, output_file, run_metrics)
+    metrics.write_metrics_files(config, run_metrics)
+
+    if failures:
+        exit_error(701, len(failures), len(images))
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_serve(subcommand, args):
+    ''' Serve HTTP requests for the save-images.sh of docker-compose files, keeping responses in memory. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Serve requests, each in its own thread, until terminated.
+
+    server = http.server.ThreadingHTTPServer((config.get('host'), config.get('port')), serve.get_serve_request_handler())
+    server.daemon_threads = True
+    server.config = config
+    server.response_cache = serve.ResponseCache(config.get('cache_max_entries'))
+    logging.info(message_info(121, *server.server_address[:2], config.get('cache_max_entries')))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_sleep(subcommand, args):
+    ''' Sleep.  Used for debugging. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Pull values from configuration.
+
+    sleep_time_in_seconds = config.get('sleep_time_in_seconds')
+
+    # Sleep.
+
+    if sleep_time_in_seconds > 0:
+        logging.info(message_info(296, sleep_time_in_seconds))
+        time.sleep(sleep_time_in_seconds)
+
+    else:
+        sleep_time_in_seconds = 3600
+        while True:
+            logging.info(message_info(295))
+            time.sleep(sleep_time_in_seconds)
+
+    # Epilog.
+
+    logging.info(configuration.exit_template(config))
+
+
+def do_version(subcommand, args):
+    ''' Log version information. '''
+
+    logging.info(message_info(294, __version__, __updated__))
+    logging.debug(message_debug(902, subcommand, args))
+
+
+def do_watch(subcommand, args):
+    ''' Watch docker-compose files and, for each change, create save-images.sh and, optionally, a bundle of the images that were added or changed. '''
+
+    # Get context from CLI, environment variables, and ini files.
+
+    config = configuration.get_configuration(subcommand, args)
+    configuration.validate_configuration(config)
+
+    # Prolog.
+
+    logging.info(configuration.entry_template(config))
+
+    # Read every docker-compose project. Its images are the first change.
+
+    watch_state = {
+        "image_keys": {},
+        "output_date": 0,
+        "output_directory": os.path.abspath(os.path.expanduser(config.get('output_directory'))),
+        "previous_bundle_manifest": config.get('previous_bundle_manifest'),
+    }
+    os.makedirs(watch_state.get("output_directory"), exist_ok=True)
+    docker_compose_watcher = watch.DockerComposeWatcher(config)
+    notifier = watch.get_notifier(config)
+    watched = None
+    changed_paths = None
+
+    # Read changes until terminated. When new directories are watched, every file is checked once, in case it changed before it was watched.
+
+    while True:
+        start_time = time.time()
+        changed_files = docker_compose_watcher.update(changed_paths)
+        if changed_files:
+            watch.write_watch_outputs(config, watch_state, docker_compose_watcher.get_services_by_file(), changed_files, start_time)
+        directories = watch.get_watched_directories(config, docker_compose_watcher.get_files())
+        try:
+            added_directories = notifier.add_directories(directories)
+        except OSError as err:
+            logging.warning(message_warning(308, config.get('poll_interval_in_seconds'), err))
+            notifier = watch.PollingNotifier(config.get('poll_interval_in_seconds'))
+            added_directories = False
+        if watched != (len(docker_compose_watcher.projects), len(directories), notifier.name):
+            watched = (len(docker_compose_watcher.projects), len(directories), notifier.name)
+            logging.info(message_info(119, *watched))
+        changed_paths = None if added_directories else notifier.wait()
+
+# -----------------------------------------------------------------------------
+# Main
+# -----------------------------------------------------------------------------
+
+
+def main():
+    ''' Run the subcommand given on the command line or in SENZING_SUBCOMMAND. '''
+
+    # Configure logging. See https://docs.python.org/2/library/logging.html#levels
+
+    log_level_map = {
+        "notset": logging.NOTSET,
+        "debug": logging.DEBUG,
+        "info": logging.INFO,
+        "fatal": logging.FATAL,
+        "warning": logging.WARNING,
+        "error": logging.ERROR,
+        "critical": logging.CRITICAL
+    }
+
+    log_level_parameter = os.getenv("SENZING_LOG_LEVEL", "info").lower()
+    log_level = log_level_map.get(log_level_parameter, logging.INFO)
+    logging.basicConfig(format=LOG_FORMAT, level=log_level)
+    logging.debug(message_debug(998))
+
+    # Trap signals temporarily until args are parsed.
+
+    signal.signal(signal.SIGTERM, bootstrap_signal_handler)
+    signal.signal(signal.SIGINT, bootstrap_signal_handler)
+
+    # Parse the command line arguments.
+
+    subcommand = os.getenv("SENZING_SUBCOMMAND", None)
+    parser = get_parser(sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].startswith("-") else None)
+    if len(sys.argv) > 1:
+        args = parser.parse_args()
+        subcommand = args.subcommand
+    elif subcommand:
+        args = argparse.Namespace(subcommand=subcommand)
+    else:
+        parser.print_help()
+        if len(os.getenv("SENZING_DOCKER_LAUNCHED", "")) > 0:
+            subcommand = "sleep"
+            args = argparse.Namespace(subcommand=subcommand)
+            do_sleep(subcommand, args)
+        exit_silently()
+
+    # Catch interrupts. Tricky code: Uses currying.
+
+    signal_handler = create_signal_handler_function(args)
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    # Transform subcommand from CLI parameter to function name string.
+
+    subcommand_function_name = "do_{0}".format(subcommand.replace('-', '_'))
+
+    # Test to see if function exists in the code.
+
+    if subcommand_function_name not in globals():
+        logging.warning(message_warning(696, subcommand))
+        parser.print_help()
+        exit_silently()
+
+    # Tricky code for calling function based on string.
+
+    globals()[subcommand_function_name](subcommand, args)
@@ -0,0 +1,276 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/common.py
+#   Lazy imports, messages, and utility functions used by the other modules.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import importlib
+import linecache
+import logging
+import sys
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    ''' A module, or a package and its submodules, imported when first used, so that subcommands which do not use it start faster.
+        Threads that use it at the same time wait for one import.
+    '''
+
+    lock = threading.RLock()
+
+    def import_module(self):
+        ''' Import the module and return it. '''
+        return importlib.import_module(self.__name__)
+
+    def import_submodule(self, name):
+        ''' Import a submodule of the package, if it has one of that name. '''
+        try:
+            importlib.import_module("{0}.{1}".format(self.__name__, name))
+        except ModuleNotFoundError as err:
+            if err.name != "{0}.{1}".format(self.__name__, name):
+                raise
+
+    def __getattr__(self, name):
+        with LazyModule.lock:
+            module = self.import_module()
+            if not hasattr(module, name) and hasattr(module, "__path__"):
+                self.import_submodule(name)
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+
+# Import from standard library, when first used.
+
+concurrent = LazyModule("concurrent")
+ctypes = LazyModule("ctypes")
+http = LazyModule("http")
+subprocess = LazyModule("subprocess")
+tarfile = LazyModule("tarfile")
+urllib = LazyModule("urllib")
+
+# Import from https://pypi.org/, when first used.
+
+yaml = LazyModule("yaml")
+
+# Metadata. docker_compose_air_gapper re-exports it.
+
+__version__ = "1.1.0"  # See https://www.python.org/dev/peps/pep-0396/
+__date__ = '2021-09-25'
+__updated__ = '2026-10-18'
+
+SENZING_PRODUCT_ID = "5028"  # See https://github.com/senzing-garage/knowledge-base/blob/main/lists/senzing-product-ids.md
+LOG_FORMAT = '%(asctime)s %(message)s'
+
+# Working with bytes.
+
+KILOBYTES = 1024
+MEGABYTES = 1024 * KILOBYTES
+GIGABYTES = 1024 * MEGABYTES
+
+# -----------------------------------------------------------------------------
+# Message handling
+# -----------------------------------------------------------------------------
+
+# 1xx Informational (i.e. logging.info())
+# 3xx Warning (i.e. logging.warning())
+# 5xx User configuration issues (either logging.warning() or logging.err() for Client errors)
+# 7xx Internal error (i.e. logging.error for Server errors)
+# 9xx Debugging (i.e. logging.debug())
+
+
+MESSAGE_INFO = 100
+MESSAGE_WARN = 300
+MESSAGE_ERROR = 700
+MESSAGE_DEBUG = 900
+
+MESSAGE_DICTIONARY = {
+    "100": "senzing-" + SENZING_PRODUCT_ID + "{0:04d}I",
+    "101": "Resolving manifests for {0} images.",
+    "102": "Downloading {0} blobs ({1:.1f} MB) for {2} images. {3} blobs already in this or a previous bundle.",
+    "103": "Created {0}",
+    "104": "Which is a compressed version of {0}",
+    "105": "Using {0} cached or pinned image digests. Resolving {1} image digests.",
+    "106": "Found {0} of {1} blobs ({2:.1f} MB) in the blob cache.",
+    "107": "Blob cache {0}: {1} blobs, {2:.1f} MB of {3} MB.",
+    "108": "Blob cache least recently used blob: {0}. Most recently used blob: {1}.",
+    "109": "Removed {0} blobs ({1:.1f} MB) from the blob cache.",
+    "110": "Plan: {0} images, {1} blobs, {2:.1f} MB to transfer. Layers shared by more than one image save {3:.1f} MB.",
+    "111": "Estimated transfer time at {0} Mbit/s: {1}",
+    "112": "Created {0} volumes: {1} to {2}. Verify them with {3}",
+    "113": "Pushed {0} images to {1}. Uploaded {2} blobs ({3:.1f} MB). {4} blobs were already in the registry. {5} blobs were mounted from another repository.",
+    "114": "Loaded {0} images into docker. {1} images were already in docker.",
+    "115": "save-images.sh will build {0} images of services that have no image: {1}",
+    "116": "Wrote metrics of {0} images to {1}",
+    "117": "Shard {0} of {1}: saving {2} of {3} images.",
+    "118": "Merged {0} bundles: {1} images, {2} blobs. {3} blobs ({4:.1f} MB) in more than one bundle are stored once.",
+    "119": "Watching {0} docker-compose files in {1} directories using {2}.",
+    "120": "Read {0} changed files in {1:.2f} seconds: {2} images added, {3} changed, {4} removed.",
+    "121": "Serving on http://{0}:{1}/ with a cache of up to {2} responses.",
+    "293": "For information on warnings and errors, see https://github.com/senzing-garage/docker-compose-air-gapper#errors",
+    "294": "Version: {0}  Updated: {1}",
+    "295": "Sleeping infinitely.",
+    "296": "Sleeping {0} seconds.",
+    "297": "Enter {0}",
+    "298": "Exit {0}",
+    "299": "{0}",
+    "300": "senzing-" + SENZING_PRODUCT_ID + "{0:04d}W",
+    "301": "Could not save {0}. Reason: {1}",
+    "302": "{0} is not in lock file {1}. Using it without a digest.",
+    "303": "Could not resolve {0}. Reason: {1}",
+    "304": "Could not push {0}. Reason: {1}",
+    "305": "Could not load {0}. Reason: {1}",
+    "306": "Service {0} has no image and is not saved. 'create-save-images' makes a save-images.sh that builds it.",
+    "307": "Could not read docker-compose file {0}. Its previous images are kept until it changes again. Reason: {1}",
+    "308": "Filesystem notifications are not available. Checking files every {0} seconds. Reason: {1}",
+    "309": "Could not read registry credentials from {0}. Continuing without them. Reason: {1}",
+    "499": "{0}",
+    "500": "senzing-" + SENZING_PRODUCT_ID + "{0:04d}E",
+    "501": "SENZING_CONCURRENCY must be 1 or greater. Current value: {0}",
+    "502": "SENZING_PREVIOUS_BUNDLE_MANIFEST file does not exist: {0}",
+    "503": "SENZING_STREAM cannot be used with SENZING_PREVIOUS_BUNDLE_MANIFEST.",
+    "504": "SENZING_COMPRESSION must be one of: {0}. Current value: {1}",
+    "505": "SENZING_COMPRESSION_LEVEL for {0} must be between 1 and {1}. Current value: {2}",
+    "506": "SENZING_COMPRESSION of {0} requires the '{0}' program, which was not found.",
+    "507": "SENZING_RESUME_DIR is not a directory: {0}",
+    "508": "SENZING_LOCK_FILE file does not exist: {0}",
+    "509": "SENZING_CACHE_TTL_IN_SECONDS must be 0 or greater. Current value: {0}",
+    "510": "SENZING_CACHE_MAX_SIZE_IN_MEGABYTES must be 0 or greater. Current value: {0}",
+    "511": "SENZING_DOCKER_COMPOSE_FILE does not exist or matches no docker-compose files: {0}",
+    "512": "SENZING_ENV_FILE file does not exist: {0}",
+    "513": "SENZING_PLATFORMS must be given as os/arch[/variant], like linux/amd64. Current value: {0}",
+    "514": "SENZING_STREAM can be used with only one platform. Current value of SENZING_PLATFORMS: {0}",
+    "515": "SENZING_BANDWIDTH_IN_MEGABITS_PER_SECOND must be 1 or greater. Current value: {0}",
+    "516": "SENZING_VOLUME_SIZE_IN_MEGABYTES must be 0 or greater. Current value: {0}",
+    "517": "SENZING_TARGET_REGISTRY is required.",
+    "518": "SENZING_INPUT_DIRECTORY is not an extracted bundle directory holding images.txt. Current value: {0}",
+    "519": "SENZING_INPUT_FILE is not a bundle file, or its volumes, next to an index file made by 'save-images --index' or 'merge-bundles --index': {0}.index.json. Bundles of save-images.sh have no index. Make an indexed copy with 'merge-bundles --index'.",
+    "520": "Only one of SENZING_INPUT_DIRECTORY or SENZING_INPUT_FILE can be given.",
+    "521": "Directory of {0} does not exist: {1}",
+    "522": "SENZING_SHARD must be K/N, with K from 1 to N. Current value: {0}",
+    "523": "SENZING_BUNDLES is required.",
+    "524": "SENZING_BUNDLES must be bundle files, or their volumes, or extracted bundle directories holding images.txt. Current value: {0}",
+    "525": "SENZING_DOCKER_COMPOSE_FILE is required.",
+    "526": "SENZING_POLL_INTERVAL_IN_SECONDS must be 1 or greater. Current value: {0}",
+    "527": "SENZING_PORT must be from 0 to 65535. Current value: {0}",
+    "528": "SENZING_CACHE_MAX_ENTRIES must be 1 or greater. Current value: {0}",
+    "529": "SENZING_DOCKER_AUTH_CONFIG must be JSON with an \"auths\" object, like docker's config.json. Reason: {0}",
+    "696": "Bad SENZING_SUBCOMMAND: {0}.",
+    "697": "No processing done.",
+    "698": "Program terminated with error.",
+    "699": "{0}",
+    "700": "senzing-" + SENZING_PRODUCT_ID + "{0:04d}E",
+    "701": "Could not save {0} of {1} images.",
+    "702": "Could not resolve {0} of {1} images.",
+    "703": "Could not read docker-compose file {0}. Reason: {1}",
+    "704": "Could not push {0} of {1} images.",
+    "705": "SENZING_IMAGES not in the bundle: {0}",
+    "706": "Could not load {0} of {1} images.",
+    "707": "Could not read the bundle. Reason: {0}",
+    "708": "Could not order builds. Reason: {0}",
+    "899": "{0}",
+    "900": "senzing-" + SENZING_PRODUCT_ID + "{0:04d}D",
+    "903": "Could not add {0} to the blob cache. Reason: {1}",
+    "904": "{0} {1}",
+    "998": "Debugging enabled.",
+    "999": "{0}",
+}
+
+
+def message(index, *args):
+    ''' Return an instantiated message. '''
+    index_string = str(index)
+    template = MESSAGE_DICTIONARY.get(index_string, "No message for index {0}.".format(index_string))
+    return template.format(*args)
+
+
+def message_generic(generic_index, index, *args):
+    ''' Return a formatted message. '''
+    return "{0} {1}".format(message(generic_index, index), message(index, *args))
+
+
+def message_info(index, *args):
+    ''' Return an info message. '''
+    return message_generic(MESSAGE_INFO, index, *args)
+
+
+def message_warning(index, *args):
+    ''' Return a warning message. '''
+    return message_generic(MESSAGE_WARN, index, *args)
+
+
+def message_error(index, *args):
+    ''' Return an error message. '''
+    return message_generic(MESSAGE_ERROR, index, *args)
+
+
+def message_debug(index, *args):
+    ''' Return a debug message. '''
+    return message_generic(MESSAGE_DEBUG, index, *args)
+
+
+def get_exception():
+    ''' Get details about an exception. '''
+    exception_type, exception_object, traceback = sys.exc_info()
+    frame = traceback.tb_frame
+    line_number = traceback.tb_lineno
+    filename = frame.f_code.co_filename
+    linecache.checkcache(filename)
+    line = linecache.getline(filename, line_number, frame.f_globals)
+    return {
+        "filename": filename,
+        "line_number": line_number,
+        "line": line.strip(),
+        "exception": exception_object,
+        "type": exception_type,
+        "traceback": traceback,
+    }
+
+# -----------------------------------------------------------------------------
+# Utility functions
+# -----------------------------------------------------------------------------
+
+
+def create_signal_handler_function(args):
+    ''' Tricky code.  Uses currying technique. Create a function for signal handling.
+        that knows about "args".
+    '''
+
+    def result_function(signal_number, frame):
+        logging.info(message_info(298, args))
+        logging.debug(message_debug(901, signal_number, frame))
+        sys.exit(0)
+
+    return result_function
+
+
+def bootstrap_signal_handler(signal_number, frame):
+    ''' Exit on signal error. '''
+    logging.debug(message_debug(901, signal_number, frame))
+    sys.exit(0)
+
+
+def exit_error(index, *args):
+    ''' Log error message and exit program. '''
+    logging.error(message_error(index, *args))
+    logging.error(message_error(698))
+    sys.exit(1)
+
+
+def exit_silently():
+    ''' Exit program. '''
+    sys.exit(0)
+
+# -----------------------------------------------------------------------------
+# Utility functions
+# -----------------------------------------------------------------------------
+
+
+def replace_variables_in_text(function_with_text, variables):
+    """ Perform variable replacement in text """
+
+    return function_with_text.__doc__.format(**variables)
@@ -0,0 +1,845 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/compose.py
+#   Resolve docker-compose files as docker compose does: .env files, interpolation, include, extends, and profiles.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import collections
+import contextvars
+import errno
+import functools
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+
+# Import from standard library and https://pypi.org/, when first used.
+
+from .common import concurrent, yaml
+
+# Import from docker_compose_air_gapper.
+
+from .common import MEGABYTES, exit_error
+from .registry import apply_lock_file
+from .shard import select_shard
+
+# -----------------------------------------------------------------------------
+# Docker compose functions
+# -----------------------------------------------------------------------------
+
+
+DOCKER_COMPOSE_FILENAMES = [
+    "compose.yaml",
+    "compose.yml",
+    "docker-compose.yaml",
+    "docker-compose.yml",
+]
+
+# Keys of a service whose sequences are replaced, not appended to, when services are merged.
+
+REPLACED_SEQUENCES = [
+    "command",
+    "entrypoint",
+    "profiles",
+]
+
+# Files read while resolving a docker-compose project, so "watch" knows which projects a changed file affects.
+
+DOCKER_COMPOSE_DEPENDENCIES = contextvars.ContextVar("docker_compose_dependencies", default=None)
+
+# The files and environment of a "serve" request, used instead of the disk and the shell environment while resolving its project.
+
+DOCKER_COMPOSE_CONTENTS = contextvars.ContextVar("docker_compose_contents", default=None)
+
+# Parsed docker-compose files: {filename: (modification_time, model)}. A changed file replaces its entry, so "watch" does not grow it.
+
+PARSED_DOCKER_COMPOSE_FILES = {}
+PARSED_DOCKER_COMPOSE_FILES_LOCK = threading.Lock()
+
+# Largest total size, in bytes, of the texts of "serve" requests whose parsed models are kept.
+
+PARSED_DOCKER_COMPOSE_TEXTS_MAX_SIZE = 64 * MEGABYTES
+
+VARIABLE_NAME_PATTERN = re.compile(r"[_A-Za-z][_A-Za-z0-9]*")
+VARIABLE_EXPRESSION_PATTERN = re.compile(r"(?P<name>[_A-Za-z][_A-Za-z0-9]*)(?:(?P<operator>:?[-?+])(?P<argument>.*))?$", re.DOTALL)
+
+
+def expand_docker_compose_file(docker_compose_file):
+    ''' Return the docker-compose projects named by a file, a directory (searched recursively), or a glob pattern.
+        Files joined by os.pathsep, as in COMPOSE_FILE, are one project in which later files override earlier ones.
+    '''
+
+    if os.pathsep in docker_compose_file:
+        filenames = docker_compose_file.split(os.pathsep)
+        return [docker_compose_file] if all(os.path.isfile(filename) for filename in filenames) else []
+
+    candidates = [docker_compose_file]
+    if any(character in docker_compose_file for character in "*?["):
+        candidates = sorted(glob.glob(os.path.expanduser(docker_compose_file), recursive=True))
+
+    result = []
+    for candidate in candidates:
+        if os.path.isdir(candidate):
+            for directory, subdirectories, filenames in os.walk(candidate):
+                subdirectories.sort()
+                result += [os.path.join(directory, filename) for filename in sorted(filenames) if filename in DOCKER_COMPOSE_FILENAMES]
+        elif os.path.isfile(candidate):
+            result.append(candidate)
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def get_yaml_tools():
+    ''' Return the YAML loader, constructor, and resolver. The loader is libyaml's when PyYAML was built with it. '''
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader), yaml.constructor.SafeConstructor(), yaml.resolver.Resolver()
+
+
+# The parts of a service that decide which images are saved. Other parts of a docker-compose file are skipped while parsing.
+
+SERVICE_KEYS = [
+    "build",
+    "depends_on",
+    "extends",
+    "image",
+    "profiles",
+]
+
+
+def keep_yaml_key(path, key):
+    ''' Decide whether the value of a mapping key at "path" in a docker-compose file is needed. '''
+    if not path:
+        return key in ["include", "name", "services"]
+    if len(path) == 2 and path[0] == "services":
+        return key in SERVICE_KEYS
+    return True
+
+
+def construct_yaml_scalar(event):
+    ''' Return the value of a scalar, as yaml.safe_load would. Scalars with unknown tags, like "!reset", are strings. '''
+    _, yaml_constructor, yaml_resolver = get_yaml_tools()
+    tag = event.tag
+    if tag in [None, "!"]:
+        tag = yaml_resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+    constructor = yaml_constructor.yaml_constructors.get(tag)
+    if not constructor:
+        return event.value
+    return constructor(yaml_constructor, yaml.ScalarNode(tag, event.value, style=event.style))
+
+
+def read_yaml_node(events, event, anchors, path):
+    ''' Build the value of the YAML node starting with "event", leaving out mapping keys that keep_yaml_key() rejects. '''
+
+    if isinstance(event, yaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise ValueError("Undefined YAML alias: {0}".format(event.anchor))
+        return anchors.get(event.anchor)
+
+    if isinstance(event, yaml.ScalarEvent):
+        result = construct_yaml_scalar(event)
+
+    elif isinstance(event, yaml.SequenceStartEvent):
+        result = []
+        item_event = next(events)
+        while not isinstance(item_event, yaml.SequenceEndEvent):
+            result.append(read_yaml_node(events, item_event, anchors, path + (None,)))
+            item_event = next(events)
+
+    else:
+
+        # Mapping. Values merged with "<<" do not replace keys of the mapping itself.
+
+        result = {}
+        merges = []
+        key_event = next(events)
+        while not isinstance(key_event, yaml.MappingEndEvent):
+            key = read_yaml_node(events, key_event, anchors, ("",))
+            value_event = next(events)
+            if key == "<<":
+                merge = read_yaml_node(events, value_event, anchors, path)
+                merges += merge if isinstance(merge, list) else [merge]
+            elif keep_yaml_key(path, key):
+                result[key] = read_yaml_node(events, value_event, anchors, path + (key,))
+            else:
+                skip_yaml_node(events, value_event, anchors)
+            key_event = next(events)
+        for merge in merges:
+            for key, value in (merge or {}).items():
+                if keep_yaml_key(path, key):
+                    result.setdefault(key, value)
+
+    if event.anchor:
+        anchors[event.anchor] = result
+    return result
+
+
+def skip_yaml_node(events, event, anchors):
+    ''' Consume the events of a YAML node without building it. Anchored nodes inside it are built, as aliases may use them. '''
+    depth = 0
+    while True:
+        if isinstance(event, yaml.NodeEvent) and not isinstance(event, yaml.AliasEvent) and event.anchor:
+            read_yaml_node(events, event, anchors, ("",))
+        elif isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+        event = next(events)
+
+
+# Names of YAML types, for messages.
+
+DOCKER_COMPOSE_TYPE_NAMES = {
+    dict: "mapping",
+    float: "number",
+    int: "number",
+    list: "list",
+    str: "string",
+    type(None): "empty",
+}
+
+
+def check_docker_compose_value(filename, path, value, value_types, item_types=None):
+    ''' Raise ValueError unless a value is missing or one of value_types, with the items of a list, or the values of a mapping, of item_types. '''
+
+    if value is None:
+        return
+    items = value.values() if isinstance(value, dict) else value if isinstance(value, list) else []
+    if not isinstance(value, value_types) or (item_types and not all(isinstance(item, item_types) for item in items)):
+        expected = " or ".join(dict.fromkeys(DOCKER_COMPOSE_TYPE_NAMES.get(value_type) for value_type in value_types))
+        if item_types:
+            expected += " of " + " or ".join(dict.fromkeys(DOCKER_COMPOSE_TYPE_NAMES.get(item_type) for item_type in item_types))
+        raise ValueError('"{0}" in {1} must be {2}, not {3}.'.format(path, filename or "STDIN", expected, json.dumps(value, default=str)))
+
+
+def check_docker_compose_document(filename, document):
+    ''' Raise ValueError if the parts of a docker-compose document that describe images are not of the types docker compose requires. '''
+
+    check_docker_compose_value(filename, "name", document.get("name"), (str,))
+    check_docker_compose_value(filename, "include", document.get("include"), (list,), (str, dict))
+    for include in document.get("include") or []:
+        if isinstance(include, dict):
+            if not include.get("path"):
+                raise ValueError('"include.path" in {0} is required.'.format(filename or "STDIN"))
+            check_docker_compose_value(filename, "include.path", include.get("path"), (str, list), (str,))
+            check_docker_compose_value(filename, "include.project_directory", include.get("project_directory"), (str,))
+            check_docker_compose_value(filename, "include.env_file", include.get("env_file"), (str, list), (str,))
+
+    check_docker_compose_value(filename, "services", document.get("services"), (dict,), (dict, type(None)))
+    for name, service in (document.get("services") or {}).items():
+        path = "services.{0}".format(name)
+        service = service or {}
+        check_docker_compose_value(filename, path + ".image", service.get("image"), (str,))
+        check_docker_compose_value(filename, path + ".profiles", service.get("profiles"), (list,), (str,))
+        check_docker_compose_value(filename, path + ".depends_on", service.get("depends_on"), (list, dict), None if isinstance(service.get("depends_on"), dict) else (str,))
+        check_docker_compose_value(filename, path + ".extends", service.get("extends"), (str, dict))
+        if isinstance(service.get("extends"), dict):
+            check_docker_compose_value(filename, path + ".extends.service", service.get("extends").get("service"), (str,))
+            check_docker_compose_value(filename, path + ".extends.file", service.get("extends").get("file"), (str,))
+        build = service.get("build")
+        check_docker_compose_value(filename, path + ".build", build, (str, dict))
+        if isinstance(build, dict):
+            for key in ["context", "dockerfile", "target"]:
+                check_docker_compose_value(filename, "{0}.build.{1}".format(path, key), build.get(key), (str,))
+            check_docker_compose_value(filename, path + ".build.args", build.get("args"), (list, dict), (str, int, float, type(None)) if isinstance(build.get("args"), dict) else (str,))
+            check_docker_compose_value(filename, path + ".build.cache_from", build.get("cache_from"), (list,), (str,))
+            check_docker_compose_value(filename, path + ".build.additional_contexts", build.get("additional_contexts"), (list, dict), (str,))
+
+
+def read_docker_compose_documents(stream):
+    ''' Return the "name", "services", and "include" of every YAML document in a stream, merged in order.
+        Events are read one at a time, so only the parts of each document that describe images are kept in memory.
+    '''
+
+    result = {
+        "include": [],
+        "name": None,
+        "services": {},
+    }
+    events = yaml.parse(stream, Loader=get_yaml_tools()[0])
+    for event in events:
+        if not isinstance(event, yaml.DocumentStartEvent):
+            continue
+        document = read_yaml_node(events, next(events), {}, ())
+        if not isinstance(document, dict):
+            continue
+        check_docker_compose_document(None if stream is sys.stdin else getattr(stream, "name", None), document)
+        result["include"] += document.get("include") or []
+        result["name"] = document.get("name") or result.get("name")
+        for name, service in (document.get("services") or {}).items():
+            result["services"][name] = merge_service(normalize_service(result["services"].get(name)), normalize_service(service))
+    return result
+
+
+def parse_yaml_file(filename, modification_time):
+    ''' Parse a docker-compose file. Memoized by name until its modification time changes, so fragments shared by several docker-compose files are parsed once. '''
+    with PARSED_DOCKER_COMPOSE_FILES_LOCK:
+        parsed = PARSED_DOCKER_COMPOSE_FILES.get(filename)
+    if parsed and parsed[0] == modification_time:
+        return parsed[1]
+    with open(filename) as a_file:
+        model = read_docker_compose_documents(a_file)
+    with PARSED_DOCKER_COMPOSE_FILES_LOCK:
+        PARSED_DOCKER_COMPOSE_FILES[filename] = (modification_time, model)
+    return model
+
+
+class ParsedTextCache:
+    ''' Parsed docker-compose texts by filename and a hash of the text, least recently used first.
+        The texts of the entries total at most max_size bytes, however large the requests are.
+    '''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, filename, text, parse_function):
+        ''' Return the model of a text, parsing it with parse_function on a miss. Errors are not cached. '''
+
+        data = text.encode()
+        key = (filename, hashlib.sha256(data).hexdigest())
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries.get(key)[1]
+        model = parse_function()
+        if len(data) > self.max_size:
+            return model
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (len(data), model)
+                self.size += len(data)
+            while self.size > self.max_size:
+                self.size -= self.entries.popitem(last=False)[1][0]
+        return model
+
+    def stats(self):
+        ''' Return the number of entries and the size of their texts. '''
+        with self.lock:
+            return {"entries": len(self.entries), "size": self.size, "max_size": self.max_size}
+
+
+PARSED_DOCKER_COMPOSE_TEXTS = ParsedTextCache(PARSED_DOCKER_COMPOSE_TEXTS_MAX_SIZE)
+
+
+def parse_yaml_text(filename, text):
+    ''' Parse the text of a docker-compose file from a "serve" request. Memoized by a hash of the text, so fragments shared by requests are parsed once. '''
+
+    def parse():
+        stream = io.StringIO(text)
+        stream.name = filename
+        return read_docker_compose_documents(stream)
+
+    return PARSED_DOCKER_COMPOSE_TEXTS.get(filename, text, parse)
+
+
+def open_docker_compose_source(filename):
+    ''' Open a file read while resolving a docker-compose project: from the request being served, if any, or from disk.
+        Files not in a request are not found, so a request cannot read the server's files.
+    '''
+    contents = DOCKER_COMPOSE_CONTENTS.get()
+    if contents is None:
+        return open(filename)
+    text = contents.get("files").get(os.path.abspath(filename))
+    if text is None:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), filename)
+    return io.StringIO(text)
+
+
+def docker_compose_source_exists(filename):
+    ''' Return True if open_docker_compose_source() can open a file. '''
+    contents = DOCKER_COMPOSE_CONTENTS.get()
+    if contents is None:
+        return os.path.isfile(filename)
+    return os.path.abspath(filename) in contents.get("files")
+
+
+def get_shell_environment():
+    ''' Return the shell environment for interpolation: that of the request being served, if any, or os.environ. '''
+    contents = DOCKER_COMPOSE_CONTENTS.get()
+    return os.environ if contents is None else contents.get("environment")
+
+
+def add_docker_compose_dependency(filename):
+    ''' Record a file that the docker-compose project being resolved depends on. It need not exist. '''
+    dependencies = DOCKER_COMPOSE_DEPENDENCIES.get()
+    if dependencies is not None and filename:
+        dependencies.add(os.path.abspath(filename))
+
+
+def load_docker_compose_file(filename):
+    ''' Return the unresolved "name", "services", and "include" of a docker-compose file. None is STDIN. '''
+    if not filename:
+        return read_docker_compose_documents(sys.stdin)
+    filename = os.path.abspath(filename)
+    add_docker_compose_dependency(filename)
+    if DOCKER_COMPOSE_CONTENTS.get() is not None:
+        with open_docker_compose_source(filename) as a_file:
+            return parse_yaml_text(filename, a_file.read())
+    return parse_yaml_file(filename, os.stat(filename).st_mtime_ns)
+
+
+def read_env_file(filename, environment=None):
+    ''' Return the variables in a docker compose ".env" file. Single-quoted values are not interpolated. '''
+    result = {}
+    with open_docker_compose_source(filename) as a_file:
+        for line in a_file:
+            line = line.strip()
+            if line.startswith("export "):
+                line = line[len("export "):].lstrip()
+            key, separator, value = line.partition("=")
+            if not separator or line.startswith("#"):
+                continue
+            value = value.strip()
+            if len(value) > 1 and value[0] == "'" and value[-1] == "'":
+                value = value[1:-1]
+            elif len(value) > 1 and value[0] == '"' and value[-1] == '"':
+                value = interpolate(value[1:-1], dict(environment or {}, **result))
+            else:
+                value = interpolate(value.split(" #", 1)[0].rstrip(), dict(environment or {}, **result))
+            result[key.strip()] = value
+    return result
+
+
+def interpolate_variable(expression, environment):
+    ''' Return the value of a ${...} expression without the "${" and "}". '''
+
+    match = VARIABLE_EXPRESSION_PATTERN.match(expression)
+    if not match:
+        raise ValueError("Invalid interpolation format: ${{{0}}}".format(expression))
+    name, operator, argument = match.group("name", "operator", "argument")
+    value = environment.get(name)
+    if not operator:
+        return value or ""
+
+    # With ":", an empty variable is treated as unset.
+
+    is_set = bool(value) if operator.startswith(":") else value is not None
+    if operator.endswith("-"):
+        return value if is_set else interpolate(argument, environment)
+    if operator.endswith("+"):
+        return interpolate(argument, environment) if is_set else ""
+    if not is_set:
+        raise ValueError("Required variable {0} is missing a value: {1}".format(name, interpolate(argument, environment)))
+    return value
+
+
+def interpolate(text, environment):
+    ''' Replace $VARIABLE, ${VARIABLE}, ${VARIABLE:-default}, ${VARIABLE-default}, ${VARIABLE:?error}, ${VARIABLE?error},
+        ${VARIABLE:+replacement}, ${VARIABLE+replacement}, and $$ as docker compose does.
+    '''
+
+    result = []
+    index = 0
+    while True:
+        dollar = text.find("$", index)
+        if dollar < 0:
+            result.append(text[index:])
+            return "".join(result)
+        result.append(text[index:dollar])
+        following = text[dollar + 1:dollar + 2]
+        if following == "$":
+            result.append("$")
+            index = dollar + 2
+        elif following == "{":
+
+            # Find the matching "}". Defaults may hold further ${...} expressions.
+
+            depth = 1
+            end = dollar + 2
+            while end < len(text) and depth:
+                if text.startswith("${", end):
+                    depth += 1
+                    end += 1
+                elif text[end] == "}":
+                    depth -= 1
+                end += 1
+            if depth:
+                raise ValueError("Missing closing brace in: {0}".format(text))
+            result.append(interpolate_variable(text[dollar + 2:end - 1], environment))
+            index = end
+        else:
+            match = VARIABLE_NAME_PATTERN.match(text, dollar + 1)
+            if match:
+                result.append(environment.get(match.group(0)) or "")
+                index = match.end()
+            else:
+                result.append("$")
+                index = dollar + 1
+
+
+def interpolate_structure(value, environment):
+    ''' Interpolate every string value, but not the keys, of parsed YAML. '''
+    if isinstance(value, dict):
+        return {key: interpolate_structure(item, environment) for key, item in value.items()}
+    if isinstance(value, list):
+        return [interpolate_structure(item, environment) for item in value]
+    if isinstance(value, str):
+        return interpolate(value, environment)
+    return value
+
+
+def normalize_service(service):
+    ''' Return a service with "depends_on" as a dictionary, so it can be merged. '''
+    result = dict(service or {})
+    depends_on = result.get("depends_on")
+    if isinstance(depends_on, list):
+        result["depends_on"] = {name: {"condition": "service_started"} for name in depends_on}
+    return result
+
+
+def merge_service(base, override):
+    ''' Merge two definitions of a service, as "extends" and multiple docker-compose files do. '''
+    result = dict(base)
+    for key, value in override.items():
+        base_value = result.get(key)
+        if isinstance(base_value, dict) and isinstance(value, dict):
+            result[key] = merge_service(base_value, value)
+        elif isinstance(base_value, list) and isinstance(value, list) and key not in REPLACED_SEQUENCES:
+            result[key] = base_value + [item for item in value if item not in base_value]
+        else:
+            result[key] = value
+    return result
+
+
+def is_local_build_context(context):
+    ''' Return True if a build context is a directory, not a URL or a "service:" or "docker-image://" reference. '''
+    return not re.match(r"^([a-z][a-z0-9+.-]*://|git@|service:|target:)", context)
+
+
+def resolve_build_directories(service, base_directory):
+    ''' Return a service with the relative directories of its "build" made absolute.
+        They are relative to the directory of the project, or of the file for "extends", that defines the service.
+    '''
+    build = service.get("build")
+    if isinstance(build, str):
+        build = {"context": build}
+    if not isinstance(build, dict):
+        return service
+    build = dict(build)
+    if isinstance(build.get("context"), str) and is_local_build_context(build.get("context")):
+        build["context"] = os.path.abspath(os.path.join(base_directory, build.get("context")))
+    additional_contexts = build.get("additional_contexts")
+    if isinstance(additional_contexts, list):
+        additional_contexts = dict(additional_context.split("=", 1) for additional_context in additional_contexts)
+    if isinstance(additional_contexts, dict):
+        build["additional_contexts"] = {key: os.path.abspath(os.path.join(base_directory, value)) if is_local_build_context(value) else value for key, value in additional_contexts.items()}
+    return dict(service, build=build)
+
+
+def resolve_service(services, environment, base_directory, chain):
+    ''' Return a service with its "extends" chain applied. Relative build directories are resolved against base_directory,
+        or against the directory of the file a service extends. "chain" ends with the (filename, name) of the service,
+        after those of the services that extend it.
+    '''
+
+    filename, name = chain[-1]
+    if name not in services:
+        raise ValueError("Service {0} not found in {1}".format(name, filename or "STDIN"))
+    service = resolve_build_directories(normalize_service(services.get(name)), base_directory)
+    extends = service.pop("extends", None)
+    if not extends:
+        return service
+    if isinstance(extends, str):
+        extends = {"service": extends}
+    if (filename, name) in chain[:-1]:
+        raise ValueError("Circular extends of service {0} in {1}".format(name, filename or "STDIN"))
+
+    base_filename = filename
+    base_services = services
+    base_service_directory = base_directory
+    if extends.get("file"):
+        base_filename = os.path.join(os.path.dirname(filename or ""), extends.get("file"))
+        base_services = interpolate_structure(load_docker_compose_file(base_filename), environment).get("services") or {}
+        base_service_directory = os.path.dirname(os.path.abspath(base_filename))
+    base = resolve_service(base_services, environment, base_service_directory, chain + ((base_filename, extends.get("service")),))
+    return merge_service(base, service)
+
+
+def get_environment(project_directory, env_files=None):
+    ''' Return the variables for interpolation: the ".env" file, or "env_files", overridden by the shell environment. '''
+    result = {}
+    if env_files is None:
+        add_docker_compose_dependency(os.path.join(project_directory, ".env"))
+        env_files = [os.path.join(project_directory, ".env")] if docker_compose_source_exists(os.path.join(project_directory, ".env")) else []
+    for env_file in env_files:
+        add_docker_compose_dependency(env_file)
+        result.update(read_env_file(env_file, dict(get_shell_environment())))
+    result.update(get_shell_environment())
+    return result
+
+
+def load_docker_compose_project(docker_compose_files, environment, project_directory):
+    ''' Return the services of docker-compose files, later files overriding earlier ones, with "include" and "extends" resolved,
+        and the top-level "name" of the project, from the last file that has one, or None.
+        Build contexts are absolute, each resolved against the project or file that defines it.
+    '''
+
+    result = {}
+    project_name = None
+    for filename in docker_compose_files:
+        directory = os.path.dirname(filename or "")
+        model = interpolate_structure(load_docker_compose_file(filename), environment)
+        project_name = model.get("name") or project_name
+
+        # Services of included projects come first. Each included project uses its own ".env" file or "env_file".
+
+        services = {}
+        for include in model.get("include") or []:
+            if isinstance(include, str):
+                include = {"path": include}
+            paths = include.get("path")
+            paths = [paths] if isinstance(paths, str) else paths
+            paths = [os.path.join(directory, path) for path in paths]
+            include_directory = os.path.join(directory, include.get("project_directory")) if include.get("project_directory") else os.path.dirname(paths[0])
+            env_files = include.get("env_file")
+            if isinstance(env_files, str):
+                env_files = [env_files]
+            if env_files is not None:
+                env_files = [os.path.join(directory, env_file) for env_file in env_files]
+            services.update(load_docker_compose_project(paths, get_environment(include_directory, env_files), include_directory)[0])
+
+        file_services = model.get("services") or {}
+        for name in file_services:
+            services[name] = resolve_service(file_services, environment, project_directory, ((filename, name),))
+
+        for name, service in services.items():
+            result[name] = merge_service(result.get(name, {}), service)
+
+    # A build without a context builds the directory of its project.
+
+    for name, service in result.items():
+        if isinstance(service.get("build"), dict) and not service.get("build").get("context"):
+            result[name] = dict(service, build=dict(service.get("build"), context=os.path.abspath(project_directory)))
+    return result, project_name
+
+
+def get_active_services(services, profiles):
+    ''' Return the names of services that run with the given profiles, including the services they depend on. '''
+
+    result = set()
+    pending = [name for name, service in services.items() if not service.get("profiles") or "*" in profiles or set(service.get("profiles")) & set(profiles)]
+    while pending:
+        name = pending.pop()
+        if name in result or name not in services:
+            continue
+        result.add(name)
+        pending += list(services.get(name).get("depends_on") or {})
+    return [name for name in services if name in result]
+
+
+def get_project_name(project_directory, environment, name=None):
+    ''' Return the project name, as docker compose makes it from COMPOSE_PROJECT_NAME, the top-level "name" of the project, or the project directory. '''
+    name = environment.get("COMPOSE_PROJECT_NAME") or name or os.path.basename(os.path.abspath(project_directory))
+    return re.sub(r"[^a-z0-9_-]", "", name.lower()).lstrip("_-")
+
+
+def get_build(project_name, name, service):
+    ''' Return how docker compose builds the image of a service that has "build" but no "image":
+        the image name, "docker build" arguments, the Dockerfile, and the services whose images it needs first.
+        The build context is absolute, as load_docker_compose_project() resolves it.
+    '''
+
+    build = service.get("build")
+    context = build.get("context")
+    remote = not is_local_build_context(context)
+    image = "{0}-{1}".format(project_name, name)
+
+    arguments = ["--tag", image]
+    dockerfile = None
+    if not remote:
+        dockerfile = os.path.join(context, build.get("dockerfile") or "Dockerfile")
+        arguments += ["--file", dockerfile]
+    args = build.get("args") or {}
+    if isinstance(args, list):
+        args = dict((arg.split("=", 1) + [None])[:2] for arg in args)
+    for key, value in args.items():
+        arguments += ["--build-arg", key if value is None else "{0}={1}".format(key, value)]
+    if build.get("target"):
+        arguments += ["--target", build.get("target")]
+    for cache_from in build.get("cache_from") or []:
+        arguments += ["--cache-from", cache_from]
+
+    # Additional contexts of the form "service:NAME" use the image built for another service.
+
+    depends_on = list(service.get("depends_on") or {})
+    additional_contexts = build.get("additional_contexts") or {}
+    if isinstance(additional_contexts, list):
+        additional_contexts = dict(additional_context.split("=", 1) for additional_context in additional_contexts)
+    for key, value in additional_contexts.items():
+        if value.startswith("service:"):
+            depends_on.append(value[len("service:"):])
+            value = "docker-image://{0}-{1}".format(project_name, value[len("service:"):])
+        arguments += ["--build-context", "{0}={1}".format(key, value)]
+
+    return {
+        "arguments": arguments + [context],
+        "depends_on": depends_on,
+        "dockerfile": dockerfile,
+        "image": image,
+        "project": project_name,
+        "service": name,
+    }
+
+
+def get_services_from_file(docker_compose_file, profiles=(), env_file=None):
+    ''' Return the unique images used by a docker-compose project, in file order, and the builds of services
+        that have "build" but no "image". None is STDIN. Services not in an active profile are left out.
+        "files" lists the files the result depends on: docker-compose files, ".env" files, and Dockerfiles.
+    '''
+
+    dependencies = set()
+    token = DOCKER_COMPOSE_DEPENDENCIES.set(dependencies)
+    try:
+        docker_compose_files = docker_compose_file.split(os.pathsep) if docker_compose_file else [None]
+        project_directory = os.path.dirname(os.path.abspath(docker_compose_files[0] or "."))
+        environment = get_environment(project_directory, [env_file] if env_file else None)
+        services, project_name = load_docker_compose_project(docker_compose_files, environment, project_directory)
+        active_services = get_active_services(services, profiles)
+        project_name = get_project_name(project_directory, environment, project_name)
+    finally:
+        DOCKER_COMPOSE_DEPENDENCIES.reset(token)
+
+    images = [services.get(name).get("image") for name in active_services]
+    builds = [get_build(project_name, name, services.get(name)) for name in active_services if services.get(name).get("build") and not services.get(name).get("image")]
+    dependencies.update(build.get("dockerfile") for build in builds if build.get("dockerfile"))
+    return {
+        "builds": builds,
+        "files": sorted(dependencies),
+        "images": list(dict.fromkeys(image for image in images if image)),
+    }
+
+
+def get_images_from_file(docker_compose_file, profiles=(), env_file=None):
+    ''' Return the list of unique images used by a docker-compose project, in file order. None is STDIN.
+        Services that are only built, or not in an active profile, have no image to pull.
+    '''
+    return get_services_from_file(docker_compose_file, profiles, env_file).get("images")
+
+
+def get_images_by_file(config):
+    ''' Return {docker_compose_file: images} for SENZING_DOCKER_COMPOSE_FILE, or {None: images} for STDIN. '''
+    return {docker_compose_file: services.get("images") for docker_compose_file, services in get_services_by_file(config).items()}
+
+
+def get_docker_compose_files(config):
+    ''' Return the docker-compose files of SENZING_DOCKER_COMPOSE_FILE, each once, in order. '''
+    result = []
+    for docker_compose_file in config.get('docker_compose_file') or []:
+        for filename in expand_docker_compose_file(docker_compose_file):
+            if filename not in result:
+                result.append(filename)
+    return result
+
+
+def get_services_by_file(config):
+    ''' Return {docker_compose_file: {"builds": ..., "images": ...}} for SENZING_DOCKER_COMPOSE_FILE, or for STDIN with a key of None.
+        Several files are parsed in parallel by up to SENZING_CONCURRENCY processes.
+    '''
+
+    docker_compose_files = get_docker_compose_files(config) or [None]
+    get_services_function = functools.partial(get_services_from_file, profiles=tuple(config.get('profiles') or []), env_file=config.get('env_file'))
+
+    result = {}
+    if len(docker_compose_files) == 1:
+        try:
+            result[docker_compose_files[0]] = get_services_function(docker_compose_files[0])
+        except (OSError, ValueError, yaml.YAMLError) as err:
+            exit_error(703, docker_compose_files[0] or "STDIN", err)
+        return result
+
+    max_workers = min(config.get('concurrency'), len(docker_compose_files))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {docker_compose_file: executor.submit(get_services_function, docker_compose_file) for docker_compose_file in docker_compose_files}
+        for docker_compose_file, future in futures.items():
+            try:
+                result[docker_compose_file] = future.result()
+            except (OSError, ValueError, yaml.YAMLError) as err:
+                exit_error(703, docker_compose_file, err)
+    return result
+
+
+def get_images(images_by_file):
+    ''' Return the list of unique images in all docker-compose files, in file order. '''
+    return list(dict.fromkeys(image for images in images_by_file.values() for image in images))
+
+
+def get_dockerfile_base_images(dockerfile):
+    ''' Return the images named by the FROM instructions of a Dockerfile, or none if it cannot be read. '''
+    try:
+        with open_docker_compose_source(dockerfile) as a_file:
+            return re.findall(r"^\s*FROM\s+(?:--\S+\s+)*(\S+)", a_file.read(), re.IGNORECASE | re.MULTILINE)
+    except (OSError, TypeError, UnicodeDecodeError):
+        return []
+
+
+def order_builds(services_by_file):
+    ''' Return the builds of all docker-compose files, each image once, with "dependencies": the built images it needs first.
+        Those are the images of the services in its "depends_on" and additional contexts, and the built images its Dockerfile starts FROM.
+        Builds come after their dependencies, and builds with longer chains of builds waiting on them come first.
+        Raise ValueError if dependencies form a cycle.
+    '''
+
+    builds = {}
+    for services in services_by_file.values():
+        for build in services.get("builds"):
+            builds.setdefault(build.get("image"), dict(build))
+    images_by_service = {(build.get("project"), build.get("service")): image for image, build in builds.items()}
+    for image, build in builds.items():
+        dependencies = [images_by_service.get((build.get("project"), service)) for service in build.get("depends_on")]
+        for base_image in get_dockerfile_base_images(build.get("dockerfile")):
+            base_image = base_image[:-len(":latest")] if base_image.endswith(":latest") else base_image
+            dependencies.append(base_image if base_image in builds else None)
+        build["dependencies"] = [dependency for dependency in dict.fromkeys(dependencies) if dependency and dependency != image]
+
+    result = []
+    done = set()
+    while len(result) < len(builds):
+        ready = [build for image, build in builds.items() if image not in done and set(build.get("dependencies")) <= done]
+        if not ready:
+            raise ValueError("Builds depend on each other in a cycle: {0}".format(", ".join(image for image in builds if image not in done)))
+        result += ready
+        done.update(build.get("image") for build in ready)
+
+    # An image's height is the length of the longest chain of builds waiting on it.
+
+    heights = {}
+    for build in reversed(result):
+        heights[build.get("image")] = max([heights.get(image) + 1 for image, other_build in builds.items() if build.get("image") in other_build.get("dependencies")] or [0])
+    result.sort(key=lambda build: -heights.get(build.get("image")))
+    return result
+
+
+def get_save_images_lists(config, services_by_file):
+    ''' Return the images_by_file, images, image_tags, and builds of a save-images.sh for services_by_file.
+        With a lock file, images are pinned to digests. Images of services that are only built are built, then saved like the others.
+        With a shard, only the images and builds of the shard are returned. Raise ValueError if builds depend on each other in a cycle.
+    '''
+
+    images_by_file = {docker_compose_file: services.get("images") for docker_compose_file, services in services_by_file.items()}
+    images, image_tags = apply_lock_file(config, get_images(images_by_file))
+    builds = order_builds(services_by_file)
+    for docker_compose_file, services in services_by_file.items():
+        images_by_file[docker_compose_file] = images_by_file.get(docker_compose_file) + [build.get("image") for build in services.get("builds")]
+    images += [build.get("image") for build in builds if build.get("image") not in images]
+    images, builds = select_shard(config, images, builds)
+    return images_by_file, images, image_tags, builds
+
+
+def create_docker_compose_files_text(images_by_file):
+    ''' Return "DOCKER_IMAGE_NAME DOCKER_COMPOSE_FILE" lines telling which docker-compose files use each image. STDIN is "-". '''
+    result = ""
+    for docker_compose_file, images in images_by_file.items():
+        for image in images:
+            if image:
+                result += "{0} {1}\n".format(image, docker_compose_file or "-")
+    return result
@@ -0,0 +1,644 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/configuration.py
+#   Build the configuration of a subcommand from command line options and environment variables, and check it.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import json
+import logging
+import os
+import re
+import shutil
+import time
+
+# Import from docker_compose_air_gapper.
+
+from .archive import COMPRESSIONS, get_index_filename, get_volume_filenames
+from .common import __updated__, __version__, exit_error, message_error, message_info
+from .compose import expand_docker_compose_file
+from .registry import parse_docker_auth_config
+from .shard import parse_shard
+
+# The "configuration_locator" describes where configuration variables are in:
+# 1) Command line options, 2) Environment variables, 3) Configuration files, 4) Default values
+
+CONFIGURATION_LOCATOR = {
+    "bandwidth_in_megabits_per_second": {
+        "default": 100,
+        "env": "SENZING_BANDWIDTH_IN_MEGABITS_PER_SECOND",
+        "cli": "bandwidth-in-megabits-per-second"
+    },
+    "bundles": {
+        "default": None,
+        "env": "SENZING_BUNDLES",
+        "cli": "bundle"
+    },
+    "cache_dir": {
+        "default": "~/.cache/docker-compose-air-gapper",
+        "env": "SENZING_CACHE_DIR",
+        "cli": "cache-dir"
+    },
+    "cache_max_entries": {
+        "default": 1024,
+        "env": "SENZING_CACHE_MAX_ENTRIES",
+        "cli": "cache-max-entries"
+    },
+    "cache_max_size_in_megabytes": {
+        "default": 10240,
+        "env": "SENZING_CACHE_MAX_SIZE_IN_MEGABYTES",
+        "cli": "cache-max-size-in-megabytes"
+    },
+    "cache_ttl_in_seconds": {
+        "default": 3600,
+        "env": "SENZING_CACHE_TTL_IN_SECONDS",
+        "cli": "cache-ttl-in-seconds"
+    },
+    "compression": {
+        "default": "gzip",
+        "env": "SENZING_COMPRESSION",
+        "cli": "compression"
+    },
+    "compression_level": {
+        "default": 0,
+        "env": "SENZING_COMPRESSION_LEVEL",
+        "cli": "compression-level"
+    },
+    "concurrency": {
+        "default": 4,
+        "env": "SENZING_CONCURRENCY",
+        "cli": "concurrency"
+    },
+    "debug": {
+        "default": False,
+        "env": "SENZING_DEBUG",
+        "cli": "debug"
+    },
+    "docker_auth_config": {
+        "default": None,
+        "env": "SENZING_DOCKER_AUTH_CONFIG",
+    },
+    "docker_config": {
+        "default": None,
+        "env": "SENZING_DOCKER_CONFIG",
+        "cli": "docker-config"
+    },
+    "env_file": {
+        "default": None,
+        "env": "SENZING_ENV_FILE",
+        "cli": "env-file"
+    },
+    "docker_compose_file": {
+        "default": None,
+        "env": "SENZING_DOCKER_COMPOSE_FILE",
+        "cli": "docker-compose-file"
+    },
+    "host": {
+        "default": "127.0.0.1",
+        "env": "SENZING_HOST",
+        "cli": "host"
+    },
+    "images": {
+        "default": None,
+        "env": "SENZING_IMAGES",
+        "cli": "image"
+    },
+    "index": {
+        "default": False,
+        "env": "SENZING_INDEX",
+        "cli": "index"
+    },
+    "input_directory": {
+        "default": None,
+        "env": "SENZING_INPUT_DIRECTORY",
+        "cli": "input-directory"
+    },
+    "input_file": {
+        "default": None,
+        "env": "SENZING_INPUT_FILE",
+        "cli": "input-file"
+    },
+    "insecure_registries": {
+        "default": None,
+        "env": "SENZING_INSECURE_REGISTRIES",
+        "cli": "insecure-registries"
+    },
+    "lock_file": {
+        "default": None,
+        "env": "SENZING_LOCK_FILE",
+        "cli": "lock-file"
+    },
+    "metrics_file": {
+        "default": None,
+        "env": "SENZING_METRICS_FILE",
+        "cli": "metrics-file"
+    },
+    "output_directory": {
+        "default": "~/docker-compose-air-gapper-watch",
+        "env": "SENZING_OUTPUT_DIRECTORY",
+        "cli": "output-directory"
+    },
+    "output_file": {
+        "default": None,
+        "env": "SENZING_OUTPUT_FILE",
+        "cli": "output-file"
+    },
+    "profiles": {
+        "default": None,
+        "env": "SENZING_PROFILES",
+        "cli": "profile"
+    },
+    "platforms": {
+        "default": None,
+        "env": "SENZING_PLATFORMS",
+        "cli": "platform"
+    },
+    "port": {
+        "default": 8250,
+        "env": "SENZING_PORT",
+        "cli": "port"
+    },
+    "poll_interval_in_seconds": {
+        "default": 2,
+        "env": "SENZING_POLL_INTERVAL_IN_SECONDS",
+        "cli": "poll-interval-in-seconds"
+    },
+    "previous_bundle_manifest": {
+        "default": None,
+        "env": "SENZING_PREVIOUS_BUNDLE_MANIFEST",
+        "cli": "previous-bundle-manifest"
+    },
+    "prometheus_file": {
+        "default": None,
+        "env": "SENZING_PROMETHEUS_FILE",
+        "cli": "prometheus-file"
+    },
+    "resume_dir": {
+        "default": None,
+        "env": "SENZING_RESUME_DIR",
+        "cli": "resume-dir"
+    },
+    "save_bundles": {
+        "default": False,
+        "env": "SENZING_SAVE_BUNDLES",
+        "cli": "save-bundles"
+    },
+    "shard": {
+        "default": None,
+        "env": "SENZING_SHARD",
+        "cli": "shard"
+    },
+    "sleep_time_in_seconds": {
+        "default": 0,
+        "env": "SENZING_SLEEP_TIME_IN_SECONDS",
+        "cli": "sleep-time-in-seconds"
+    },
+    "stream": {
+        "default": False,
+        "env": "SENZING_STREAM",
+        "cli": "stream"
+    },
+    "subcommand": {
+        "default": None,
+        "env": "SENZING_SUBCOMMAND",
+    },
+    "target_registry": {
+        "default": None,
+        "env": "SENZING_TARGET_REGISTRY",
+        "cli": "target-registry"
+    },
+    "volume_size_in_megabytes": {
+        "default": 0,
+        "env": "SENZING_VOLUME_SIZE_IN_MEGABYTES",
+        "cli": "volume-size-in-megabytes"
+    }
+}
+
+# Enumerate keys in 'configuration_locator' that should not be printed to the log.
+
+KEYS_TO_REDACT = [
+    "docker_auth_config",
+    "password",
+]
+
+# -----------------------------------------------------------------------------
+# Configuration
+# -----------------------------------------------------------------------------
+
+
+def get_configuration(subcommand, args):
+    ''' Order of precedence: CLI, OS environment variables, INI file, default. '''
+    result = {}
+
+    # Copy default values into configuration dictionary.
+
+    for key, value in list(CONFIGURATION_LOCATOR.items()):
+        result[key] = value.get('default', None)
+
+    # "Prime the pump" with command line args. This will be done again as the last step.
+
+    for key, value in list(args.__dict__.items()):
+        new_key = key.format(subcommand.replace('-', '_'))
+        if value:
+            result[new_key] = value
+
+    # Copy OS environment variables into configuration dictionary.
+
+    for key, value in list(CONFIGURATION_LOCATOR.items()):
+        os_env_var = value.get('env', None)
+        if os_env_var:
+            os_env_value = os.getenv(os_env_var, None)
+            if os_env_value:
+                result[key] = os_env_value
+
+    # Copy 'args' into configuration dictionary.
+
+    for key, value in list(args.__dict__.items()):
+        new_key = key.format(subcommand.replace('-', '_'))
+        if value:
+            result[new_key] = value
+
+    # Add program information.
+
+    result['program_version'] = __version__
+    result['program_updated'] = __updated__
+
+    # Special case: subcommand from command-line
+
+    if args.subcommand:
+        result['subcommand'] = args.subcommand
+
+    # Special case: Change boolean strings to booleans.
+
+    booleans = [
+        'debug',
+        'index',
+        'save_bundles',
+        'stream',
+    ]
+    for boolean in booleans:
+        boolean_value = result.get(boolean)
+        if isinstance(boolean_value, str):
+            boolean_value_lower_case = boolean_value.lower()
+            if boolean_value_lower_case in ['true', '1', 't', 'y', 'yes']:
+                result[boolean] = True
+            else:
+                result[boolean] = False
+
+    # Special case: Change comma-separated strings to lists.
+
+    lists = [
+        'bundles',
+        'docker_compose_file',
+        'images',
+        'insecure_registries',
+        'platforms',
+        'profiles',
+    ]
+    for a_list in lists:
+        list_value = result.get(a_list)
+        if isinstance(list_value, str):
+            result[a_list] = [item.strip() for item in list_value.split(",") if item.strip()]
+
+    # Special case: Change integer strings to integers.
+
+    integers = [
+        'bandwidth_in_megabits_per_second',
+        'cache_max_entries',
+        'cache_max_size_in_megabytes',
+        'cache_ttl_in_seconds',
+        'compression_level',
+        'concurrency',
+        'poll_interval_in_seconds',
+        'port',
+        'sleep_time_in_seconds',
+        'volume_size_in_megabytes',
+    ]
+    for integer in integers:
+        integer_string = result.get(integer)
+        result[integer] = int(integer_string)
+
+    return result
+
+
+def validate_concurrency(config):
+    ''' Return error messages for the "concurrency" of a subcommand. '''
+    concurrency = config.get('concurrency')
+    if concurrency < 1:
+        return [message_error(501, concurrency)]
+    return []
+
+
+def validate_compression(config):
+    ''' Return error messages for the compression of a bundle and its level. '''
+    compression = config.get('compression')
+    compression_level = config.get('compression_level')
+    if compression not in COMPRESSIONS:
+        return [message_error(504, ", ".join(COMPRESSIONS), compression)]
+    if compression_level and not 1 <= compression_level <= COMPRESSIONS[compression]["max_level"]:
+        return [message_error(505, compression, COMPRESSIONS[compression]["max_level"], compression_level)]
+    return []
+
+
+def validate_zstd(config):
+    ''' Return an error message if a bundle is compressed with zstd and it is not installed. '''
+    if config.get('compression') == "zstd" and not shutil.which("zstd"):
+        return [message_error(506, "zstd")]
+    return []
+
+
+def validate_volume_size(config):
+    ''' Return error messages for the size of the volumes of a bundle. '''
+    volume_size_in_megabytes = config.get('volume_size_in_megabytes')
+    if volume_size_in_megabytes < 0:
+        return [message_error(516, volume_size_in_megabytes)]
+    return []
+
+
+def validate_bundle_options(config):
+    ''' Return error messages for the options of subcommands that save or plan a bundle. '''
+
+    user_error_messages = validate_concurrency(config)
+
+    previous_bundle_manifest = config.get('previous_bundle_manifest')
+    if previous_bundle_manifest and not os.path.isfile(previous_bundle_manifest):
+        user_error_messages.append(message_error(502, previous_bundle_manifest))
+
+    if config.get('stream') and previous_bundle_manifest:
+        user_error_messages.append(message_error(503))
+
+    user_error_messages.extend(validate_compression(config))
+
+    lock_file = config.get('lock_file')
+    if lock_file and not os.path.isfile(lock_file):
+        user_error_messages.append(message_error(508, lock_file))
+
+    platforms = config.get('platforms') or []
+    for platform in platforms:
+        if not re.match(r"^[a-z0-9]+/[a-z0-9_]+(/[a-z0-9]+)?$", platform):
+            user_error_messages.append(message_error(513, platform))
+    if config.get('stream') and len(platforms) > 1:
+        user_error_messages.append(message_error(514, ",".join(platforms)))
+
+    return user_error_messages
+
+
+def validate_output_options(config):
+    ''' Return error messages for the volumes and the shard of the output of save-images.sh. '''
+
+    user_error_messages = validate_volume_size(config)
+
+    shard = config.get('shard')
+    if shard:
+        try:
+            parse_shard(shard)
+        except ValueError:
+            user_error_messages.append(message_error(522, shard))
+
+    return user_error_messages
+
+
+def validate_docker_compose_options(config):
+    ''' Return error messages for the docker-compose files and the env_file of a subcommand. '''
+
+    user_error_messages = []
+
+    for docker_compose_file in config.get('docker_compose_file') or []:
+        if not expand_docker_compose_file(docker_compose_file):
+            user_error_messages.append(message_error(511, docker_compose_file))
+
+    env_file = config.get('env_file')
+    if env_file and not os.path.isfile(env_file):
+        user_error_messages.append(message_error(512, env_file))
+
+    return user_error_messages
+
+
+def validate_lock_file_options(config):
+    ''' Return error messages for the options of create-lock-file. '''
+
+    user_error_messages = validate_concurrency(config)
+
+    cache_ttl_in_seconds = config.get('cache_ttl_in_seconds')
+    if cache_ttl_in_seconds < 0:
+        user_error_messages.append(message_error(509, cache_ttl_in_seconds))
+
+    return user_error_messages
+
+
+def validate_input_options(config):
+    ''' Return error messages for the bundle that load-images or push-images reads. '''
+
+    user_error_messages = validate_concurrency(config)
+
+    input_directory = config.get('input_directory')
+    input_file = config.get('input_file')
+    if input_directory and input_file:
+        user_error_messages.append(message_error(520))
+    elif input_file:
+        if not os.path.isfile(get_index_filename(input_file)) or not get_volume_filenames(input_file):
+            user_error_messages.append(message_error(519, input_file))
+    elif not input_directory or not os.path.isfile(os.path.join(input_directory, "images.txt")):
+        user_error_messages.append(message_error(518, input_directory))
+
+    return user_error_messages
+
+
+def validate_push_options(config):
+    ''' Return error messages for the options of push-images. '''
+    if not config.get('target_registry'):
+        return [message_error(517)]
+    return []
+
+
+def validate_metrics_options(config):
+    ''' Return error messages for the files metrics are written to. '''
+
+    user_error_messages = []
+
+    for key, variable in [('metrics_file', "SENZING_METRICS_FILE"), ('prometheus_file', "SENZING_PROMETHEUS_FILE")]:
+        metrics_file = config.get(key)
+        if metrics_file and not os.path.isdir(os.path.dirname(os.path.abspath(metrics_file))):
+            user_error_messages.append(message_error(521, variable, metrics_file))
+
+    return user_error_messages
+
+
+def validate_merge_options(config):
+    ''' Return error messages for the options of merge-bundles. '''
+
+    user_error_messages = []
+
+    bundles = config.get('bundles') or []
+    if not bundles:
+        user_error_messages.append(message_error(523))
+    for bundle in bundles:
+        if not os.path.isfile(os.path.join(bundle, "images.txt")) and not get_volume_filenames(bundle):
+            user_error_messages.append(message_error(524, bundle))
+
+    return user_error_messages + validate_compression(config) + validate_zstd(config) + validate_volume_size(config)
+
+
+def validate_plan_options(config):
+    ''' Return error messages for the options of plan. '''
+    bandwidth_in_megabits_per_second = config.get('bandwidth_in_megabits_per_second')
+    if bandwidth_in_megabits_per_second < 1:
+        return [message_error(515, bandwidth_in_megabits_per_second)]
+    return []
+
+
+def validate_cache_options(config):
+    ''' Return error messages for the size of the blob cache. '''
+    cache_max_size_in_megabytes = config.get('cache_max_size_in_megabytes')
+    if cache_max_size_in_megabytes < 0:
+        return [message_error(510, cache_max_size_in_megabytes)]
+    return []
+
+
+def validate_registry_options(config):
+    ''' Return error messages for the credentials of registries. '''
+    try:
+        parse_docker_auth_config(config.get('docker_auth_config'))
+    except ValueError as err:
+        return [message_error(529, err)]
+    return []
+
+
+def validate_save_options(config):
+    ''' Return error messages for the options of save-images. '''
+
+    user_error_messages = validate_zstd(config)
+
+    resume_dir = config.get('resume_dir')
+    if resume_dir and not os.path.isdir(resume_dir):
+        user_error_messages.append(message_error(507, resume_dir))
+
+    return user_error_messages
+
+
+def validate_serve_options(config):
+    ''' Return error messages for the options of serve. '''
+
+    user_error_messages = []
+
+    port = config.get('port')
+    if not 0 <= port <= 65535:
+        user_error_messages.append(message_error(527, port))
+
+    cache_max_entries = config.get('cache_max_entries')
+    if cache_max_entries < 1:
+        user_error_messages.append(message_error(528, cache_max_entries))
+
+    return user_error_messages
+
+
+def validate_watch_options(config):
+    ''' Return error messages for the options of watch. '''
+
+    user_error_messages = []
+
+    if not config.get('docker_compose_file'):
+        user_error_messages.append(message_error(525))
+
+    poll_interval_in_seconds = config.get('poll_interval_in_seconds')
+    if poll_interval_in_seconds < 1:
+        user_error_messages.append(message_error(526, poll_interval_in_seconds))
+
+    if config.get('save_bundles'):
+        user_error_messages.extend(validate_zstd(config))
+
+    return user_error_messages
+
+
+# The checks of the options of each subcommand, in the order their messages are logged.
+
+SUBCOMMAND_VALIDATORS = [
+    (['create-save-images', 'plan', 'save-images', 'watch'], validate_bundle_options),
+    (['create-save-images', 'save-images', 'watch'], validate_output_options),
+    (['create-lock-file', 'create-save-images', 'plan', 'save-images', 'watch'], validate_docker_compose_options),
+    (['create-lock-file'], validate_lock_file_options),
+    (['load-images', 'push-images'], validate_input_options),
+    (['push-images'], validate_push_options),
+    (['load-images', 'push-images', 'save-images'], validate_metrics_options),
+    (['merge-bundles'], validate_merge_options),
+    (['plan'], validate_plan_options),
+    (['cache-stats', 'prune-cache', 'save-images', 'watch'], validate_cache_options),
+    (['create-lock-file', 'plan', 'push-images', 'save-images', 'watch'], validate_registry_options),
+    (['save-images'], validate_save_options),
+    (['serve'], validate_serve_options),
+    (['watch'], validate_watch_options),
+]
+
+
+def validate_configuration(config):
+    ''' Check aggregate configuration from commandline options, environment variables, config files, and defaults. '''
+
+    user_warning_messages = []
+    user_error_messages = []
+
+    # Perform subcommand specific checking.
+
+    subcommand = config.get('subcommand')
+
+    for subcommands, validator in SUBCOMMAND_VALIDATORS:
+        if subcommand in subcommands:
+            user_error_messages.extend(validator(config))
+
+    # Log warning messages.
+
+    for user_warning_message in user_warning_messages:
+        logging.warning(user_warning_message)
+
+    # Log error messages.
+
+    for user_error_message in user_error_messages:
+        logging.error(user_error_message)
+
+    # Log where to go for help.
+
+    if len(user_warning_messages) > 0 or len(user_error_messages) > 0:
+        logging.info(message_info(293))
+
+    # If there are error messages, exit.
+
+    if len(user_error_messages) > 0:
+        exit_error(697)
+
+
+def redact_configuration(config):
+    ''' Return a shallow copy of config with certain keys removed. '''
+    result = config.copy()
+    for key in KEYS_TO_REDACT:
+        try:
+            result.pop(key)
+        except Exception:
+            pass
+    return result
+
+
+def entry_template(config):
+    ''' Format of entry message. '''
+    debug = config.get("debug", False)
+    config['start_time'] = time.time()
+    if debug:
+        final_config = config
+    else:
+        final_config = redact_configuration(config)
+    config_json = json.dumps(final_config, sort_keys=True)
+    return message_info(297, config_json)
+
+
+def exit_template(config):
+    ''' Format of exit message. '''
+    debug = config.get("debug", False)
+    stop_time = time.time()
+    config['stop_time'] = stop_time
+    config['elapsed_time'] = stop_time - config.get('start_time', stop_time)
+    if debug:
+        final_config = config
+    else:
+        final_config = redact_configuration(config)
+    config_json = json.dumps(final_config, sort_keys=True)
+    return message_info(298, config_json)
@@ -0,0 +1,81 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/library.py
+#   Functions for Python programs that import docker_compose_air_gapper.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import os
+
+# Import from docker_compose_air_gapper.
+
+from .bundle_scripts import create_load_images_text
+from .common import __updated__, __version__
+from .compose import get_docker_compose_files, get_save_images_lists, get_services_from_file
+from .configuration import CONFIGURATION_LOCATOR
+from .save_images_script import create_output_text
+from .serve import SERVE_OPTIONS, get_serve_request_config
+
+# -----------------------------------------------------------------------------
+# Library functions
+#   The API for use from Python, after "import docker_compose_air_gapper".
+#   These read docker-compose files as "create-save-images" does, but take arguments instead of
+#   SENZING_* environment variables, and raise exceptions instead of exiting:
+#   ValueError for bad arguments, OSError and yaml.YAMLError for files that cannot be read.
+#   Options are those of a "serve" request: compression, compression_level, concurrency,
+#   platforms, shard, stream, and volume_size_in_megabytes.
+# -----------------------------------------------------------------------------
+
+
+def get_library_configuration(options):
+    ''' Return the default configuration with the options of a library function. Raise ValueError for a bad option. '''
+
+    unknown_options = sorted(set(options) - set(SERVE_OPTIONS))
+    if unknown_options:
+        raise ValueError("Unknown options: {0}. Options are: {1}".format(", ".join(unknown_options), ", ".join(sorted(set(SERVE_OPTIONS) - {"profiles"}))))
+    config = {key: value.get('default') for key, value in CONFIGURATION_LOCATOR.items()}
+    config.update(program_version=__version__, program_updated=__updated__)
+    return get_serve_request_config(config, options)
+
+
+def get_library_services_by_file(docker_compose_files, profiles=(), env_file=None):
+    ''' Return {docker_compose_file: {"builds": ..., "files": ..., "images": ...}} for files, directories, and glob patterns.
+        Raise ValueError if they name no docker-compose file.
+    '''
+
+    if isinstance(docker_compose_files, (str, os.PathLike)):
+        docker_compose_files = [docker_compose_files]
+    filenames = get_docker_compose_files({"docker_compose_file": [os.fspath(docker_compose_file) for docker_compose_file in docker_compose_files]})
+    if not filenames:
+        raise ValueError("No docker-compose files found in: {0}".format(", ".join(os.fspath(docker_compose_file) for docker_compose_file in docker_compose_files)))
+    return {filename: get_services_from_file(filename, tuple(profiles), env_file) for filename in filenames}
+
+
+def extract_services(docker_compose_files, profiles=(), env_file=None):
+    ''' Return, for each docker-compose project, the images it pulls, the builds of services that have "build" but no "image",
+        and the files the result depends on. docker_compose_files is a path or a list of files, directories, and glob patterns,
+        resolved as docker compose does, with .env or env_file and the active profiles.
+    '''
+    return get_library_services_by_file(docker_compose_files, profiles, env_file)
+
+
+def extract_images(docker_compose_files, profiles=(), env_file=None):
+    ''' Return the unique images of docker-compose projects, in file order, including the images of services that are only built. '''
+    services_by_file = get_library_services_by_file(docker_compose_files, profiles, env_file)
+    _, images, _, _ = get_save_images_lists(get_library_configuration({}), services_by_file)
+    return images
+
+
+def render_save_images_script(docker_compose_files, profiles=(), env_file=None, **options):
+    ''' Return the save-images.sh that "create-save-images" would create for docker-compose projects. '''
+    config = get_library_configuration(dict(options, profiles=list(profiles)))
+    services_by_file = get_library_services_by_file(docker_compose_files, profiles, env_file)
+    images_by_file, images, image_tags, builds = get_save_images_lists(config, services_by_file)
+    return create_output_text(config, images, image_tags, images_by_file, builds)
+
+
+def render_load_images_script():
+    ''' Return the load-images.sh that every bundle holds. '''
+    return create_load_images_text()
@@ -0,0 +1,193 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/merge.py
+#   Merge the bundles of the shards of a save-images run into one bundle.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import functools
+import io
+import os
+import shutil
+
+# Import from standard library and https://pypi.org/, when first used.
+
+from .common import tarfile
+
+# Import from docker_compose_air_gapper.
+
+from .archive import ChunkReader, decompress_member, get_volume_filenames
+from .bundle import link_or_copy
+from .bundle_scripts import create_load_images_text
+from .registry import HTTP_CHUNK_SIZE
+
+# -----------------------------------------------------------------------------
+# Merge functions
+#   Bundles, such as the shards of a sharded save, are combined into one bundle directory:
+#     blobs/                  Each blob once. A blob in more than one bundle is the same file, because it is named by its digest.
+#     manifests/IMAGE_ID/     Taken from the first bundle that has the image.
+#     images.txt, ...         Lines of all bundles, each once. See MERGED_BUNDLE_FILES.
+#     load-images.sh          Created again.
+#   Extracted bundle directories are hard linked, when possible, and bundle files are read as a stream, without extracting them first.
+# -----------------------------------------------------------------------------
+
+
+# Files whose lines are merged, with the field that identifies a line, or None when the whole line does.
+
+MERGED_BUNDLE_FILES = {
+    "blobs.sha256": 1,
+    "bundle-manifest.txt": None,
+    "docker-compose-files.txt": None,
+    "images.txt": 0,
+    "journal.txt": None,
+    "platforms.txt": None,
+}
+
+
+def get_file_compression(filename):
+    ''' Return the compression of a file by its "magic number", as decompress_command in load-images.sh does. '''
+    with open(filename, "rb") as a_file:
+        magic_number = a_file.read(4)
+    if magic_number.startswith(b"\x1f\x8b"):
+        return "gzip"
+    if magic_number == b"\x28\xb5\x2f\xfd":
+        return "zstd"
+    return "none"
+
+
+def iterate_volumes(filenames):
+    ''' Yield the bytes of files, one after another. '''
+    for filename in filenames:
+        with open(filename, "rb") as a_file:
+            yield from iter(functools.partial(a_file.read, HTTP_CHUNK_SIZE), b"")
+
+
+class BundleMerger:
+    ''' Combine bundles into one bundle directory. Add bundles in order with add_bundle(), then call finish(). '''
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.bundle_number = 0
+        self.lines = {name: {} for name in MERGED_BUNDLE_FILES}
+        self.manifest_owners = {}
+        self.counts = {"blobs": 0, "duplicate_blobs": 0, "duplicate_size": 0}
+
+    def check_inside(self, filename, path):
+        ''' Raise RuntimeError unless a file, after following symbolic links, is in the merged bundle directory.
+            "path" names the file of the current bundle that uses it, for the message.
+        '''
+        output_dir = os.path.realpath(self.output_dir)
+        if os.path.commonpath([output_dir, os.path.realpath(filename)]) != output_dir:
+            raise RuntimeError("The bundle has a file outside the bundle directory: {0}".format(path))
+
+    def get_destination(self, path, size):
+        ''' Return where a file of the current bundle goes in the merged bundle, or None if it is not needed.
+            "path" is relative to the bundle directory. A destination reached through a symbolic link outside the bundle directory is refused.
+        '''
+        parts = path.split("/")
+        if path.startswith("/") or ".." in parts:
+            raise RuntimeError("The bundle has a file outside the bundle directory: {0}".format(path))
+        destination = os.path.join(self.output_dir, *parts)
+        self.check_inside(os.path.dirname(destination), path)
+        if parts[0] == "manifests" and len(parts) > 2:
+            if self.manifest_owners.setdefault(parts[1], self.bundle_number) != self.bundle_number:
+                return None
+        elif parts[0] == "blobs" and len(parts) > 1:
+            if os.path.lexists(destination):
+                self.counts["duplicate_blobs"] += 1
+                self.counts["duplicate_size"] += size
+                return None
+            self.counts["blobs"] += 1
+        else:
+            return None
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        return destination
+
+    def add_symlink(self, destination, target, path):
+        ''' Create a symbolic link, unless its target is outside the merged bundle directory. '''
+        self.check_inside(os.path.join(os.path.dirname(destination), target), path)
+        os.symlink(target, destination)
+
+    def add_lines(self, name, text):
+        ''' Add the lines of a file that is merged line by line. '''
+        field = MERGED_BUNDLE_FILES.get(name)
+        for line in text.splitlines():
+            if line.strip():
+                self.lines[name].setdefault(line.split()[field] if field is not None else line, line)
+
+    def add_directory(self, bundle_dir):
+        ''' Add an extracted bundle directory. Files are hard linked when possible. '''
+        if not os.path.isdir(os.path.join(bundle_dir, "manifests")):
+            raise RuntimeError("{0} has no manifests directory. A bundle made with STREAM=true cannot be merged.".format(bundle_dir))
+        for name in MERGED_BUNDLE_FILES:
+            if os.path.isfile(os.path.join(bundle_dir, name)):
+                with open(os.path.join(bundle_dir, name)) as a_file:
+                    self.add_lines(name, a_file.read())
+        for directory, _, filenames in os.walk(bundle_dir):
+            for filename in filenames:
+                source = os.path.join(directory, filename)
+                destination = self.get_destination(os.path.relpath(source, bundle_dir).replace(os.sep, "/"), os.lstat(source).st_size)
+                if not destination:
+                    continue
+                if os.path.islink(source):
+                    self.add_symlink(destination, os.readlink(source), os.path.relpath(source, bundle_dir))
+                else:
+                    link_or_copy(source, destination)
+
+    def add_file(self, bundle_file):
+        ''' Add a bundle file, or its volumes, reading it once as a stream. '''
+        volume_filenames = get_volume_filenames(bundle_file)
+        chunks = decompress_member(iterate_volumes(volume_filenames), get_file_compression(volume_filenames[0]))
+        root = None
+        has_manifests = False
+        with io.BufferedReader(ChunkReader(chunks), HTTP_CHUNK_SIZE) as stream, tarfile.open(fileobj=stream, mode="r|") as tar_file:
+            for tar_info in tar_file:
+                member_root, _, path = tar_info.name.strip("/").partition("/")
+                if tar_info.isdir():
+                    continue
+                if not path:
+                    raise RuntimeError("{0} has {1} outside a bundle directory. A bundle made with STREAM=true cannot be merged.".format(bundle_file, member_root))
+                if root and member_root != root:
+                    raise RuntimeError("{0} holds more than one bundle directory: {1} and {2}".format(bundle_file, root, member_root))
+                root = member_root
+                has_manifests = has_manifests or path.startswith("manifests/")
+                if path in MERGED_BUNDLE_FILES and tar_info.isreg():
+                    self.add_lines(path, tar_file.extractfile(tar_info).read().decode())
+                    continue
+                destination = self.get_destination(path, tar_info.size)
+                if not destination:
+                    continue
+                if tar_info.issym():
+                    self.add_symlink(destination, tar_info.linkname, path)
+                elif tar_info.islnk():
+                    source = os.path.join(self.output_dir, tar_info.linkname.strip("/").partition("/")[2])
+                    self.check_inside(source, path)
+                    link_or_copy(source, destination)
+                elif tar_info.isreg():
+                    with open(destination, "wb") as a_file:
+                        shutil.copyfileobj(tar_file.extractfile(tar_info), a_file, HTTP_CHUNK_SIZE)
+        if not has_manifests:
+            raise RuntimeError("{0} has no manifests directory. A bundle made with STREAM=true cannot be merged.".format(bundle_file))
+
+    def add_bundle(self, bundle):
+        ''' Add a bundle file or an extracted bundle directory. '''
+        self.bundle_number += 1
+        if os.path.isdir(bundle):
+            self.add_directory(bundle)
+        else:
+            self.add_file(bundle)
+
+    def finish(self):
+        ''' Write the merged files and load-images.sh. Return the number of images. '''
+        for name, lines in self.lines.items():
+            if lines:
+                with open(os.path.join(self.output_dir, name), "w") as a_file:
+                    for line in sorted(lines.values()) if name == "bundle-manifest.txt" else lines.values():
+                        a_file.write("{0}\n".format(line))
+        load_images_filename = os.path.join(self.output_dir, "load-images.sh")
+        with open(load_images_filename, "w") as a_file:
+            a_file.write(create_load_images_text())
+        os.chmod(load_images_filename, 0o755)
+        return len(self.lines.get("images.txt"))
@@ -0,0 +1,137 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/metrics.py
+#   Metrics of a run, written as a JSON report and as a Prometheus textfile.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import collections
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+# Import from docker_compose_air_gapper.
+
+from .common import MEGABYTES, message_info
+
+# -----------------------------------------------------------------------------
+# Metrics functions
+#   The report written to SENZING_METRICS_FILE, in the same format as METRICS_FILE of save-images.sh and load-images.sh:
+#     {"command", "created_on", "duration_seconds", "images": [{"image", "image_id", "platform", "result", "stages"}], "stages"}
+#   "stages" maps each stage, like "pull" or "compress", to {"bytes", "duration_seconds", "megabytes_per_second"}.
+# -----------------------------------------------------------------------------
+
+PROMETHEUS_METRICS = [
+    ("stage_duration_seconds", "Duration of a stage of an image or of the whole run."),
+    ("stage_bytes", "Bytes handled by a stage of an image or of the whole run."),
+    ("images", "Images by result."),
+    ("run_duration_seconds", "Duration of the whole run."),
+]
+
+
+def get_stage_metrics(size, seconds):
+    ''' Return the metrics of a stage that handled "size" bytes in "seconds". '''
+    return {
+        "bytes": size,
+        "duration_seconds": round(seconds, 3),
+        "megabytes_per_second": round(size / MEGABYTES / seconds, 2) if seconds > 0 else 0,
+    }
+
+
+class RunMetrics:
+    ''' Durations and bytes of the stages of a run, for each image and for the whole run.
+        A stage of an image worked on by several threads is timed from its first start to its last end.
+    '''
+
+    def __init__(self, command=None):
+        self.command = command
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.images = {}
+        self.stages = {}
+
+    def add(self, stage, start_time, size=0, image_id=None):
+        ''' Add work on a stage, from "start_time" until now, to an image or, without "image_id", to the run. '''
+        end_time = time.time()
+        with self.lock:
+            stages = self.stages if image_id is None else self.images.setdefault(image_id, {"stages": {}}).get("stages")
+            first_start_time, last_end_time, total_size = stages.get(stage, (start_time, end_time, 0))
+            stages[stage] = (min(first_start_time, start_time), max(last_end_time, end_time), total_size + size)
+
+    def set_result(self, image_id, image, platform, result):
+        ''' Record the name, platform, and result of an image. '''
+        with self.lock:
+            self.images.setdefault(image_id, {"stages": {}}).update({"image": image, "platform": platform or "", "result": result})
+
+    def report(self):
+        ''' Return the report of the run. '''
+
+        def get_stages_report(stages):
+            return {stage: get_stage_metrics(size, end_time - start_time) for stage, (start_time, end_time, size) in sorted(stages.items())}
+
+        with self.lock:
+            return {
+                "command": self.command,
+                "created_on": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "duration_seconds": round(time.time() - self.start_time, 3),
+                "images": [
+                    {
+                        "image": value.get("image", image_id),
+                        "image_id": image_id,
+                        "platform": value.get("platform", ""),
+                        "result": value.get("result", ""),
+                        "stages": get_stages_report(value.get("stages")),
+                    } for image_id, value in self.images.items()
+                ],
+                "stages": get_stages_report(self.stages),
+            }
+
+
+def create_prometheus_text(report):
+    ''' Return a report in the Prometheus text format, for the node_exporter textfile collector. '''
+
+    samples = {name: [] for name, _ in PROMETHEUS_METRICS}
+    command_label = 'command="{0}"'.format(report.get("command"))
+    stage_sources = [('{0},image="{1}",platform="{2}"'.format(command_label, image.get("image"), image.get("platform")), image.get("stages")) for image in report.get("images")]
+    stage_sources.append((command_label, report.get("stages")))
+    for labels, stages in stage_sources:
+        for stage, metrics in stages.items():
+            samples["stage_duration_seconds"].append(('{0},stage="{1}"'.format(labels, stage), "{0:.3f}".format(metrics.get("duration_seconds"))))
+            samples["stage_bytes"].append(('{0},stage="{1}"'.format(labels, stage), metrics.get("bytes")))
+    results = collections.Counter(image.get("result") for image in report.get("images"))
+    for result, count in results.items():
+        samples["images"].append(('{0},result="{1}"'.format(command_label, result), count))
+    samples["run_duration_seconds"].append((command_label, "{0:.3f}".format(report.get("duration_seconds"))))
+
+    lines = []
+    for name, help_text in PROMETHEUS_METRICS:
+        lines.append("# HELP docker_compose_air_gapper_{0} {1}".format(name, help_text))
+        lines.append("# TYPE docker_compose_air_gapper_{0} gauge".format(name))
+        lines += ["docker_compose_air_gapper_{0}{{{1}}} {2}".format(name, labels, value) for labels, value in samples.get(name)]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_files(config, metrics):
+    ''' Write the report of a run to SENZING_METRICS_FILE and, as a Prometheus textfile, to SENZING_PROMETHEUS_FILE.
+        The Prometheus textfile is renamed into place, so a collector never reads part of it.
+    '''
+
+    report = metrics.report()
+    metrics_file = config.get('metrics_file')
+    if metrics_file:
+        with open(metrics_file, "w") as a_file:
+            json.dump(report, a_file, indent=4)
+            a_file.write("\n")
+        logging.info(message_info(116, len(report.get("images")), metrics_file))
+    prometheus_file = config.get('prometheus_file')
+    if prometheus_file:
+        partial_filename = "{0}.{1}".format(prometheus_file, os.getpid())
+        with open(partial_filename, "w") as a_file:
+            a_file.write(create_prometheus_text(report))
+        os.replace(partial_filename, prometheus_file)
+        logging.info(message_info(116, len(report.get("images")), prometheus_file))
@@ -0,0 +1,682 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/parser.py
+#   The command line parser.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import argparse
+
+# -----------------------------------------------------------------------------
+# Define argument parser
+# -----------------------------------------------------------------------------
+
+
+def get_parser(selected_subcommand=None):
+    ''' Parse commandline arguments.
+        With selected_subcommand, only that subcommand's arguments are added, which makes startup faster.
+        The other subcommands are still listed in the help.
+    '''
+
+    subcommands = {
+        'cache-stats': {
+            "help": 'Report the number, size, and age of blobs in the blob cache.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--cache-dir": {
+                    "dest": "cache_dir",
+                    "metavar": "SENZING_CACHE_DIR",
+                    "help": "Directory for cached digest resolutions and blobs. Default: ~/.cache/docker-compose-air-gapper"
+                },
+                "--cache-max-size-in-megabytes": {
+                    "dest": "cache_max_size_in_megabytes",
+                    "metavar": "SENZING_CACHE_MAX_SIZE_IN_MEGABYTES",
+                    "help": "Size of the blob cache. Least recently used blobs are removed beyond this size. 0 disables the cache. Default: 10240"
+                },
+            },
+        },
+        'create-lock-file': {
+            "help": 'Resolve each image to a content digest and create a lock file.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--cache-dir": {
+                    "dest": "cache_dir",
+                    "metavar": "SENZING_CACHE_DIR",
+                    "help": "Directory for cached digest resolutions and blobs. Default: ~/.cache/docker-compose-air-gapper"
+                },
+                "--cache-ttl-in-seconds": {
+                    "dest": "cache_ttl_in_seconds",
+                    "metavar": "SENZING_CACHE_TTL_IN_SECONDS",
+                    "help": "Seconds a cached digest resolution is used before asking the registry again. Default: 3600"
+                },
+                "--concurrency": {
+                    "dest": "concurrency",
+                    "metavar": "SENZING_CONCURRENCY",
+                    "help": "Number of images to resolve at the same time. Default: 4"
+                },
+                "--docker-compose-file": {
+                    "dest": "docker_compose_file",
+                    "metavar": "SENZING_DOCKER_COMPOSE_FILE",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Locations of 'docker-compose.yaml' files, directories holding them, or glob patterns. Join override files with ':' as in COMPOSE_FILE. Default: STDIN"
+                },
+                "--env-file": {
+                    "dest": "env_file",
+                    "metavar": "SENZING_ENV_FILE",
+                    "help": "File of variables for interpolating docker-compose files. Default: '.env' next to each docker-compose file"
+                },
+                "--profile": {
+                    "dest": "profiles",
+                    "metavar": "SENZING_PROFILES",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Docker compose profiles to enable. Services in other profiles are not saved. Default: none"
+                },
+                "--docker-config": {
+                    "dest": "docker_config",
+                    "metavar": "SENZING_DOCKER_CONFIG",
+                    "help": "Directory of the docker config.json holding registry credentials, as from 'docker login'. Default: $DOCKER_CONFIG or ~/.docker"
+                },
+                "--insecure-registries": {
+                    "dest": "insecure_registries",
+                    "metavar": "SENZING_INSECURE_REGISTRIES",
+                    "help": "Comma-separated list of registries to access with HTTP instead of HTTPS. Default: none"
+                },
+                "--output-file": {
+                    "dest": "output_file",
+                    "metavar": "SENZING_OUTPUT_FILE",
+                    "help": "Send lock file to this file. Default: STDOUT"
+                },
+            },
+        },
+        'create-save-images': {
+            "help": 'Create the save-images.sh file.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--compression": {
+                    "dest": "compression",
+                    "metavar": "SENZING_COMPRESSION",
+                    "help": "Compression of the output file: gzip, zstd, or none. Default: gzip"
+                },
+                "--compression-level": {
+                    "dest": "compression_level",
+                    "metavar": "SENZING_COMPRESSION_LEVEL",
+                    "help": "Compression level. 1-9 for gzip, 1-22 for zstd. Default: 6 for gzip, 3 for zstd"
+                },
+                "--concurrency": {
+                    "dest": "concurrency",
+                    "metavar": "SENZING_CONCURRENCY",
+                    "help": "Number of images to pull and save at the same time. Default: 4"
+                },
+                "--docker-compose-file": {
+                    "dest": "docker_compose_file",
+                    "metavar": "SENZING_DOCKER_COMPOSE_FILE",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Locations of 'docker-compose.yaml' files, directories holding them, or glob patterns. Join override files with ':' as in COMPOSE_FILE. Default: STDIN"
+                },
+                "--env-file": {
+                    "dest": "env_file",
+                    "metavar": "SENZING_ENV_FILE",
+                    "help": "File of variables for interpolating docker-compose files. Default: '.env' next to each docker-compose file"
+                },
+                "--profile": {
+                    "dest": "profiles",
+                    "metavar": "SENZING_PROFILES",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Docker compose profiles to enable. Services in other profiles are not saved. Default: none"
+                },
+                "--lock-file": {
+                    "dest": "lock_file",
+                    "metavar": "SENZING_LOCK_FILE",
+                    "help": "Lock file from 'create-lock-file'. Images are pulled by digest and each digest is saved once. Default: none"
+                },
+                "--metrics-file": {
+                    "dest": "metrics_file",
+                    "metavar": "SENZING_METRICS_FILE",
+                    "help": "JSON report of the duration, bytes, and MB/s of each stage of each image, written by save-images.sh. Default: none"
+                },
+                "--output-file": {
+                    "dest": "output_file",
+                    "metavar": "SENZING_OUTPUT_FILE",
+                    "help": "Send output to this file. Default: STDOUT"
+                },
+                "--platform": {
+                    "dest": "platforms",
+                    "metavar": "SENZING_PLATFORMS",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Platforms, as os/arch[/variant], to pull and save. load-images.sh refuses other platforms. Default: the platform of docker"
+                },
+                "--previous-bundle-manifest": {
+                    "dest": "previous_bundle_manifest",
+                    "metavar": "SENZING_PREVIOUS_BUNDLE_MANIFEST",
+                    "help": "The 'bundle-manifest.txt' file of a bundle already on the air-gapped system. Only new blobs are saved. Default: none"
+                },
+                "--prometheus-file": {
+                    "dest": "prometheus_file",
+                    "metavar": "SENZING_PROMETHEUS_FILE",
+                    "help": "Prometheus textfile of the same metrics, written by save-images.sh. Default: none"
+                },
+                "--shard": {
+                    "dest": "shard",
+                    "metavar": "SENZING_SHARD",
+                    "help": "Save only shard K of N of the images, given as K/N, so N hosts can save parts of a bundle at the same time. Combine them with 'merge-bundles'. Default: all images"
+                },
+                "--stream": {
+                    "dest": "stream",
+                    "action": "store_true",
+                    "help": "Compress one 'docker save' of all images directly into the output file, without an uncompressed copy. (SENZING_STREAM) Default: False"
+                },
+                "--volume-size-in-megabytes": {
+                    "dest": "volume_size_in_megabytes",
+                    "metavar": "SENZING_VOLUME_SIZE_IN_MEGABYTES",
+                    "help": "Split the output file into numbered volumes of this size, with a checksum file and a script that verifies them. Default: 0 (one file)"
+                },
+            },
+        },
+        'load-images': {
+            "help": 'Load selected images of a bundle into docker. An indexed bundle file is read in place, without extracting it.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--concurrency": {
+                    "dest": "concurrency",
+                    "metavar": "SENZING_CONCURRENCY",
+                    "help": "Number of images to load at the same time. Default: 4"
+                },
+                "--image": {
+                    "dest": "images",
+                    "metavar": "SENZING_IMAGES",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Images to load, by name or by IMAGE_ID from images.txt. Default: all images for the platform of docker"
+                },
+                "--input-directory": {
+                    "dest": "input_directory",
+                    "metavar": "SENZING_INPUT_DIRECTORY",
+                    "help": "Extracted bundle directory, holding images.txt. Default: none"
+                },
+                "--input-file": {
+                    "dest": "input_file",
+                    "metavar": "SENZING_INPUT_FILE",
+                    "help": "Bundle file created with 'save-images --index', next to its .index.json file. Default: none"
+                },
+                "--metrics-file": {
+                    "dest": "metrics_file",
+                    "metavar": "SENZING_METRICS_FILE",
+                    "help": "JSON report of the duration, bytes, and MB/s of loading each image. Default: none"
+                },
+                "--prometheus-file": {
+                    "dest": "prometheus_file",
+                    "metavar": "SENZING_PROMETHEUS_FILE",
+                    "help": "Prometheus textfile of the same metrics, for the node_exporter textfile collector. Default: none"
+                },
+            },
+        },
+        'merge-bundles': {
+            "help": 'Combine bundles, such as the shards of a sharded save, into one bundle with one load-images.sh. Each blob is stored once.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--bundle": {
+                    "dest": "bundles",
+                    "metavar": "SENZING_BUNDLES",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Bundle files, or extracted bundle directories, to combine. An image in more than one bundle is taken from the first. Default: none"
+                },
+                "--compression": {
+                    "dest": "compression",
+                    "metavar": "SENZING_COMPRESSION",
+                    "help": "Compression of the output file: gzip, zstd, or none. Default: gzip"
+                },
+                "--compression-level": {
+                    "dest": "compression_level",
+                    "metavar": "SENZING_COMPRESSION_LEVEL",
+                    "help": "Compression level. 1-9 for gzip, 1-22 for zstd. Default: 6 for gzip, 3 for zstd"
+                },
+                "--index": {
+                    "dest": "index",
+                    "action": "store_true",
+                    "help": "Compress each file separately and write OUTPUT_FILE.index.json, so 'load-images' and 'push-images' can read selected images without extracting the bundle. (SENZING_INDEX) Default: False"
+                },
+                "--output-file": {
+                    "dest": "output_file",
+                    "metavar": "SENZING_OUTPUT_FILE",
+                    "help": "File to create. Default: ~/docker-compose-air-gapper-<timestamp>.tgz (.tar.zst or .tar, depending on SENZING_COMPRESSION)"
+                },
+                "--volume-size-in-megabytes": {
+                    "dest": "volume_size_in_megabytes",
+                    "metavar": "SENZING_VOLUME_SIZE_IN_MEGABYTES",
+                    "help": "Split the output file into numbered volumes of this size, with a checksum file and a script that verifies them. Default: 0 (one file)"
+                },
+            },
+        },
+        'plan': {
+            "help": 'Report the size of a bundle, the layers its images share, and its transfer time, by fetching only manifests.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--bandwidth-in-megabits-per-second": {
+                    "dest": "bandwidth_in_megabits_per_second",
+                    "metavar": "SENZING_BANDWIDTH_IN_MEGABITS_PER_SECOND",
+                    "help": "Bandwidth used to estimate the transfer time. Default: 100"
+                },
+                "--concurrency": {
+                    "dest": "concurrency",
+                    "metavar": "SENZING_CONCURRENCY",
+                    "help": "Number of manifests to fetch at the same time. Default: 4"
+                },
+                "--docker-compose-file": {
+                    "dest": "docker_compose_file",
+                    "metavar": "SENZING_DOCKER_COMPOSE_FILE",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Locations of 'docker-compose.yaml' files, directories holding them, or glob patterns. Join override files with ':' as in COMPOSE_FILE. Default: STDIN"
+                },
+                "--env-file": {
+                    "dest": "env_file",
+                    "metavar": "SENZING_ENV_FILE",
+                    "help": "File of variables for interpolating docker-compose files. Default: '.env' next to each docker-compose file"
+                },
+                "--profile": {
+                    "dest": "profiles",
+                    "metavar": "SENZING_PROFILES",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Docker compose profiles to enable. Services in other profiles are not saved. Default: none"
+                },
+                "--docker-config": {
+                    "dest": "docker_config",
+                    "metavar": "SENZING_DOCKER_CONFIG",
+                    "help": "Directory of the docker config.json holding registry credentials, as from 'docker login'. Default: $DOCKER_CONFIG or ~/.docker"
+                },
+                "--insecure-registries": {
+                    "dest": "insecure_registries",
+                    "metavar": "SENZING_INSECURE_REGISTRIES",
+                    "help": "Comma-separated list of registries to access with HTTP instead of HTTPS. Default: none"
+                },
+                "--lock-file": {
+                    "dest": "lock_file",
+                    "metavar": "SENZING_LOCK_FILE",
+                    "help": "Lock file from 'create-lock-file'. Images are pulled by digest and each digest is saved once. Default: none"
+                },
+                "--output-file": {
+                    "dest": "output_file",
+                    "metavar": "SENZING_OUTPUT_FILE",
+                    "help": "Send the JSON plan to this file. Default: STDOUT"
+                },
+                "--platform": {
+                    "dest": "platforms",
+                    "metavar": "SENZING_PLATFORMS",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Platforms, as os/arch[/variant], to plan for. Default: linux/amd64"
+                },
+                "--previous-bundle-manifest": {
+                    "dest": "previous_bundle_manifest",
+                    "metavar": "SENZING_PREVIOUS_BUNDLE_MANIFEST",
+                    "help": "The 'bundle-manifest.txt' file of a bundle already on the air-gapped system. Its blobs are not counted. Default: none"
+                },
+            },
+        },
+        'prune-cache': {
+            "help": 'Remove least recently used blobs from the blob cache until it fits SENZING_CACHE_MAX_SIZE_IN_MEGABYTES.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--cache-dir": {
+                    "dest": "cache_dir",
+                    "metavar": "SENZING_CACHE_DIR",
+                    "help": "Directory for cached digest resolutions and blobs. Default: ~/.cache/docker-compose-air-gapper"
+                },
+                "--cache-max-size-in-megabytes": {
+                    "dest": "cache_max_size_in_megabytes",
+                    "metavar": "SENZING_CACHE_MAX_SIZE_IN_MEGABYTES",
+                    "help": "Size of the blob cache. Least recently used blobs are removed beyond this size. 0 disables the cache. Default: 10240"
+                },
+            },
+        },
+        'push-images': {
+            "help": 'Push the images of a bundle to a registry. An indexed bundle file is read in place. Does not use docker.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--concurrency": {
+                    "dest": "concurrency",
+                    "metavar": "SENZING_CONCURRENCY",
+                    "help": "Number of blobs to upload at the same time. Default: 4"
+                },
+                "--image": {
+                    "dest": "images",
+                    "metavar": "SENZING_IMAGES",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Images to push, by name or by IMAGE_ID from images.txt. Default: all images"
+                },
+                "--input-directory": {
+                    "dest": "input_directory",
+                    "metavar": "SENZING_INPUT_DIRECTORY",
+                    "help": "Extracted bundle directory, holding images.txt. Default: none"
+                },
+                "--input-file": {
+                    "dest": "input_file",
+                    "metavar": "SENZING_INPUT_FILE",
+                    "help": "Bundle file created with 'save-images --index', next to its .index.json file. Default: none"
+                },
+                "--docker-config": {
+                    "dest": "docker_config",
+                    "metavar": "SENZING_DOCKER_CONFIG",
+                    "help": "Directory of the docker config.json holding registry credentials, as from 'docker login'. Default: $DOCKER_CONFIG or ~/.docker"
+                },
+                "--insecure-registries": {
+                    "dest": "insecure_registries",
+                    "metavar": "SENZING_INSECURE_REGISTRIES",
+                    "help": "Comma-separated list of registries to access with HTTP instead of HTTPS. Default: none"
+                },
+                "--metrics-file": {
+                    "dest": "metrics_file",
+                    "metavar": "SENZING_METRICS_FILE",
+                    "help": "JSON report of the duration and bytes of reading each image and uploading its blobs. Default: none"
+                },
+                "--output-file": {
+                    "dest": "output_file",
+                    "metavar": "SENZING_OUTPUT_FILE",
+                    "help": "Send the list of original and pushed image names to this file. Default: STDOUT"
+                },
+                "--prometheus-file": {
+                    "dest": "prometheus_file",
+                    "metavar": "SENZING_PROMETHEUS_FILE",
+                    "help": "Prometheus textfile of the same metrics, for the node_exporter textfile collector. Default: none"
+                },
+                "--target-registry": {
+                    "dest": "target_registry",
+                    "metavar": "SENZING_TARGET_REGISTRY",
+                    "help": "Registry, with an optional path, that replaces the registry of each image. Example: registry.example.com:5000/mirror. Default: none"
+                },
+            },
+        },
+        'save-images': {
+            "help": 'Save images directly from their registries into a TGZ file. Does not use docker.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--cache-dir": {
+                    "dest": "cache_dir",
+                    "metavar": "SENZING_CACHE_DIR",
+                    "help": "Directory for cached digest resolutions and blobs. Default: ~/.cache/docker-compose-air-gapper"
+                },
+                "--cache-max-size-in-megabytes": {
+                    "dest": "cache_max_size_in_megabytes",
+                    "metavar": "SENZING_CACHE_MAX_SIZE_IN_MEGABYTES",
+                    "help": "Size of the blob cache. Least recently used blobs are removed beyond this size. 0 disables the cache. Default: 10240"
+                },
+                "--compression": {
+                    "dest": "compression",
+                    "metavar": "SENZING_COMPRESSION",
+                    "help": "Compression of the output file: gzip, zstd, or none. Default: gzip"
+                },
+                "--compression-level": {
+                    "dest": "compression_level",
+                    "metavar": "SENZING_COMPRESSION_LEVEL",
+                    "help": "Compression level. 1-9 for gzip, 1-22 for zstd. Default: 6 for gzip, 3 for zstd"
+                },
+                "--concurrency": {
+                    "dest": "concurrency",
+                    "metavar": "SENZING_CONCURRENCY",
+                    "help": "Number of manifests and blobs to download at the same time. Default: 4"
+                },
+                "--docker-compose-file": {
+                    "dest": "docker_compose_file",
+                    "metavar": "SENZING_DOCKER_COMPOSE_FILE",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Locations of 'docker-compose.yaml' files, directories holding them, or glob patterns. Join override files with ':' as in COMPOSE_FILE. Default: STDIN"
+                },
+                "--env-file": {
+                    "dest": "env_file",
+                    "metavar": "SENZING_ENV_FILE",
+                    "help": "File of variables for interpolating docker-compose files. Default: '.env' next to each docker-compose file"
+                },
+                "--profile": {
+                    "dest": "profiles",
+                    "metavar": "SENZING_PROFILES",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Docker compose profiles to enable. Services in other profiles are not saved. Default: none"
+                },
+                "--index": {
+                    "dest": "index",
+                    "action": "store_true",
+                    "help": "Compress each file separately and write OUTPUT_FILE.index.json, so 'load-images' and 'push-images' can read selected images without extracting the bundle. (SENZING_INDEX) Default: False"
+                },
+                "--docker-config": {
+                    "dest": "docker_config",
+                    "metavar": "SENZING_DOCKER_CONFIG",
+                    "help": "Directory of the docker config.json holding registry credentials, as from 'docker login'. Default: $DOCKER_CONFIG or ~/.docker"
+                },
+                "--insecure-registries": {
+                    "dest": "insecure_registries",
+                    "metavar": "SENZING_INSECURE_REGISTRIES",
+                    "help": "Comma-separated list of registries to access with HTTP instead of HTTPS. Default: none"
+                },
+                "--lock-file": {
+                    "dest": "lock_file",
+                    "metavar": "SENZING_LOCK_FILE",
+                    "help": "Lock file from 'create-lock-file'. Images are pulled by digest and each digest is saved once. Default: none"
+                },
+                "--metrics-file": {
+                    "dest": "metrics_file",
+                    "metavar": "SENZING_METRICS_FILE",
+                    "help": "JSON report of the duration, bytes, and MB/s of each stage of each image. Default: none"
+                },
+                "--output-file": {
+                    "dest": "output_file",
+                    "metavar": "SENZING_OUTPUT_FILE",
+                    "help": "File to create. Default: ~/docker-compose-air-gapper-<timestamp>.tgz (.tar.zst or .tar, depending on SENZING_COMPRESSION)"
+                },
+                "--resume-dir": {
+                    "dest": "resume_dir",
+                    "metavar": "SENZING_RESUME_DIR",
+                    "help": "Bundle directory of an earlier, unfinished run to continue. Default: none"
+                },
+                "--platform": {
+                    "dest": "platforms",
+                    "metavar": "SENZING_PLATFORMS",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Platforms, as os/arch[/variant], to pull and save. load-images.sh refuses other platforms. Default: linux/amd64"
+                },
+                "--previous-bundle-manifest": {
+                    "dest": "previous_bundle_manifest",
+                    "metavar": "SENZING_PREVIOUS_BUNDLE_MANIFEST",
+                    "help": "The 'bundle-manifest.txt' file of a bundle already on the air-gapped system. Only new blobs are saved. Default: none"
+                },
+                "--prometheus-file": {
+                    "dest": "prometheus_file",
+                    "metavar": "SENZING_PROMETHEUS_FILE",
+                    "help": "Prometheus textfile of the same metrics, for the node_exporter textfile collector. Default: none"
+                },
+                "--shard": {
+                    "dest": "shard",
+                    "metavar": "SENZING_SHARD",
+                    "help": "Save only shard K of N of the images, given as K/N, so N hosts can save parts of a bundle at the same time. Combine them with 'merge-bundles'. Default: all images"
+                },
+                "--volume-size-in-megabytes": {
+                    "dest": "volume_size_in_megabytes",
+                    "metavar": "SENZING_VOLUME_SIZE_IN_MEGABYTES",
+                    "help": "Split the output file into numbered volumes of this size, with a checksum file and a script that verifies them. Default: 0 (one file)"
+                },
+            },
+        },
+        'serve': {
+            "help": 'Serve HTTP requests that return save-images.sh, load-images.sh, and the images of docker-compose files sent as JSON.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--cache-max-entries": {
+                    "dest": "cache_max_entries",
+                    "metavar": "SENZING_CACHE_MAX_ENTRIES",
+                    "help": "Number of responses kept in memory. Least recently used responses are removed beyond this number. Default: 1024"
+                },
+                "--host": {
+                    "dest": "host",
+                    "metavar": "SENZING_HOST",
+                    "help": "Address to listen on. Use 0.0.0.0 to accept requests from other hosts. Default: 127.0.0.1"
+                },
+                "--port": {
+                    "dest": "port",
+                    "metavar": "SENZING_PORT",
+                    "help": "Port to listen on. 0 picks a free port. Default: 8250"
+                },
+            },
+        },
+        'sleep': {
+            "help": 'Do nothing but sleep. For Docker testing.',
+            "arguments": {
+                "--sleep-time-in-seconds": {
+                    "dest": "sleep_time_in_seconds",
+                    "metavar": "SENZING_SLEEP_TIME_IN_SECONDS",
+                    "help": "Sleep time in seconds. DEFAULT: 0 (infinite)"
+                },
+            },
+        },
+        'version': {
+            "help": 'Print version of program.',
+        },
+        'watch': {
+            "help": 'Watch docker-compose files and, when they change, create save-images.sh for the images that were added or changed.',
+            "argument_aspects": ["common"],
+            "arguments": {
+                "--cache-dir": {
+                    "dest": "cache_dir",
+                    "metavar": "SENZING_CACHE_DIR",
+                    "help": "Directory for cached digest resolutions and blobs. Default: ~/.cache/docker-compose-air-gapper"
+                },
+                "--cache-max-size-in-megabytes": {
+                    "dest": "cache_max_size_in_megabytes",
+                    "metavar": "SENZING_CACHE_MAX_SIZE_IN_MEGABYTES",
+                    "help": "Size of the blob cache. Least recently used blobs are removed beyond this size. 0 disables the cache. Default: 10240"
+                },
+                "--compression": {
+                    "dest": "compression",
+                    "metavar": "SENZING_COMPRESSION",
+                    "help": "Compression of the output files: gzip, zstd, or none. Default: gzip"
+                },
+                "--compression-level": {
+                    "dest": "compression_level",
+                    "metavar": "SENZING_COMPRESSION_LEVEL",
+                    "help": "Compression level. 1-9 for gzip, 1-22 for zstd. Default: 6 for gzip, 3 for zstd"
+                },
+                "--concurrency": {
+                    "dest": "concurrency",
+                    "metavar": "SENZING_CONCURRENCY",
+                    "help": "Number of images to save at the same time. Default: 4"
+                },
+                "--docker-compose-file": {
+                    "dest": "docker_compose_file",
+                    "metavar": "SENZING_DOCKER_COMPOSE_FILE",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Locations of 'docker-compose.yaml' files, directories holding them, or glob patterns, to watch. Join override files with ':' as in COMPOSE_FILE. Required"
+                },
+                "--env-file": {
+                    "dest": "env_file",
+                    "metavar": "SENZING_ENV_FILE",
+                    "help": "File of variables for interpolating docker-compose files. Default: '.env' next to each docker-compose file"
+                },
+                "--profile": {
+                    "dest": "profiles",
+                    "metavar": "SENZING_PROFILES",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Docker compose profiles to enable. Services in other profiles are not saved. Default: none"
+                },
+                "--docker-config": {
+                    "dest": "docker_config",
+                    "metavar": "SENZING_DOCKER_CONFIG",
+                    "help": "Directory of the docker config.json holding registry credentials, as from 'docker login'. Default: $DOCKER_CONFIG or ~/.docker"
+                },
+                "--insecure-registries": {
+                    "dest": "insecure_registries",
+                    "metavar": "SENZING_INSECURE_REGISTRIES",
+                    "help": "Comma-separated list of registries to access with HTTP instead of HTTPS. Default: none"
+                },
+                "--lock-file": {
+                    "dest": "lock_file",
+                    "metavar": "SENZING_LOCK_FILE",
+                    "help": "Lock file from 'create-lock-file'. Images are pinned to digests. The lock file is watched too. Default: none"
+                },
+                "--output-directory": {
+                    "dest": "output_directory",
+                    "metavar": "SENZING_OUTPUT_DIRECTORY",
+                    "help": "Directory for save-images.sh, the save-images-<timestamp>.sh and changes-<timestamp>.json of each change, and bundles. Default: ~/docker-compose-air-gapper-watch"
+                },
+                "--platform": {
+                    "dest": "platforms",
+                    "metavar": "SENZING_PLATFORMS",
+                    "nargs": "+",
+                    "action": "extend",
+                    "help": "Platforms, as os/arch[/variant], to save. load-images.sh refuses other platforms. Default: linux/amd64"
+                },
+                "--poll-interval-in-seconds": {
+                    "dest": "poll_interval_in_seconds",
+                    "metavar": "SENZING_POLL_INTERVAL_IN_SECONDS",
+                    "help": "Seconds between checks of the watched files when filesystem notifications are not available. Default: 2"
+                },
+                "--previous-bundle-manifest": {
+                    "dest": "previous_bundle_manifest",
+                    "metavar": "SENZING_PREVIOUS_BUNDLE_MANIFEST",
+                    "help": "The 'bundle-manifest.txt' file of a bundle already on the air-gapped system. Only new blobs are saved. Default: none"
+                },
+                "--save-bundles": {
+                    "dest": "save_bundles",
+                    "action": "store_true",
+                    "help": "Also save the added and changed images from their registries into a bundle for each change, as 'save-images' does. Each bundle holds only blobs not in the bundles before it. (SENZING_SAVE_BUNDLES) Default: False"
+                },
+                "--shard": {
+                    "dest": "shard",
+                    "metavar": "SENZING_SHARD",
+                    "help": "Watch only shard K of N of the images, given as K/N. Default: all images"
+                },
+            },
+        },
+        'docker-acceptance-test': {
+            "help": 'For Docker acceptance testing.',
+        },
+    }
+
+    # Define argument_aspects.
+
+    argument_aspects = {
+        "common": {
+            "--debug": {
+                "dest": "debug",
+                "action": "store_true",
+                "help": "Enable debugging. (SENZING_DEBUG) Default: False"
+            },
+        },
+    }
+
+    # Augment "subcommands" variable with arguments specified by aspects.
+
+    for subcommand, subcommand_value in subcommands.items():
+        if 'argument_aspects' in subcommand_value:
+            for aspect in subcommand_value['argument_aspects']:
+                if 'arguments' not in subcommands[subcommand]:
+                    subcommands[subcommand]['arguments'] = {}
+                arguments = argument_aspects.get(aspect, {})
+                for argument, argument_value in arguments.items():
+                    subcommands[subcommand]['arguments'][argument] = argument_value
+
+    parser = argparse.ArgumentParser(prog="docker-compose-air-gapper.py", description="Initialize Senzing installation. For more information, see https://github.com/senzing-garage/docker-compose-air-gapper")
+    subparsers = parser.add_subparsers(dest='subcommand', help='Subcommands (SENZING_SUBCOMMAND):')
+
+    for subcommand_key, subcommand_values in subcommands.items():
+        subcommand_help = subcommand_values.get('help', "")
+        subcommand_arguments = subcommand_values.get('arguments', {})
+        subparser = subparsers.add_parser(subcommand_key, help=subcommand_help)
+        if selected_subcommand not in [None, subcommand_key]:
+            continue
+        for argument_key, argument_values in subcommand_arguments.items():
+            subparser.add_argument(argument_key, **argument_values)
+
+    return parser
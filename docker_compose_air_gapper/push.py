@@ -0,0 +1,328 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/push.py
+#   Push the images of a bundle to a registry.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import functools
+import hashlib
+import json
+import time
+
+# Import from standard library and https://pypi.org/, when first used.
+
+from .common import concurrent, urllib
+
+# Import from docker_compose_air_gapper.
+
+from .metrics import RunMetrics
+from .registry import (
+    DEFAULT_PLATFORM,
+    HTTP_CHUNK_SIZE,
+    MEDIA_TYPES_INDEX,
+    create_registry_client,
+    digest_path,
+    parse_image_reference,
+)
+
+# -----------------------------------------------------------------------------
+# Push functions
+#   Images in a bundle are uploaded to a registry, as "docker push" would.
+#   See https://distribution.github.io/distribution/spec/api/#pushing-an-image
+# -----------------------------------------------------------------------------
+
+
+MEDIA_TYPE_OCI_CONFIG = "application/vnd.oci.image.config.v1+json"
+MEDIA_TYPE_OCI_INDEX = "application/vnd.oci.image.index.v1+json"
+MEDIA_TYPE_OCI_LAYER = "application/vnd.oci.image.layer.v1.tar"
+MEDIA_TYPE_OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+
+
+def get_target_image(image, target_registry):
+    ''' Replace the registry of an image reference with a target registry and optional path.
+        Example: senzing/xterm:1.4.3 becomes registry.example.com:5000/mirror/senzing/xterm:1.4.3
+    '''
+    first_component, _, remainder = image.partition("/")
+    if remainder and ("." in first_component or ":" in first_component or first_component == "localhost"):
+        image = remainder
+    return "{0}/{1}".format(target_registry.rstrip("/"), image)
+
+
+def get_file_digest(bundle, path):
+    ''' Return the "sha256:..." digest of a file of a bundle. '''
+    hasher = hashlib.sha256()
+    with bundle.open(path) as a_file:
+        for chunk in iter(lambda: a_file.read(HTTP_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return "sha256:{0}".format(hasher.hexdigest())
+
+
+def get_blob_digest(bundle, path):
+    ''' Return (digest, blob) of a blob listed in a "docker save" manifest.json. '''
+    blob = bundle.find_blob(path)
+    if path.startswith("blobs/sha256/"):
+        return "sha256:{0}".format(path.rsplit("/", 1)[-1]), blob
+    if not blob:
+        raise RuntimeError("{0} is not in this bundle or a previous bundle.".format(path))
+    return get_file_digest(bundle, blob), blob
+
+
+def read_bundle_image(bundle, image_id):
+    ''' Return the registry manifest of an image in a bundle, with the blobs it needs.
+        The manifest saved with the image is used when the bundle has it, so the image keeps its digest.
+        Otherwise, as for bundles from older versions of "docker save", an OCI manifest is made from manifest.json.
+    '''
+
+    image_manifest_dir = "manifests/{0}".format(image_id)
+    with bundle.open("{0}/manifest.json".format(image_manifest_dir)) as a_file:
+        docker_manifest = json.load(a_file)[0]
+    config_digest, config_blob = get_blob_digest(bundle, docker_manifest.get("Config"))
+
+    # Find the saved manifest. An index, as saved by docker's containerd image store, leads to the manifest with this config.
+
+    descriptors = []
+    if bundle.exists("{0}/index.json".format(image_manifest_dir)):
+        with bundle.open("{0}/index.json".format(image_manifest_dir)) as a_file:
+            descriptors = json.load(a_file).get("manifests", [])
+    manifest = None
+    while descriptors:
+        descriptor = descriptors.pop(0)
+        blob = bundle.find_blob(digest_path(descriptor.get("digest")))
+        if not blob:
+            continue
+        with bundle.open(blob) as a_file:
+            content = a_file.read()
+        if descriptor.get("mediaType") in MEDIA_TYPES_INDEX:
+            descriptors = json.loads(content).get("manifests", []) + descriptors
+        elif json.loads(content).get("config", {}).get("digest") == config_digest:
+            manifest = {
+                "content": content,
+                "digest": descriptor.get("digest"),
+                "media_type": descriptor.get("mediaType"),
+            }
+            break
+
+    # Without a saved manifest, make one.
+
+    blobs = [(config_digest, config_blob)]
+    if manifest:
+        for layer in json.loads(manifest.get("content")).get("layers", []):
+            if not layer.get("urls"):
+                blobs.append((layer.get("digest"), bundle.find_blob(digest_path(layer.get("digest")))))
+    else:
+        layers = []
+        for layer_path in docker_manifest.get("Layers"):
+            layer_digest, layer_blob = get_blob_digest(bundle, layer_path)
+            blobs.append((layer_digest, layer_blob))
+            layers.append({
+                "mediaType": MEDIA_TYPE_OCI_LAYER,
+                "digest": layer_digest,
+                "size": bundle.size(layer_blob) if layer_blob else 0,
+            })
+        content = json.dumps({
+            "schemaVersion": 2,
+            "mediaType": MEDIA_TYPE_OCI_MANIFEST,
+            "config": {
+                "mediaType": MEDIA_TYPE_OCI_CONFIG,
+                "digest": config_digest,
+                "size": bundle.size(config_blob),
+            },
+            "layers": layers,
+        }, separators=(",", ":")).encode()
+        manifest = {
+            "content": content,
+            "digest": "sha256:{0}".format(hashlib.sha256(content).hexdigest()),
+            "media_type": MEDIA_TYPE_OCI_MANIFEST,
+        }
+
+    manifest["blobs"] = blobs
+    manifest["tags"] = docker_manifest.get("RepoTags") or []
+    return manifest
+
+
+def upload_blob(registry_client, bundle, image_reference, blob, mount_from=None):
+    ''' Upload a blob unless the repository already has it. Return "exists", "mounted", or "uploaded".
+        "blob" is (digest, file of the blob in the bundle), as in the "blobs" of read_bundle_image().
+        With "mount_from", the registry is first asked to link the blob from another of its repositories.
+    '''
+
+    digest, blob_file = blob
+    repository = image_reference.get("repository")
+    with registry_client.request("HEAD", image_reference, "/v2/{0}/blobs/{1}".format(repository, digest)) as response:
+        response.read()
+        if response.status == 200:
+            return "exists"
+
+    path = "/v2/{0}/blobs/uploads/".format(repository)
+    if mount_from:
+        path += "?" + urllib.parse.urlencode({"mount": digest, "from": mount_from})
+    with registry_client.request("POST", image_reference, path) as response:
+        response.read()
+        if response.status == 201:
+            return "mounted"
+        if response.status != 202:
+            raise RuntimeError("POST {0} returned HTTP {1}".format(path, response.status))
+        location = response.headers.get("Location")
+
+    if not blob_file:
+        raise RuntimeError("{0} is not in this bundle, a previous bundle, or the registry.".format(digest))
+    location = "{0}{1}{2}".format(location, "&" if "?" in location else "?", urllib.parse.urlencode({"digest": digest}))
+    headers = {
+        "Content-Length": str(bundle.size(blob_file)),
+        "Content-Type": "application/octet-stream",
+    }
+    with registry_client.request("PUT", image_reference, location, headers=headers, body=functools.partial(bundle.open, blob_file)) as response:
+        response.read()
+        if response.status != 201:
+            raise RuntimeError("PUT {0} returned HTTP {1}".format(digest, response.status))
+    return "uploaded"
+
+
+def put_manifest(registry_client, image_reference, reference, media_type, content):
+    ''' Upload a manifest or manifest index under a tag or digest. '''
+    path = "/v2/{0}/manifests/{1}".format(image_reference.get("repository"), reference)
+    with registry_client.request("PUT", image_reference, path, headers={"Content-Type": media_type}, body=content) as response:
+        response.read()
+        if response.status not in [200, 201]:
+            raise RuntimeError("PUT {0} returned HTTP {1}".format(path, response.status))
+
+
+def get_platform_object(platform):
+    ''' Change "os/architecture[/variant]" into the "platform" object of a manifest index. '''
+    parts = platform.split("/")
+    result = {
+        "architecture": parts[1],
+        "os": parts[0],
+    }
+    if len(parts) > 2:
+        result["variant"] = parts[2]
+    return result
+
+
+def read_bundle_manifests(bundle, bundle_images, target_registry, metrics):
+    ''' Read the manifest of each image of a bundle, as read_bundle_image() returns it, adding its "image" and "platform".
+        Return (manifests, targets, failures): manifests by image ID, the image IDs of each name in the target registry, and errors by image.
+        Images saved for several platforms share their target names.
+    '''
+
+    manifests = {}
+    targets = {}
+    failures = {}
+    for image_id, image, platform in bundle_images:
+        start_time = time.time()
+        try:
+            bundle_image = read_bundle_image(bundle, image_id)
+        except Exception as err:
+            failures[image] = err
+            continue
+        metrics.add("read", start_time, len(bundle_image.get("content")), image_id)
+        bundle_image.update({"image": image, "platform": platform})
+        manifests[image_id] = bundle_image
+        for name in bundle_image.get("tags") or [image]:
+            targets.setdefault(get_target_image(name, target_registry), []).append(image_id)
+    return manifests, targets, failures
+
+
+def put_image_manifests(registry_client, target, bundle_images):
+    ''' Upload the manifests of the images of a name in the target registry. Images for several platforms get a manifest index.
+        Return the name of the pushed image, with the digest of its manifest when the name has no tag.
+    '''
+
+    image_reference = parse_image_reference(target)
+    if len(bundle_images) == 1:
+        bundle_image = bundle_images[0]
+        reference = image_reference.get("tag") or bundle_image.get("digest")
+        put_manifest(registry_client, image_reference, reference, bundle_image.get("media_type"), bundle_image.get("content"))
+        if not image_reference.get("tag"):
+            return "{0}@{1}".format(target.split("@", 1)[0], bundle_image.get("digest"))
+        return target
+
+    index = {
+        "schemaVersion": 2,
+        "mediaType": MEDIA_TYPE_OCI_INDEX,
+        "manifests": [],
+    }
+    for bundle_image in bundle_images:
+        put_manifest(registry_client, image_reference, bundle_image.get("digest"), bundle_image.get("media_type"), bundle_image.get("content"))
+        index["manifests"].append({
+            "mediaType": bundle_image.get("media_type"),
+            "digest": bundle_image.get("digest"),
+            "size": len(bundle_image.get("content")),
+            "platform": get_platform_object(bundle_image.get("platform") or DEFAULT_PLATFORM),
+        })
+    put_manifest(registry_client, image_reference, image_reference.get("tag") or "latest", MEDIA_TYPE_OCI_INDEX, json.dumps(index).encode())
+    return target
+
+
+def push_images(config, bundle, bundle_images, metrics=None):
+    ''' Push images of a bundle to SENZING_TARGET_REGISTRY. Return (pushed, failures, counts).
+        "pushed" maps each original image name to its name in the target registry.
+        The "read" and "push" stages are added to "metrics". Each blob counts toward the first image that uses it.
+    '''
+
+    metrics = metrics or RunMetrics()
+    registry_client = create_registry_client(config, actions="pull,push")
+    manifests, targets, failures = read_bundle_manifests(bundle, bundle_images, config.get('target_registry'), metrics)
+
+    # Upload each blob once, to the first repository that needs it. Other repositories mount it from there.
+
+    first_uploads = {}
+    mounts = {}
+    blob_image_ids = {}
+    for target, image_ids in targets.items():
+        image_reference = parse_image_reference(target)
+        for image_id in image_ids:
+            for digest, blob in manifests.get(image_id).get("blobs"):
+                blob_image_ids.setdefault(digest, image_id)
+                first_upload = first_uploads.setdefault(digest, (image_reference, blob))
+                if first_upload[0].get("repository") != image_reference.get("repository"):
+                    mounts.setdefault((image_reference.get("repository"), digest), (image_reference, blob, first_upload[0].get("repository")))
+
+    def upload(image_reference, digest, blob, mount_from):
+        start_time = time.time()
+        result = upload_blob(registry_client, bundle, image_reference, (digest, blob), mount_from)
+        metrics.add("push", start_time, bundle.size(blob) if result == "uploaded" else 0, blob_image_ids.get(digest))
+        return result
+
+    counts = {"exists": 0, "mounted": 0, "uploaded": 0, "uploaded_size": 0}
+    failed_blobs = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.get('concurrency')) as executor:
+        for uploads in [
+            {(image_reference.get("repository"), digest): (image_reference, digest, blob, None) for digest, (image_reference, blob) in first_uploads.items()},
+            {key: (image_reference, key[1], blob, mount_from) for key, (image_reference, blob, mount_from) in mounts.items() if key[1] not in failed_blobs},
+        ]:
+            futures = {key: executor.submit(upload, *arguments) for key, arguments in uploads.items()}
+            for key, future in futures.items():
+                try:
+                    result = future.result()
+                    counts[result] += 1
+                    if result == "uploaded":
+                        counts["uploaded_size"] += bundle.size(uploads[key][2])
+                except Exception as err:
+                    failed_blobs[key[1]] = err
+
+    # Upload manifests. A name with images for several platforms gets a manifest index.
+
+    pushed = {}
+    for target, image_ids in targets.items():
+        try:
+            for image_id in image_ids:
+                for digest, _ in manifests.get(image_id).get("blobs"):
+                    if digest in failed_blobs:
+                        raise failed_blobs.get(digest)
+            target = put_image_manifests(registry_client, target, [manifests.get(image_id) for image_id in image_ids])
+            for image_id in image_ids:
+                pushed[manifests.get(image_id).get("image")] = target
+        except Exception as err:
+            for image_id in image_ids:
+                failures[manifests.get(image_id).get("image")] = err
+
+    registry_client.close()
+    for image in failures:
+        pushed.pop(image, None)
+    for image_id, image, platform in bundle_images:
+        metrics.set_result(image_id, image, platform, "failed" if image in failures else "pushed")
+    return pushed, failures, counts
@@ -0,0 +1,627 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/registry.py
+#   A client of the Docker Registry HTTP API V2, and lock files that pin images to digests.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import base64
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+# Import from standard library and https://pypi.org/, when first used.
+
+from .common import concurrent, http, subprocess, urllib
+
+# Import from docker_compose_air_gapper.
+
+from .common import MEGABYTES, message_info, message_warning
+
+# -----------------------------------------------------------------------------
+# Registry functions
+#   See https://distribution.github.io/distribution/spec/api/
+# -----------------------------------------------------------------------------
+
+
+DOCKER_HUB_REGISTRY = "registry-1.docker.io"
+DOCKER_HUB_REGISTRY_ALIASES = ["docker.io", "index.docker.io", DOCKER_HUB_REGISTRY]
+
+# The name docker's config.json and credential helpers use for Docker Hub.
+
+DOCKER_HUB_CREDENTIALS_SERVER = "https://index.docker.io/v1/"
+DEFAULT_PLATFORM = "linux/amd64"
+
+MEDIA_TYPES_INDEX = [
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.index.v1+json",
+]
+
+MEDIA_TYPES_MANIFEST = [
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+]
+
+HTTP_REDIRECTS = [301, 302, 303, 307, 308]
+HTTP_MAX_REDIRECTS = 5
+HTTP_CHUNK_SIZE = MEGABYTES
+HTTP_TIMEOUT = 60  # Seconds.
+
+
+def parse_image_reference(image):
+    ''' Split an image reference into registry, repository, tag, and digest. '''
+
+    name = image
+    digest = None
+    if "@" in name:
+        name, digest = name.split("@", 1)
+
+    tag = None
+    if ":" in name.rsplit("/", 1)[-1]:
+        name, tag = name.rsplit(":", 1)
+
+    registry = DOCKER_HUB_REGISTRY
+    repository = name
+    first_component, _, remainder = name.partition("/")
+    if remainder and ("." in first_component or ":" in first_component or first_component == "localhost"):
+        registry = first_component
+        repository = remainder
+    if registry in DOCKER_HUB_REGISTRY_ALIASES:
+        registry = DOCKER_HUB_REGISTRY
+        if "/" not in repository:
+            repository = "library/{0}".format(repository)
+
+    if not tag and not digest:
+        tag = "latest"
+
+    return {
+        "digest": digest,
+        "image": image,
+        "reference": digest or tag,
+        "registry": registry,
+        "repository": repository,
+        "tag": tag,
+    }
+
+
+def parse_www_authenticate(header):
+    ''' Parse a "WWW-Authenticate" header into (scheme, parameters). '''
+
+    scheme, _, parameters_text = header.partition(" ")
+    parameters = dict(re.findall(r'(\w+)="([^"]*)"', parameters_text))
+    return scheme.lower(), parameters
+
+
+def normalize_registry_name(name):
+    ''' Return the registry of a docker config.json key, such as "https://index.docker.io/v1/" or "registry.example.com". '''
+    registry = re.sub(r"^[a-z]+://", "", name).split("/", 1)[0]
+    return DOCKER_HUB_REGISTRY if registry in DOCKER_HUB_REGISTRY_ALIASES else registry
+
+
+def parse_docker_auth_config(text):
+    ''' Return the "auths" of SENZING_DOCKER_AUTH_CONFIG by registry. Raise ValueError if it is not like docker's config.json. '''
+    if not text:
+        return {}
+    docker_auth_config = json.loads(text)
+    if not isinstance(docker_auth_config, dict) or not isinstance(docker_auth_config.get("auths"), dict):
+        raise ValueError('There is no "auths" object.')
+    return {normalize_registry_name(key): value for key, value in docker_auth_config.get("auths").items()}
+
+
+def read_docker_auth(config):
+    ''' Return the registry credentials of docker's config.json, as written by "docker login", and of SENZING_DOCKER_AUTH_CONFIG.
+        SENZING_DOCKER_AUTH_CONFIG wins for a registry in both.
+    '''
+
+    filename = os.path.join(os.path.expanduser(config.get('docker_config') or os.environ.get("DOCKER_CONFIG") or "~/.docker"), "config.json")
+    docker_config = {}
+    try:
+        with open(filename) as a_file:
+            docker_config = json.load(a_file)
+        if not isinstance(docker_config, dict):
+            raise ValueError("It is not a JSON object.")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as err:
+        logging.warning(message_warning(309, filename, err))
+        docker_config = {}
+
+    result = {
+        "auths": {normalize_registry_name(key): value for key, value in (docker_config.get("auths") or {}).items()},
+        "credential_helpers": {normalize_registry_name(key): value for key, value in (docker_config.get("credHelpers") or {}).items()},
+        "credential_store": docker_config.get("credsStore"),
+    }
+    result["auths"].update(parse_docker_auth_config(config.get('docker_auth_config')))
+    return result
+
+
+def get_registry_credentials(docker_auth, registry):
+    ''' Return {"username": ..., "password": ...} or {"identity_token": ...} for a registry, or None to access it anonymously.
+        Credentials are taken from "auths", or from the credential helper of the registry, as docker does.
+    '''
+
+    auth = (docker_auth.get("auths") or {}).get(registry) or {}
+    if auth.get("identitytoken"):
+        return {"identity_token": auth.get("identitytoken")}
+    if auth.get("auth"):
+        username, _, password = base64.b64decode(auth.get("auth")).decode().partition(":")
+        return {"username": username, "password": password}
+    if auth.get("username"):
+        return {"username": auth.get("username"), "password": auth.get("password") or ""}
+    helper = (docker_auth.get("credential_helpers") or {}).get(registry) or docker_auth.get("credential_store")
+    return get_credential_helper_credentials(helper, registry) if helper else None
+
+
+def get_credential_helper_credentials(helper, registry):
+    ''' Return the credentials that a docker credential helper, such as "pass" or "ecr-login", has for a registry, or None. '''
+    server = DOCKER_HUB_CREDENTIALS_SERVER if registry == DOCKER_HUB_REGISTRY else registry
+    try:
+        completed_process = subprocess.run(["docker-credential-{0}".format(helper), "get"], input=server, capture_output=True, text=True, check=True, timeout=60)
+        secret = json.loads(completed_process.stdout)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+    if secret.get("Username") == "<token>":
+        return {"identity_token": secret.get("Secret")}
+    return {"username": secret.get("Username"), "password": secret.get("Secret")}
+
+
+@contextlib.contextmanager
+def open_request_body(body):
+    ''' Yield the body of a request: bytes, or a new file from a function that opens it,
+        so that the whole body is sent again after a redirect or an authorization.
+    '''
+    if callable(body):
+        with body() as a_file:
+            yield a_file
+    else:
+        yield body
+
+
+def digest_path(digest):
+    ''' Path of a blob, relative to the "blobs" directory of a bundle. See https://github.com/opencontainers/image-spec/blob/main/image-layout.md '''
+
+    algorithm, hex_digest = digest.split(":", 1)
+    return "blobs/{0}/{1}".format(algorithm, hex_digest)
+
+
+class RegistryClient:
+    ''' Docker Registry HTTP API V2 client that keeps a pool of keep-alive connections per registry.
+        "docker_auth" holds registry credentials, as read_docker_auth() returns them. Without them, registries are accessed anonymously.
+        "actions" are the actions its tokens allow: "pull", or "pull,push" for a client that pushes images.
+    '''
+
+    def __init__(self, insecure_registries=None, docker_auth=None, actions="pull"):
+        self.insecure_registries = set(insecure_registries or [])
+        self.docker_auth = docker_auth or {}
+        self.actions = actions
+        self.lock = threading.Lock()
+        self.idle_connections = {}
+        self.credentials = {}
+        self.authorizations = {}
+
+    def get_scheme(self, registry):
+        ''' Plain HTTP is only used for localhost and registries explicitly marked insecure. '''
+        hostname = registry.rsplit(":", 1)[0]
+        if registry in self.insecure_registries or hostname in ["localhost", "127.0.0.1"]:
+            return "http"
+        return "https"
+
+    def get_connection(self, scheme, netloc):
+        ''' Reuse an idle connection, or create a new one. Return the connection and whether it was reused. '''
+        with self.lock:
+            idle_connections = self.idle_connections.get((scheme, netloc), [])
+            if idle_connections:
+                return idle_connections.pop(), True
+        return self.create_connection(scheme, netloc), False
+
+    @staticmethod
+    def create_connection(scheme, netloc):
+        ''' Create a new connection. '''
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=HTTP_TIMEOUT, blocksize=HTTP_CHUNK_SIZE)
+        return http.client.HTTPConnection(netloc, timeout=HTTP_TIMEOUT, blocksize=HTTP_CHUNK_SIZE)
+
+    def release_connection(self, scheme, netloc, connection, response):
+        ''' Return a connection to the pool if it can be reused. '''
+        if response.will_close or not response.isclosed():
+            connection.close()
+            return
+        with self.lock:
+            self.idle_connections.setdefault((scheme, netloc), []).append(connection)
+
+    def send_request(self, method, parsed_url, headers, body):
+        ''' Send a request to a urllib.parse.urlsplit() URL and return the connection and its http.client.HTTPResponse.
+            A reused keep-alive connection may have been closed by the server while it was idle. Then the request fails
+            before any response arrives, and it is sent once more on a new connection.
+        '''
+
+        path = parsed_url.path + ("?" + parsed_url.query if parsed_url.query else "")
+        connection, reused = self.get_connection(parsed_url.scheme, parsed_url.netloc)
+        while True:
+            try:
+                with open_request_body(body) as request_body:
+                    connection.request(method, path, body=request_body, headers=headers)
+                    return connection, connection.getresponse()
+            except (BrokenPipeError, ConnectionResetError):
+                connection.close()
+                if not reused:
+                    raise
+            except Exception:
+                connection.close()
+                raise
+            connection, reused = self.create_connection(parsed_url.scheme, parsed_url.netloc), False
+
+    def close(self):
+        ''' Close all idle connections. '''
+        with self.lock:
+            for connections in self.idle_connections.values():
+                for connection in connections:
+                    connection.close()
+            self.idle_connections = {}
+
+    def get_credentials(self, registry):
+        ''' Return the credentials of a registry, looked up once. '''
+        with self.lock:
+            if registry in self.credentials:
+                return self.credentials.get(registry)
+        credentials = get_registry_credentials(self.docker_auth, registry)
+        with self.lock:
+            self.credentials[registry] = credentials
+        return credentials
+
+    def get_authorization(self, key):
+        ''' Return the "Authorization" header for (registry, repository, actions), unless it has none or its token has expired. '''
+        with self.lock:
+            authorization, expires = self.authorizations.get(key, (None, None))
+        if expires is not None and time.monotonic() >= expires:
+            return None
+        return authorization
+
+    def get_token(self, image_reference, parameters, actions):
+        ''' Get a bearer token, and its lifetime in seconds, from the registry's authorization service.
+            With credentials, the token service is sent the user name and password, or the identity token of "docker login".
+        '''
+
+        credentials = self.get_credentials(image_reference.get("registry")) or {}
+        scope = "repository:{0}:{1}".format(image_reference.get("repository"), actions)
+        query = {"scope": scope}
+        if "service" in parameters:
+            query["service"] = parameters.get("service")
+        if credentials.get("identity_token"):
+            data = dict(query, grant_type="refresh_token", refresh_token=credentials.get("identity_token"), client_id="docker-compose-air-gapper")
+            token_request = urllib.request.Request(parameters.get("realm"), data=urllib.parse.urlencode(data).encode())
+        else:
+            token_request = urllib.request.Request("{0}?{1}".format(parameters.get("realm"), urllib.parse.urlencode(query)))
+            if credentials.get("username"):
+                token_request.add_header("Authorization", "Basic {0}".format(base64.b64encode("{0}:{1}".format(credentials.get("username"), credentials.get("password")).encode()).decode()))
+        with urllib.request.urlopen(token_request, timeout=HTTP_TIMEOUT) as response:
+            token_response = json.loads(response.read())
+        token = token_response.get("token") or token_response.get("access_token")
+        if not token:
+            raise RuntimeError("{0} returned no token.".format(parameters.get("realm")))
+        return token, int(token_response.get("expires_in") or 60)
+
+    def authorize(self, image_reference, www_authenticate, actions):
+        ''' Return a new "Authorization" header for the challenge of a 401 response, replacing the one the registry refused.
+            "Bearer" challenges get a token, which is kept until shortly before it expires. "Basic" challenges need credentials.
+        '''
+
+        registry = image_reference.get("registry")
+        key = (registry, image_reference.get("repository"), actions)
+        with self.lock:
+            self.authorizations.pop(key, None)
+        scheme, parameters = parse_www_authenticate(www_authenticate)
+        if scheme == "basic":
+            credentials = self.get_credentials(registry) or {}
+            if not credentials.get("username"):
+                raise RuntimeError("{0} requires a user name and password. Run 'docker login {0}' or set SENZING_DOCKER_AUTH_CONFIG.".format(registry))
+            authorization = "Basic {0}".format(base64.b64encode("{0}:{1}".format(credentials.get("username"), credentials.get("password")).encode()).decode())
+            expires = None
+        elif scheme == "bearer" and parameters.get("realm"):
+            token, expires_in = self.get_token(image_reference, parameters, actions)
+            authorization = "Bearer {0}".format(token)
+            expires = time.monotonic() + expires_in * 0.9
+        else:
+            raise RuntimeError("{0} asked for an unsupported authorization: {1}".format(registry, www_authenticate))
+        with self.lock:
+            self.authorizations[key] = (authorization, expires)
+        return authorization
+
+    @contextlib.contextmanager
+    def request(self, method, image_reference, path, headers=None, body=None):
+        ''' Context manager yielding the final http.client.HTTPResponse, after authorization and redirects.
+            "path" may also be an absolute URL, such as the "Location" of a blob upload.
+            "body" is bytes, or a function that opens the body, so that it can be sent again. See open_request_body().
+            A 401 response gets a new authorization, once, so that an expired token is replaced.
+        '''
+
+        registry = image_reference.get("registry")
+        url = urllib.parse.urljoin("{0}://{1}/".format(self.get_scheme(registry), registry), path)
+        headers = dict(headers or {})
+        authorized = False
+        authorization = self.get_authorization((registry, image_reference.get("repository"), self.actions))
+        if authorization:
+            headers["Authorization"] = authorization
+
+        for _ in range(HTTP_MAX_REDIRECTS + 2):
+            parsed_url = urllib.parse.urlsplit(url)
+            request_headers = dict(headers)
+            if parsed_url.netloc != registry:
+                request_headers.pop("Authorization", None)
+            connection, response = self.send_request(method, parsed_url, request_headers, body)
+
+            # Authorize and retry.
+
+            if response.status == 401 and not authorized and "WWW-Authenticate" in response.headers:
+                response.read()
+                self.release_connection(parsed_url.scheme, parsed_url.netloc, connection, response)
+                headers["Authorization"] = self.authorize(image_reference, response.headers.get("WWW-Authenticate"), self.actions)
+                authorized = True
+                continue
+
+            # Follow redirects, for example to a blob storage service.
+
+            if response.status in HTTP_REDIRECTS:
+                response.read()
+                self.release_connection(parsed_url.scheme, parsed_url.netloc, connection, response)
+                url = urllib.parse.urljoin(url, response.headers.get("Location"))
+                continue
+
+            try:
+                yield response
+            finally:
+                self.release_connection(parsed_url.scheme, parsed_url.netloc, connection, response)
+            return
+
+        raise RuntimeError("Too many redirects for {0}".format(url))
+
+    def get_manifest_digest(self, image_reference):
+        ''' Return the digest of the manifest or manifest index that a tag refers to. Uses HEAD when the registry reports the digest. '''
+        path = "/v2/{0}/manifests/{1}".format(image_reference.get("repository"), image_reference.get("reference"))
+        headers = {
+            "Accept": ", ".join(MEDIA_TYPES_INDEX + MEDIA_TYPES_MANIFEST),
+        }
+        with self.request("HEAD", image_reference, path, headers=headers) as response:
+            response.read()
+            if response.status != 200:
+                raise RuntimeError("HEAD {0} returned HTTP {1}".format(path, response.status))
+            digest = response.headers.get("Docker-Content-Digest")
+        if not digest:
+            digest, _, _ = self.get_manifest(image_reference)
+        return digest
+
+    def get_manifest(self, image_reference, reference=None):
+        ''' Return (digest, media_type, bytes) for a manifest or manifest index. '''
+        path = "/v2/{0}/manifests/{1}".format(image_reference.get("repository"), reference or image_reference.get("reference"))
+        headers = {
+            "Accept": ", ".join(MEDIA_TYPES_INDEX + MEDIA_TYPES_MANIFEST),
+        }
+        with self.request("GET", image_reference, path, headers=headers) as response:
+            content = response.read()
+            if response.status != 200:
+                raise RuntimeError("GET {0} returned HTTP {1}".format(path, response.status))
+            media_type = response.headers.get("Content-Type", "").split(";")[0]
+        digest = "sha256:{0}".format(hashlib.sha256(content).hexdigest())
+        if not media_type or media_type == "application/json":
+            media_type = json.loads(content).get("mediaType", "")
+        return digest, media_type, content
+
+    def download_blob(self, image_reference, digest, filename):
+        ''' Download a blob to a file. An interrupted download is resumed with an HTTP Range request.
+            A download that was interrupted after it was complete, but before it was renamed, is only renamed.
+        '''
+
+        partial_filename = "{0}.partial".format(filename)
+        algorithm, expected_hex_digest = digest.split(":", 1)
+        hasher = hashlib.new(algorithm)
+        offset = 0
+        if os.path.exists(partial_filename):
+            with open(partial_filename, "rb") as partial_file:
+                for chunk in iter(lambda: partial_file.read(HTTP_CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+                    offset += len(chunk)
+            if hasher.hexdigest() == expected_hex_digest:
+                os.replace(partial_filename, filename)
+                return
+
+        path = "/v2/{0}/blobs/{1}".format(image_reference.get("repository"), digest)
+        headers = {}
+        if offset:
+            headers["Range"] = "bytes={0}-".format(offset)
+        with self.request("GET", image_reference, path, headers=headers) as response:
+            if response.status == 200:
+                hasher = hashlib.new(algorithm)
+                mode = "wb"
+            elif response.status == 206:
+                mode = "ab"
+            else:
+                response.read()
+
+                # The registry refuses the range of a partial download that is not part of the blob. The next attempt starts over.
+
+                if response.status == 416:
+                    os.remove(partial_filename)
+                raise RuntimeError("GET {0} returned HTTP {1}".format(path, response.status))
+            with open(partial_filename, mode) as output_file:
+                for chunk in iter(lambda: response.read(HTTP_CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+                    output_file.write(chunk)
+
+        if hasher.hexdigest() != expected_hex_digest:
+            os.remove(partial_filename)
+            raise RuntimeError("Digest mismatch for {0}".format(digest))
+        os.replace(partial_filename, filename)
+
+
+def create_registry_client(config, actions="pull"):
+    ''' Return a RegistryClient for SENZING_INSECURE_REGISTRIES, with the credentials of docker's config.json and SENZING_DOCKER_AUTH_CONFIG. '''
+    return RegistryClient(insecure_registries=config.get('insecure_registries'), docker_auth=read_docker_auth(config), actions=actions)
+
+
+def platform_matches(descriptor_platform, platform):
+    ''' Compare a manifest index "platform" object with an "os/architecture[/variant]" string. '''
+
+    parts = platform.split("/")
+    if descriptor_platform.get("os") != parts[0] or descriptor_platform.get("architecture") != parts[1]:
+        return False
+    if len(parts) > 2 and descriptor_platform.get("variant") != parts[2]:
+        return False
+    return True
+
+
+def resolve_image(registry_client, image, platform=DEFAULT_PLATFORM):
+    ''' Fetch the image manifest for one platform, following a manifest index if needed. '''
+
+    image_reference = parse_image_reference(image)
+    digest, media_type, content = registry_client.get_manifest(image_reference)
+    if media_type in MEDIA_TYPES_INDEX:
+        index = json.loads(content)
+        for descriptor in index.get("manifests", []):
+            if platform_matches(descriptor.get("platform", {}), platform):
+                digest, media_type, content = registry_client.get_manifest(image_reference, descriptor.get("digest"))
+                break
+        else:
+            raise RuntimeError("No {0} manifest for {1}".format(platform, image))
+    manifest = json.loads(content)
+    return {
+        "config": manifest.get("config", {}),
+        "digest": digest,
+        "image": image,
+        "image_reference": image_reference,
+        "layers": [layer for layer in manifest.get("layers", []) if not layer.get("urls")],
+        "manifest": content,
+        "media_type": media_type,
+    }
+
+
+def resolve_images(executor, registry_client, images, platforms):
+    ''' Resolve image manifests, once for each platform. Without a platform, DEFAULT_PLATFORM is used.
+        Return (resolved_images, failures), where "resolved_images" is keyed by (image, platform).
+    '''
+
+    futures = {(image, platform): executor.submit(resolve_image, registry_client, image, platform or DEFAULT_PLATFORM) for image in images for platform in platforms}
+    resolved_images = {}
+    failures = {}
+    for (image, platform), future in futures.items():
+        try:
+            resolved_images[(image, platform)] = future.result()
+        except Exception as err:
+            failures[image] = err
+    return resolved_images, failures
+
+# -----------------------------------------------------------------------------
+# Lock file functions
+#   A lock file maps each image in a docker-compose file to a content digest:
+#     {"created_on": "...", "images": {"senzing/xterm:1.4.3": "sha256:..."}}
+# -----------------------------------------------------------------------------
+
+
+RESOLUTION_CACHE_FILENAME = "resolutions.json"
+
+
+def read_json_cache(cache_dir, filename):
+    ''' Read a JSON file from the cache directory. A missing or damaged file is an empty cache. '''
+    try:
+        with open(os.path.join(os.path.expanduser(cache_dir), filename)) as a_file:
+            return json.load(a_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json_cache(cache_dir, filename, cache):
+    ''' Atomically replace a JSON file in the cache directory. '''
+    cache_dir = os.path.expanduser(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_filename = os.path.join(cache_dir, "{0}.{1}".format(filename, os.getpid()))
+    with open(temporary_filename, "w") as a_file:
+        json.dump(cache, a_file, indent=2, sort_keys=True)
+    os.replace(temporary_filename, os.path.join(cache_dir, filename))
+
+
+def resolve_image_digests(config, images):
+    ''' Resolve image references to manifest digests. Return (digests, failures).
+        Resolutions cached less than SENZING_CACHE_TTL_IN_SECONDS ago are used without asking the registry.
+    '''
+
+    cache_dir = config.get('cache_dir')
+    cache_ttl_in_seconds = config.get('cache_ttl_in_seconds')
+    now = time.time()
+    cache = read_json_cache(cache_dir, RESOLUTION_CACHE_FILENAME)
+    digests = {}
+    failures = {}
+
+    images_to_resolve = []
+    for image in images:
+        image_reference = parse_image_reference(image)
+        cached = cache.get(image, {})
+        if image_reference.get("digest"):
+            digests[image] = image_reference.get("digest")
+        elif cached and now - cached.get("resolved_at", 0) < cache_ttl_in_seconds:
+            digests[image] = cached.get("digest")
+        else:
+            images_to_resolve.append(image)
+    logging.info(message_info(105, len(images) - len(images_to_resolve), len(images_to_resolve)))
+
+    if images_to_resolve:
+        registry_client = create_registry_client(config)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=config.get('concurrency')) as executor:
+            futures = {image: executor.submit(registry_client.get_manifest_digest, parse_image_reference(image)) for image in images_to_resolve}
+            for image, future in futures.items():
+                try:
+                    digests[image] = future.result()
+                    cache[image] = {
+                        "digest": digests[image],
+                        "resolved_at": now,
+                    }
+                except Exception as err:
+                    failures[image] = err
+        registry_client.close()
+        write_json_cache(cache_dir, RESOLUTION_CACHE_FILENAME, cache)
+
+    return {image: digests[image] for image in images if image in digests}, failures
+
+
+def pin_image(image, digest):
+    ''' Replace the tag of an image reference with a digest. Example: senzing/xterm:1.4.3 becomes senzing/xterm@sha256:... '''
+    path, slash, last_component = image.split("@", 1)[0].rpartition("/")
+    return "{0}{1}{2}@{3}".format(path, slash, last_component.split(":", 1)[0], digest)
+
+
+def apply_lock_file(config, images):
+    ''' With SENZING_LOCK_FILE, replace images by digest references, one per distinct digest.
+        Return (references, tags), where "tags" lists the original image names for each digest reference.
+    '''
+
+    lock_file = config.get('lock_file')
+    if not lock_file:
+        return images, {}
+
+    with open(lock_file) as a_file:
+        locked_images = json.load(a_file).get("images", {})
+
+    references = []
+    tags = {}
+    digest_references = {}
+    for image in images:
+        digest = locked_images.get(image)
+        if not digest:
+            if image:
+                logging.warning(message_warning(302, image, lock_file))
+            if image not in references:
+                references.append(image)
+            continue
+        reference = digest_references.setdefault(digest, pin_image(image, digest))
+        if reference not in references:
+            references.append(reference)
+        if parse_image_reference(image).get("tag"):
+            tag = image.split("@", 1)[0]
+            if tag not in tags.setdefault(reference, []):
+                tags[reference].append(tag)
+    return references, tags
@@ -0,0 +1,599 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/save_images_script.py
+#   The save-images.sh script.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import shlex
+
+# Import from docker_compose_air_gapper.
+
+from .bundle import get_previous_blobs
+from .bundle_scripts import (
+    file_text_for_load_images,
+    file_text_for_load_images_header,
+    file_text_for_metrics,
+    file_text_for_verify_volumes,
+)
+from .common import replace_variables_in_text
+from .compose import create_docker_compose_files_text
+from .shard import get_shard_suffix
+
+# -----------------------------------------------------------------------------
+# Text functions
+# -----------------------------------------------------------------------------
+
+
+def file_text_for_save_images():
+    """#!/usr/bin/env bash
+
+# The save-images.sh script takes 4 inputs:
+#  - DOCKER_IMAGE_NAMES
+#  - DOCKER_IMAGE_TAGS, the tags of images given by digest. Usually empty.
+#  - DOCKER_BUILD_IMAGES, images built from docker-compose services that have "build" but no "image". Usually empty.
+#  - PREVIOUS_BUNDLE_MANIFEST, the blobs already on the air-gapped system. Usually empty.
+# Given that input, the docker images are built or downloaded, saved, and compressed into a single file.
+# Up to CONCURRENCY images are built at the same time, each after the built images it depends on.
+# Layers shared between images are stored once in the "blobs" directory.
+# Layers listed in PREVIOUS_BUNDLE_MANIFEST are not stored at all.
+# Up to CONCURRENCY images are pulled and saved at the same time.
+# With STREAM=true, one "docker save" of all images is compressed straight into the output file
+# instead, so no uncompressed copy of the images is kept on disk.
+# COMPRESSION is "gzip" (multithreaded if "pigz" is installed), "zstd" (multithreaded), or "none".
+# Each saved image is recorded in "journal.txt". If a run stops, run again with RESUME_DIR set to
+# its output directory to skip images that are already saved and still match their checksums.
+# With PLATFORMS set to a comma-separated list of "os/arch[/variant]", each image is pulled and saved
+# for those platforms only, and load-images.sh refuses to load the bundle on a host of another platform.
+# Images in DOCKER_BUILD_IMAGES are built and saved for the first of those platforms only.
+# With VOLUME_SIZE_IN_MEGABYTES greater than 0, the output file is written as numbered volumes,
+# OUTPUT_FILE.0000, OUTPUT_FILE.0001, ..., with their checksums in OUTPUT_FILE.sha256
+# and a script, OUTPUT_FILE.verify.sh, that checks them on the air-gapped system.
+# With METRICS_FILE set, a JSON report of the duration, bytes, and MB/s of building, pulling, and saving
+# each image, and of compressing the bundle, is written to it. With PROMETHEUS_FILE set, the same metrics
+# are written as a Prometheus textfile.
+# A save-images.sh created with "--shard K/N" holds only shard K of N of the images, and its output names
+# end in "-shard-K-of-N". Combine the bundles of all shards with "docker-compose-air-gapper.py merge-bundles".
+
+set -o pipefail
+
+# Enumerate docker images to be processed.
+
+DOCKER_IMAGE_NAMES=(
+{image_list})
+
+# Enumerate tags of docker images given by digest, so they are saved and loaded with their tags. Usually empty.
+
+declare -A DOCKER_IMAGE_TAGS=(
+{image_tag_list})
+
+# Enumerate images to build, after the built images they depend on, with their "docker build" arguments. Usually empty.
+
+DOCKER_BUILD_IMAGES=(
+{build_image_list})
+declare -A DOCKER_BUILD_ARGUMENTS=(
+{build_argument_list})
+declare -A DOCKER_BUILD_DEPENDENCIES=(
+{build_dependency_list})
+
+# Enumerate blobs delivered by previous bundles.
+
+PREVIOUS_BUNDLE_MANIFEST=(
+{previous_blob_list})
+
+# Choose compression. An empty COMPRESSION_LEVEL uses the default level of the compression program.
+
+COMPRESSION=${{COMPRESSION:-{compression}}}
+COMPRESSION_LEVEL=${{COMPRESSION_LEVEL:-{compression_level}}}
+case ${{COMPRESSION}} in
+  gzip)
+    COMPRESS_COMMAND="gzip -${{COMPRESSION_LEVEL:-6}}"
+    if command -v pigz > /dev/null; then
+      COMPRESS_COMMAND="pigz -${{COMPRESSION_LEVEL:-6}}"
+    fi
+    OUTPUT_FILE_EXTENSION=tgz
+    ;;
+  zstd)
+    COMPRESS_COMMAND="zstd --quiet --threads=0 --ultra -${{COMPRESSION_LEVEL:-3}}"
+    OUTPUT_FILE_EXTENSION=tar.zst
+    ;;
+  none)
+    COMPRESS_COMMAND="cat"
+    OUTPUT_FILE_EXTENSION=tar
+    ;;
+  *)
+    echo "Error: COMPRESSION must be gzip, zstd, or none. Current value: ${{COMPRESSION}}"
+    exit 1
+    ;;
+esac
+
+# Make output variables.
+
+MY_HOME=${{MY_HOME:-~}}
+OUTPUT_DATE=$(date +%s){shard_suffix}
+RESUME_DIR=${{RESUME_DIR:-}}
+if [ -n "${{RESUME_DIR}}" ]; then
+  if [ ! -f ${{RESUME_DIR}}/journal.txt ]; then
+    echo "Error: RESUME_DIR is not a save-images.sh output directory. Current value: ${{RESUME_DIR}}"
+    exit 1
+  fi
+  RESUME_DIR=$(cd ${{RESUME_DIR}} && pwd)
+  MY_HOME=$(dirname ${{RESUME_DIR}})
+  OUTPUT_DATE=$(basename ${{RESUME_DIR}} | sed "s/^docker-compose-air-gapper-//")
+fi
+OUTPUT_DATE_HUMAN=$(date --rfc-3339=seconds)
+OUTPUT_FILE=${{OUTPUT_FILE:-${{MY_HOME}}/docker-compose-air-gapper-${{OUTPUT_DATE}}.${{OUTPUT_FILE_EXTENSION}}}}
+OUTPUT_DIR_NAME=docker-compose-air-gapper-${{OUTPUT_DATE}}
+OUTPUT_DIR=${{MY_HOME}}/${{OUTPUT_DIR_NAME}}
+OUTPUT_BLOBS_DIR=${{OUTPUT_DIR}}/blobs
+OUTPUT_MANIFESTS_DIR=${{OUTPUT_DIR}}/manifests
+OUTPUT_STAGING_DIR=${{OUTPUT_DIR}}/staging
+OUTPUT_IMAGES_FILE=${{OUTPUT_DIR}}/images.txt
+OUTPUT_PLATFORMS_FILE=${{OUTPUT_DIR}}/platforms.txt
+OUTPUT_DOCKER_COMPOSE_FILES_FILE=${{OUTPUT_DIR}}/docker-compose-files.txt
+OUTPUT_BUNDLE_MANIFEST_FILE=${{OUTPUT_DIR}}/bundle-manifest.txt
+OUTPUT_JOURNAL_FILE=${{OUTPUT_DIR}}/journal.txt
+OUTPUT_CHECKSUMS_FILE=${{OUTPUT_DIR}}/blobs.sha256
+OUTPUT_LOAD_REPOSITORY_SCRIPT=${{OUTPUT_DIR}}/load-images.sh
+OUTPUT_VOLUME_CHECKSUMS_FILE=${{OUTPUT_FILE}}.sha256
+OUTPUT_VERIFY_VOLUMES_SCRIPT=${{OUTPUT_FILE}}.verify.sh
+
+# Make processing variables.
+
+CONCURRENCY=${{CONCURRENCY:-{concurrency}}}
+STREAM=${{STREAM:-{stream}}}
+if [ "${{STREAM}}" == "true" ] && [ -n "${{RESUME_DIR}}" ]; then
+  echo "Error: RESUME_DIR cannot be used with STREAM=true."
+  exit 1
+fi
+PLATFORMS=${{PLATFORMS:-{platforms}}}
+PLATFORM_LIST=(${{PLATFORMS//,/ }})
+if [ ${{#PLATFORM_LIST[@]}} -eq 0 ]; then
+  PLATFORM_LIST=("")
+fi
+if [ "${{STREAM}}" == "true" ] && [ ${{#PLATFORM_LIST[@]}} -gt 1 ]; then
+  echo "Error: STREAM=true can be used with only one platform. Current value of PLATFORMS: ${{PLATFORMS}}"
+  exit 1
+fi
+VOLUME_SIZE_IN_MEGABYTES=${{VOLUME_SIZE_IN_MEGABYTES:-{volume_size_in_megabytes}}}
+METRICS_FILE=${{METRICS_FILE:-{metrics_file}}}
+PROMETHEUS_FILE=${{PROMETHEUS_FILE:-{prometheus_file}}}
+declare -A PREVIOUS_BLOBS
+for BLOB in ${{PREVIOUS_BUNDLE_MANIFEST[@]}};
+do
+  PREVIOUS_BLOBS[${{BLOB}}]=1
+done
+
+# Files in a "docker save" tar that describe the image rather than hold its content.
+
+METADATA_FILES=(
+  "index.json"
+  "manifest.json"
+  "oci-layout"
+  "repositories"
+)
+
+# Make output directories.
+
+mkdir -p ${{OUTPUT_DIR}}
+mkdir -p ${{OUTPUT_BLOBS_DIR}}
+mkdir -p ${{OUTPUT_MANIFESTS_DIR}}
+rm -rf ${{OUTPUT_STAGING_DIR}}
+mkdir ${{OUTPUT_STAGING_DIR}}
+: > ${{OUTPUT_IMAGES_FILE}}
+touch ${{OUTPUT_JOURNAL_FILE}}
+touch ${{OUTPUT_CHECKSUMS_FILE}}
+if [ -n "${{PLATFORMS}}" ]; then
+  printf "%s\n" ${{PLATFORM_LIST[@]}} > ${{OUTPUT_PLATFORMS_FILE}}
+fi
+
+# Define return codes.
+
+OK=0
+NOT_OK=1
+
+{metrics_functions}
+METRICS_DIR=$(mktemp -d)
+trap "rm -rf ${{METRICS_DIR}}" EXIT
+RUN_START_MILLISECONDS=$(now_milliseconds)
+
+# Create OUTPUT_LOAD_REPOSITORY_SCRIPT.
+
+cat <<EOT > ${{OUTPUT_LOAD_REPOSITORY_SCRIPT}}
+{load_images_header}EOT
+
+cat <<'EOT_LOAD_IMAGES' >> ${{OUTPUT_LOAD_REPOSITORY_SCRIPT}}
+{load_images_script}EOT_LOAD_IMAGES
+
+# Record which docker-compose files use each image, so the air-gapped system knows what each stack needs.
+
+cat <<'EOT' > ${{OUTPUT_DOCKER_COMPOSE_FILES_FILE}}
+{docker_compose_file_list}EOT
+
+chmod +x ${{OUTPUT_LOAD_REPOSITORY_SCRIPT}}
+
+# Write compressed output from STDIN to OUTPUT_FILE.
+# With VOLUME_SIZE_IN_MEGABYTES, write numbered volumes instead, record their checksums, and create OUTPUT_VERIFY_VOLUMES_SCRIPT.
+
+write_output() {{
+  local OUTPUT_FILE_NAME=$(basename ${{OUTPUT_FILE}})
+  if [ "${{VOLUME_SIZE_IN_MEGABYTES:-0}}" -eq 0 ]; then
+    cat > ${{OUTPUT_FILE}}
+    return
+  fi
+  rm -f ${{OUTPUT_FILE}}.[0-9][0-9][0-9][0-9]
+  if ! split --bytes=${{VOLUME_SIZE_IN_MEGABYTES}}M --numeric-suffixes --suffix-length=4 - ${{OUTPUT_FILE}}.; then
+    echo "Error: Could not write ${{OUTPUT_FILE}} as volumes of ${{VOLUME_SIZE_IN_MEGABYTES}} MB. There can be at most 10000 volumes."
+    return ${{NOT_OK}}
+  fi
+  (cd $(dirname ${{OUTPUT_FILE}}) && ls ${{OUTPUT_FILE_NAME}}.[0-9][0-9][0-9][0-9] | xargs -P ${{CONCURRENCY}} -n 1 sha256sum | sort -k 2) > ${{OUTPUT_VOLUME_CHECKSUMS_FILE}} || return ${{NOT_OK}}
+  cat <<'EOT_VERIFY_VOLUMES' > ${{OUTPUT_VERIFY_VOLUMES_SCRIPT}}
+{verify_volumes_script}EOT_VERIFY_VOLUMES
+  chmod +x ${{OUTPUT_VERIFY_VOLUMES_SCRIPT}}
+}}
+
+# Name of an image's directory in OUTPUT_MANIFESTS_DIR. An image saved for a platform has the platform appended.
+
+image_id() {{
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM=$2
+  echo ${{DOCKER_IMAGE_NAME}}${{PLATFORM:+--${{PLATFORM}}}} | tr "/:@" "---"
+}}
+
+# Number of platforms, from the start of PLATFORM_LIST, that an image is saved for.
+# A built image exists only for the platform it was built for, the first in PLATFORM_LIST.
+
+image_platform_count() {{
+  local DOCKER_IMAGE_NAME=$1
+  if [ -n "${{DOCKER_BUILD_ARGUMENTS[${{DOCKER_IMAGE_NAME}}]}}" ]; then
+    echo 1
+  else
+    echo ${{#PLATFORM_LIST[@]}}
+  fi
+}}
+
+# Pull a single Docker image, for a single platform if one is given.
+# A built image is not pulled. It is ready if its build succeeded.
+
+pull_image() {{
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM=$2
+  local START_MILLISECONDS=$(now_milliseconds)
+  local TAG
+  if [ -n "${{DOCKER_BUILD_ARGUMENTS[${{DOCKER_IMAGE_NAME}}]}}" ]; then
+    [ "$(cat ${{OUTPUT_STAGING_DIR}}/$(image_id ${{DOCKER_IMAGE_NAME}}).build.rc 2>/dev/null)" == "${{OK}}" ]
+    return $?
+  fi
+  echo "Pulling ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}} from DockerHub."
+  docker pull ${{PLATFORM:+--platform ${{PLATFORM}}}} ${{DOCKER_IMAGE_NAME}} || return ${{NOT_OK}}
+  record_metric $(image_id ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}}) pull ${{START_MILLISECONDS}} $(docker image inspect --format "{{{{.Size}}}}" ${{DOCKER_IMAGE_NAME}} 2>/dev/null)
+  for TAG in ${{DOCKER_IMAGE_TAGS[${{DOCKER_IMAGE_NAME}}]}};
+  do
+    docker tag ${{DOCKER_IMAGE_NAME}} ${{TAG}} || return ${{NOT_OK}}
+  done
+}}
+
+# Checksum of an image's metadata, including its list of blobs.
+
+image_checksum() {{
+  cat $1/* | sha256sum | cut -d " " -f 1
+}}
+
+# Succeed if a blob in OUTPUT_BLOBS_DIR matches the checksum recorded in OUTPUT_CHECKSUMS_FILE.
+
+blob_is_valid() {{
+  local BLOB=$1
+  local CHECKSUM_LINE=$(awk -v blob=${{BLOB}} '$2 == blob {{print; exit}}' ${{OUTPUT_CHECKSUMS_FILE}})
+  if [ -z "${{CHECKSUM_LINE}}" ]; then
+    return ${{NOT_OK}}
+  fi
+  echo "${{CHECKSUM_LINE}}" | (cd ${{OUTPUT_BLOBS_DIR}} && sha256sum --check --quiet --status)
+}}
+
+# Succeed if OUTPUT_JOURNAL_FILE shows that an image was saved and its metadata and blobs still match their checksums.
+
+image_is_saved() {{
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM=$2
+  local IMAGE_ID=$(image_id ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}})
+  local IMAGE_MANIFEST_DIR=${{OUTPUT_MANIFESTS_DIR}}/${{IMAGE_ID}}
+  local JOURNAL_IMAGE_NAME IMAGE_DIGEST IMAGE_OUTPUT CHECKSUM BLOB
+
+  read JOURNAL_IMAGE_NAME IMAGE_DIGEST IMAGE_OUTPUT CHECKSUM <<< $(awk -v output=manifests/${{IMAGE_ID}} '$3 == output' ${{OUTPUT_JOURNAL_FILE}} | tail -1)
+  if [ -z "${{CHECKSUM}}" ] || [ ! -d ${{IMAGE_MANIFEST_DIR}} ] || [ "$(image_checksum ${{IMAGE_MANIFEST_DIR}})" != "${{CHECKSUM}}" ]; then
+    return ${{NOT_OK}}
+  fi
+
+  while read BLOB;
+  do
+    if [ -n "${{PREVIOUS_BLOBS[${{BLOB}}]}}" ] || [ -L ${{OUTPUT_BLOBS_DIR}}/${{BLOB}} ]; then
+      continue
+    fi
+    blob_is_valid ${{BLOB}} || return ${{NOT_OK}}
+  done < ${{IMAGE_MANIFEST_DIR}}/blobs.txt
+}}
+
+# Pull and save a single Docker image into OUTPUT_DIR, for a single platform if one is given.
+
+save_image() {{
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM=$2
+  local IMAGE_ID=$(image_id ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}})
+  local IMAGE_MANIFEST_DIR=${{OUTPUT_MANIFESTS_DIR}}/${{IMAGE_ID}}
+  local IMAGE_STAGING_DIR=${{OUTPUT_STAGING_DIR}}/${{IMAGE_ID}}
+  local IMAGE_DIGEST START_MILLISECONDS SAVED_BYTES
+
+  # Skip images saved by an earlier run.
+
+  if image_is_saved ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}}; then
+    echo "Skipping ${{DOCKER_IMAGE_NAME}}. Already saved in ${{IMAGE_MANIFEST_DIR}}"
+    return ${{OK}}
+  fi
+  rm -rf ${{IMAGE_MANIFEST_DIR}}
+
+  # Pull docker image.
+
+  pull_image ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}} || return ${{NOT_OK}}
+
+  # Do a "docker save" and unpack it into a staging directory.
+
+  mkdir -p ${{IMAGE_MANIFEST_DIR}} ${{IMAGE_STAGING_DIR}}
+  echo "Creating ${{IMAGE_MANIFEST_DIR}}"
+  START_MILLISECONDS=$(now_milliseconds)
+  docker save ${{PLATFORM:+--platform ${{PLATFORM}}}} ${{DOCKER_IMAGE_TAGS[${{DOCKER_IMAGE_NAME}}]:-${{DOCKER_IMAGE_NAME}}}} | tar --extract --file - --directory ${{IMAGE_STAGING_DIR}} || return ${{NOT_OK}}
+  SAVED_BYTES=$(du --bytes --summarize ${{IMAGE_STAGING_DIR}} | cut -f 1)
+
+  # Keep the image metadata with the image.
+
+  for METADATA_FILE in ${{METADATA_FILES[@]}};
+  do
+    if [ -e ${{IMAGE_STAGING_DIR}}/${{METADATA_FILE}} ]; then
+      mv ${{IMAGE_STAGING_DIR}}/${{METADATA_FILE}} ${{IMAGE_MANIFEST_DIR}}/${{METADATA_FILE}}
+    fi
+  done
+
+  # Move layers and configs into OUTPUT_BLOBS_DIR, keeping only the first copy of each.
+  # Blobs from previous bundles are already on the air-gapped system.
+  # The checksum is recorded before the move, so every blob in OUTPUT_BLOBS_DIR has a checksum.
+  # When resuming, a blob left by an earlier run is replaced if it does not match its checksum.
+
+  (cd ${{IMAGE_STAGING_DIR}} && find . -type f -o -type l | sed "s|^\\./||" | sort) > ${{IMAGE_MANIFEST_DIR}}/blobs.txt
+  while read BLOB;
+  do
+    if [ -n "${{PREVIOUS_BLOBS[${{BLOB}}]}}" ]; then
+      continue
+    fi
+    if [ -e ${{OUTPUT_BLOBS_DIR}}/${{BLOB}} ]; then
+      if [ -z "${{RESUME_DIR}}" ] || [ -L ${{OUTPUT_BLOBS_DIR}}/${{BLOB}} ] || blob_is_valid ${{BLOB}}; then
+        continue
+      fi
+    fi
+    if [ ! -L ${{IMAGE_STAGING_DIR}}/${{BLOB}} ]; then
+      (cd ${{IMAGE_STAGING_DIR}} && sha256sum ${{BLOB}}) >> ${{OUTPUT_CHECKSUMS_FILE}}
+    fi
+    mkdir -p $(dirname ${{OUTPUT_BLOBS_DIR}}/${{BLOB}})
+    mv ${{IMAGE_STAGING_DIR}}/${{BLOB}} ${{OUTPUT_BLOBS_DIR}}/${{BLOB}}
+  done < ${{IMAGE_MANIFEST_DIR}}/blobs.txt
+  rm -rf ${{IMAGE_STAGING_DIR}}
+  record_metric ${{IMAGE_ID}} save ${{START_MILLISECONDS}} ${{SAVED_BYTES}}
+
+  # Record the saved image in OUTPUT_JOURNAL_FILE.
+
+  IMAGE_DIGEST=$(docker image inspect --format "{{{{.Id}}}}" ${{DOCKER_IMAGE_NAME}})
+  echo "${{DOCKER_IMAGE_NAME}} ${{IMAGE_DIGEST:-unknown}} manifests/${{IMAGE_ID}} $(image_checksum ${{IMAGE_MANIFEST_DIR}})" >> ${{OUTPUT_JOURNAL_FILE}}
+}}
+
+# Pull and save a single Docker image for each of its platforms in PLATFORM_LIST.
+# Platforms are done one after another, because pulling another platform replaces the image in docker's classic image store.
+# With STREAM=true, only pull the image.
+
+process_image() {{
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM
+  for PLATFORM in "${{PLATFORM_LIST[@]:0:$(image_platform_count ${{DOCKER_IMAGE_NAME}})}}";
+  do
+    if [ "${{STREAM}}" == "true" ]; then
+      pull_image ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}} || return ${{NOT_OK}}
+    else
+      save_image ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}} || return ${{NOT_OK}}
+    fi
+  done
+}}
+
+# Build a single Docker image, for the first platform in PLATFORM_LIST if one is given.
+# docker reuses its build cache, so unchanged layers are not built again.
+
+build_image() {{
+  local DOCKER_IMAGE_NAME=$1
+  local START_MILLISECONDS=$(now_milliseconds)
+  echo "Building ${{DOCKER_IMAGE_NAME}}"
+  eval "docker build ${{PLATFORM_LIST[0]:+--platform ${{PLATFORM_LIST[0]}}}} ${{DOCKER_BUILD_ARGUMENTS[${{DOCKER_IMAGE_NAME}}]}}" || return ${{NOT_OK}}
+  record_metric $(image_id ${{DOCKER_IMAGE_NAME}} ${{PLATFORM_LIST[0]}}) build ${{START_MILLISECONDS}} $(docker image inspect --format "{{{{.Size}}}}" ${{DOCKER_IMAGE_NAME}} 2>/dev/null)
+}}
+
+# Build images, running at most CONCURRENCY "build_image" jobs at a time.
+# An image is started when the images it depends on are built, and skipped if one of them failed.
+# The return code of each build is kept in "OUTPUT_STAGING_DIR/IMAGE_ID.build.rc".
+
+PENDING_BUILDS=(${{DOCKER_BUILD_IMAGES[@]}})
+while [ ${{#PENDING_BUILDS[@]}} -gt 0 ];
+do
+  WAITING_BUILDS=()
+  for DOCKER_IMAGE_NAME in ${{PENDING_BUILDS[@]}};
+  do
+    BUILD_STATE=ready
+    for DEPENDENCY in ${{DOCKER_BUILD_DEPENDENCIES[${{DOCKER_IMAGE_NAME}}]}};
+    do
+      case "$(cat ${{OUTPUT_STAGING_DIR}}/$(image_id ${{DEPENDENCY}}).build.rc 2>/dev/null)" in
+        ${{OK}}) ;;
+        "") BUILD_STATE=waiting ;;
+        *) BUILD_STATE=failed; break ;;
+      esac
+    done
+    if [ ${{BUILD_STATE}} == failed ]; then
+      echo "Error: Not building ${{DOCKER_IMAGE_NAME}}, because building ${{DEPENDENCY}} failed."
+      echo ${{NOT_OK}} > ${{OUTPUT_STAGING_DIR}}/$(image_id ${{DOCKER_IMAGE_NAME}}).build.rc
+    elif [ ${{BUILD_STATE}} == ready ] && [ $(jobs -r -p | wc -l) -lt ${{CONCURRENCY}} ]; then
+      (build_image ${{DOCKER_IMAGE_NAME}}; echo $? > ${{OUTPUT_STAGING_DIR}}/$(image_id ${{DOCKER_IMAGE_NAME}}).build.rc) &
+    else
+      WAITING_BUILDS+=(${{DOCKER_IMAGE_NAME}})
+    fi
+  done
+  if [ ${{#WAITING_BUILDS[@]}} -gt 0 ] && [ ${{#WAITING_BUILDS[@]}} -eq ${{#PENDING_BUILDS[@]}} ]; then
+    wait -n
+  fi
+  PENDING_BUILDS=(${{WAITING_BUILDS[@]}})
+done
+wait
+
+# Process Docker images, running at most CONCURRENCY "process_image" jobs at a time.
+# The return code of each job is kept in "OUTPUT_STAGING_DIR/IMAGE_ID.rc".
+
+for DOCKER_IMAGE_NAME in ${{DOCKER_IMAGE_NAMES[@]}};
+do
+  while [ $(jobs -r -p | wc -l) -ge ${{CONCURRENCY}} ];
+  do
+    wait -n
+  done
+  IMAGE_ID=$(image_id ${{DOCKER_IMAGE_NAME}})
+  (process_image ${{DOCKER_IMAGE_NAME}}; echo $? > ${{OUTPUT_STAGING_DIR}}/${{IMAGE_ID}}.rc) &
+done
+wait
+
+# Add saved images to OUTPUT_IMAGES_FILE, in DOCKER_IMAGE_NAMES order, so that OUTPUT_LOAD_REPOSITORY_SCRIPT will load them.
+# The result of each image is recorded for METRICS_FILE.
+
+RETURN_CODE=${{OK}}
+for DOCKER_IMAGE_NAME in ${{DOCKER_IMAGE_NAMES[@]}};
+do
+  IMAGE_ID=$(image_id ${{DOCKER_IMAGE_NAME}})
+  if [ "$(cat ${{OUTPUT_STAGING_DIR}}/${{IMAGE_ID}}.rc 2>/dev/null)" == "${{OK}}" ]; then
+    for PLATFORM in "${{PLATFORM_LIST[@]:0:$(image_platform_count ${{DOCKER_IMAGE_NAME}})}}";
+    do
+      echo "$(image_id ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}}) ${{DOCKER_IMAGE_NAME}}${{PLATFORM:+ ${{PLATFORM}}}}" >> ${{OUTPUT_IMAGES_FILE}}
+      echo "$(image_id ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}}) saved ${{DOCKER_IMAGE_NAME}}${{PLATFORM:+ ${{PLATFORM}}}}" >> ${{METRICS_DIR}}/images.txt
+    done
+  else
+    echo "Error: Could not save ${{DOCKER_IMAGE_NAME}}"
+    for PLATFORM in "${{PLATFORM_LIST[@]:0:$(image_platform_count ${{DOCKER_IMAGE_NAME}})}}";
+    do
+      rm -rf ${{OUTPUT_MANIFESTS_DIR}}/$(image_id ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}})
+      echo "$(image_id ${{DOCKER_IMAGE_NAME}} ${{PLATFORM}}) failed ${{DOCKER_IMAGE_NAME}}${{PLATFORM:+ ${{PLATFORM}}}}" >> ${{METRICS_DIR}}/images.txt
+    done
+    RETURN_CODE=${{NOT_OK}}
+  fi
+done
+
+rm -rf ${{OUTPUT_STAGING_DIR}}
+
+# With STREAM=true, compress a single "docker save" of all pulled images directly into OUTPUT_FILE.
+# "docker save" stores layers shared by images once.
+# load-images.sh, images.txt, docker-compose-files.txt, and platforms.txt are appended as a second tar archive,
+# so OUTPUT_FILE is extracted using "tar --ignore-zeros".
+
+if [ "${{STREAM}}" == "true" ]; then
+  echo "Streaming images into ${{OUTPUT_FILE}}"
+  SAVE_NAMES=()
+  for DOCKER_IMAGE_NAME in $(cut -d " " -f 2 ${{OUTPUT_IMAGES_FILE}});
+  do
+    SAVE_NAMES+=(${{DOCKER_IMAGE_TAGS[${{DOCKER_IMAGE_NAME}}]:-${{DOCKER_IMAGE_NAME}}}})
+  done
+  START_MILLISECONDS=$(now_milliseconds)
+  {{
+    docker save ${{PLATFORMS:+--platform ${{PLATFORMS}}}} ${{SAVE_NAMES[@]}} | ${{COMPRESS_COMMAND}} || exit ${{NOT_OK}}
+    tar --create --file - --directory ${{OUTPUT_DIR}} $(cd ${{OUTPUT_DIR}} && ls load-images.sh images.txt docker-compose-files.txt platforms.txt 2>/dev/null) | ${{COMPRESS_COMMAND}}
+  }} | write_output || RETURN_CODE=${{NOT_OK}}
+  record_metric run stream ${{START_MILLISECONDS}} $(du --bytes --total ${{OUTPUT_FILE}} ${{OUTPUT_FILE}}.[0-9][0-9][0-9][0-9] 2>/dev/null | tail -1 | cut -f 1)
+  write_metrics save-images.sh ${{RUN_START_MILLISECONDS}}
+  rm -rf ${{OUTPUT_DIR}}
+  echo "Done."
+  echo "    Output file: ${{OUTPUT_FILE}}"
+  if [ "${{VOLUME_SIZE_IN_MEGABYTES:-0}}" -gt 0 ]; then
+    echo "    Written as volumes listed in ${{OUTPUT_VOLUME_CHECKSUMS_FILE}}"
+    echo "    Verify them with ${{OUTPUT_VERIFY_VOLUMES_SCRIPT}}"
+  fi
+  if [ -n "${{METRICS_FILE}}" ]; then
+    echo "    Metrics: ${{METRICS_FILE}}"
+  fi
+  exit ${{RETURN_CODE}}
+fi
+
+# Images saved at the same time may both have recorded the checksum of a blob they share. Keep one line for each blob.
+
+sort -u -o ${{OUTPUT_CHECKSUMS_FILE}} ${{OUTPUT_CHECKSUMS_FILE}}
+
+# List every blob on the air-gapped system once this bundle is loaded. Input for the next delta bundle.
+
+(printf "%s\n" ${{PREVIOUS_BUNDLE_MANIFEST[@]}}; cat ${{OUTPUT_MANIFESTS_DIR}}/*/blobs.txt 2>/dev/null) | grep -v "^$" | sort -u > ${{OUTPUT_BUNDLE_MANIFEST_FILE}}
+
+# Compress results. With COMPRESSION=none, layers that "docker save" already compressed are not compressed again.
+# The "compress" metric counts the bytes of OUTPUT_DIR, before compression.
+
+START_MILLISECONDS=$(now_milliseconds)
+COMPRESS_BYTES=$(du --bytes --summarize ${{OUTPUT_DIR}} | cut -f 1)
+tar --create --verbose --file - --directory ${{MY_HOME}} ${{OUTPUT_DIR_NAME}} | ${{COMPRESS_COMMAND}} | write_output || RETURN_CODE=${{NOT_OK}}
+record_metric run compress ${{START_MILLISECONDS}} ${{COMPRESS_BYTES}}
+write_metrics save-images.sh ${{RUN_START_MILLISECONDS}}
+
+# Epilog.
+
+echo "Done."
+echo "    Output file: ${{OUTPUT_FILE}}"
+echo "    Which is a compressed version of ${{OUTPUT_DIR}}"
+if [ "${{VOLUME_SIZE_IN_MEGABYTES:-0}}" -gt 0 ]; then
+  echo "    Written as volumes listed in ${{OUTPUT_VOLUME_CHECKSUMS_FILE}}"
+  echo "    Verify them with ${{OUTPUT_VERIFY_VOLUMES_SCRIPT}}"
+fi
+if [ -n "${{METRICS_FILE}}" ]; then
+  echo "    Metrics: ${{METRICS_FILE}}"
+fi
+
+exit ${{RETURN_CODE}}
+"""
+    return 0
+
+
+def create_output_text(config, images, image_tags=None, images_by_file=None, builds=None):
+    """ Perform variable replacement in text """
+
+    image_list = ""
+    for image in images:
+        image_list += "  \"{0}\"\n".format(image)
+    image_tag_list = ""
+    for image, tags in (image_tags or {}).items():
+        image_tag_list += "  [\"{0}\"]=\"{1}\"\n".format(image, " ".join(tags))
+    build_image_list = ""
+    build_argument_list = ""
+    build_dependency_list = ""
+    for build in builds or []:
+        build_image_list += "  \"{0}\"\n".format(build.get("image"))
+        build_argument_list += "  [\"{0}\"]={1}\n".format(build.get("image"), shlex.quote(shlex.join(build.get("arguments"))))
+        build_dependency_list += "  [\"{0}\"]=\"{1}\"\n".format(build.get("image"), " ".join(build.get("dependencies")))
+    previous_blob_list = ""
+    for blob in get_previous_blobs(config):
+        previous_blob_list += "  \"{0}\"\n".format(blob)
+    variables = {
+        "concurrency": config.get('concurrency'),
+        "previous_blob_list": previous_blob_list,
+        "stream": str(config.get('stream')).lower(),
+        "compression": config.get('compression'),
+        "compression_level": config.get('compression_level') or "",
+        "image_list": image_list,
+        "image_tag_list": image_tag_list,
+        "build_image_list": build_image_list,
+        "build_argument_list": build_argument_list,
+        "build_dependency_list": build_dependency_list,
+        "platforms": ",".join(config.get('platforms') or []),
+        "shard_suffix": get_shard_suffix(config),
+        "volume_size_in_megabytes": config.get('volume_size_in_megabytes'),
+        "verify_volumes_script": replace_variables_in_text(file_text_for_verify_volumes, {}),
+        "docker_compose_file_list": create_docker_compose_files_text(images_by_file or {}),
+        "load_images_header": replace_variables_in_text(file_text_for_load_images_header, {"created_on": "${OUTPUT_DATE_HUMAN}"}),
+        "load_images_script": replace_variables_in_text(file_text_for_load_images, {"metrics_functions": replace_variables_in_text(file_text_for_metrics, {})}),
+        "metrics_file": config.get('metrics_file') or "",
+        "metrics_functions": replace_variables_in_text(file_text_for_metrics, {}),
+        "prometheus_file": config.get('prometheus_file') or "",
+    }
+    return replace_variables_in_text(file_text_for_save_images, variables)
@@ -0,0 +1,298 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/serve.py
+#   Answer save-images requests over HTTP.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import collections
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+# Import from standard library and https://pypi.org/, when first used.
+
+from .common import concurrent, http, urllib, yaml
+
+# Import from docker_compose_air_gapper.
+
+from .archive import COMPRESSIONS
+from .bundle_scripts import create_load_images_text
+from .common import MEGABYTES, __updated__, __version__, message, message_debug
+from .compose import (
+    DOCKER_COMPOSE_CONTENTS,
+    DOCKER_COMPOSE_FILENAMES,
+    PARSED_DOCKER_COMPOSE_TEXTS,
+    get_save_images_lists,
+    get_services_from_file,
+)
+from .save_images_script import create_output_text
+from .shard import parse_shard
+
+# -----------------------------------------------------------------------------
+# Serve functions
+#   "serve" answers POST /save-images with the images, save-images.sh, and load-images.sh of docker-compose
+#   files sent in the request, as "create-save-images" would create them. Responses are kept in memory by
+#   a hash of the request, so a repeated request is answered without parsing. A request looks like:
+#     {
+#         "files": {"docker-compose.yaml": "services: ...", ".env": "TAG=1.0"},
+#         "docker_compose_file": "docker-compose.yaml",
+#         "project_directory": "/home/me/project",
+#         "environment": {"COMPOSE_PROJECT_NAME": "demo"},
+#         "profiles": ["demo"],
+#         "platforms": ["linux/amd64"]
+#     }
+#   Only "files" is required. Paths in "files" are relative to "project_directory", which need not exist on the server.
+#   GET /stats returns the cache's counts, and the size of the parsed docker-compose texts kept, as JSON.
+#   GET /metrics returns them in the Prometheus text format.
+# -----------------------------------------------------------------------------
+
+
+# Largest request body, in bytes.
+
+SERVE_MAX_REQUEST_SIZE = 16 * MEGABYTES
+
+# Options of a request that change save-images.sh, with their types.
+
+SERVE_OPTIONS = {
+    "compression": str,
+    "compression_level": int,
+    "concurrency": int,
+    "platforms": list,
+    "profiles": list,
+    "shard": str,
+    "stream": bool,
+    "volume_size_in_megabytes": int,
+}
+
+
+def get_serve_request_config(config, request):
+    ''' Return config with the options of a request. Raise ValueError for a bad option. '''
+
+    result = dict(config, lock_file=None, previous_bundle_manifest=None)
+    for key, option_type in SERVE_OPTIONS.items():
+        if request.get(key) is None:
+            continue
+        if not isinstance(request.get(key), option_type) or isinstance(request.get(key), bool) != (option_type is bool):
+            raise ValueError('"{0}" must be of type {1}.'.format(key, option_type.__name__))
+        if option_type is list and not all(isinstance(item, str) for item in request.get(key)):
+            raise ValueError('"{0}" must be a list of strings.'.format(key))
+        result[key] = request.get(key)
+
+    compression = result.get('compression')
+    compression_level = result.get('compression_level')
+    if compression not in COMPRESSIONS:
+        raise ValueError(message(504, ", ".join(COMPRESSIONS), compression))
+    if compression_level and not 1 <= compression_level <= COMPRESSIONS[compression]["max_level"]:
+        raise ValueError(message(505, compression, COMPRESSIONS[compression]["max_level"], compression_level))
+    if result.get('concurrency') < 1:
+        raise ValueError(message(501, result.get('concurrency')))
+    for platform in result.get('platforms') or []:
+        if not re.match(r"^[a-z0-9]+/[a-z0-9_]+(/[a-z0-9]+)?$", str(platform)):
+            raise ValueError(message(513, platform))
+    if result.get('stream') and len(result.get('platforms') or []) > 1:
+        raise ValueError(message(514, ",".join(result.get('platforms'))))
+    if result.get('volume_size_in_megabytes') < 0:
+        raise ValueError(message(516, result.get('volume_size_in_megabytes')))
+    try:
+        parse_shard(result.get('shard'))
+    except ValueError as err:
+        raise ValueError(message(522, result.get('shard'))) from err
+    return result
+
+
+def create_serve_response(config, request):
+    ''' Return the images, builds, save-images.sh, and load-images.sh of the docker-compose files of a request.
+        Raise ValueError for a bad request, and OSError or yaml.YAMLError for files that cannot be read.
+    '''
+
+    request_config = get_serve_request_config(config, request)
+    files = request.get("files")
+    if not isinstance(files, dict) or not files or not all(isinstance(text, str) for text in files.values()):
+        raise ValueError('"files" must map file names to their contents.')
+    for key in ["docker_compose_file", "env_file", "project_directory"]:
+        if request.get(key) is not None and not isinstance(request.get(key), str):
+            raise ValueError('"{0}" must be of type str.'.format(key))
+    environment = request.get("environment") or {}
+    if not isinstance(environment, dict) or not all(isinstance(value, (str, int, float)) for value in environment.values()):
+        raise ValueError('"environment" must map variable names to their values.')
+    project_directory = os.path.abspath(request.get("project_directory") or "/project")
+    docker_compose_file = request.get("docker_compose_file") or next((filename for filename in DOCKER_COMPOSE_FILENAMES if filename in files), None)
+    if not docker_compose_file and len(files) == 1:
+        docker_compose_file = list(files)[0]
+    if not isinstance(docker_compose_file, str):
+        raise ValueError('"docker_compose_file" is required when "files" holds no compose.yaml or docker-compose.yaml.')
+    env_file = request.get("env_file")
+    contents = {
+        "environment": {str(key): str(value) for key, value in environment.items()},
+        "files": {os.path.abspath(os.path.join(project_directory, filename)): text for filename, text in files.items()},
+    }
+
+    token = DOCKER_COMPOSE_CONTENTS.set(contents)
+    try:
+        docker_compose_file = os.pathsep.join(os.path.join(project_directory, filename) for filename in docker_compose_file.split(os.pathsep))
+        services = get_services_from_file(docker_compose_file, tuple(request_config.get('profiles') or []), os.path.join(project_directory, env_file) if env_file else None)
+        images_by_file, images, image_tags, builds = get_save_images_lists(request_config, {docker_compose_file: services})
+        save_images_text = create_output_text(request_config, images, image_tags, images_by_file, builds)
+    finally:
+        DOCKER_COMPOSE_CONTENTS.reset(token)
+
+    return {
+        "images": images,
+        "builds": [{key: build.get(key) for key in ["image", "service", "dependencies", "arguments"]} for build in builds],
+        "save_images_script": save_images_text,
+        "load_images_script": create_load_images_text(),
+    }
+
+
+class ResponseCache:
+    ''' Responses by content hash, least recently used first, with counts of hits, misses, and evictions.
+        Requests for a response that is being created wait for it, and count as hits.
+    '''
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.counts = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key, create_function):
+        ''' Return (response, hit), creating the response with create_function on a miss. Errors are not cached. '''
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.counts["hits"] += 1
+                return self.entries.get(key), True
+            future = self.pending.get(key)
+            waiting = future is not None
+            if waiting:
+                self.counts["hits"] += 1
+            else:
+                self.counts["misses"] += 1
+                future = self.pending[key] = concurrent.futures.Future()
+        if waiting:
+            return future.result(), True
+
+        try:
+            future.set_result(create_function())
+        except Exception as err:
+            future.set_exception(err)
+        with self.lock:
+            self.pending.pop(key)
+            if not future.exception():
+                self.entries[key] = future.result()
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.counts["evictions"] += 1
+        return future.result(), False
+
+    def stats(self):
+        ''' Return the counts, with the number of entries. '''
+        with self.lock:
+            return dict(self.counts, entries=len(self.entries), max_entries=self.max_entries)
+
+
+def create_serve_prometheus_text(stats):
+    ''' Return the counts of a ResponseCache, and the size of the parsed texts, in the Prometheus text format. '''
+    lines = []
+    for name, help_text, metric_type, value in [
+            ("serve_cache_hits_total", "Requests answered from the response cache.", "counter", stats.get("hits")),
+            ("serve_cache_misses_total", "Requests that created a response.", "counter", stats.get("misses")),
+            ("serve_cache_evictions_total", "Responses removed from the response cache.", "counter", stats.get("evictions")),
+            ("serve_cache_entries", "Responses in the response cache.", "gauge", stats.get("entries")),
+            ("serve_parsed_texts_bytes", "Bytes of the docker-compose texts whose parsed models are kept.", "gauge", stats.get("parsed_texts").get("size")),
+    ]:
+        lines.append("# HELP docker_compose_air_gapper_{0} {1}".format(name, help_text))
+        lines.append("# TYPE docker_compose_air_gapper_{0} {1}".format(name, metric_type))
+        lines.append("docker_compose_air_gapper_{0} {1}".format(name, value))
+    return "\n".join(lines) + "\n"
+
+
+@functools.lru_cache(maxsize=None)
+def get_serve_request_handler():
+    ''' Return the request handler class of "serve". http.server is imported only when it is needed. '''
+
+    class ServeRequestHandler(http.server.BaseHTTPRequestHandler):
+        ''' Handle a "serve" request. The server runs each request in its own thread. '''
+
+        protocol_version = "HTTP/1.1"
+        server_version = "docker-compose-air-gapper/{0}".format(__version__)
+
+        def send_text(self, status, text, content_type="application/json", headers=None):
+            ''' Send a response. '''
+            body = text.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for header, value in (headers or {}).items():
+                self.send_header(header, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status, value, headers=None):
+            ''' Send a JSON response. '''
+            self.send_text(status, json.dumps(value, indent=4) + "\n", headers=headers)
+
+        def do_GET(self):
+            ''' Return the cache's counts or the program's version. '''
+            path = urllib.parse.urlsplit(self.path).path
+            stats = dict(self.server.response_cache.stats(), parsed_texts=PARSED_DOCKER_COMPOSE_TEXTS.stats())
+            if path == "/stats":
+                self.send_json(200, stats)
+            elif path == "/metrics":
+                self.send_text(200, create_serve_prometheus_text(stats), "text/plain; version=0.0.4")
+            elif path == "/version":
+                self.send_json(200, {"version": __version__, "updated": __updated__})
+            else:
+                self.send_json(404, {"error": "Not found: {0}".format(path)})
+
+        def do_POST(self):
+            ''' Return the response for the docker-compose files of a request, from the cache when it has the same request. '''
+
+            path = urllib.parse.urlsplit(self.path).path
+            length = self.headers.get("Content-Length")
+            if path != "/save-images":
+                self.send_json(404, {"error": "Not found: {0}".format(path)}, {"Connection": "close"})
+                return
+
+            # Without a valid Content-Length, the end of the body is unknown, so the connection is closed.
+
+            if length is None:
+                self.send_json(411, {"error": "Requests need a Content-Length."}, {"Connection": "close"})
+                return
+            if not re.fullmatch("[0-9]+", length.strip()):
+                self.send_json(400, {"error": "Content-Length is not a number of bytes: {0}".format(length)}, {"Connection": "close"})
+                return
+            if int(length) > SERVE_MAX_REQUEST_SIZE:
+                self.send_json(413, {"error": "Requests are limited to {0} bytes.".format(SERVE_MAX_REQUEST_SIZE)}, {"Connection": "close"})
+                return
+            body = self.rfile.read(int(length))
+            try:
+                request = json.loads(body)
+                if not isinstance(request, dict):
+                    raise ValueError("The request must be a JSON object.")
+            except ValueError as err:
+                self.send_json(400, {"error": str(err)})
+                return
+
+            content_hash = "sha256:{0}".format(hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest())
+            try:
+                response, hit = self.server.response_cache.get(content_hash, functools.partial(create_serve_response, self.server.config, request))
+            except (OSError, ValueError, yaml.YAMLError) as err:
+                self.send_json(400, {"content_hash": content_hash, "error": str(err)})
+                return
+            self.send_json(200, dict(response, content_hash=content_hash), {"X-Cache": "HIT" if hit else "MISS"})
+
+        def log_request(self, code="-", size="-"):
+            ''' Log requests at the debug level. '''
+            logging.debug(message_debug(904, self.address_string(), '"{0}" {1} {2}'.format(self.requestline, code, size)))
+
+    return ServeRequestHandler
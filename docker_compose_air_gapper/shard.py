@@ -0,0 +1,78 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/shard.py
+#   Split the images of docker-compose files into shards.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import hashlib
+import logging
+
+# Import from docker_compose_air_gapper.
+
+from .common import message_info
+from .registry import parse_image_reference
+
+# -----------------------------------------------------------------------------
+# Shard functions
+#   With SENZING_SHARD of "K/N", a save holds only shard K of N of the images, so N hosts,
+#   or N processes on one host, can each save a part of a bundle at the same time.
+#   "merge-bundles" combines the parts into one bundle.
+#   An image's shard depends only on its digest, or on its name when it is not given by digest,
+#   so every host picks the same images without talking to the others.
+#   With a lock file, images are given by digest, and every host saves the same content.
+# -----------------------------------------------------------------------------
+
+
+def parse_shard(shard):
+    ''' Return (K, N) of a shard given as "K/N", or (1, 1) when there is none. Raise ValueError unless 1 <= K <= N. '''
+    if not shard:
+        return 1, 1
+    shard_number, _, shard_count = str(shard).partition("/")
+    shard_number, shard_count = int(shard_number), int(shard_count)
+    if not 1 <= shard_number <= shard_count:
+        raise ValueError("Shard {0} is not from 1 to {1}.".format(shard_number, shard_count))
+    return shard_number, shard_count
+
+
+def get_shard_suffix(config):
+    ''' Return the suffix of the names of a shard's bundle, like "-shard-2-of-4", so shards can be saved side by side. '''
+    if not config.get('shard'):
+        return ""
+    return "-shard-{0}-of-{1}".format(*parse_shard(config.get('shard')))
+
+
+def get_shard_number(key, shard_count):
+    ''' Return the shard, from 1 to shard_count, of an image's digest or name. '''
+    return int(hashlib.sha256(key.encode()).hexdigest()[:16], 16) % shard_count + 1
+
+
+def select_shard(config, images, builds=None):
+    ''' Return the images and builds in shard SENZING_SHARD. An image is assigned by its digest, if it is given by digest, or by its name.
+        Builds that depend on each other are assigned together, by the first of their names, because they are built on one host.
+    '''
+
+    shard_number, shard_count = parse_shard(config.get('shard'))
+    if shard_count == 1:
+        return images, builds or []
+
+    # Find groups of builds that depend on each other.
+
+    groups = {}
+    for build in builds or []:
+        group = {build.get("image")}
+        for dependency in build.get("dependencies"):
+            group |= groups.get(dependency, {dependency})
+        for image in group:
+            groups[image] = group
+
+    keys = {image: min(group) for image, group in groups.items()}
+    for image in images:
+        if image and image not in keys:
+            keys[image] = parse_image_reference(image).get("digest") or image
+    selected_images = [image for image in images if get_shard_number(keys.get(image) or str(image), shard_count) == shard_number]
+    selected_builds = [build for build in builds or [] if get_shard_number(keys.get(build.get("image")), shard_count) == shard_number]
+    logging.info(message_info(117, shard_number, shard_count, len(selected_images), len(images)))
+    return selected_images, selected_builds
@@ -0,0 +1,347 @@
+'''
+# -----------------------------------------------------------------------------
+# docker_compose_air_gapper/watch.py
+#   Watch docker-compose files and write the outputs of the projects that change.
+# -----------------------------------------------------------------------------
+'''
+
+# Import from standard library. https://docs.python.org/3/library/
+
+import datetime
+import errno
+import functools
+import glob
+import json
+import logging
+import os
+import select
+import struct
+import time
+
+# Import from standard library and https://pypi.org/, when first used.
+
+from .common import ctypes, yaml
+
+# Import from docker_compose_air_gapper.
+
+from .archive import COMPRESSIONS
+from .bundle import save_bundle
+from .common import KILOBYTES, message_info, message_warning
+from .compose import (
+    DOCKER_COMPOSE_FILENAMES,
+    get_docker_compose_files,
+    get_save_images_lists,
+    get_services_from_file,
+)
+from .save_images_script import create_output_text
+from .shard import get_shard_suffix
+
+# -----------------------------------------------------------------------------
+# Watch functions
+#   "watch" keeps the services of each docker-compose project with the files the project read:
+#   its docker-compose files, ".env" files, and Dockerfiles. When files change, only the projects
+#   that read them are parsed again, and only the images that were added or changed are saved.
+#   Changes are found with Linux inotify, or by checking the modification time and size of the
+#   files every SENZING_POLL_INTERVAL_IN_SECONDS.
+# -----------------------------------------------------------------------------
+
+
+# Linux inotify events, from <sys/inotify.h>: modify, attrib, close_write, moved_from, moved_to, create, delete, delete_self, move_self.
+
+INOTIFY_MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+INOTIFY_IGNORED = 0x8000
+INOTIFY_QUEUE_OVERFLOW = 0x4000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Seconds without events before changes are read, so that an editor's or "git checkout"'s burst of writes is read once.
+
+WATCH_SETTLE_SECONDS = 0.5
+
+
+def get_file_signature(filename):
+    ''' Return the modification time and size of a file, or None if it does not exist. '''
+    try:
+        stat_result = os.stat(filename)
+    except (OSError, TypeError):
+        return None
+    return (stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def get_watched_directories(config, filenames):
+    ''' Return the directories of filenames, and every directory under the directories and glob patterns
+        of SENZING_DOCKER_COMPOSE_FILE, where new docker-compose files may appear.
+    '''
+
+    result = {os.path.dirname(filename) for filename in filenames}
+    for docker_compose_file in config.get('docker_compose_file') or []:
+        for path in docker_compose_file.split(os.pathsep):
+            path = os.path.abspath(os.path.expanduser(path))
+            if glob.has_magic(path):
+                path = os.path.dirname(path[:min(path.index(character) for character in "*?[" if character in path)])
+            if os.path.isdir(path):
+                result.update(directory for directory, _, _ in os.walk(path))
+            else:
+                result.add(os.path.dirname(path))
+    return {directory for directory in result if os.path.isdir(directory)}
+
+
+class InotifyNotifier:
+    ''' Wait for changes in directories using Linux inotify, through ctypes. '''
+
+    name = "inotify"
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.file_descriptor = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.file_descriptor < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.directories = {}
+
+    def add_directories(self, directories):
+        ''' Watch the directories not yet watched. Return True if any were added. '''
+        added = False
+        for directory in set(directories) - set(self.directories.values()):
+            watch_descriptor = self.libc.inotify_add_watch(self.file_descriptor, os.fsencode(directory), INOTIFY_MASK)
+            if watch_descriptor < 0:
+                if ctypes.get_errno() == errno.ENOENT:
+                    continue
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), directory)
+            self.directories[watch_descriptor] = directory
+            added = True
+        return added
+
+    def read_events(self, paths):
+        ''' Add the paths of pending events to paths. Return False if events were lost. '''
+        try:
+            data = os.read(self.file_descriptor, 64 * KILOBYTES)
+        except BlockingIOError:
+            return True
+        offset = 0
+        while offset < len(data):
+            watch_descriptor, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + length
+            if mask & INOTIFY_QUEUE_OVERFLOW:
+                return False
+            directory = self.directories.get(watch_descriptor)
+            if mask & INOTIFY_IGNORED:
+                self.directories.pop(watch_descriptor, None)
+            if directory:
+                paths.add(os.path.join(directory, os.fsdecode(name)) if name else directory)
+        return True
+
+    def wait(self):
+        ''' Return the paths that changed, once changes stop for WATCH_SETTLE_SECONDS, or None if events were lost. '''
+        paths = set()
+        complete = True
+        select.select([self.file_descriptor], [], [])
+        while select.select([self.file_descriptor], [], [], WATCH_SETTLE_SECONDS)[0]:
+            complete = self.read_events(paths) and complete
+        return paths if complete else None
+
+
+class PollingNotifier:
+    ''' Wait SENZING_POLL_INTERVAL_IN_SECONDS. Every watched file is then checked for changes. '''
+
+    name = "polling"
+
+    def __init__(self, poll_interval_in_seconds):
+        self.poll_interval_in_seconds = poll_interval_in_seconds
+
+    def add_directories(self, _directories):
+        ''' Polling checks files, not directories. '''
+        return False
+
+    def wait(self):
+        ''' Return None: any file may have changed. '''
+        time.sleep(self.poll_interval_in_seconds)
+
+
+def get_notifier(config):
+    ''' Return an InotifyNotifier, or a PollingNotifier where inotify is not available. '''
+    try:
+        return InotifyNotifier()
+    except (AttributeError, OSError) as err:
+        logging.warning(message_warning(308, config.get('poll_interval_in_seconds'), err))
+        return PollingNotifier(config.get('poll_interval_in_seconds'))
+
+
+class DockerComposeWatcher:
+    ''' The services of the docker-compose projects of SENZING_DOCKER_COMPOSE_FILE, kept up to date by parsing only
+        the projects whose files changed. Parsing is done in this process, so unchanged included files stay cached.
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self.projects = {}
+        self.other_files = {os.path.abspath(config.get('lock_file')): None} if config.get('lock_file') else {}
+        self.get_services_function = functools.partial(get_services_from_file, profiles=tuple(config.get('profiles') or []), env_file=config.get('env_file'))
+
+    def get_files(self):
+        ''' Return every watched file. '''
+        result = set(self.other_files)
+        for project in self.projects.values():
+            result.update(project.get("files"))
+        return result
+
+    def get_services_by_file(self):
+        ''' Return {docker_compose_file: {"builds": ..., "images": ...}}, as get_services_by_file() does. '''
+        return {docker_compose_file: project.get("services") for docker_compose_file, project in self.projects.items()}
+
+    @staticmethod
+    def get_changed_files(signatures, changed_paths):
+        ''' Return the files of {filename: signature} that changed. changed_paths of None compares every signature. '''
+        if changed_paths is None:
+            return [filename for filename, signature in signatures.items() if get_file_signature(filename) != signature]
+        return [filename for filename in signatures if filename in changed_paths]
+
+    def read_project(self, docker_compose_file, previous_project=None):
+        ''' Return {"files": {filename: signature}, "services": ...} of a project. Signatures are taken before parsing,
+            so a file changed while it is parsed is read again. A project that cannot be parsed keeps its previous services.
+        '''
+        filenames = {os.path.abspath(filename) for filename in docker_compose_file.split(os.pathsep)}
+        filenames.update((previous_project or {}).get("files", {}))
+        signatures = {filename: get_file_signature(filename) for filename in filenames}
+        try:
+            services = self.get_services_function(docker_compose_file)
+        except (OSError, ValueError, yaml.YAMLError) as err:
+            logging.warning(message_warning(307, docker_compose_file, err))
+            services = (previous_project or {}).get("services") or {"builds": [], "files": [], "images": []}
+            return {"files": signatures, "services": services}
+        files = {filename: signatures.get(filename) if filename in signatures else get_file_signature(filename) for filename in services.get("files")}
+        return {"files": files, "services": services}
+
+    def update(self, changed_paths=None):
+        ''' Parse new projects and projects whose files are in changed_paths, and forget projects that are gone.
+            changed_paths of None checks every watched file. Return the changed files.
+        '''
+
+        result = set()
+        for filename in self.get_changed_files(self.other_files, changed_paths):
+            self.other_files[filename] = get_file_signature(filename)
+            result.add(filename)
+
+        # Directories and globs are searched again only when a change may have added or removed a docker-compose file.
+
+        docker_compose_files = list(self.projects)
+        if changed_paths is None or any(os.path.basename(path) in DOCKER_COMPOSE_FILENAMES or not os.path.isfile(path) for path in changed_paths):
+            docker_compose_files = get_docker_compose_files(self.config)
+        for docker_compose_file in set(self.projects) - set(docker_compose_files):
+            result.update(os.path.abspath(filename) for filename in docker_compose_file.split(os.pathsep))
+
+        projects = {}
+        for docker_compose_file in docker_compose_files:
+            project = self.projects.get(docker_compose_file)
+            changed_files = self.get_changed_files(project.get("files"), changed_paths) if project else [os.path.abspath(filename) for filename in docker_compose_file.split(os.pathsep)]
+            if changed_files:
+                project = self.read_project(docker_compose_file, project)
+                result.update(changed_files)
+            projects[docker_compose_file] = project
+        self.projects = projects
+        return sorted(result)
+
+
+def get_image_keys(images, image_tags, builds):
+    ''' Return {image: key}. A key changes when what is saved for the image changes: its tags or, for a built image,
+        its build arguments, the builds it depends on, and its Dockerfile.
+    '''
+    build_keys = {build.get("image"): [build.get("arguments"), build.get("dependencies"), get_file_signature(build.get("dockerfile"))] for build in builds}
+    return {image: json.dumps([image_tags.get(image), build_keys.get(image)]) for image in images}
+
+
+def select_connected_builds(builds, images):
+    ''' Return the builds of images, with the builds they depend on and the builds that depend on them, in build order.
+        A build waits for the builds it depends on, so they are built again too.
+    '''
+    selected = {build.get("image") for build in builds if build.get("image") in images}
+    count = 0
+    while count != len(selected):
+        count = len(selected)
+        for build in builds:
+            if build.get("image") in selected or selected.intersection(build.get("dependencies")):
+                selected.add(build.get("image"))
+                selected.update(build.get("dependencies"))
+    return [build for build in builds if build.get("image") in selected]
+
+
+def write_watch_outputs(config, watch_state, services_by_file, changed_files, start_time):
+    ''' Create the outputs of one change in SENZING_OUTPUT_DIRECTORY: save-images.sh for every image, and for the images
+        added or changed, save-images-<timestamp>.sh, changes-<timestamp>.json and, with SENZING_SAVE_BUNDLES, a bundle.
+        Images that could not be saved are saved with the next change. Update watch_state.
+    '''
+
+    try:
+        images_by_file, images, image_tags, builds = get_save_images_lists(config, services_by_file)
+    except (OSError, ValueError) as err:
+        logging.warning(message_warning(307, ", ".join(changed_files), err))
+        return
+
+    # Compare with the images of the previous change.
+
+    previous_image_keys = watch_state.get("image_keys")
+    image_keys = get_image_keys(images, image_tags, builds)
+    added = [image for image in images if image not in previous_image_keys]
+    changed = [image for image in images if image in previous_image_keys and image_keys.get(image) != previous_image_keys.get(image)]
+    removed = [image for image in previous_image_keys if image not in image_keys]
+    logging.info(message_info(120, len(changed_files), time.time() - start_time, len(added), len(changed), len(removed)))
+    if not (added or changed or removed):
+        return
+
+    output_directory = watch_state.get("output_directory")
+    output_date = max(int(time.time()), watch_state.get("output_date") + 1)
+    watch_state["output_date"] = output_date
+    output_suffix = "{0}{1}".format(output_date, get_shard_suffix(config))
+
+    # save-images.sh for every image is replaced all at once, so it is never read half written.
+
+    save_images_filename = os.path.join(output_directory, "save-images.sh")
+    with open("{0}.{1}".format(save_images_filename, os.getpid()), "w") as a_file:
+        a_file.write(create_output_text(config, images, image_tags, images_by_file, builds))
+    os.replace("{0}.{1}".format(save_images_filename, os.getpid()), save_images_filename)
+    logging.info(message_info(103, save_images_filename))
+
+    # The images added or changed, and the builds they wait for or that wait for them, skipping blobs already saved.
+
+    delta_builds = select_connected_builds(builds, set(added + changed))
+    delta_images = [image for image in images if image in added or image in changed or image in [build.get("image") for build in delta_builds]]
+    delta_names = set(delta_images).union(*[image_tags.get(image, []) for image in delta_images])
+    delta_images_by_file = {docker_compose_file: [image for image in file_images if image in delta_names] for docker_compose_file, file_images in images_by_file.items()}
+    delta_config = dict(config, previous_bundle_manifest=watch_state.get("previous_bundle_manifest"))
+    changes = {
+        "created_on": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "changed_files": changed_files,
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "save_images_file": None,
+        "bundle_file": None,
+        "failures": {},
+    }
+    if delta_images:
+        changes["save_images_file"] = os.path.join(output_directory, "save-images-{0}.sh".format(output_suffix))
+        with open(changes.get("save_images_file"), "w") as a_file:
+            a_file.write(create_output_text(delta_config, delta_images, image_tags, delta_images_by_file, delta_builds))
+        logging.info(message_info(103, changes.get("save_images_file")))
+
+    # Images of services that are only built cannot be pulled from a registry. They are in save-images-<timestamp>.sh only.
+
+    built_images = [build.get("image") for build in builds]
+    pulled_images = [image for image in delta_images if image not in built_images]
+    if config.get('save_bundles') and pulled_images:
+        output_extension = COMPRESSIONS.get(config.get('compression')).get("extension")
+        output_dir = os.path.join(output_directory, "docker-compose-air-gapper-{0}".format(output_suffix))
+        changes["bundle_file"] = "{0}.{1}".format(output_dir, output_extension)
+        os.makedirs(output_dir, exist_ok=True)
+        failures = save_bundle(delta_config, {"images": pulled_images, "image_tags": image_tags, "images_by_file": delta_images_by_file}, output_dir, changes.get("bundle_file"))
+        changes["failures"] = {image: str(failure) for image, failure in failures.items()}
+        if os.path.isfile(os.path.join(output_dir, "bundle-manifest.txt")):
+            watch_state["previous_bundle_manifest"] = os.path.join(output_dir, "bundle-manifest.txt")
+        for image in changes.get("failures"):
+            image_keys.pop(image, None)
+
+    changes_filename = os.path.join(output_directory, "changes-{0}.json".format(output_suffix))
+    with open(changes_filename, "w") as a_file:
+        json.dump(changes, a_file, indent=4)
+        a_file.write("\n")
+    logging.info(message_info(103, changes_filename))
+    watch_state["image_keys"] = image_keys
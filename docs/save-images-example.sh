@@ -1,8 +1,33 @@
 #!/usr/bin/env bash
 
-# The save-images.sh script takes 1 input:
+# The save-images.sh script takes 4 inputs:
 #  - DOCKER_IMAGE_NAMES
-# Given that input, the docker images are downloaded, saved, and compressed into a single file.
+#  - DOCKER_IMAGE_TAGS, the tags of images given by digest. Usually empty.
+#  - DOCKER_BUILD_IMAGES, images built from docker-compose services that have "build" but no "image". Usually empty.
+#  - PREVIOUS_BUNDLE_MANIFEST, the blobs already on the air-gapped system. Usually empty.
+# Given that input, the docker images are built or downloaded, saved, and compressed into a single file.
+# Up to CONCURRENCY images are built at the same time, each after the built images it depends on.
+# Layers shared between images are stored once in the "blobs" directory.
+# Layers listed in PREVIOUS_BUNDLE_MANIFEST are not stored at all.
+# Up to CONCURRENCY images are pulled and saved at the same time.
+# With STREAM=true, one "docker save" of all images is compressed straight into the output file
+# instead, so no uncompressed copy of the images is kept on disk.
+# COMPRESSION is "gzip" (multithreaded if "pigz" is installed), "zstd" (multithreaded), or "none".
+# Each saved image is recorded in "journal.txt". If a run stops, run again with RESUME_DIR set to
+# its output directory to skip images that are already saved and still match their checksums.
+# With PLATFORMS set to a comma-separated list of "os/arch[/variant]", each image is pulled and saved
+# for those platforms only, and load-images.sh refuses to load the bundle on a host of another platform.
+# Images in DOCKER_BUILD_IMAGES are built and saved for the first of those platforms only.
+# With VOLUME_SIZE_IN_MEGABYTES greater than 0, the output file is written as numbered volumes,
+# OUTPUT_FILE.0000, OUTPUT_FILE.0001, ..., with their checksums in OUTPUT_FILE.sha256
+# and a script, OUTPUT_FILE.verify.sh, that checks them on the air-gapped system.
+# With METRICS_FILE set, a JSON report of the duration, bytes, and MB/s of building, pulling, and saving
+# each image, and of compressing the bundle, is written to it. With PROMETHEUS_FILE set, the same metrics
+# are written as a Prometheus textfile.
+# A save-images.sh created with "--shard K/N" holds only shard K of N of the images, and its output names
+# end in "-shard-K-of-N". Combine the bundles of all shards with "docker-compose-air-gapper.py merge-bundles".
+
+set -o pipefail
 
 # Enumerate docker images to be processed.
 
@@ -11,69 +36,1031 @@ DOCKER_IMAGE_NAMES=(
   "senzing/xterm:1.4.3"
 )
 
+# Enumerate tags of docker images given by digest, so they are saved and loaded with their tags. Usually empty.
+
+declare -A DOCKER_IMAGE_TAGS=(
+)
+
+# Enumerate images to build, after the built images they depend on, with their "docker build" arguments. Usually empty.
+
+DOCKER_BUILD_IMAGES=(
+)
+declare -A DOCKER_BUILD_ARGUMENTS=(
+)
+declare -A DOCKER_BUILD_DEPENDENCIES=(
+)
+
+# Enumerate blobs delivered by previous bundles.
+
+PREVIOUS_BUNDLE_MANIFEST=(
+)
+
+# Choose compression. An empty COMPRESSION_LEVEL uses the default level of the compression program.
+
+COMPRESSION=${COMPRESSION:-gzip}
+COMPRESSION_LEVEL=${COMPRESSION_LEVEL:-}
+case ${COMPRESSION} in
+  gzip)
+    COMPRESS_COMMAND="gzip -${COMPRESSION_LEVEL:-6}"
+    if command -v pigz > /dev/null; then
+      COMPRESS_COMMAND="pigz -${COMPRESSION_LEVEL:-6}"
+    fi
+    OUTPUT_FILE_EXTENSION=tgz
+    ;;
+  zstd)
+    COMPRESS_COMMAND="zstd --quiet --threads=0 --ultra -${COMPRESSION_LEVEL:-3}"
+    OUTPUT_FILE_EXTENSION=tar.zst
+    ;;
+  none)
+    COMPRESS_COMMAND="cat"
+    OUTPUT_FILE_EXTENSION=tar
+    ;;
+  *)
+    echo "Error: COMPRESSION must be gzip, zstd, or none. Current value: ${COMPRESSION}"
+    exit 1
+    ;;
+esac
+
 # Make output variables.
 
-MY_HOME=~
+MY_HOME=${MY_HOME:-~}
 OUTPUT_DATE=$(date +%s)
+RESUME_DIR=${RESUME_DIR:-}
+if [ -n "${RESUME_DIR}" ]; then
+  if [ ! -f ${RESUME_DIR}/journal.txt ]; then
+    echo "Error: RESUME_DIR is not a save-images.sh output directory. Current value: ${RESUME_DIR}"
+    exit 1
+  fi
+  RESUME_DIR=$(cd ${RESUME_DIR} && pwd)
+  MY_HOME=$(dirname ${RESUME_DIR})
+  OUTPUT_DATE=$(basename ${RESUME_DIR} | sed "s/^docker-compose-air-gapper-//")
+fi
 OUTPUT_DATE_HUMAN=$(date --rfc-3339=seconds)
-OUTPUT_FILE=${MY_HOME}/docker-compose-air-gapper-${OUTPUT_DATE}.tgz
+OUTPUT_FILE=${OUTPUT_FILE:-${MY_HOME}/docker-compose-air-gapper-${OUTPUT_DATE}.${OUTPUT_FILE_EXTENSION}}
 OUTPUT_DIR_NAME=docker-compose-air-gapper-${OUTPUT_DATE}
 OUTPUT_DIR=${MY_HOME}/${OUTPUT_DIR_NAME}
-OUTPUT_IMAGES_DIR=${OUTPUT_DIR}/images
+OUTPUT_BLOBS_DIR=${OUTPUT_DIR}/blobs
+OUTPUT_MANIFESTS_DIR=${OUTPUT_DIR}/manifests
+OUTPUT_STAGING_DIR=${OUTPUT_DIR}/staging
+OUTPUT_IMAGES_FILE=${OUTPUT_DIR}/images.txt
+OUTPUT_PLATFORMS_FILE=${OUTPUT_DIR}/platforms.txt
+OUTPUT_DOCKER_COMPOSE_FILES_FILE=${OUTPUT_DIR}/docker-compose-files.txt
+OUTPUT_BUNDLE_MANIFEST_FILE=${OUTPUT_DIR}/bundle-manifest.txt
+OUTPUT_JOURNAL_FILE=${OUTPUT_DIR}/journal.txt
+OUTPUT_CHECKSUMS_FILE=${OUTPUT_DIR}/blobs.sha256
 OUTPUT_LOAD_REPOSITORY_SCRIPT=${OUTPUT_DIR}/load-images.sh
+OUTPUT_VOLUME_CHECKSUMS_FILE=${OUTPUT_FILE}.sha256
+OUTPUT_VERIFY_VOLUMES_SCRIPT=${OUTPUT_FILE}.verify.sh
+
+# Make processing variables.
+
+CONCURRENCY=${CONCURRENCY:-4}
+STREAM=${STREAM:-false}
+if [ "${STREAM}" == "true" ] && [ -n "${RESUME_DIR}" ]; then
+  echo "Error: RESUME_DIR cannot be used with STREAM=true."
+  exit 1
+fi
+PLATFORMS=${PLATFORMS:-}
+PLATFORM_LIST=(${PLATFORMS//,/ })
+if [ ${#PLATFORM_LIST[@]} -eq 0 ]; then
+  PLATFORM_LIST=("")
+fi
+if [ "${STREAM}" == "true" ] && [ ${#PLATFORM_LIST[@]} -gt 1 ]; then
+  echo "Error: STREAM=true can be used with only one platform. Current value of PLATFORMS: ${PLATFORMS}"
+  exit 1
+fi
+VOLUME_SIZE_IN_MEGABYTES=${VOLUME_SIZE_IN_MEGABYTES:-0}
+METRICS_FILE=${METRICS_FILE:-}
+PROMETHEUS_FILE=${PROMETHEUS_FILE:-}
+declare -A PREVIOUS_BLOBS
+for BLOB in ${PREVIOUS_BUNDLE_MANIFEST[@]};
+do
+  PREVIOUS_BLOBS[${BLOB}]=1
+done
+
+# Files in a "docker save" tar that describe the image rather than hold its content.
+
+METADATA_FILES=(
+  "index.json"
+  "manifest.json"
+  "oci-layout"
+  "repositories"
+)
 
 # Make output directories.
 
-mkdir ${OUTPUT_DIR}
-mkdir ${OUTPUT_IMAGES_DIR}
+mkdir -p ${OUTPUT_DIR}
+mkdir -p ${OUTPUT_BLOBS_DIR}
+mkdir -p ${OUTPUT_MANIFESTS_DIR}
+rm -rf ${OUTPUT_STAGING_DIR}
+mkdir ${OUTPUT_STAGING_DIR}
+: > ${OUTPUT_IMAGES_FILE}
+touch ${OUTPUT_JOURNAL_FILE}
+touch ${OUTPUT_CHECKSUMS_FILE}
+if [ -n "${PLATFORMS}" ]; then
+  printf "%s
+" ${PLATFORM_LIST[@]} > ${OUTPUT_PLATFORMS_FILE}
+fi
 
 # Define return codes.
 
 OK=0
 NOT_OK=1
 
-# Create preamble to OUTPUT_LOAD_REPOSITORY_SCRIPT.
+# Record metrics in METRICS_DIR. Each stage of an image adds "STAGE MILLISECONDS BYTES" to METRICS_DIR/IMAGE_ID.metrics
+# and each stage of the whole run adds the same to METRICS_DIR/run.metrics.
+# METRICS_DIR/images.txt lists "IMAGE_ID RESULT DOCKER_IMAGE_NAME [PLATFORM]" for each image.
+
+now_milliseconds() {
+  date +%s%3N
+}
+
+record_metric() {
+  local NAME=$1
+  local STAGE=$2
+  local START_MILLISECONDS=$3
+  local BYTES=$4
+  echo "${STAGE} $(( $(now_milliseconds) - START_MILLISECONDS )) ${BYTES:-0}" >> ${METRICS_DIR}/${NAME}.metrics
+}
+
+# Write the metrics in METRICS_DIR as a JSON report to METRICS_FILE, and as a Prometheus textfile to PROMETHEUS_FILE.
+# The Prometheus textfile is renamed into place, so a collector never reads part of it.
+
+write_metrics() {
+  local COMMAND=$1
+  local START_MILLISECONDS=$2
+  if [ -z "${METRICS_FILE}" ] && [ -z "${PROMETHEUS_FILE}" ]; then
+    return ${OK}
+  fi
+  touch ${METRICS_DIR}/images.txt
+  awk \
+    -v command=${COMMAND} \
+    -v created_on=$(date -u +%Y-%m-%dT%H:%M:%SZ) \
+    -v duration=$(( $(now_milliseconds) - START_MILLISECONDS )) \
+    -v metrics_dir=${METRICS_DIR} \
+    -v prometheus_file=${PROMETHEUS_FILE:+${PROMETHEUS_FILE}.$$} \
+    '
+    function stages(metrics_file, labels,    line, fields, result, separator) {
+      while ((getline line < metrics_file) > 0) {
+        split(line, fields, " ")
+        result = result separator sprintf("\"%s\": {\"bytes\": %d, \"duration_seconds\": %.3f, \"megabytes_per_second\": %.2f}", fields[1], fields[3], fields[2] / 1000, fields[2] > 0 ? fields[3] / 1048576 / (fields[2] / 1000) : 0)
+        separator = ", "
+        durations = durations sprintf("docker_compose_air_gapper_stage_duration_seconds{%sstage=\"%s\"} %.3f\n", labels, fields[1], fields[2] / 1000)
+        sizes = sizes sprintf("docker_compose_air_gapper_stage_bytes{%sstage=\"%s\"} %d\n", labels, fields[1], fields[3])
+      }
+      close(metrics_file)
+      return result
+    }
+    BEGIN {
+      printf "{\n    \"command\": \"%s\",\n    \"created_on\": \"%s\",\n    \"duration_seconds\": %.3f,\n    \"images\": [", command, created_on, duration / 1000
+    }
+    {
+      labels = sprintf("command=\"%s\",image=\"%s\",platform=\"%s\",", command, $3, $4)
+      printf "%s\n        {\"image\": \"%s\", \"image_id\": \"%s\", \"platform\": \"%s\", \"result\": \"%s\", \"stages\": {%s}}", separator, $3, $1, $4, $2, stages(metrics_dir "/" $1 ".metrics", labels)
+      separator = ","
+      results[$2]++
+    }
+    END {
+      printf "\n    ],\n    \"stages\": {%s}\n}\n", stages(metrics_dir "/run.metrics", sprintf("command=\"%s\",", command))
+      if (prometheus_file != "") {
+        print "# HELP docker_compose_air_gapper_stage_duration_seconds Duration of a stage of an image or of the whole run." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_stage_duration_seconds gauge" > prometheus_file
+        printf "%s", durations > prometheus_file
+        print "# HELP docker_compose_air_gapper_stage_bytes Bytes handled by a stage of an image or of the whole run." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_stage_bytes gauge" > prometheus_file
+        printf "%s", sizes > prometheus_file
+        print "# HELP docker_compose_air_gapper_images Images by result." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_images gauge" > prometheus_file
+        for (result in results) {
+          printf "docker_compose_air_gapper_images{command=\"%s\",result=\"%s\"} %d\n", command, result, results[result] > prometheus_file
+        }
+        print "# HELP docker_compose_air_gapper_run_duration_seconds Duration of the whole run." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_run_duration_seconds gauge" > prometheus_file
+        printf "docker_compose_air_gapper_run_duration_seconds{command=\"%s\"} %.3f\n", command, duration / 1000 > prometheus_file
+      }
+    }
+    ' ${METRICS_DIR}/images.txt > ${METRICS_FILE:-/dev/null}
+  if [ -n "${PROMETHEUS_FILE}" ]; then
+    mv ${PROMETHEUS_FILE}.$$ ${PROMETHEUS_FILE}
+  fi
+}
+
+METRICS_DIR=$(mktemp -d)
+trap "rm -rf ${METRICS_DIR}" EXIT
+RUN_START_MILLISECONDS=$(now_milliseconds)
+
+# Create OUTPUT_LOAD_REPOSITORY_SCRIPT.
 
 cat <<EOT > ${OUTPUT_LOAD_REPOSITORY_SCRIPT}
 #!/usr/bin/env bash
 
 # 'load-images.sh' uses 'docker load' to import images into local registry.
 # Created on ${OUTPUT_DATE_HUMAN}
+EOT
+
+cat <<'EOT_LOAD_IMAGES' >> ${OUTPUT_LOAD_REPOSITORY_SCRIPT}
+
+# Images are rebuilt from the layer-deduplicated bundle:
+#  - images.txt lists "IMAGE_ID DOCKER_IMAGE_NAME [PLATFORM]" for each image.
+#  - platforms.txt, if present, lists the platforms the images were saved for.
+#  - manifests/IMAGE_ID holds the "docker save" metadata for the image.
+#  - manifests/IMAGE_ID/blobs.txt lists the files in "blobs" used by the image.
+# Blobs that are not in this bundle are found in previous bundles, which are
+# either given as arguments or extracted next to this bundle.
+# A bundle created with STREAM=true is a "docker save" archive that "docker load"
+# reads directly, so it does not need to be extracted. Its compression is detected automatically.
+# Before any image is loaded, the blobs in this bundle are checked against blobs.sha256,
+# using up to CONCURRENCY "sha256sum" processes. Set VERIFY=false to skip the check.
+# Then up to CONCURRENCY images are loaded at the same time. An image whose image ID
+# is already in docker is only tagged. A summary shows how long each image took.
+# With METRICS_FILE set, a JSON report of the duration, bytes, and MB/s of loading each image,
+# and of verifying the blobs, is written to it. With PROMETHEUS_FILE set, the same metrics
+# are written as a Prometheus textfile.
+#
+# Usage: load-images.sh [PREVIOUS_BUNDLE_DIR ...]
+#        load-images.sh docker-compose-air-gapper-0000000000.tgz
+
+set -o pipefail
+
+# Make input variables.
+
+INPUT_DIR=$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)
+INPUT_BLOBS_DIR=${INPUT_DIR}/blobs
+INPUT_MANIFESTS_DIR=${INPUT_DIR}/manifests
+INPUT_IMAGES_FILE=${INPUT_DIR}/images.txt
+INPUT_PLATFORMS_FILE=${INPUT_DIR}/platforms.txt
+INPUT_CHECKSUMS_FILE=${INPUT_DIR}/blobs.sha256
+
+# Make processing variables.
+
+CONCURRENCY=${CONCURRENCY:-4}
+VERIFY=${VERIFY:-true}
+METRICS_FILE=${METRICS_FILE:-}
+PROMETHEUS_FILE=${PROMETHEUS_FILE:-}
+
+# Define return codes.
+
+OK=0
+NOT_OK=1
+
+# Record metrics in METRICS_DIR. Each stage of an image adds "STAGE MILLISECONDS BYTES" to METRICS_DIR/IMAGE_ID.metrics
+# and each stage of the whole run adds the same to METRICS_DIR/run.metrics.
+# METRICS_DIR/images.txt lists "IMAGE_ID RESULT DOCKER_IMAGE_NAME [PLATFORM]" for each image.
+
+now_milliseconds() {
+  date +%s%3N
+}
+
+record_metric() {
+  local NAME=$1
+  local STAGE=$2
+  local START_MILLISECONDS=$3
+  local BYTES=$4
+  echo "${STAGE} $(( $(now_milliseconds) - START_MILLISECONDS )) ${BYTES:-0}" >> ${METRICS_DIR}/${NAME}.metrics
+}
+
+# Write the metrics in METRICS_DIR as a JSON report to METRICS_FILE, and as a Prometheus textfile to PROMETHEUS_FILE.
+# The Prometheus textfile is renamed into place, so a collector never reads part of it.
+
+write_metrics() {
+  local COMMAND=$1
+  local START_MILLISECONDS=$2
+  if [ -z "${METRICS_FILE}" ] && [ -z "${PROMETHEUS_FILE}" ]; then
+    return ${OK}
+  fi
+  touch ${METRICS_DIR}/images.txt
+  awk \
+    -v command=${COMMAND} \
+    -v created_on=$(date -u +%Y-%m-%dT%H:%M:%SZ) \
+    -v duration=$(( $(now_milliseconds) - START_MILLISECONDS )) \
+    -v metrics_dir=${METRICS_DIR} \
+    -v prometheus_file=${PROMETHEUS_FILE:+${PROMETHEUS_FILE}.$$} \
+    '
+    function stages(metrics_file, labels,    line, fields, result, separator) {
+      while ((getline line < metrics_file) > 0) {
+        split(line, fields, " ")
+        result = result separator sprintf("\"%s\": {\"bytes\": %d, \"duration_seconds\": %.3f, \"megabytes_per_second\": %.2f}", fields[1], fields[3], fields[2] / 1000, fields[2] > 0 ? fields[3] / 1048576 / (fields[2] / 1000) : 0)
+        separator = ", "
+        durations = durations sprintf("docker_compose_air_gapper_stage_duration_seconds{%sstage=\"%s\"} %.3f\n", labels, fields[1], fields[2] / 1000)
+        sizes = sizes sprintf("docker_compose_air_gapper_stage_bytes{%sstage=\"%s\"} %d\n", labels, fields[1], fields[3])
+      }
+      close(metrics_file)
+      return result
+    }
+    BEGIN {
+      printf "{\n    \"command\": \"%s\",\n    \"created_on\": \"%s\",\n    \"duration_seconds\": %.3f,\n    \"images\": [", command, created_on, duration / 1000
+    }
+    {
+      labels = sprintf("command=\"%s\",image=\"%s\",platform=\"%s\",", command, $3, $4)
+      printf "%s\n        {\"image\": \"%s\", \"image_id\": \"%s\", \"platform\": \"%s\", \"result\": \"%s\", \"stages\": {%s}}", separator, $3, $1, $4, $2, stages(metrics_dir "/" $1 ".metrics", labels)
+      separator = ","
+      results[$2]++
+    }
+    END {
+      printf "\n    ],\n    \"stages\": {%s}\n}\n", stages(metrics_dir "/run.metrics", sprintf("command=\"%s\",", command))
+      if (prometheus_file != "") {
+        print "# HELP docker_compose_air_gapper_stage_duration_seconds Duration of a stage of an image or of the whole run." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_stage_duration_seconds gauge" > prometheus_file
+        printf "%s", durations > prometheus_file
+        print "# HELP docker_compose_air_gapper_stage_bytes Bytes handled by a stage of an image or of the whole run." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_stage_bytes gauge" > prometheus_file
+        printf "%s", sizes > prometheus_file
+        print "# HELP docker_compose_air_gapper_images Images by result." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_images gauge" > prometheus_file
+        for (result in results) {
+          printf "docker_compose_air_gapper_images{command=\"%s\",result=\"%s\"} %d\n", command, result, results[result] > prometheus_file
+        }
+        print "# HELP docker_compose_air_gapper_run_duration_seconds Duration of the whole run." > prometheus_file
+        print "# TYPE docker_compose_air_gapper_run_duration_seconds gauge" > prometheus_file
+        printf "docker_compose_air_gapper_run_duration_seconds{command=\"%s\"} %.3f\n", command, duration / 1000 > prometheus_file
+      }
+    }
+    ' ${METRICS_DIR}/images.txt > ${METRICS_FILE:-/dev/null}
+  if [ -n "${PROMETHEUS_FILE}" ]; then
+    mv ${PROMETHEUS_FILE}.$$ ${PROMETHEUS_FILE}
+  fi
+}
+
+# Identify the platform of the docker daemon as "os/arch[/variant]". Set PLATFORM to override.
+
+PLATFORM=${PLATFORM:-$(docker version --format "{{.Server.Os}}/{{.Server.Arch}}" 2>/dev/null)}
+
+# Succeed if an image saved for a platform runs on PLATFORM. Variants are not compared.
+
+platform_matches() {
+  local IMAGE_PLATFORM=$1
+  [ -z "${IMAGE_PLATFORM}" ] || [ -z "${PLATFORM}" ] || [ "$(echo ${IMAGE_PLATFORM} | cut -d / -f 1-2)" == "$(echo ${PLATFORM} | cut -d / -f 1-2)" ]
+}
+
+# Refuse a bundle saved for other platforms before loading anything.
+
+if [ -f ${INPUT_PLATFORMS_FILE} ]; then
+  PLATFORM_FOUND=false
+  for IMAGE_PLATFORM in $(cat ${INPUT_PLATFORMS_FILE});
+  do
+    if platform_matches ${IMAGE_PLATFORM}; then
+      PLATFORM_FOUND=true
+    fi
+  done
+  if [ ${PLATFORM_FOUND} = false ]; then
+    echo "Error: Images in this bundle are for $(paste -s -d " " ${INPUT_PLATFORMS_FILE}), but docker runs on ${PLATFORM}."
+    exit ${NOT_OK}
+  fi
+fi
+
+# Identify the program that decompresses a file, by its "magic number".
+
+decompress_command() {
+  case $(head -c 4 $1 | od -An -tx1 | tr -d " 
+") in
+    1f8b*)
+      if command -v pigz > /dev/null; then
+        echo "pigz --decompress --stdout"
+      else
+        echo "gzip --decompress --stdout"
+      fi
+      ;;
+    28b52ffd)
+      echo "zstd --decompress --stdout --quiet"
+      ;;
+    *)
+      echo "cat"
+      ;;
+  esac
+}
+
+# Load a bundle created with STREAM=true.
+
+if [ -f "$1" ]; then
+  echo "Loading images from $1"
+  $(decompress_command $1) < $1 | docker load
+  exit $?
+fi
+
+if [ ! -d ${INPUT_MANIFESTS_DIR} ] && [ -f ${INPUT_DIR}/manifest.json ]; then
+  echo "Loading images from ${INPUT_DIR}"
+  tar --create --file - --directory ${INPUT_DIR} $(ls ${INPUT_DIR} | grep -v -e "^load-images.sh$" -e "^images.txt$" -e "^docker-compose-files.txt$" -e "^platforms.txt$") | docker load
+  exit $?
+fi
+
+# Enumerate directories holding blobs. This bundle's blobs are used first.
+
+BLOB_DIRS=(${INPUT_BLOBS_DIR})
+for PREVIOUS_BUNDLE_DIR in "$@" ${INPUT_DIR}/../docker-compose-air-gapper-*/;
+do
+  PREVIOUS_BUNDLE_DIR=$(cd ${PREVIOUS_BUNDLE_DIR} 2>/dev/null && pwd)
+  if [ -d "${PREVIOUS_BUNDLE_DIR}/blobs" ] && [ "${PREVIOUS_BUNDLE_DIR}" != "${INPUT_DIR}" ]; then
+    BLOB_DIRS+=(${PREVIOUS_BUNDLE_DIR}/blobs)
+  fi
+done
+
+# Stream a "docker save" tar of a single image into "docker load".
+# Each blob is taken from the first directory in BLOB_DIRS that has it.
+# The "load" metric counts the bytes of the blobs.
+
+load_image() {
+  local IMAGE_ID=$1
+  local IMAGE_MANIFEST_DIR=${INPUT_MANIFESTS_DIR}/${IMAGE_ID}
+  local METADATA_FILES=$(cd ${IMAGE_MANIFEST_DIR} && ls | grep -v "^blobs.txt$")
+  local BLOB_LISTS_DIR=$(mktemp -d)
+  local TAR_ARGUMENTS=(--directory ${IMAGE_MANIFEST_DIR} ${METADATA_FILES})
+  local START_MILLISECONDS=$(now_milliseconds)
+  local LOAD_BYTES=0
+  local BLOB BLOB_DIR_INDEX FOUND RETURN_CODE
+
+  while read BLOB;
+  do
+    FOUND=false
+    for BLOB_DIR_INDEX in ${!BLOB_DIRS[@]};
+    do
+      if [ -e ${BLOB_DIRS[${BLOB_DIR_INDEX}]}/${BLOB} ]; then
+        echo ${BLOB} >> ${BLOB_LISTS_DIR}/${BLOB_DIR_INDEX}
+        FOUND=true
+        break
+      fi
+    done
+    if [ ${FOUND} = false ]; then
+      echo "Error: ${BLOB} is not in this bundle or a previous bundle."
+      rm -rf ${BLOB_LISTS_DIR}
+      return ${NOT_OK}
+    fi
+  done < ${IMAGE_MANIFEST_DIR}/blobs.txt
+
+  for BLOB_DIR_INDEX in ${!BLOB_DIRS[@]};
+  do
+    if [ -f ${BLOB_LISTS_DIR}/${BLOB_DIR_INDEX} ]; then
+      TAR_ARGUMENTS+=(--directory ${BLOB_DIRS[${BLOB_DIR_INDEX}]} --files-from ${BLOB_LISTS_DIR}/${BLOB_DIR_INDEX})
+      LOAD_BYTES=$(( LOAD_BYTES + $(cd ${BLOB_DIRS[${BLOB_DIR_INDEX}]} && xargs -r stat --dereference --format %s < ${BLOB_LISTS_DIR}/${BLOB_DIR_INDEX} | awk '{total += $1} END {print total + 0}') ))
+    fi
+  done
+
+  tar --create --file - --no-recursion "${TAR_ARGUMENTS[@]}" | docker load
+  RETURN_CODE=$?
+  if [ ${RETURN_CODE} -eq ${OK} ]; then
+    record_metric ${IMAGE_ID} load ${START_MILLISECONDS} ${LOAD_BYTES}
+  fi
+  rm -rf ${BLOB_LISTS_DIR}
+  return ${RETURN_CODE}
+}
+
+# Check the blobs in this bundle against the checksums recorded when they were saved,
+# in CONCURRENCY parts at the same time. Nothing is loaded if a blob is damaged or missing.
+
+RESULTS_DIR=$(mktemp -d)
+trap "rm -rf ${RESULTS_DIR}" EXIT
+METRICS_DIR=${RESULTS_DIR}
+RUN_START_MILLISECONDS=$(now_milliseconds)
+
+if [ "${VERIFY}" == "true" ] && [ -s ${INPUT_CHECKSUMS_FILE} ]; then
+  echo "Verifying $(wc -l < ${INPUT_CHECKSUMS_FILE}) blobs in ${INPUT_BLOBS_DIR}"
+  split --number=l/${CONCURRENCY} --numeric-suffixes ${INPUT_CHECKSUMS_FILE} ${RESULTS_DIR}/checksums.
+  for CHECKSUMS_PART in ${RESULTS_DIR}/checksums.*;
+  do
+    (cd ${INPUT_BLOBS_DIR} && sha256sum --check --quiet ${CHECKSUMS_PART} 2>/dev/null | sed "s/: .*//" > ${CHECKSUMS_PART}.failed) &
+  done
+  wait
+  BAD_BLOBS=($(cat ${RESULTS_DIR}/checksums.*.failed))
+  if [ ${#BAD_BLOBS[@]} -gt 0 ]; then
+    for BAD_BLOB in ${BAD_BLOBS[@]};
+    do
+      echo "Error: ${BAD_BLOB} is damaged or missing. Used by: $(grep -l -x ${BAD_BLOB} ${INPUT_MANIFESTS_DIR}/*/blobs.txt | xargs -r -n 1 dirname | xargs -r -n 1 basename | paste -s -d " ")"
+    done
+    echo "Error: ${#BAD_BLOBS[@]} blobs do not match blobs.sha256. No images were loaded."
+    exit ${NOT_OK}
+  fi
+  record_metric run verify ${RUN_START_MILLISECONDS} $(du --bytes --summarize --dereference ${INPUT_BLOBS_DIR} | cut -f 1)
+fi
+
+# Print the IDs an image may have in docker: the digest of its config
+# (docker's classic image store) and the digests in its index.json (containerd image store).
+
+image_digests() {
+  local IMAGE_MANIFEST_DIR=$1
+  grep -o '"Config": *"[^"]*"' ${IMAGE_MANIFEST_DIR}/manifest.json | sed 's|.*/||; s|"||g; s|^|sha256:|'
+  grep -o '"digest": *"sha256:[0-9a-f]*"' ${IMAGE_MANIFEST_DIR}/index.json 2>/dev/null | sed 's|.*: *||; s|"||g'
+}
+
+# Print the tags of an image, from the "RepoTags" of its manifest.json.
+
+image_tags() {
+  local IMAGE_MANIFEST_DIR=$1
+  grep -o '"RepoTags": *\[[^]]*\]' ${IMAGE_MANIFEST_DIR}/manifest.json | grep -o '"[^"]*"' | tail -n +2 | tr -d '"'
+}
+
+# Load a single image, unless docker already has it, in which case only tag it.
+# The result and elapsed milliseconds are kept in "RESULTS_DIR/IMAGE_ID.result".
+
+process_image() {
+  local IMAGE_ID=$1
+  local DOCKER_IMAGE_NAME=$2
+  local IMAGE_PLATFORM=$3
+  local IMAGE_MANIFEST_DIR=${INPUT_MANIFESTS_DIR}/${IMAGE_ID}
+  local START_TIME=$(date +%s%N)
+  local RESULT=failed
+  local DIGEST TAG
+
+  for DIGEST in $(image_digests ${IMAGE_MANIFEST_DIR});
+  do
+    if docker image inspect --format "{{.Id}}" ${DIGEST} > /dev/null 2>&1; then
+      RESULT=present
+      for TAG in $(image_tags ${IMAGE_MANIFEST_DIR});
+      do
+        docker tag ${DIGEST} ${TAG} || RESULT=failed
+      done
+      echo "Skipping ${DOCKER_IMAGE_NAME} ${IMAGE_PLATFORM}. Already in docker as ${DIGEST}"
+      break
+    fi
+  done
+
+  if [ ${RESULT} == failed ]; then
+    echo "Loading ${DOCKER_IMAGE_NAME} ${IMAGE_PLATFORM}"
+    if load_image ${IMAGE_ID}; then
+      RESULT=loaded
+    else
+      echo "Error: Could not load ${DOCKER_IMAGE_NAME}"
+    fi
+  fi
+  echo "${RESULT} $(( ($(date +%s%N) - START_TIME) / 1000000 ))" > ${RESULTS_DIR}/${IMAGE_ID}.result
+}
 
+# Load images, running at most CONCURRENCY "process_image" jobs at a time.
+
+LOAD_START_TIME=$(date +%s%N)
+while read IMAGE_ID DOCKER_IMAGE_NAME IMAGE_PLATFORM;
+do
+  if ! platform_matches "${IMAGE_PLATFORM}"; then
+    echo "Skipping ${DOCKER_IMAGE_NAME} for ${IMAGE_PLATFORM}"
+    echo "other-platform 0" > ${RESULTS_DIR}/${IMAGE_ID}.result
+    continue
+  fi
+  while [ $(jobs -r -p | wc -l) -ge ${CONCURRENCY} ];
+  do
+    wait -n
+  done
+  process_image ${IMAGE_ID} ${DOCKER_IMAGE_NAME} ${IMAGE_PLATFORM} &
+done < ${INPUT_IMAGES_FILE}
+wait
+
+# Summarize, in images.txt order. The result of each image is recorded for METRICS_FILE.
+
+RETURN_CODE=${OK}
+echo ""
+printf "%-16s %10s  %s
+" "RESULT" "SECONDS" "IMAGE"
+while read IMAGE_ID DOCKER_IMAGE_NAME IMAGE_PLATFORM;
+do
+  read RESULT MILLISECONDS 2>/dev/null < ${RESULTS_DIR}/${IMAGE_ID}.result
+  if [ "${RESULT:-failed}" == failed ]; then
+    RETURN_CODE=${NOT_OK}
+  fi
+  printf "%-16s %6d.%03d  %s
+" "${RESULT:-failed}" $(( ${MILLISECONDS:-0} / 1000 )) $(( ${MILLISECONDS:-0} % 1000 )) "${DOCKER_IMAGE_NAME} ${IMAGE_PLATFORM}"
+  echo "${IMAGE_ID} ${RESULT:-failed} ${DOCKER_IMAGE_NAME}${IMAGE_PLATFORM:+ ${IMAGE_PLATFORM}}" >> ${METRICS_DIR}/images.txt
+  RESULT=""
+  MILLISECONDS=""
+done < ${INPUT_IMAGES_FILE}
+LOAD_MILLISECONDS=$(( ($(date +%s%N) - LOAD_START_TIME) / 1000000 ))
+printf "%-16s %6d.%03d
+" "total" $(( LOAD_MILLISECONDS / 1000 )) $(( LOAD_MILLISECONDS % 1000 ))
+write_metrics load-images.sh ${RUN_START_MILLISECONDS}
+
+exit ${RETURN_CODE}
+EOT_LOAD_IMAGES
+
+# Record which docker-compose files use each image, so the air-gapped system knows what each stack needs.
+
+cat <<'EOT' > ${OUTPUT_DOCKER_COMPOSE_FILES_FILE}
+senzing/senzing-console:1.2.2 docker-compose.yaml
+senzing/xterm:1.4.3 docker-compose.yaml
 EOT
 
 chmod +x ${OUTPUT_LOAD_REPOSITORY_SCRIPT}
 
-# Save Docker images and scripts to output directory.
+# Write compressed output from STDIN to OUTPUT_FILE.
+# With VOLUME_SIZE_IN_MEGABYTES, write numbered volumes instead, record their checksums, and create OUTPUT_VERIFY_VOLUMES_SCRIPT.
 
-for DOCKER_IMAGE_NAME in ${DOCKER_IMAGE_NAMES[@]};
+write_output() {
+  local OUTPUT_FILE_NAME=$(basename ${OUTPUT_FILE})
+  if [ "${VOLUME_SIZE_IN_MEGABYTES:-0}" -eq 0 ]; then
+    cat > ${OUTPUT_FILE}
+    return
+  fi
+  rm -f ${OUTPUT_FILE}.[0-9][0-9][0-9][0-9]
+  if ! split --bytes=${VOLUME_SIZE_IN_MEGABYTES}M --numeric-suffixes --suffix-length=4 - ${OUTPUT_FILE}.; then
+    echo "Error: Could not write ${OUTPUT_FILE} as volumes of ${VOLUME_SIZE_IN_MEGABYTES} MB. There can be at most 10000 volumes."
+    return ${NOT_OK}
+  fi
+  (cd $(dirname ${OUTPUT_FILE}) && ls ${OUTPUT_FILE_NAME}.[0-9][0-9][0-9][0-9] | xargs -P ${CONCURRENCY} -n 1 sha256sum | sort -k 2) > ${OUTPUT_VOLUME_CHECKSUMS_FILE} || return ${NOT_OK}
+  cat <<'EOT_VERIFY_VOLUMES' > ${OUTPUT_VERIFY_VOLUMES_SCRIPT}
+#!/usr/bin/env bash
+
+# 'NAME.verify.sh' checks the volumes of a bundle, NAME.0000, NAME.0001, ...,
+# against the checksums in NAME.sha256 that were recorded when the volumes were written.
+# Up to CONCURRENCY volumes are checked at the same time. Default: the number of CPUs.
+# Volumes that are missing or damaged are listed, so that only they need to be sent again.
+# When every volume is good and OUTPUT_DIRECTORY is given, the volumes are joined and extracted into it.
+# To load a bundle created with STREAM=true, join the volumes with "cat NAME.[0-9][0-9][0-9][0-9] > NAME" instead.
+#
+# Usage: NAME.verify.sh [OUTPUT_DIRECTORY]
+
+set -o pipefail
+
+# Make input variables.
+
+INPUT_FILE=${0%.verify.sh}
+INPUT_DIR=$(cd "$(dirname "${INPUT_FILE}")" && pwd)
+INPUT_CHECKSUMS_FILE=${INPUT_DIR}/$(basename ${INPUT_FILE}).sha256
+OUTPUT_DIRECTORY=${1:+$(mkdir -p $1 && cd $1 && pwd)}
+CONCURRENCY=${CONCURRENCY:-$(nproc)}
+RESULTS_DIR=$(mktemp -d)
+
+# Define return codes.
+
+OK=0
+NOT_OK=1
+
+# Check each volume, running at most CONCURRENCY checks at a time.
+# The return code of each check is kept in "RESULTS_DIR/VOLUME.rc".
+
+VOLUMES=($(awk '{print $2}' ${INPUT_CHECKSUMS_FILE}))
+echo "Verifying ${#VOLUMES[@]} volumes in ${INPUT_DIR}"
+cd ${INPUT_DIR}
+for VOLUME in ${VOLUMES[@]};
+do
+  while [ $(jobs -r -p | wc -l) -ge ${CONCURRENCY} ];
+  do
+    wait -n
+  done
+  (awk -v volume=${VOLUME} '$2 == volume' ${INPUT_CHECKSUMS_FILE} | sha256sum --check --quiet --status 2>/dev/null; echo $? > ${RESULTS_DIR}/${VOLUME}.rc) &
+done
+wait
+
+# Report volumes to send again.
+
+BAD_VOLUMES=()
+for VOLUME in ${VOLUMES[@]};
 do
+  if [ ! -f ${VOLUME} ]; then
+    BAD_VOLUMES+=(${VOLUME})
+    echo "Missing: ${VOLUME}"
+  elif [ "$(cat ${RESULTS_DIR}/${VOLUME}.rc)" != "${OK}" ]; then
+    BAD_VOLUMES+=(${VOLUME})
+    echo "Damaged: ${VOLUME}"
+  fi
+done
+rm -rf ${RESULTS_DIR}
+
+if [ ${#BAD_VOLUMES[@]} -gt 0 ]; then
+  echo "Error: ${#BAD_VOLUMES[@]} of ${#VOLUMES[@]} volumes must be sent again:"
+  printf "    %s
+" ${BAD_VOLUMES[@]}
+  exit ${NOT_OK}
+fi
+echo "All ${#VOLUMES[@]} volumes are good."
+
+# Identify the program that decompresses the bundle, by the "magic number" of its first volume.
+
+case $(head -c 4 ${VOLUMES[0]} | od -An -tx1 | tr -d " 
+") in
+  1f8b*)
+    DECOMPRESS_COMMAND="gzip --decompress --stdout"
+    if command -v pigz > /dev/null; then
+      DECOMPRESS_COMMAND="pigz --decompress --stdout"
+    fi
+    ;;
+  28b52ffd)
+    DECOMPRESS_COMMAND="zstd --decompress --stdout --quiet"
+    ;;
+  *)
+    DECOMPRESS_COMMAND="cat"
+    ;;
+esac
+
+# Join and extract the volumes.
+
+if [ -n "${OUTPUT_DIRECTORY}" ]; then
+  echo "Extracting into ${OUTPUT_DIRECTORY}"
+  cat ${VOLUMES[@]} | ${DECOMPRESS_COMMAND} | tar --extract --ignore-zeros --file - --directory ${OUTPUT_DIRECTORY} || exit ${NOT_OK}
+fi
+EOT_VERIFY_VOLUMES
+  chmod +x ${OUTPUT_VERIFY_VOLUMES_SCRIPT}
+}
+
+# Name of an image's directory in OUTPUT_MANIFESTS_DIR. An image saved for a platform has the platform appended.
+
+image_id() {
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM=$2
+  echo ${DOCKER_IMAGE_NAME}${PLATFORM:+--${PLATFORM}} | tr "/:@" "---"
+}
+
+# Number of platforms, from the start of PLATFORM_LIST, that an image is saved for.
+# A built image exists only for the platform it was built for, the first in PLATFORM_LIST.
+
+image_platform_count() {
+  local DOCKER_IMAGE_NAME=$1
+  if [ -n "${DOCKER_BUILD_ARGUMENTS[${DOCKER_IMAGE_NAME}]}" ]; then
+    echo 1
+  else
+    echo ${#PLATFORM_LIST[@]}
+  fi
+}
+
+# Pull a single Docker image, for a single platform if one is given.
+# A built image is not pulled. It is ready if its build succeeded.
+
+pull_image() {
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM=$2
+  local START_MILLISECONDS=$(now_milliseconds)
+  local TAG
+  if [ -n "${DOCKER_BUILD_ARGUMENTS[${DOCKER_IMAGE_NAME}]}" ]; then
+    [ "$(cat ${OUTPUT_STAGING_DIR}/$(image_id ${DOCKER_IMAGE_NAME}).build.rc 2>/dev/null)" == "${OK}" ]
+    return $?
+  fi
+  echo "Pulling ${DOCKER_IMAGE_NAME} ${PLATFORM} from DockerHub."
+  docker pull ${PLATFORM:+--platform ${PLATFORM}} ${DOCKER_IMAGE_NAME} || return ${NOT_OK}
+  record_metric $(image_id ${DOCKER_IMAGE_NAME} ${PLATFORM}) pull ${START_MILLISECONDS} $(docker image inspect --format "{{.Size}}" ${DOCKER_IMAGE_NAME} 2>/dev/null)
+  for TAG in ${DOCKER_IMAGE_TAGS[${DOCKER_IMAGE_NAME}]};
+  do
+    docker tag ${DOCKER_IMAGE_NAME} ${TAG} || return ${NOT_OK}
+  done
+}
+
+# Checksum of an image's metadata, including its list of blobs.
+
+image_checksum() {
+  cat $1/* | sha256sum | cut -d " " -f 1
+}
+
+# Succeed if a blob in OUTPUT_BLOBS_DIR matches the checksum recorded in OUTPUT_CHECKSUMS_FILE.
+
+blob_is_valid() {
+  local BLOB=$1
+  local CHECKSUM_LINE=$(awk -v blob=${BLOB} '$2 == blob {print; exit}' ${OUTPUT_CHECKSUMS_FILE})
+  if [ -z "${CHECKSUM_LINE}" ]; then
+    return ${NOT_OK}
+  fi
+  echo "${CHECKSUM_LINE}" | (cd ${OUTPUT_BLOBS_DIR} && sha256sum --check --quiet --status)
+}
+
+# Succeed if OUTPUT_JOURNAL_FILE shows that an image was saved and its metadata and blobs still match their checksums.
+
+image_is_saved() {
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM=$2
+  local IMAGE_ID=$(image_id ${DOCKER_IMAGE_NAME} ${PLATFORM})
+  local IMAGE_MANIFEST_DIR=${OUTPUT_MANIFESTS_DIR}/${IMAGE_ID}
+  local JOURNAL_IMAGE_NAME IMAGE_DIGEST IMAGE_OUTPUT CHECKSUM BLOB
+
+  read JOURNAL_IMAGE_NAME IMAGE_DIGEST IMAGE_OUTPUT CHECKSUM <<< $(awk -v output=manifests/${IMAGE_ID} '$3 == output' ${OUTPUT_JOURNAL_FILE} | tail -1)
+  if [ -z "${CHECKSUM}" ] || [ ! -d ${IMAGE_MANIFEST_DIR} ] || [ "$(image_checksum ${IMAGE_MANIFEST_DIR})" != "${CHECKSUM}" ]; then
+    return ${NOT_OK}
+  fi
+
+  while read BLOB;
+  do
+    if [ -n "${PREVIOUS_BLOBS[${BLOB}]}" ] || [ -L ${OUTPUT_BLOBS_DIR}/${BLOB} ]; then
+      continue
+    fi
+    blob_is_valid ${BLOB} || return ${NOT_OK}
+  done < ${IMAGE_MANIFEST_DIR}/blobs.txt
+}
+
+# Pull and save a single Docker image into OUTPUT_DIR, for a single platform if one is given.
+
+save_image() {
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM=$2
+  local IMAGE_ID=$(image_id ${DOCKER_IMAGE_NAME} ${PLATFORM})
+  local IMAGE_MANIFEST_DIR=${OUTPUT_MANIFESTS_DIR}/${IMAGE_ID}
+  local IMAGE_STAGING_DIR=${OUTPUT_STAGING_DIR}/${IMAGE_ID}
+  local IMAGE_DIGEST START_MILLISECONDS SAVED_BYTES
+
+  # Skip images saved by an earlier run.
+
+  if image_is_saved ${DOCKER_IMAGE_NAME} ${PLATFORM}; then
+    echo "Skipping ${DOCKER_IMAGE_NAME}. Already saved in ${IMAGE_MANIFEST_DIR}"
+    return ${OK}
+  fi
+  rm -rf ${IMAGE_MANIFEST_DIR}
 
   # Pull docker image.
 
-  echo "Pulling ${DOCKER_IMAGE_NAME} from DockerHub."
-  docker pull ${DOCKER_IMAGE_NAME}
+  pull_image ${DOCKER_IMAGE_NAME} ${PLATFORM} || return ${NOT_OK}
+
+  # Do a "docker save" and unpack it into a staging directory.
+
+  mkdir -p ${IMAGE_MANIFEST_DIR} ${IMAGE_STAGING_DIR}
+  echo "Creating ${IMAGE_MANIFEST_DIR}"
+  START_MILLISECONDS=$(now_milliseconds)
+  docker save ${PLATFORM:+--platform ${PLATFORM}} ${DOCKER_IMAGE_TAGS[${DOCKER_IMAGE_NAME}]:-${DOCKER_IMAGE_NAME}} | tar --extract --file - --directory ${IMAGE_STAGING_DIR} || return ${NOT_OK}
+  SAVED_BYTES=$(du --bytes --summarize ${IMAGE_STAGING_DIR} | cut -f 1)
+
+  # Keep the image metadata with the image.
+
+  for METADATA_FILE in ${METADATA_FILES[@]};
+  do
+    if [ -e ${IMAGE_STAGING_DIR}/${METADATA_FILE} ]; then
+      mv ${IMAGE_STAGING_DIR}/${METADATA_FILE} ${IMAGE_MANIFEST_DIR}/${METADATA_FILE}
+    fi
+  done
+
+  # Move layers and configs into OUTPUT_BLOBS_DIR, keeping only the first copy of each.
+  # Blobs from previous bundles are already on the air-gapped system.
+  # The checksum is recorded before the move, so every blob in OUTPUT_BLOBS_DIR has a checksum.
+  # When resuming, a blob left by an earlier run is replaced if it does not match its checksum.
+
+  (cd ${IMAGE_STAGING_DIR} && find . -type f -o -type l | sed "s|^\./||" | sort) > ${IMAGE_MANIFEST_DIR}/blobs.txt
+  while read BLOB;
+  do
+    if [ -n "${PREVIOUS_BLOBS[${BLOB}]}" ]; then
+      continue
+    fi
+    if [ -e ${OUTPUT_BLOBS_DIR}/${BLOB} ]; then
+      if [ -z "${RESUME_DIR}" ] || [ -L ${OUTPUT_BLOBS_DIR}/${BLOB} ] || blob_is_valid ${BLOB}; then
+        continue
+      fi
+    fi
+    if [ ! -L ${IMAGE_STAGING_DIR}/${BLOB} ]; then
+      (cd ${IMAGE_STAGING_DIR} && sha256sum ${BLOB}) >> ${OUTPUT_CHECKSUMS_FILE}
+    fi
+    mkdir -p $(dirname ${OUTPUT_BLOBS_DIR}/${BLOB})
+    mv ${IMAGE_STAGING_DIR}/${BLOB} ${OUTPUT_BLOBS_DIR}/${BLOB}
+  done < ${IMAGE_MANIFEST_DIR}/blobs.txt
+  rm -rf ${IMAGE_STAGING_DIR}
+  record_metric ${IMAGE_ID} save ${START_MILLISECONDS} ${SAVED_BYTES}
+
+  # Record the saved image in OUTPUT_JOURNAL_FILE.
+
+  IMAGE_DIGEST=$(docker image inspect --format "{{.Id}}" ${DOCKER_IMAGE_NAME})
+  echo "${DOCKER_IMAGE_NAME} ${IMAGE_DIGEST:-unknown} manifests/${IMAGE_ID} $(image_checksum ${IMAGE_MANIFEST_DIR})" >> ${OUTPUT_JOURNAL_FILE}
+}
 
-  # Do a "docker save" to make a file from docker image.
+# Pull and save a single Docker image for each of its platforms in PLATFORM_LIST.
+# Platforms are done one after another, because pulling another platform replaces the image in docker's classic image store.
+# With STREAM=true, only pull the image.
 
-  DOCKER_OUTPUT_FILENAME=$(echo ${DOCKER_IMAGE_NAME} | tr "/:" "--")-${OUTPUT_DATE}.tar
-  echo "Creating ${OUTPUT_IMAGES_DIR}/${DOCKER_OUTPUT_FILENAME}"
-  docker save ${DOCKER_IMAGE_NAME} --output ${OUTPUT_IMAGES_DIR}/${DOCKER_OUTPUT_FILENAME}
+process_image() {
+  local DOCKER_IMAGE_NAME=$1
+  local PLATFORM
+  for PLATFORM in "${PLATFORM_LIST[@]:0:$(image_platform_count ${DOCKER_IMAGE_NAME})}";
+  do
+    if [ "${STREAM}" == "true" ]; then
+      pull_image ${DOCKER_IMAGE_NAME} ${PLATFORM} || return ${NOT_OK}
+    else
+      save_image ${DOCKER_IMAGE_NAME} ${PLATFORM} || return ${NOT_OK}
+    fi
+  done
+}
 
-  # Add commands to OUTPUT_LOAD_REPOSITORY_SCRIPT to load file into local repository.
+# Build a single Docker image, for the first platform in PLATFORM_LIST if one is given.
+# docker reuses its build cache, so unchanged layers are not built again.
 
-  echo "docker load --input images/${DOCKER_OUTPUT_FILENAME}" >> ${OUTPUT_LOAD_REPOSITORY_SCRIPT}
+build_image() {
+  local DOCKER_IMAGE_NAME=$1
+  local START_MILLISECONDS=$(now_milliseconds)
+  echo "Building ${DOCKER_IMAGE_NAME}"
+  eval "docker build ${PLATFORM_LIST[0]:+--platform ${PLATFORM_LIST[0]}} ${DOCKER_BUILD_ARGUMENTS[${DOCKER_IMAGE_NAME}]}" || return ${NOT_OK}
+  record_metric $(image_id ${DOCKER_IMAGE_NAME} ${PLATFORM_LIST[0]}) build ${START_MILLISECONDS} $(docker image inspect --format "{{.Size}}" ${DOCKER_IMAGE_NAME} 2>/dev/null)
+}
 
+# Build images, running at most CONCURRENCY "build_image" jobs at a time.
+# An image is started when the images it depends on are built, and skipped if one of them failed.
+# The return code of each build is kept in "OUTPUT_STAGING_DIR/IMAGE_ID.build.rc".
+
+PENDING_BUILDS=(${DOCKER_BUILD_IMAGES[@]})
+while [ ${#PENDING_BUILDS[@]} -gt 0 ];
+do
+  WAITING_BUILDS=()
+  for DOCKER_IMAGE_NAME in ${PENDING_BUILDS[@]};
+  do
+    BUILD_STATE=ready
+    for DEPENDENCY in ${DOCKER_BUILD_DEPENDENCIES[${DOCKER_IMAGE_NAME}]};
+    do
+      case "$(cat ${OUTPUT_STAGING_DIR}/$(image_id ${DEPENDENCY}).build.rc 2>/dev/null)" in
+        ${OK}) ;;
+        "") BUILD_STATE=waiting ;;
+        *) BUILD_STATE=failed; break ;;
+      esac
+    done
+    if [ ${BUILD_STATE} == failed ]; then
+      echo "Error: Not building ${DOCKER_IMAGE_NAME}, because building ${DEPENDENCY} failed."
+      echo ${NOT_OK} > ${OUTPUT_STAGING_DIR}/$(image_id ${DOCKER_IMAGE_NAME}).build.rc
+    elif [ ${BUILD_STATE} == ready ] && [ $(jobs -r -p | wc -l) -lt ${CONCURRENCY} ]; then
+      (build_image ${DOCKER_IMAGE_NAME}; echo $? > ${OUTPUT_STAGING_DIR}/$(image_id ${DOCKER_IMAGE_NAME}).build.rc) &
+    else
+      WAITING_BUILDS+=(${DOCKER_IMAGE_NAME})
+    fi
+  done
+  if [ ${#WAITING_BUILDS[@]} -gt 0 ] && [ ${#WAITING_BUILDS[@]} -eq ${#PENDING_BUILDS[@]} ]; then
+    wait -n
+  fi
+  PENDING_BUILDS=(${WAITING_BUILDS[@]})
+done
+wait
+
+# Process Docker images, running at most CONCURRENCY "process_image" jobs at a time.
+# The return code of each job is kept in "OUTPUT_STAGING_DIR/IMAGE_ID.rc".
+
+for DOCKER_IMAGE_NAME in ${DOCKER_IMAGE_NAMES[@]};
+do
+  while [ $(jobs -r -p | wc -l) -ge ${CONCURRENCY} ];
+  do
+    wait -n
+  done
+  IMAGE_ID=$(image_id ${DOCKER_IMAGE_NAME})
+  (process_image ${DOCKER_IMAGE_NAME}; echo $? > ${OUTPUT_STAGING_DIR}/${IMAGE_ID}.rc) &
 done
+wait
+
+# Add saved images to OUTPUT_IMAGES_FILE, in DOCKER_IMAGE_NAMES order, so that OUTPUT_LOAD_REPOSITORY_SCRIPT will load them.
+# The result of each image is recorded for METRICS_FILE.
+
+RETURN_CODE=${OK}
+for DOCKER_IMAGE_NAME in ${DOCKER_IMAGE_NAMES[@]};
+do
+  IMAGE_ID=$(image_id ${DOCKER_IMAGE_NAME})
+  if [ "$(cat ${OUTPUT_STAGING_DIR}/${IMAGE_ID}.rc 2>/dev/null)" == "${OK}" ]; then
+    for PLATFORM in "${PLATFORM_LIST[@]:0:$(image_platform_count ${DOCKER_IMAGE_NAME})}";
+    do
+      echo "$(image_id ${DOCKER_IMAGE_NAME} ${PLATFORM}) ${DOCKER_IMAGE_NAME}${PLATFORM:+ ${PLATFORM}}" >> ${OUTPUT_IMAGES_FILE}
+      echo "$(image_id ${DOCKER_IMAGE_NAME} ${PLATFORM}) saved ${DOCKER_IMAGE_NAME}${PLATFORM:+ ${PLATFORM}}" >> ${METRICS_DIR}/images.txt
+    done
+  else
+    echo "Error: Could not save ${DOCKER_IMAGE_NAME}"
+    for PLATFORM in "${PLATFORM_LIST[@]:0:$(image_platform_count ${DOCKER_IMAGE_NAME})}";
+    do
+      rm -rf ${OUTPUT_MANIFESTS_DIR}/$(image_id ${DOCKER_IMAGE_NAME} ${PLATFORM})
+      echo "$(image_id ${DOCKER_IMAGE_NAME} ${PLATFORM}) failed ${DOCKER_IMAGE_NAME}${PLATFORM:+ ${PLATFORM}}" >> ${METRICS_DIR}/images.txt
+    done
+    RETURN_CODE=${NOT_OK}
+  fi
+done
+
+rm -rf ${OUTPUT_STAGING_DIR}
+
+# With STREAM=true, compress a single "docker save" of all pulled images directly into OUTPUT_FILE.
+# "docker save" stores layers shared by images once.
+# load-images.sh, images.txt, docker-compose-files.txt, and platforms.txt are appended as a second tar archive,
+# so OUTPUT_FILE is extracted using "tar --ignore-zeros".
+
+if [ "${STREAM}" == "true" ]; then
+  echo "Streaming images into ${OUTPUT_FILE}"
+  SAVE_NAMES=()
+  for DOCKER_IMAGE_NAME in $(cut -d " " -f 2 ${OUTPUT_IMAGES_FILE});
+  do
+    SAVE_NAMES+=(${DOCKER_IMAGE_TAGS[${DOCKER_IMAGE_NAME}]:-${DOCKER_IMAGE_NAME}})
+  done
+  START_MILLISECONDS=$(now_milliseconds)
+  {
+    docker save ${PLATFORMS:+--platform ${PLATFORMS}} ${SAVE_NAMES[@]} | ${COMPRESS_COMMAND} || exit ${NOT_OK}
+    tar --create --file - --directory ${OUTPUT_DIR} $(cd ${OUTPUT_DIR} && ls load-images.sh images.txt docker-compose-files.txt platforms.txt 2>/dev/null) | ${COMPRESS_COMMAND}
+  } | write_output || RETURN_CODE=${NOT_OK}
+  record_metric run stream ${START_MILLISECONDS} $(du --bytes --total ${OUTPUT_FILE} ${OUTPUT_FILE}.[0-9][0-9][0-9][0-9] 2>/dev/null | tail -1 | cut -f 1)
+  write_metrics save-images.sh ${RUN_START_MILLISECONDS}
+  rm -rf ${OUTPUT_DIR}
+  echo "Done."
+  echo "    Output file: ${OUTPUT_FILE}"
+  if [ "${VOLUME_SIZE_IN_MEGABYTES:-0}" -gt 0 ]; then
+    echo "    Written as volumes listed in ${OUTPUT_VOLUME_CHECKSUMS_FILE}"
+    echo "    Verify them with ${OUTPUT_VERIFY_VOLUMES_SCRIPT}"
+  fi
+  if [ -n "${METRICS_FILE}" ]; then
+    echo "    Metrics: ${METRICS_FILE}"
+  fi
+  exit ${RETURN_CODE}
+fi
+
+# Images saved at the same time may both have recorded the checksum of a blob they share. Keep one line for each blob.
+
+sort -u -o ${OUTPUT_CHECKSUMS_FILE} ${OUTPUT_CHECKSUMS_FILE}
+
+# List every blob on the air-gapped system once this bundle is loaded. Input for the next delta bundle.
+
+(printf "%s
+" ${PREVIOUS_BUNDLE_MANIFEST[@]}; cat ${OUTPUT_MANIFESTS_DIR}/*/blobs.txt 2>/dev/null) | grep -v "^$" | sort -u > ${OUTPUT_BUNDLE_MANIFEST_FILE}
 
-# Compress results.
+# Compress results. With COMPRESSION=none, layers that "docker save" already compressed are not compressed again.
+# The "compress" metric counts the bytes of OUTPUT_DIR, before compression.
 
-tar -zcvf ${OUTPUT_FILE} --directory ${MY_HOME} ${OUTPUT_DIR_NAME}
+START_MILLISECONDS=$(now_milliseconds)
+COMPRESS_BYTES=$(du --bytes --summarize ${OUTPUT_DIR} | cut -f 1)
+tar --create --verbose --file - --directory ${MY_HOME} ${OUTPUT_DIR_NAME} | ${COMPRESS_COMMAND} | write_output || RETURN_CODE=${NOT_OK}
+record_metric run compress ${START_MILLISECONDS} ${COMPRESS_BYTES}
+write_metrics save-images.sh ${RUN_START_MILLISECONDS}
 
 # Epilog.
 
 echo "Done."
 echo "    Output file: ${OUTPUT_FILE}"
 echo "    Which is a compressed version of ${OUTPUT_DIR}"
+if [ "${VOLUME_SIZE_IN_MEGABYTES:-0}" -gt 0 ]; then
+  echo "    Written as volumes listed in ${OUTPUT_VOLUME_CHECKSUMS_FILE}"
+  echo "    Verify them with ${OUTPUT_VERIFY_VOLUMES_SCRIPT}"
+fi
+if [ -n "${METRICS_FILE}" ]; then
+  echo "    Metrics: ${METRICS_FILE}"
+fi
 
-exit ${OK}
+exit ${RETURN_CODE}
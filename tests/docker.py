@@ -0,0 +1,85 @@
+'''
+A stand-in docker for tests of save-images.sh and load-images.sh: benchmark/bin/docker, the stand-in docker CLI
+of the benchmark, first on the PATH. Each docker command is logged with the times it started and ended,
+so tests can see which commands ran and how many ran at the same time.
+'''
+
+import os
+import shlex
+import subprocess
+import sys
+
+STAND_IN_DOCKER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmark", "bin", "docker")
+
+DOCKER_SCRIPT = '''#!/usr/bin/env bash
+echo "$(date +%s%N) start $*" >> {log_file}
+{python} {docker} "$@"
+RETURN_CODE=$?
+echo "$(date +%s%N) end $*" >> {log_file}
+exit ${{RETURN_CODE}}
+'''
+
+
+class Docker:
+    ''' A stand-in docker with images of its own, kept in a directory. Layers are small, so tests run fast.
+        "variables" are the environment variables that make programs use it.
+    '''
+
+    def __init__(self, directory, **variables):
+        bin_dir = os.path.join(directory, "bin")
+        os.makedirs(bin_dir)
+        self.log_file = os.path.join(directory, "docker.log")
+        with open(os.path.join(bin_dir, "docker"), "w") as a_file:
+            a_file.write(DOCKER_SCRIPT.format(log_file=shlex.quote(self.log_file), python=shlex.quote(sys.executable), docker=shlex.quote(STAND_IN_DOCKER)))
+        os.chmod(os.path.join(bin_dir, "docker"), 0o755)
+        self.variables = {
+            "FAKE_DOCKER_BASE_LAYER_SIZE": "20000",
+            "FAKE_DOCKER_LAYER_SIZE": "5000",
+            "FAKE_DOCKER_STATE": os.path.join(directory, "state"),
+            "PATH": "{0}{1}{2}".format(bin_dir, os.pathsep, os.environ.get("PATH", "")),
+            **variables,
+        }
+        self.environment = dict(os.environ, **self.variables)
+
+    def run_script(self, script, *arguments, **variables):
+        ''' Run a bash script using this docker. Return the completed process, with its output as text. '''
+        return subprocess.run(["bash", script, *arguments], capture_output=True, check=False, env=dict(self.environment, **variables), text=True, timeout=120)
+
+    def get_commands(self, command=None):
+        ''' Return the logged docker commands, or those of one docker command, as lists of arguments, in the order they started. '''
+        result = []
+        if not os.path.exists(self.log_file):
+            return result
+        with open(self.log_file) as a_file:
+            for line in a_file:
+                _, event, *arguments = line.split()
+                if event == "start" and (command is None or arguments[:1] == [command]):
+                    result.append(arguments)
+        return result
+
+    def get_intervals(self, command):
+        ''' Return the (start, end, arguments) of each logged command of a kind, in the order they started. Times are in nanoseconds. '''
+        starts = {}
+        result = []
+        with open(self.log_file) as a_file:
+            for line in a_file:
+                time, event, *arguments = line.split()
+                if arguments[:1] != [command]:
+                    continue
+                if event == "start":
+                    starts[tuple(arguments)] = int(time)
+                else:
+                    result.append((starts.pop(tuple(arguments)), int(time), arguments))
+        return sorted(result)
+
+    def get_max_concurrency(self, command):
+        ''' Return the most commands of a kind, such as "pull", that ran at the same time. '''
+        running = 0
+        result = 0
+        with open(self.log_file) as a_file:
+            events = sorted((int(line.split()[0]), line.split()[1] == "start", line.split()[2]) for line in a_file)
+        for _, started, logged_command in events:
+            if logged_command == command:
+                running += 1 if started else -1
+                result = max(result, running)
+        return result
@@ -0,0 +1,16 @@
+'''
+Run docker-compose-air-gapper.py as a user does, in a separate process.
+'''
+
+import os
+import subprocess
+import sys
+
+PROGRAM = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docker-compose-air-gapper.py")
+
+
+def run_program(subcommand, *arguments, cwd=None, **variables):
+    ''' Run a subcommand, with more environment variables if given. Return the completed process, with its output and log as text. '''
+    environment = {key: value for key, value in os.environ.items() if not key.startswith("SENZING_")}
+    environment.update(variables)
+    return subprocess.run([sys.executable, PROGRAM, subcommand, *arguments], capture_output=True, check=False, cwd=cwd, env=environment, text=True, timeout=120)
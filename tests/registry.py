@@ -0,0 +1,242 @@
+'''
+A stand-in registry for tests: the parts of the Docker Registry HTTP API V2 that docker-compose-air-gapper uses,
+served from memory on a free local port. Requests need a bearer token from its "/token" realm,
+and blobs are downloaded through a redirect, as from registries that keep blobs in object storage.
+'''
+
+import collections
+import gzip
+import hashlib
+import http.server
+import io
+import json
+import re
+import tarfile
+import threading
+import urllib.parse
+import uuid
+
+MEDIA_TYPE_OCI_INDEX = "application/vnd.oci.image.index.v1+json"
+MEDIA_TYPE_OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+TOKEN = "test-token"
+
+
+def get_digest(data):
+    ''' Return the sha256 digest of bytes. '''
+    return "sha256:{0}".format(hashlib.sha256(data).hexdigest())
+
+
+def create_layer(content):
+    ''' Return a gzipped tar holding one file, and the digest of the uncompressed tar. '''
+    tar_bytes = io.BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode="w") as tar_file:
+        tar_info = tarfile.TarInfo("file.txt")
+        tar_info.size = len(content)
+        tar_file.addfile(tar_info, io.BytesIO(content))
+    return gzip.compress(tar_bytes.getvalue(), mtime=0), get_digest(tar_bytes.getvalue())
+
+
+class Registry:
+    ''' A registry on 127.0.0.1. "counts" counts requests by kind: token, manifest_get, blob_get, blob_head, mount, upload, manifest_put.
+        With an "idle_timeout", it closes keep-alive connections that are idle for that many seconds.
+    '''
+
+    def __init__(self, idle_timeout=None):
+        self.idle_timeout = idle_timeout
+        self.blobs = {}
+        self.links = set()
+        self.manifests = {}
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RegistryRequestHandler)
+        self.server.daemon_threads = True
+        self.server.registry = self
+
+    @property
+    def host(self):
+        ''' Return the "host:port" of the registry, as used in image names. '''
+        return "127.0.0.1:{0}".format(self.server.server_address[1])
+
+    def start(self):
+        ''' Serve requests in a thread. '''
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        ''' Stop serving requests. '''
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, kind):
+        ''' Count a request. '''
+        with self.lock:
+            self.counts[kind] += 1
+
+    def add_blob(self, repository, data):
+        ''' Store a blob in a repository and return its digest. Repositories of a registry share the data of their blobs. '''
+        digest = get_digest(data)
+        self.blobs[digest] = data
+        self.links.add((repository, digest))
+        return digest
+
+    def add_manifest(self, repository, reference, media_type, content):
+        ''' Store a manifest by tag or digest and by its own digest. Return its digest. '''
+        digest = get_digest(content)
+        self.manifests[(repository, reference)] = (media_type, content)
+        self.manifests[(repository, digest)] = (media_type, content)
+        return digest
+
+    def add_image(self, repository, tag, architectures=("amd64", "arm64")):
+        ''' Store an image index with a manifest for each architecture. The base layer of an architecture is
+            the same in every image, so images share it. Return the name of the image.
+        '''
+
+        manifests = []
+        for architecture in architectures:
+            base_layer, base_diff_id = create_layer("base-{0}".format(architecture).encode() * 20000)
+            own_layer, own_diff_id = create_layer("{0}:{1}/{2}".format(repository, tag, architecture).encode() * 5000)
+            config = json.dumps({
+                "architecture": architecture,
+                "os": "linux",
+                "rootfs": {"type": "layers", "diff_ids": [base_diff_id, own_diff_id]},
+            }).encode()
+            content = json.dumps({
+                "schemaVersion": 2,
+                "mediaType": MEDIA_TYPE_OCI_MANIFEST,
+                "config": {"mediaType": "application/vnd.oci.image.config.v1+json", "digest": self.add_blob(repository, config), "size": len(config)},
+                "layers": [{"mediaType": "application/vnd.oci.image.layer.v1.tar+gzip", "digest": self.add_blob(repository, layer), "size": len(layer)} for layer in [base_layer, own_layer]],
+            }).encode()
+            digest = self.add_manifest(repository, get_digest(content), MEDIA_TYPE_OCI_MANIFEST, content)
+            manifests.append({"mediaType": MEDIA_TYPE_OCI_MANIFEST, "digest": digest, "size": len(content), "platform": {"os": "linux", "architecture": architecture}})
+        index = json.dumps({"schemaVersion": 2, "mediaType": MEDIA_TYPE_OCI_INDEX, "manifests": manifests}).encode()
+        self.add_manifest(repository, tag, MEDIA_TYPE_OCI_INDEX, index)
+        return "{0}/{1}:{2}".format(self.host, repository, tag)
+
+
+class RegistryRequestHandler(http.server.BaseHTTPRequestHandler):
+    ''' Requests of a Registry. '''
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        ''' Time out idle connections after the idle_timeout of the registry. '''
+        self.timeout = self.server.registry.idle_timeout
+        super().setup()
+
+    def log_message(self, *args):
+        ''' Do not log requests or timeouts. '''
+
+    def send(self, status, body=b"", headers=None):
+        ''' Send a response. HEAD responses have the headers of a GET response, without its body. '''
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if "Content-Length" not in (headers or {}):
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def read_body(self):
+        ''' Read the body of a request. '''
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_GET(self):
+        ''' Handle a GET request. '''
+        self.handle_request()
+
+    def do_HEAD(self):
+        ''' Handle a HEAD request. '''
+        self.handle_request()
+
+    def do_POST(self):
+        ''' Handle a POST request. '''
+        self.handle_request()
+
+    def do_PUT(self):
+        ''' Handle a PUT request. '''
+        self.handle_request()
+
+    def handle_request(self):
+        ''' Answer a request of the registry API. '''
+
+        registry = self.server.registry
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        body = self.read_body()
+
+        if url.path == "/token":
+            registry.count("token")
+            self.send(200, json.dumps({"token": TOKEN, "expires_in": 300}).encode())
+            return
+        if url.path.startswith("/storage/"):
+            self.send_blob(registry.blobs.get(url.path[len("/storage/"):]))
+            return
+        if self.headers.get("Authorization") != "Bearer {0}".format(TOKEN):
+            self.send(401, b"{}", {"WWW-Authenticate": 'Bearer realm="http://{0}/token",service="test"'.format(registry.host)})
+            return
+
+        match = re.match(r"^/v2/(?P<repository>.+)/manifests/(?P<reference>[^/]+)$", url.path)
+        if match:
+            self.handle_manifest(registry, match.group("repository"), match.group("reference"), body)
+            return
+        match = re.match(r"^/v2/(?P<repository>.+)/blobs/uploads/[^/]*$", url.path)
+        if match:
+            self.handle_upload(registry, match.group("repository"), query, body)
+            return
+        match = re.match(r"^/v2/(?P<repository>.+)/blobs/(?P<digest>[^/]+)$", url.path)
+        if match and (match.group("repository"), match.group("digest")) in registry.links:
+            if self.command == "HEAD":
+                registry.count("blob_head")
+                self.send(200, headers={"Content-Length": str(len(registry.blobs.get(match.group("digest")))), "Docker-Content-Digest": match.group("digest")})
+            else:
+                registry.count("blob_get")
+                self.send(307, headers={"Location": "/storage/{0}".format(match.group("digest"))})
+            return
+        self.send(404, b"{}")
+
+    def handle_manifest(self, registry, repository, reference, body):
+        ''' Get or put a manifest. '''
+        if self.command == "PUT":
+            registry.count("manifest_put")
+            digest = registry.add_manifest(repository, reference, self.headers.get("Content-Type"), body)
+            self.send(201, headers={"Docker-Content-Digest": digest, "Location": "/v2/{0}/manifests/{1}".format(repository, digest)})
+            return
+        if (repository, reference) not in registry.manifests:
+            self.send(404, b"{}")
+            return
+        registry.count("manifest_get")
+        media_type, content = registry.manifests.get((repository, reference))
+        self.send(200, content, {"Content-Type": media_type, "Docker-Content-Digest": get_digest(content)})
+
+    def handle_upload(self, registry, repository, query, body):
+        ''' Start an upload, or mount the blob from the repository it names. Finish an upload with a monolithic PUT. '''
+        if self.command == "POST":
+            if (query.get("from"), query.get("mount")) in registry.links:
+                registry.count("mount")
+                registry.links.add((repository, query.get("mount")))
+                self.send(201, headers={"Location": "/v2/{0}/blobs/{1}".format(repository, query.get("mount"))})
+                return
+            self.send(202, headers={"Location": "/v2/{0}/blobs/uploads/{1}".format(repository, uuid.uuid4())})
+            return
+        if get_digest(body) != query.get("digest"):
+            self.send(400, b'{"errors": [{"code": "DIGEST_INVALID"}]}')
+            return
+        registry.count("upload")
+        registry.add_blob(repository, body)
+        self.send(201, headers={"Docker-Content-Digest": query.get("digest")})
+
+    def send_blob(self, data):
+        ''' Send a blob from storage, or the rest of it from a "Range" offset. '''
+        if data is None:
+            self.send(404)
+            return
+        match = re.match(r"^bytes=(\d+)-$", self.headers.get("Range") or "")
+        if match:
+            start = int(match.group(1))
+            if start >= len(data):
+                self.send(416, headers={"Content-Range": "bytes */{0}".format(len(data))})
+                return
+            self.send(206, data[start:], {"Content-Range": "bytes {0}-{1}/{2}".format(start, len(data) - 1, len(data))})
+            return
+        self.send(200, data)
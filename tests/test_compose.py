@@ -0,0 +1,174 @@
+'''
+Tests of how docker-compose files are resolved: ".env" files, "include", "extends", profiles, and build contexts.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import docker_compose_air_gapper
+from docker_compose_air_gapper.compose import ParsedTextCache, read_docker_compose_documents
+
+
+class ComposeTest(unittest.TestCase):
+    ''' Resolve projects written to a temporary directory. '''
+
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_files(self, files):
+        ''' Write {relative path: text} into the temporary directory. '''
+        for filename, text in files.items():
+            path = os.path.join(self.directory, filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as a_file:
+                a_file.write(text)
+
+    def get_services(self, filename, **options):
+        ''' Return the images and the Dockerfiles of the builds of a docker-compose file. '''
+        path = os.path.join(self.directory, filename)
+        services = docker_compose_air_gapper.get_library_services_by_file(path, **options).get(path)
+        return services.get("images"), sorted(build.get("dockerfile") for build in services.get("builds"))
+
+    def get_built_images(self, filename):
+        ''' Return the names of the images built for the services of a docker-compose file. '''
+        path = os.path.join(self.directory, filename)
+        return [build.get("image") for build in docker_compose_air_gapper.get_library_services_by_file(path).get(path).get("builds")]
+
+    def test_env_file(self):
+        ''' Variables come from the ".env" file of the project, or from "env_file" instead. '''
+
+        self.write_files({
+            "project/docker-compose.yaml": "services:\n  app:\n    image: senzing/app:${TAG}\n",
+            "project/.env": "TAG=1.0\n",
+            "project/other.env": "TAG=2.0\n",
+        })
+        self.assertEqual(self.get_services("project/docker-compose.yaml")[0], ["senzing/app:1.0"])
+        self.assertEqual(self.get_services("project/docker-compose.yaml", env_file=os.path.join(self.directory, "project/other.env"))[0], ["senzing/app:2.0"])
+
+    def test_include(self):
+        ''' An included project uses the ".env" file and the build contexts of its own directory, or of its "project_directory". '''
+
+        self.write_files({
+            "project/docker-compose.yaml": "include:\n  - stacks/db/compose.yaml\n  - path: stacks/web/compose.yaml\n    project_directory: stacks/web\nservices:\n  app:\n    image: senzing/app:1.0\n",
+            "project/stacks/db/compose.yaml": "services:\n  db:\n    image: postgres:${POSTGRES_VERSION}\n  db-tools:\n    build: ./tools\n",
+            "project/stacks/db/.env": "POSTGRES_VERSION=16\n",
+            "project/stacks/web/compose.yaml": "services:\n  web:\n    image: nginx:${NGINX_VERSION}\n    build:\n      context: ./site\n",
+            "project/stacks/web/.env": "NGINX_VERSION=1.27\n",
+        })
+        images, dockerfiles = self.get_services("project/docker-compose.yaml")
+        self.assertEqual(images, ["postgres:16", "nginx:1.27", "senzing/app:1.0"])
+        self.assertEqual(dockerfiles, [os.path.join(self.directory, "project/stacks/db/tools/Dockerfile")])
+
+    def test_include_relative_path(self):
+        ''' An included project of a docker-compose file named by a relative path uses the ".env" file of its own directory. '''
+
+        self.write_files({
+            "project/docker-compose.yaml": "include:\n  - stacks/db/compose.yaml\n",
+            "project/stacks/db/compose.yaml": "services:\n  db:\n    image: postgres:${POSTGRES_VERSION}\n",
+            "project/stacks/db/.env": "POSTGRES_VERSION=16\n",
+        })
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory)
+        services = docker_compose_air_gapper.get_library_services_by_file("project/docker-compose.yaml").get("project/docker-compose.yaml")
+        self.assertEqual(services.get("images"), ["postgres:16"])
+
+    def test_extends(self):
+        ''' A service extended from a file in another directory builds a context in that directory. '''
+
+        self.write_files({
+            "project/docker-compose.yaml": "services:\n  app:\n    extends:\n      file: ../common/compose.yaml\n      service: base\n    build:\n      target: dev\n",
+            "common/compose.yaml": "services:\n  base:\n    build:\n      context: ./app\n      dockerfile: app.Dockerfile\n",
+        })
+        self.assertEqual(self.get_services("project/docker-compose.yaml")[1], [os.path.join(self.directory, "common/app/app.Dockerfile")])
+
+    def test_override_files(self):
+        ''' Later files override earlier ones, and relative build contexts are relative to the first file's directory. '''
+
+        self.write_files({
+            "project/docker-compose.yaml": "services:\n  app:\n    image: senzing/app:1.0\n  tools:\n    build: .\n",
+            "project/override/docker-compose.override.yaml": "services:\n  app:\n    image: senzing/app:2.0\n  tools:\n    build:\n      dockerfile: tools.Dockerfile\n",
+        })
+        path = os.pathsep.join(os.path.join(self.directory, name) for name in ["project/docker-compose.yaml", "project/override/docker-compose.override.yaml"])
+        services = docker_compose_air_gapper.get_library_services_by_file(path).get(path)
+        self.assertEqual(services.get("images"), ["senzing/app:2.0"])
+        self.assertEqual([build.get("dockerfile") for build in services.get("builds")], [os.path.join(self.directory, "project/tools.Dockerfile")])
+
+    def test_profiles(self):
+        ''' Services with profiles are used only when one of their profiles is active. '''
+
+        self.write_files({
+            "project/docker-compose.yaml": "services:\n  app:\n    image: senzing/app:1.0\n  debug:\n    image: senzing/debug:1.0\n    profiles: [debug]\n  tools:\n    image: senzing/tools:1.0\n    profiles: [tools]\n",
+        })
+        self.assertEqual(self.get_services("project/docker-compose.yaml")[0], ["senzing/app:1.0"])
+        self.assertEqual(self.get_services("project/docker-compose.yaml", profiles=["debug"])[0], ["senzing/app:1.0", "senzing/debug:1.0"])
+        self.assertEqual(self.get_services("project/docker-compose.yaml", profiles=["*"])[0], ["senzing/app:1.0", "senzing/debug:1.0", "senzing/tools:1.0"])
+
+    def test_project_name(self):
+        ''' Built images are named after COMPOSE_PROJECT_NAME, then the top-level "name" of the project, then its directory. '''
+
+        self.write_files({
+            "t1/docker-compose.yaml": "name: ${PROJECT:-myproj}\nservices:\n  web:\n    build: .\n",
+            "t2/docker-compose.yaml": "services:\n  web:\n    build: .\n",
+        })
+        self.assertEqual(self.get_built_images("t1/docker-compose.yaml"), ["myproj-web"])
+        self.assertEqual(self.get_built_images("t2/docker-compose.yaml"), ["t2-web"])
+        self.write_files({"t1/.env": "COMPOSE_PROJECT_NAME=Other.Project\n"})
+        self.assertEqual(self.get_built_images("t1/docker-compose.yaml"), ["otherproject-web"])
+
+    def test_multiple_documents(self):
+        ''' Services of later YAML documents in a file are merged into those of earlier ones. Anchors and "<<" merge keys are resolved. '''
+
+        self.write_files({
+            "project/docker-compose.yaml": "x-app: &app\n  image: senzing/app:1.0\nservices:\n  app: *app\n  tools:\n    <<: *app\n    image: senzing/tools:1.0\n---\nservices:\n  app:\n    image: senzing/app:2.0\n  db:\n    image: postgres:16\n",
+        })
+        self.assertEqual(self.get_services("project/docker-compose.yaml")[0], ["senzing/app:2.0", "senzing/tools:1.0", "postgres:16"])
+
+    def test_large_file(self):
+        ''' Parts of a large docker-compose file that do not describe images are not kept. '''
+
+        with open(os.path.join(self.directory, "docker-compose.yaml"), "w") as a_file:
+            a_file.write("x-environment: &environment\n  LOG_LEVEL: info\nservices:\n")
+            for number in range(5000):
+                a_file.write("  app{0}:\n    image: senzing/app{1}:1.0\n    environment: *environment\n    volumes:\n{2}".format(number, number % 100, "      - /data:/data\n" * 20))
+        with open(os.path.join(self.directory, "docker-compose.yaml")) as a_file:
+            model = read_docker_compose_documents(a_file)
+        self.assertEqual(list(model), ["include", "name", "services"])
+        self.assertEqual(len(model.get("services")), 5000)
+        self.assertEqual(model.get("services").get("app0"), {"image": "senzing/app0:1.0"})
+        self.assertEqual(len(self.get_services("docker-compose.yaml")[0]), 100)
+
+    def test_malformed(self):
+        ''' Parts of a docker-compose file of the wrong type raise ValueError. '''
+
+        for number, text in enumerate([
+            "services: [1]\n",
+            "services:\n  app:\n    image: [1]\n",
+            "include: [5]\n",
+            "include:\n  - project_directory: .\n",
+            "services:\n  app:\n    build: 5\n",
+            "services:\n  app:\n    build:\n      context: .\n      args: [5]\n",
+        ]):
+            filename = "project-{0}/docker-compose.yaml".format(number)
+            self.write_files({filename: text})
+            with self.assertRaises(ValueError):
+                self.get_services(filename)
+
+    def test_parsed_text_cache(self):
+        ''' Texts are parsed once while their entries are kept. The least recently used are forgotten beyond the size of the cache. '''
+
+        parsed = []
+        parsed_text_cache = ParsedTextCache(100)
+        texts = ["services: {{}}\n# {0}\n".format(character * 20) for character in "abc"]
+        for text in texts[:2] + texts[:1] + texts[2:] + texts[:2]:
+            self.assertEqual(parsed_text_cache.get("docker-compose.yaml", text, lambda text=text: parsed.append(text) or text), text)
+        self.assertEqual(parsed, texts + texts[1:2])
+        self.assertLessEqual(parsed_text_cache.size, 100)
+        parsed_text_cache.get("docker-compose.yaml", "#" * 101, lambda: None)
+        self.assertEqual(len(parsed_text_cache.entries), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+'''
+Tests of docker_compose_air_gapper as a package Python programs import: its functions give what the subcommands give,
+and the package imports only the modules that what is used needs.
+'''
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from program import PROGRAM, run_program
+
+import docker_compose_air_gapper
+
+# Print the modules imported by "import docker_compose_air_gapper" and, if given, a subcommand.
+
+IMPORTED_MODULES_SCRIPT = '''
+import json
+import sys
+import docker_compose_air_gapper
+if len(sys.argv) > 1:
+    try:
+        docker_compose_air_gapper.main()
+    except SystemExit:
+        pass
+print(json.dumps(sorted(sys.modules)))
+'''
+
+
+class LibraryTest(unittest.TestCase):
+    ''' Use a project with a pulled image and an image that is only built. '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.project_dir = os.path.join(self.directory, "project")
+        os.makedirs(os.path.join(self.project_dir, "tools"))
+        with open(os.path.join(self.project_dir, "tools", "Dockerfile"), "w") as a_file:
+            a_file.write("FROM scratch\n")
+        with open(os.path.join(self.project_dir, "docker-compose.yaml"), "w") as a_file:
+            a_file.write("services:\n  app0:\n    image: senzing/app0:1.0\n  app1:\n    image: senzing/app1:1.0\n  tools:\n    build: ./tools\n")
+
+    def get_imported_modules(self, *arguments):
+        ''' Return the modules a new Python process imports for "import docker_compose_air_gapper" and a subcommand, if given. '''
+        result = subprocess.run([sys.executable, "-c", IMPORTED_MODULES_SCRIPT, *arguments], capture_output=True, check=True, cwd=os.path.dirname(PROGRAM), text=True, timeout=60)
+        return json.loads(result.stdout)
+
+    def test_imports(self):
+        ''' Importing the package, and "version", do not import the modules and libraries that other subcommands use. '''
+
+        for arguments, modules in [((), ["docker_compose_air_gapper"]), (("version",), ["docker_compose_air_gapper.cli", "docker_compose_air_gapper.parser"])]:
+            with self.subTest(arguments=arguments):
+                imported_modules = self.get_imported_modules(*arguments)
+                for module in modules:
+                    self.assertIn(module, imported_modules)
+                for module in ["concurrent", "docker_compose_air_gapper.archive", "docker_compose_air_gapper.compose", "docker_compose_air_gapper.library", "tarfile", "urllib", "yaml"]:
+                    self.assertNotIn(module, imported_modules)
+        self.assertNotIn("docker_compose_air_gapper.cli", self.get_imported_modules())
+
+    def test_render_save_images_script(self):
+        ''' render_save_images_script() returns the save-images.sh of "create-save-images" with the same options. '''
+
+        for arguments, options in [
+            ([], {}),
+            (["--platform", "linux/amd64", "linux/arm64", "--shard", "1/2", "--compression", "none"], {"platforms": ["linux/amd64", "linux/arm64"], "shard": "1/2", "compression": "none"}),
+        ]:
+            with self.subTest(options=options):
+                output_file = os.path.join(self.directory, "save-images.sh")
+                result = run_program("create-save-images", "--docker-compose-file", self.project_dir, "--output-file", output_file, *arguments)
+                self.assertEqual(result.returncode, 0, result.stderr)
+                with open(output_file) as a_file:
+                    self.assertEqual(docker_compose_air_gapper.render_save_images_script(self.project_dir, **options), a_file.read())
+
+    def test_extract_images(self):
+        ''' extract_images() returns the pulled images, then the built images. Bad arguments raise ValueError. '''
+
+        self.assertEqual(docker_compose_air_gapper.extract_images(self.project_dir), ["senzing/app0:1.0", "senzing/app1:1.0", "project-tools"])
+        services = docker_compose_air_gapper.extract_services(self.project_dir).get(os.path.join(self.project_dir, "docker-compose.yaml"))
+        self.assertEqual([build.get("image") for build in services.get("builds")], ["project-tools"])
+        with self.assertRaises(ValueError):
+            docker_compose_air_gapper.render_save_images_script(self.project_dir, platform="linux/amd64")
+        with self.assertRaises(ValueError):
+            docker_compose_air_gapper.extract_images(os.path.join(self.directory, "missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+'''
+Tests of sharded saves with save-images.sh and of "merge-bundles".
+'''
+
+import io
+import os
+import tarfile
+import unittest
+
+from program import run_program
+from test_save_images_script import BundleTestCase
+
+IMAGES = ["senzing/app{0}:1.0".format(number) for number in range(6)]
+
+
+class MergeBundlesTest(BundleTestCase):
+    ''' Save the shards of a docker-compose file of 6 images that share a base layer, then merge them.
+        Each image has a layer, a config and a manifest of its own.
+    '''
+
+    def get_shard_images(self, script):
+        ''' Return the images in the DOCKER_IMAGE_NAMES of a save-images.sh. '''
+        with open(script) as a_file:
+            text = a_file.read()
+        return text.split("DOCKER_IMAGE_NAMES=(\n", 1)[1].split(")", 1)[0].replace('"', "").split()
+
+    def merge_bundles(self, *bundles):
+        ''' Merge bundles into "merged/bundle.tgz". Return the completed process and the merged bundle file. '''
+        output_file = os.path.join(self.directory, "merged", "bundle.tgz")
+        return run_program("merge-bundles", "--bundle", *bundles, "--output-file", output_file), output_file
+
+    def test_shards_are_stable(self):
+        ''' Each image is in exactly one shard, and the same one every time. '''
+
+        shards = []
+        for shard in range(1, 4):
+            first = self.get_shard_images(self.create_save_images(IMAGES, "--shard", "{0}/3".format(shard), name="first-{0}.sh".format(shard)))
+            second = self.get_shard_images(self.create_save_images(list(reversed(IMAGES)), "--shard", "{0}/3".format(shard), name="second-{0}.sh".format(shard)))
+            self.assertEqual(sorted(first), sorted(second))
+            shards.append(first)
+        self.assertEqual(sorted(image for images in shards for image in images), IMAGES)
+
+    def test_merge_bundles(self):
+        ''' The merged bundle stores the shared base layer once, and load-images.sh loads every image from it. '''
+
+        bundles = []
+        for shard in range(1, 3):
+            script = self.create_save_images(IMAGES, "--shard", "{0}/2".format(shard), name="shard-{0}.sh".format(shard))
+            bundles.append(self.save_images(script, name="shard-{0}".format(shard)))
+        result, output_file = self.merge_bundles(*bundles)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        bundle_dir = self.extract_bundle(output_file)
+        with open(os.path.join(bundle_dir, "images.txt")) as a_file:
+            self.assertEqual(sorted(line.split()[1] for line in a_file), IMAGES)
+        with open(os.path.join(bundle_dir, "blobs.sha256")) as a_file:
+            checksums = a_file.read().splitlines()
+        self.assertEqual(len(checksums), len(set(checksums)))
+        self.assertEqual(sorted(line.split()[1] for line in checksums), ["blobs/sha256/{0}".format(blob) for blob in self.get_blobs(bundle_dir)])
+        self.assertEqual(len(checksums), 1 + 3 * len(IMAGES))
+
+        result, docker = self.load_images(bundle_dir)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        self.assertEqual(len(docker.get_commands("load")), len(IMAGES))
+
+    def test_links_outside_the_bundle(self):
+        ''' A bundle whose symbolic or hard links lead outside the bundle directory is refused, and nothing is written outside it. '''
+
+        outside_dir = os.path.join(self.directory, "outside")
+        os.makedirs(outside_dir)
+        for number, links in enumerate([
+            [("blobs/blobs", tarfile.SYMTYPE, outside_dir), ("blobs/blobs/sha256/0", tarfile.REGTYPE, "")],
+            [("blobs/sha256/0", tarfile.SYMTYPE, "../../../../outside/secret")],
+            [("blobs/sha256/0", tarfile.LNKTYPE, "bundle/../../outside/secret")],
+        ]):
+            with self.subTest(number=number):
+                bundle_file = os.path.join(self.directory, "links-{0}.tar".format(number))
+                with tarfile.open(bundle_file, "w") as tar_file:
+                    for name, member_type, target in [("manifests/image/blobs.txt", tarfile.REGTYPE, "")] + links:
+                        tar_info = tarfile.TarInfo("bundle/{0}".format(name))
+                        tar_info.type = member_type
+                        tar_info.linkname = target
+                        tar_file.addfile(tar_info, io.BytesIO(b""))
+                result, _ = self.merge_bundles(bundle_file)
+                self.assertNotEqual(result.returncode, 0)
+                self.assertIn("The bundle has a file outside the bundle directory", result.stderr)
+                self.assertEqual(os.listdir(outside_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+'''
+Tests of "push-images" from a bundle to a stand-in registry.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from program import run_program
+from registry import Registry
+
+
+class PushImagesTest(unittest.TestCase):
+    ''' Push a bundle of two images that share a base layer. '''
+
+    def setUp(self):
+        source_registry = Registry().start()
+        self.addCleanup(source_registry.stop)
+        self.target_registry = Registry().start()
+        self.addCleanup(self.target_registry.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        project_directory = os.path.join(self.directory, "project")
+        os.makedirs(project_directory)
+        with open(os.path.join(project_directory, "docker-compose.yaml"), "w") as a_file:
+            a_file.write("services:\n")
+            for number in range(2):
+                a_file.write("  app{0}:\n    image: {1}\n".format(number, source_registry.add_image("senzing/app{0}".format(number), "1.0")))
+        self.bundle_file = os.path.join(self.directory, "bundle.tgz")
+        result = run_program(
+            "save-images",
+            "--docker-compose-file", project_directory,
+            "--insecure-registries", source_registry.host,
+            "--platform", "linux/amd64",
+            "--cache-max-size-in-megabytes", "0",
+            "--index",
+            "--output-file", self.bundle_file)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def push_images(self):
+        ''' Push the bundle. Return {original image: pushed image}. '''
+        output_file = os.path.join(self.directory, "pushed.txt")
+        result = run_program(
+            "push-images",
+            "--input-file", self.bundle_file,
+            "--insecure-registries", self.target_registry.host,
+            "--target-registry", self.target_registry.host,
+            "--output-file", output_file)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with open(output_file) as a_file:
+            return dict(line.split() for line in a_file)
+
+    def test_push_images(self):
+        ''' Each blob is uploaded once. The second repository mounts the shared base layer from the first. '''
+
+        pushed = self.push_images()
+        self.assertEqual(sorted(pushed.values()), ["{0}/senzing/app{1}:1.0".format(self.target_registry.host, number) for number in range(2)])
+        self.assertEqual(self.target_registry.counts.get("upload"), 5)
+        self.assertEqual(self.target_registry.counts.get("mount"), 1)
+        for number in range(2):
+            self.assertIn(("senzing/app{0}".format(number), "1.0"), self.target_registry.manifests)
+
+    def test_push_images_again(self):
+        ''' Blobs already in the registry are found with HEAD requests and not uploaded again. '''
+
+        self.push_images()
+        self.target_registry.counts.clear()
+        self.push_images()
+        self.assertEqual(self.target_registry.counts.get("upload", 0), 0)
+        self.assertEqual(self.target_registry.counts.get("mount", 0), 0)
+        self.assertEqual(self.target_registry.counts.get("blob_head"), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+'''
+Tests of the registry client against a stand-in registry.
+'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from registry import Registry
+
+from docker_compose_air_gapper.registry import RegistryClient, parse_image_reference
+
+
+class RegistryClientTest(unittest.TestCase):
+    ''' Use a registry that closes keep-alive connections after they are idle for 0.2 seconds. '''
+
+    def setUp(self):
+        self.registry = Registry(idle_timeout=0.2).start()
+        self.addCleanup(self.registry.stop)
+        self.image_reference = parse_image_reference(self.registry.add_image("senzing/app", "1.0"))
+        self.registry_client = RegistryClient()
+        self.addCleanup(self.registry_client.close)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_idle_connection(self):
+        ''' A request on a keep-alive connection that the registry closed while it was idle is sent again on a new connection. '''
+
+        first_digest, _, _ = self.registry_client.get_manifest(self.image_reference)
+        time.sleep(0.5)
+        second_digest, _, _ = self.registry_client.get_manifest(self.image_reference)
+        self.assertEqual(first_digest, second_digest)
+        self.assertEqual(self.registry.counts.get("manifest_get"), 2)
+
+    def download_partial(self, size=None):
+        ''' Download the first blob of the image, after an interrupted download that wrote "size" bytes, or all of them. Return the blob and what was downloaded. '''
+        digest, data = next(iter(self.registry.blobs.items()))
+        filename = os.path.join(self.directory, "blob")
+        with open("{0}.partial".format(filename), "wb") as a_file:
+            a_file.write(data[:size])
+        self.registry_client.download_blob(self.image_reference, digest, filename)
+        with open(filename, "rb") as a_file:
+            return data, a_file.read()
+
+    def test_resume_partial_download(self):
+        ''' An interrupted download is resumed where it stopped. '''
+
+        data, downloaded = self.download_partial(100)
+        self.assertEqual(downloaded, data)
+        self.assertEqual(self.registry.counts.get("blob_get"), 1)
+
+    def test_complete_partial_download(self):
+        ''' A download that was complete, but not renamed, is renamed without a request. '''
+
+        data, downloaded = self.download_partial()
+        self.assertEqual(downloaded, data)
+        self.assertIsNone(self.registry.counts.get("blob_get"))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "blob.partial")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+'''
+Tests of "save-images" and "plan" against a stand-in registry.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from program import run_program
+from registry import Registry
+
+
+class SaveImagesTest(unittest.TestCase):
+    ''' Save two images that share a base layer. '''
+
+    def setUp(self):
+        self.registry = Registry().start()
+        self.addCleanup(self.registry.stop)
+        self.images = [self.registry.add_image("senzing/app0", "1.0"), self.registry.add_image("senzing/app1", "1.0")]
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.project_directory = os.path.join(self.directory, "project")
+        os.makedirs(self.project_directory)
+        with open(os.path.join(self.project_directory, "docker-compose.yaml"), "w") as a_file:
+            a_file.write("services:\n")
+            for number, image in enumerate(self.images):
+                a_file.write("  app{0}:\n    image: {1}\n".format(number, image))
+
+    def save_images(self, name, *arguments):
+        ''' Save the images of the project for linux/amd64 into the bundle directory "name". Return the bundle file. '''
+        output_file = os.path.join(self.directory, "{0}.tgz".format(name))
+        os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+        result = run_program(
+            "save-images",
+            "--docker-compose-file", self.project_directory,
+            "--insecure-registries", self.registry.host,
+            "--platform", "linux/amd64",
+            "--output-file", output_file,
+            "--resume-dir", os.path.join(self.directory, name),
+            *arguments)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return output_file
+
+    def test_save_images(self):
+        ''' Each of the 5 blobs is downloaded once, and the bundle holds the images and the checksums of its blobs and 2 manifests. '''
+
+        output_file = self.save_images("bundle", "--cache-max-size-in-megabytes", "0")
+        self.assertEqual(self.registry.counts.get("blob_get"), 5)
+
+        with tarfile.open(output_file) as tar_file:
+            members = {member.name: member for member in tar_file.getmembers()}
+            images = [line.split()[1] for line in tar_file.extractfile("bundle/images.txt").read().decode().splitlines()]
+            checksums = tar_file.extractfile("bundle/blobs.sha256").read().decode().splitlines()
+            self.assertEqual(sorted(images), sorted(self.images))
+            self.assertEqual(len(checksums), 7)
+            for line in checksums:
+                checksum, blob = line.split("  ")
+                self.assertEqual(hashlib.sha256(tar_file.extractfile("bundle/blobs/" + blob).read()).hexdigest(), checksum)
+        self.assertIn("bundle/load-images.sh", members)
+
+    def test_resume(self):
+        ''' A resumed bundle downloads only the blobs it does not have. '''
+
+        self.save_images("bundle", "--cache-max-size-in-megabytes", "0")
+        blob_path = os.path.join(self.directory, "bundle", "blobs", "blobs", "sha256")
+        layers = [digest.split(":")[1] for digest, data in self.registry.blobs.items() if data.startswith(b"\x1f\x8b")]
+        os.remove(os.path.join(blob_path, next(name for name in sorted(os.listdir(blob_path)) if name in layers)))
+        self.registry.counts.clear()
+        self.save_images("bundle", "--cache-max-size-in-megabytes", "0")
+        self.assertEqual(self.registry.counts.get("blob_get"), 1)
+
+    def test_cache(self):
+        ''' A second bundle gets its blobs from the blob cache. '''
+
+        cache_dir = os.path.join(self.directory, "cache")
+        self.save_images("bundle-1", "--cache-dir", cache_dir)
+        self.registry.counts.clear()
+        output_file = self.save_images("bundle-2", "--cache-dir", cache_dir)
+        self.assertEqual(self.registry.counts.get("blob_get", 0), 0)
+        with tarfile.open(output_file) as tar_file:
+            self.assertEqual(len(tar_file.extractfile("bundle-2/blobs.sha256").read().decode().splitlines()), 7)
+
+    def test_plan(self):
+        ''' A plan counts the shared base layer once and downloads no blob. '''
+
+        output_file = os.path.join(self.directory, "plan.json")
+        result = run_program(
+            "plan",
+            "--docker-compose-file", self.project_directory,
+            "--insecure-registries", self.registry.host,
+            "--platform", "linux/amd64",
+            "--output-file", output_file)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with open(output_file) as a_file:
+            total = json.load(a_file).get("total")
+        self.assertEqual(total.get("images"), 2)
+        self.assertEqual(total.get("blobs"), 7)
+        self.assertLess(total.get("compressed_size"), sum(len(blob) for blob in self.registry.blobs.values()))
+        self.assertEqual(self.registry.counts.get("blob_get", 0), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
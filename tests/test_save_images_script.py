@@ -0,0 +1,392 @@
+'''
+Tests of save-images.sh and load-images.sh with a stand-in docker.
+'''
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from docker import Docker
+from program import run_program
+
+from docker_compose_air_gapper.archive import BundleArchive, load_bundle_images, read_bundle_images
+
+IMAGES = ["senzing/app0:1.0", "senzing/app1:1.0"]
+
+
+class BundleTestCase(unittest.TestCase):
+    ''' Helpers that save bundles with save-images.sh and a stand-in docker, and load them into another one. '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.docker = Docker(os.path.join(self.directory, "docker"))
+
+    def write_docker_compose_file(self, docker_compose_file, images):
+        ''' Write a docker-compose file of one service for each image. '''
+        os.makedirs(os.path.dirname(docker_compose_file), exist_ok=True)
+        with open(docker_compose_file, "w") as a_file:
+            a_file.write("services:\n")
+            for number, image in enumerate(images):
+                a_file.write("  app{0}:\n    image: {1}\n".format(number, image))
+
+    def create_save_images(self, images, *arguments, name="save-images.sh"):
+        ''' Create a save-images.sh for a docker-compose file of one service for each image, or for the
+            docker-compose files given by "--docker-compose-file" in "arguments" if "images" is None. Return its name.
+        '''
+        if images is not None:
+            docker_compose_file = os.path.join(self.directory, "{0}.yaml".format(name))
+            self.write_docker_compose_file(docker_compose_file, images)
+            arguments = ("--docker-compose-file", docker_compose_file, *arguments)
+        output_file = os.path.join(self.directory, name)
+        result = run_program("create-save-images", "--output-file", output_file, *arguments)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return output_file
+
+    def save_images(self, script, name="bundle", output_file_name="bundle.tgz", **variables):
+        ''' Run save-images.sh, writing into the directory "name". Return the output file. '''
+        home_dir = os.path.join(self.directory, name)
+        os.makedirs(home_dir, exist_ok=True)
+        output_file = os.path.join(home_dir, output_file_name)
+        result = self.docker.run_script(script, MY_HOME=home_dir, OUTPUT_FILE=output_file, **variables)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        return output_file
+
+    def extract_bundle(self, output_file, name="load"):
+        ''' Extract a bundle into the directory "name". Return the bundle directory. '''
+        load_dir = os.path.join(self.directory, name)
+        os.makedirs(load_dir, exist_ok=True)
+        subprocess.run(["tar", "--extract", "--ignore-zeros", "--file", output_file, "--directory", load_dir], check=True)
+        return os.path.join(load_dir, next(name for name in os.listdir(load_dir) if name.startswith("docker-compose-air-gapper-")))
+
+    def get_blobs(self, bundle_dir):
+        ''' Return the names of the blob files of a bundle directory. '''
+        return sorted(os.listdir(os.path.join(bundle_dir, "blobs", "blobs", "sha256")))
+
+    def load_images(self, bundle_dir, *arguments, docker=None, **variables):
+        ''' Run load-images.sh of a bundle directory with another docker. Return the completed process and that docker. '''
+        docker = docker or Docker(os.path.join(self.directory, "load-docker"))
+        return docker.run_script(os.path.join(bundle_dir, "load-images.sh"), *arguments, **variables), docker
+
+    def create_indexed_bundle(self, output_file):
+        ''' Rewrite a bundle of save-images.sh, which has no index, as an indexed bundle with "merge-bundles --index". Return the indexed bundle file. '''
+        indexed_file = os.path.join(self.directory, "indexed", "bundle.tgz")
+        result = run_program("merge-bundles", "--bundle", output_file, "--index", "--output-file", indexed_file)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertTrue(os.path.exists("{0}.index.json".format(indexed_file)))
+        return indexed_file
+
+
+class SaveImagesScriptTest(BundleTestCase):
+    ''' Save the images of docker-compose files with save-images.sh, then load them into another docker with load-images.sh. '''
+
+    def test_shared_layers(self):
+        ''' The base layer that both images share is stored once, and load-images.sh rebuilds each image from the shared blobs. '''
+
+        bundle_dir = self.extract_bundle(self.save_images(self.create_save_images(IMAGES)))
+        blob_lists = []
+        for image_id in os.listdir(os.path.join(bundle_dir, "manifests")):
+            with open(os.path.join(bundle_dir, "manifests", image_id, "blobs.txt")) as a_file:
+                blob_lists.append(set(a_file.read().split()))
+        with open(os.path.join(bundle_dir, "blobs.sha256")) as a_file:
+            checksums = a_file.read().splitlines()
+
+        self.assertEqual(len(blob_lists), 2)
+        self.assertEqual(len(blob_lists[0] & blob_lists[1]), 1)
+        self.assertEqual(len(self.get_blobs(bundle_dir)), len(blob_lists[0] | blob_lists[1]))
+        self.assertEqual(len(checksums), 7)
+
+        result, docker = self.load_images(bundle_dir)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        for image in IMAGES:
+            self.assertIn("Loaded image: {0}".format(image), result.stdout)
+        self.assertEqual(len(docker.get_commands("load")), 2)
+
+    def test_concurrency(self):
+        ''' Up to CONCURRENCY images are pulled at the same time, and every image is pulled once. '''
+
+        images = ["senzing/app{0}:1.0".format(number) for number in range(6)]
+        self.save_images(self.create_save_images(images), CONCURRENCY="3", FAKE_DOCKER_PULL_SECONDS="0.3")
+        self.assertEqual(sorted(arguments[-1] for arguments in self.docker.get_commands("pull")), images)
+        self.assertEqual(self.docker.get_max_concurrency("pull"), 3)
+
+    def test_delta_bundle(self):
+        ''' A bundle made against the bundle-manifest.txt of a previous bundle holds only new blobs, and load-images.sh reads the rest from the previous bundle. '''
+
+        previous_bundle_dir = self.extract_bundle(self.save_images(self.create_save_images(IMAGES)), name="previous")
+        images = IMAGES + ["senzing/app2:1.0"]
+        script = self.create_save_images(images, "--previous-bundle-manifest", os.path.join(previous_bundle_dir, "bundle-manifest.txt"), name="delta.sh")
+        bundle_dir = self.extract_bundle(self.save_images(script, name="delta"))
+
+        with open(os.path.join(previous_bundle_dir, "bundle-manifest.txt")) as a_file:
+            previous_blobs = {os.path.basename(blob) for blob in a_file.read().split()}
+        with open(os.path.join(bundle_dir, "bundle-manifest.txt")) as a_file:
+            blobs = {os.path.basename(blob) for blob in a_file.read().split()}
+        self.assertTrue(self.get_blobs(bundle_dir))
+        self.assertFalse(previous_blobs & set(self.get_blobs(bundle_dir)))
+        self.assertEqual(blobs, previous_blobs | set(self.get_blobs(bundle_dir)))
+
+        result, docker = self.load_images(bundle_dir, previous_bundle_dir)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        for image in images:
+            self.assertIn("Loaded image: {0}".format(image), result.stdout)
+        self.assertEqual(len(docker.get_commands("load")), 3)
+
+    def test_stream(self):
+        ''' With STREAM=true, no output directory is left behind, and load-images.sh loads the images from the output file without extracting it. '''
+
+        output_file = self.save_images(self.create_save_images(IMAGES), STREAM="true")
+        self.assertEqual(os.listdir(os.path.dirname(output_file)), ["bundle.tgz"])
+        self.assertEqual(len(self.docker.get_commands("save")), 1)
+
+        load_dir = os.path.join(self.directory, "load")
+        os.makedirs(load_dir)
+        subprocess.run(["tar", "--extract", "--gzip", "--ignore-zeros", "--file", output_file, "--directory", load_dir, "load-images.sh", "images.txt"], check=True)
+        result, docker = self.load_images(load_dir, output_file)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        for image in IMAGES:
+            self.assertIn("Loaded image: {0}".format(image), result.stdout)
+        self.assertEqual(len(docker.get_commands("load")), 1)
+
+    def test_compression(self):
+        ''' Each COMPRESSION writes a bundle in its format, and each bundle loads. '''
+
+        script = self.create_save_images(IMAGES)
+        for compression, output_file_name, offset, magic_number in [("gzip", "bundle.tgz", 0, b"\x1f\x8b"), ("zstd", "bundle.tar.zst", 0, b"\x28\xb5\x2f\xfd"), ("none", "bundle.tar", 257, b"ustar")]:
+            with self.subTest(compression=compression):
+                output_file = self.save_images(script, name=compression, output_file_name=output_file_name, COMPRESSION=compression)
+                with open(output_file, "rb") as a_file:
+                    a_file.seek(offset)
+                    self.assertEqual(a_file.read(len(magic_number)), magic_number)
+                bundle_dir = self.extract_bundle(output_file, name="load-{0}".format(compression))
+                result, _ = self.load_images(bundle_dir, docker=Docker(os.path.join(self.directory, "docker-{0}".format(compression))))
+                self.assertEqual(result.returncode, 0, result.stdout)
+                for image in IMAGES:
+                    self.assertIn("Loaded image: {0}".format(image), result.stdout)
+
+        result = self.docker.run_script(script, MY_HOME=self.directory, COMPRESSION="lzma")
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("COMPRESSION must be gzip, zstd, or none", result.stdout)
+
+    def test_resume(self):
+        ''' A run with RESUME_DIR pulls and saves only the images that its journal does not show as saved. '''
+
+        script = self.create_save_images(IMAGES)
+        self.save_images(script)
+        output_dir = next(os.path.join(self.directory, "bundle", name) for name in os.listdir(os.path.join(self.directory, "bundle")) if name.startswith("docker-compose-air-gapper-"))
+        journal_file = os.path.join(output_dir, "journal.txt")
+        with open(journal_file) as a_file:
+            lines = a_file.readlines()
+        self.assertEqual(sorted(line.split()[0] for line in lines), IMAGES)
+        with open(journal_file, "w") as a_file:
+            a_file.writelines(line for line in lines if not line.startswith(IMAGES[1]))
+
+        self.docker = Docker(os.path.join(self.directory, "resume-docker"))
+        output_file = self.save_images(script, RESUME_DIR=output_dir)
+        self.assertEqual([arguments[-1] for arguments in self.docker.get_commands("pull")], [IMAGES[1]])
+        self.assertEqual(len(self.docker.get_commands("save")), 1)
+
+        result, _ = self.load_images(self.extract_bundle(output_file))
+        self.assertEqual(result.returncode, 0, result.stdout)
+        for image in IMAGES:
+            self.assertIn("Loaded image: {0}".format(image), result.stdout)
+
+    def test_many_docker_compose_files(self):
+        ''' Directories and glob patterns of docker-compose files give one save-images.sh that saves each image once
+            and records which docker-compose files use it.
+        '''
+
+        stacks_dir = os.path.join(self.directory, "stacks")
+        docker_compose_files = {
+            os.path.join(stacks_dir, "a", "docker-compose.yaml"): ["senzing/app0:1.0", "senzing/app1:1.0"],
+            os.path.join(stacks_dir, "b", "compose.yaml"): ["senzing/app1:1.0", "senzing/app2:1.0"],
+            os.path.join(self.directory, "more", "c", "docker-compose.yml"): ["senzing/app0:1.0", "senzing/app3:1.0"],
+        }
+        for docker_compose_file, images in docker_compose_files.items():
+            self.write_docker_compose_file(docker_compose_file, images)
+        script = self.create_save_images(None, "--docker-compose-file", os.path.join(stacks_dir, "a"), os.path.join(stacks_dir, "b"), os.path.join(self.directory, "more", "*", "docker-compose.yml"))
+        bundle_dir = self.extract_bundle(self.save_images(script))
+
+        images = ["senzing/app{0}:1.0".format(number) for number in range(4)]
+        self.assertEqual(sorted(arguments[-1] for arguments in self.docker.get_commands("pull")), images)
+        with open(os.path.join(bundle_dir, "docker-compose-files.txt")) as a_file:
+            lines = sorted(tuple(line.split()) for line in a_file)
+        self.assertEqual(lines, sorted((image, os.path.realpath(docker_compose_file)) for docker_compose_file, file_images in docker_compose_files.items() for image in file_images))
+
+    def test_platforms(self):
+        ''' With PLATFORMS, a pulled image is pulled and saved for each platform, and a built image is built and saved for the first one.
+            load-images.sh loads the images of the platform of its docker.
+        '''
+
+        project_dir = os.path.join(self.directory, "project")
+        os.makedirs(os.path.join(project_dir, "tools"))
+        with open(os.path.join(project_dir, "tools", "Dockerfile"), "w") as a_file:
+            a_file.write("FROM scratch\n")
+        with open(os.path.join(project_dir, "docker-compose.yaml"), "w") as a_file:
+            a_file.write("services:\n  app:\n    image: senzing/app0:1.0\n  tools:\n    build: ./tools\n")
+        script = self.create_save_images(None, "--docker-compose-file", project_dir)
+        bundle_dir = self.extract_bundle(self.save_images(script, PLATFORMS="linux/amd64,linux/arm64"))
+
+        self.assertEqual([arguments[arguments.index("--platform") + 1] for arguments in self.docker.get_commands("pull")], ["linux/amd64", "linux/arm64"])
+        self.assertEqual([arguments[arguments.index("--platform") + 1] for arguments in self.docker.get_commands("build")], ["linux/amd64"])
+        with open(os.path.join(bundle_dir, "images.txt")) as a_file:
+            lines = [line.split() for line in a_file]
+        self.assertEqual(sorted(tuple(line[1:]) for line in lines), [("project-tools", "linux/amd64"), ("senzing/app0:1.0", "linux/amd64"), ("senzing/app0:1.0", "linux/arm64")])
+        self.assertEqual(sorted(os.listdir(os.path.join(bundle_dir, "manifests"))), sorted(line[0] for line in lines))
+
+        for platform, loaded_images in [("linux/amd64", ["project-tools", "senzing/app0:1.0"]), ("linux/arm64", ["senzing/app0:1.0"])]:
+            with self.subTest(platform=platform):
+                docker = Docker(os.path.join(self.directory, "docker-{0}".format(platform.replace("/", "-"))), FAKE_DOCKER_PLATFORM=platform)
+                result, _ = self.load_images(bundle_dir, docker=docker)
+                self.assertEqual(result.returncode, 0, result.stdout)
+                self.assertEqual(sorted(line.split()[-1] for line in result.stdout.splitlines() if line.startswith("Loaded image:")), loaded_images)
+
+    def test_volumes(self):
+        ''' With VOLUME_SIZE_IN_MEGABYTES, the bundle is written as volumes that the verify script checks, joins, and extracts.
+            Missing and damaged volumes are listed.
+        '''
+
+        output_file = self.save_images(self.create_save_images(IMAGES), VOLUME_SIZE_IN_MEGABYTES="1", FAKE_DOCKER_BASE_LAYER_SIZE="2500000")
+        volumes = sorted(name for name in os.listdir(os.path.dirname(output_file)) if name.startswith("bundle.tgz."))
+        self.assertEqual(volumes, ["bundle.tgz.0000", "bundle.tgz.0001", "bundle.tgz.0002", "bundle.tgz.sha256", "bundle.tgz.verify.sh"])
+
+        load_dir = os.path.join(self.directory, "load")
+        result = self.docker.run_script("{0}.verify.sh".format(output_file), load_dir)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn("All 3 volumes are good.", result.stdout)
+        bundle_dir = os.path.join(load_dir, next(name for name in os.listdir(load_dir) if name.startswith("docker-compose-air-gapper-")))
+        result, _ = self.load_images(bundle_dir)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        for image in IMAGES:
+            self.assertIn("Loaded image: {0}".format(image), result.stdout)
+
+        with open("{0}.0001".format(output_file), "r+b") as a_file:
+            a_file.write(b"damaged")
+        os.remove("{0}.0002".format(output_file))
+        result = self.docker.run_script("{0}.verify.sh".format(output_file))
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("Damaged: bundle.tgz.0001", result.stdout)
+        self.assertIn("Missing: bundle.tgz.0002", result.stdout)
+        self.assertIn("Error: 2 of 3 volumes must be sent again:", result.stdout)
+
+    def test_verify_first(self):
+        ''' load-images.sh loads nothing if a blob is damaged, names the images that use it, and otherwise loads up to CONCURRENCY images at the same time. '''
+
+        images = ["senzing/app{0}:1.0".format(number) for number in range(4)]
+        bundle_dir = self.extract_bundle(self.save_images(self.create_save_images(images)))
+        image_id = "senzing-app3-1.0"
+        blob_lists = {}
+        for name in os.listdir(os.path.join(bundle_dir, "manifests")):
+            with open(os.path.join(bundle_dir, "manifests", name, "blobs.txt")) as a_file:
+                blob_lists[name] = set(a_file.read().split())
+        blob = sorted(blob_lists.pop(image_id).difference(*blob_lists.values()))[0]
+        with open(os.path.join(bundle_dir, "blobs", blob), "r+b") as a_file:
+            data = a_file.read()
+            a_file.seek(0)
+            a_file.write(b"damaged")
+
+        result, docker = self.load_images(bundle_dir)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("Error: {0} is damaged or missing. Used by: {1}".format(blob, image_id), result.stdout)
+        self.assertIn("No images were loaded.", result.stdout)
+        self.assertEqual(docker.get_commands("load"), [])
+
+        with open(os.path.join(bundle_dir, "blobs", blob), "wb") as a_file:
+            a_file.write(data)
+        result, docker = self.load_images(bundle_dir, docker=docker, CONCURRENCY="2", FAKE_DOCKER_LOAD_SECONDS="0.3")
+        self.assertEqual(result.returncode, 0, result.stdout)
+        self.assertEqual(len(docker.get_commands("load")), 4)
+        self.assertEqual(docker.get_max_concurrency("load"), 2)
+
+    def test_builds(self):
+        ''' Services that are only built are built up to CONCURRENCY at a time, each after the built image its Dockerfile starts FROM,
+            and saved in the bundle with the pulled images.
+        '''
+
+        project_dir = os.path.join(self.directory, "project")
+        for name, dockerfile in [("base", "FROM scratch\n"), ("app", "FROM project-base\n"), ("tools", "FROM scratch\n")]:
+            os.makedirs(os.path.join(project_dir, name))
+            with open(os.path.join(project_dir, name, "Dockerfile"), "w") as a_file:
+                a_file.write(dockerfile)
+        with open(os.path.join(project_dir, "docker-compose.yaml"), "w") as a_file:
+            a_file.write("services:\n  db:\n    image: senzing/app0:1.0\n  app:\n    build: ./app\n  base:\n    build: ./base\n  tools:\n    build: ./tools\n")
+        script = self.create_save_images(None, "--docker-compose-file", project_dir)
+        bundle_dir = self.extract_bundle(self.save_images(script, FAKE_DOCKER_PULL_SECONDS="0.3"))
+
+        builds = {arguments[arguments.index("--tag") + 1]: (start, end) for start, end, arguments in self.docker.get_intervals("build")}
+        self.assertEqual(sorted(builds), ["project-app", "project-base", "project-tools"])
+        self.assertGreaterEqual(builds.get("project-app")[0], builds.get("project-base")[1])
+        self.assertEqual(self.docker.get_max_concurrency("build"), 2)
+        self.assertEqual([arguments[-1] for arguments in self.docker.get_commands("pull")], ["senzing/app0:1.0"])
+
+        result, _ = self.load_images(bundle_dir)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        for image in ["senzing/app0:1.0", "project-app", "project-base", "project-tools"]:
+            self.assertIn("Loaded image: {0}".format(image), result.stdout)
+
+    def test_metrics(self):
+        ''' save-images.sh and load-images.sh report the stages of each image and of the run as JSON and as a Prometheus textfile. '''
+
+        metrics_file = os.path.join(self.directory, "save-metrics.json")
+        prometheus_file = os.path.join(self.directory, "save-metrics.prom")
+        bundle_dir = self.extract_bundle(self.save_images(self.create_save_images(IMAGES), METRICS_FILE=metrics_file, PROMETHEUS_FILE=prometheus_file))
+        with open(metrics_file) as a_file:
+            metrics = json.load(a_file)
+        self.assertEqual(metrics.get("command"), "save-images.sh")
+        self.assertEqual(sorted(image.get("image") for image in metrics.get("images")), IMAGES)
+        for image in metrics.get("images"):
+            self.assertEqual(image.get("result"), "saved")
+            self.assertEqual(sorted(image.get("stages")), ["pull", "save"])
+            self.assertGreater(image.get("stages").get("save").get("bytes"), 0)
+        self.assertIn("compress", metrics.get("stages"))
+        with open(prometheus_file) as a_file:
+            samples = [line for line in a_file if not line.startswith("#")]
+        self.assertIn('docker_compose_air_gapper_images{command="save-images.sh",result="saved"} 2\n', samples)
+        self.assertIn('docker_compose_air_gapper_stage_bytes{{command="save-images.sh",image="{0}",platform="",stage="save"}}'.format(IMAGES[0]), "".join(samples))
+
+        metrics_file = os.path.join(self.directory, "load-metrics.json")
+        result, _ = self.load_images(bundle_dir, METRICS_FILE=metrics_file)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        with open(metrics_file) as a_file:
+            metrics = json.load(a_file)
+        self.assertEqual(metrics.get("command"), "load-images.sh")
+        self.assertEqual(sorted((image.get("image"), image.get("result")) for image in metrics.get("images")), [(image, "loaded") for image in IMAGES])
+        self.assertIn("verify", metrics.get("stages"))
+
+    def test_indexed_load(self):
+        ''' A bundle of save-images.sh has no index until "merge-bundles --index" makes an indexed copy.
+            "load-images" reads the selected image of the platform of docker from that copy, without extracting it.
+        '''
+
+        output_file = self.save_images(self.create_save_images(IMAGES), PLATFORMS="linux/amd64,linux/arm64")
+        result = run_program("load-images", "--input-file", output_file)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("Bundles of save-images.sh have no index. Make an indexed copy with 'merge-bundles --index'.", result.stderr)
+
+        indexed_file = self.create_indexed_bundle(output_file)
+        docker = Docker(os.path.join(self.directory, "load-docker"), FAKE_DOCKER_PLATFORM="linux/arm64")
+        result = run_program("load-images", "--input-file", indexed_file, "--image", IMAGES[1], **docker.variables)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("Loaded 1 images into docker.", result.stderr)
+        self.assertEqual(len(docker.get_commands("load")), 1)
+
+    def test_load_bundle_images(self):
+        ''' The results of loading an image for several platforms are kept for each platform. '''
+
+        indexed_file = self.create_indexed_bundle(self.save_images(self.create_save_images(IMAGES), PLATFORMS="linux/amd64,linux/arm64"))
+        bundle = BundleArchive(indexed_file)
+        bundle_images = read_bundle_images(bundle)
+        docker = Docker(os.path.join(self.directory, "load-docker"))
+        with mock.patch.dict(os.environ, docker.variables):
+            results, failures = load_bundle_images({"concurrency": 2}, bundle, bundle_images)
+        self.assertEqual(failures, {})
+        self.assertEqual(sorted(results), sorted((image_id, platform) for image_id, _, platform in bundle_images))
+        self.assertEqual(len(results), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+'''
+Tests of "serve".
+'''
+
+import contextlib
+import json
+import socket
+import subprocess
+import sys
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from program import PROGRAM
+
+DOCKER_COMPOSE_TEXT = "services:\n  app:\n    image: ${IMAGE:-senzing/app:1.0}\n"
+
+
+def get_free_port():
+    ''' Return a local TCP port that is not in use. '''
+    with socket.socket() as a_socket:
+        a_socket.bind(("127.0.0.1", 0))
+        return a_socket.getsockname()[1]
+
+
+class ServeTest(unittest.TestCase):
+    ''' A server that keeps one response in its cache. '''
+
+    def setUp(self):
+        self.port = get_free_port()
+        exit_stack = contextlib.ExitStack()
+        self.addCleanup(exit_stack.close)
+        process = exit_stack.enter_context(subprocess.Popen([sys.executable, PROGRAM, "serve", "--host", "127.0.0.1", "--port", str(self.port), "--cache-max-entries", "1"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        exit_stack.callback(process.terminate)
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", self.port)).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+    def post(self, request):
+        ''' POST a request to /save-images. Return the status, the X-Cache header, and the response. '''
+        http_request = urllib.request.Request("http://127.0.0.1:{0}/save-images".format(self.port), data=json.dumps(request).encode(), headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(http_request, timeout=30) as response:
+                return response.status, response.headers.get("X-Cache"), json.load(response)
+        except urllib.error.HTTPError as err:
+            with err:
+                return err.code, None, json.load(err)
+
+    def test_cache(self):
+        ''' The same request is answered from the cache until a different request takes its place. '''
+
+        first_request = {"files": {"docker-compose.yaml": DOCKER_COMPOSE_TEXT}}
+        second_request = {"files": {"docker-compose.yaml": DOCKER_COMPOSE_TEXT}, "environment": {"IMAGE": "senzing/other:2.0"}}
+
+        status, cache, response = self.post(first_request)
+        self.assertEqual((status, cache), (200, "MISS"))
+        self.assertEqual(response.get("images"), ["senzing/app:1.0"])
+        self.assertIn("senzing/app:1.0", response.get("save_images_script"))
+        self.assertEqual(self.post(first_request)[:2], (200, "HIT"))
+
+        status, cache, response = self.post(second_request)
+        self.assertEqual((status, cache), (200, "MISS"))
+        self.assertEqual(response.get("images"), ["senzing/other:2.0"])
+        self.assertEqual(self.post(first_request)[:2], (200, "MISS"))
+
+        with urllib.request.urlopen("http://127.0.0.1:{0}/stats".format(self.port), timeout=30) as response:
+            stats = json.load(response)
+        self.assertEqual((stats.get("hits"), stats.get("misses"), stats.get("evictions"), stats.get("entries")), (1, 3, 2, 1))
+        self.assertEqual(stats.get("parsed_texts").get("entries"), 1)
+
+    def test_bad_requests(self):
+        ''' Requests with options or docker-compose files of the wrong type are answered with 400. '''
+
+        for request in [
+            {"files": {"docker-compose.yaml": DOCKER_COMPOSE_TEXT}, "environment": ["IMAGE=senzing/app:2.0"]},
+            {"files": {"docker-compose.yaml": DOCKER_COMPOSE_TEXT}, "profiles": [{}]},
+            {"files": {"docker-compose.yaml": DOCKER_COMPOSE_TEXT}, "project_directory": 5},
+            {"files": {"docker-compose.yaml": "services: [1]\n"}},
+            {"files": {"docker-compose.yaml": "services:\n  app:\n    image: [1]\n"}},
+        ]:
+            status, _, response = self.post(request)
+            self.assertEqual(status, 400, request)
+            self.assertTrue(response.get("error"))
+
+    def post_raw(self, headers):
+        ''' POST an empty JSON object to /save-images with the given header lines. Return the status and whether the server closed the connection. '''
+        with socket.create_connection(("127.0.0.1", self.port), timeout=30) as a_socket:
+            a_socket.sendall("POST /save-images HTTP/1.1\r\nHost: 127.0.0.1\r\n{0}\r\n{{}}".format("".join("{0}\r\n".format(header) for header in headers)).encode())
+            with a_socket.makefile("rb") as a_file:
+                status = int(a_file.readline().split()[1])
+                return status, b"Connection: close" in a_file.read()
+
+    def test_content_length(self):
+        ''' A request without a Content-Length is answered with 411, and one with an invalid Content-Length with 400. The connection is closed. '''
+
+        for headers, status in [([], 411), (["Content-Length: -1"], 400), (["Content-Length: two"], 400), (["Content-Length: {0}".format(17 * 1024 * 1024)], 413)]:
+            with self.subTest(headers=headers):
+                self.assertEqual(self.post_raw(headers), (status, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
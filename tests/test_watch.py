@@ -0,0 +1,102 @@
+'''
+Tests of "watch": only the docker-compose projects whose files changed are parsed again,
+and each change gets a save-images.sh of the images that were added or changed.
+'''
+
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from program import PROGRAM
+
+from docker_compose_air_gapper.watch import DockerComposeWatcher
+
+
+class WatchTest(unittest.TestCase):
+    ''' Watch a directory of two docker-compose projects, "a" and "b". '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.projects_dir = os.path.join(self.directory, "projects")
+        self.write_docker_compose_file("a", ["senzing/app0:1.0"])
+        self.write_docker_compose_file("b", ["senzing/app1:1.0"])
+
+    def write_docker_compose_file(self, project, images):
+        ''' Write the docker-compose.yaml of a project, with a service for each image. Return its filename. '''
+        os.makedirs(os.path.join(self.projects_dir, project), exist_ok=True)
+        filename = os.path.join(self.projects_dir, project, "docker-compose.yaml")
+        with open(filename, "w") as a_file:
+            a_file.write("services:\n")
+            for number, image in enumerate(images):
+                a_file.write("  service{0}:\n    image: {1}\n".format(number, image))
+        return filename
+
+    def wait_for_changes(self, output_directory, count):
+        ''' Wait until "watch" wrote "count" changes-<timestamp>.json files. Return them, oldest first, as read. '''
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            filenames = sorted(glob.glob(os.path.join(output_directory, "changes-*.json")))
+            if len(filenames) >= count:
+                break
+            time.sleep(0.1)
+        self.assertEqual(len(filenames), count)
+        result = []
+        for filename in filenames:
+            with open(filename) as a_file:
+                result.append(json.load(a_file))
+        return result
+
+    def test_watch(self):
+        ''' The first change saves every image. When a project changes, its added, changed and removed images are listed,
+            and only the added and changed images are in its save-images-<timestamp>.sh.
+        '''
+
+        output_directory = os.path.join(self.directory, "output")
+        environment = {key: value for key, value in os.environ.items() if not key.startswith("SENZING_")}
+        with subprocess.Popen([sys.executable, PROGRAM, "watch", "--docker-compose-file", self.projects_dir, "--output-directory", output_directory], env=environment, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL) as process:
+            try:
+                changes = self.wait_for_changes(output_directory, 1)
+                self.assertEqual(changes[0].get("added"), ["senzing/app0:1.0", "senzing/app1:1.0"])
+                filename = self.write_docker_compose_file("a", ["senzing/app0:2.0", "senzing/app2:1.0"])
+                changes = self.wait_for_changes(output_directory, 2)
+            finally:
+                process.terminate()
+
+        self.assertEqual(changes[1].get("changed_files"), [filename])
+        self.assertEqual(changes[1].get("added"), ["senzing/app0:2.0", "senzing/app2:1.0"])
+        self.assertEqual(changes[1].get("removed"), ["senzing/app0:1.0"])
+        with open(changes[1].get("save_images_file")) as a_file:
+            delta_text = a_file.read()
+        with open(os.path.join(output_directory, "save-images.sh")) as a_file:
+            full_text = a_file.read()
+        for image in ["senzing/app0:2.0", "senzing/app2:1.0"]:
+            self.assertIn(image, delta_text)
+            self.assertIn(image, full_text)
+        self.assertNotIn("senzing/app1:1.0", delta_text)
+        self.assertIn("senzing/app1:1.0", full_text)
+        self.assertNotIn("senzing/app0:1.0", full_text)
+
+    def test_polling(self):
+        ''' When every file is checked, as with polling, only the project whose file changed is parsed again. '''
+
+        docker_compose_watcher = DockerComposeWatcher({"docker_compose_file": [self.projects_dir]})
+        self.assertEqual(len(docker_compose_watcher.update()), 2)
+        self.assertEqual(docker_compose_watcher.update(), [])
+
+        filename = self.write_docker_compose_file("b", ["senzing/app1:2.0"])
+        with mock.patch.object(docker_compose_watcher, "get_services_function", wraps=docker_compose_watcher.get_services_function) as get_services_function:
+            self.assertEqual(docker_compose_watcher.update(), [filename])
+        get_services_function.assert_called_once_with(filename)
+        self.assertEqual(docker_compose_watcher.get_services_by_file().get(filename).get("images"), ["senzing/app1:2.0"])
+
+
+if __name__ == "__main__":
+    unittest.main()